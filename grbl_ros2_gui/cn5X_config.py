@@ -34,7 +34,25 @@ DEFAULT_AXIS_NAMES = ['X', 'Y', 'Z', 'A', 'B']
 
 COM_DEFAULT_BAUD_RATE = 115200
 SERIAL_READ_TIMEOUT   = 250      # ms
-GRBL_QUERY_DELAY      =  40      # ms, default 75 ms == 13.3 Hz
+GRBL_QUERY_DELAY      =  40      # ms, default 75 ms == 13.3 Hz, periode d'interrogation (?) quand la machine bouge
+GRBL_QUERY_DELAY_IDLE = 200      # ms, periode d'interrogation (?) quand la machine est a l'arret (Idle, Alarm...)
+GRBL_GCODE_STATE_DELAY = 1000    # ms, intervalle minimum entre deux $G tant que Grbl n'est pas Idle
+COM_TX_SATURATION     =  64      # octets en attente d'emission sur le port au dela desquels on n'interroge plus Grbl
+COM_TCP_URL_SCHEMES   = ["socket://", "tcp://", "telnet://"] # Prefixes des ports reseau (Grbl-ESP32...), ex : socket://192.168.0.1:23
+COM_TCP_DEFAULT_PORT  =  23      # Port TCP par defaut (telnet de Grbl-ESP32)
+COM_TCP_CONNECT_TIMEOUT = 5000   # ms, delai maxi de connexion TCP
+COM_TCP_WRITE_TIMEOUT = 1000     # ms, delai maxi d'emission d'un bloc sur la socket
+COM_REPLAY_URL_SCHEME = "replay://" # Rejeu d'une capture a la place de Grbl, ex : replay:///tmp/grbl.cap?speed=4
+COM_CAPTURE_MAX_BYTES = 64 * 1024 * 1024 # Taille d'un fichier de capture du trafic avec Grbl avant rotation
+COM_CAPTURE_FILES     =   5      # Nombre de fichiers de capture conserves (fichier courant compris)
+COM_CAPTURE_BUFFER_SIZE = 64 * 1024 # Taille du buffer d'ecriture du fichier de capture
+GRBL_RX_BUFFER_SIZE   = 128      # Taille du buffer de reception serie de Grbl (octets)
+GRBL_PLANNER_BUFFER_SIZE = 15    # Nombre de blocs du planificateur de mouvements de Grbl
+GUI_REFRESH_DELAY     =  50      # ms, periode minimum de rafraichissement de l'interface par les status de Grbl
+GUI_OVERRIDE_DELAY    =  50      # ms, periode minimum d'envoi des surcharges lors des mouvements des boutons rotatifs
+GUI_OVERRIDE_SETTLE   = 100      # ms apres un envoi de surcharge pendant lesquels le Ov: des status peut encore etre anterieur a l'envoi
+GRBL_OVERRIDE_MIN     =  10      # %, surcharges d'avance et de broche mini de Grbl
+GRBL_OVERRIDE_MAX     = 200      # %, surcharges d'avance et de broche maxi de Grbl
 
 DEFAULT_JOG_SPEED     = 5000.0
 
@@ -107,6 +125,13 @@ GRBL_STATUS_CHECK = 'Check'
 GRBL_STATUS_HOME  = 'Home'
 GRBL_STATUS_SLEEP = 'Sleep'
 
+''' Etats dans lesquels la machine bouge, Grbl est interroge a la periode GRBL_QUERY_DELAY '''
+GRBL_QUERY_FAST_STATUS = [GRBL_STATUS_RUN, GRBL_STATUS_JOG, GRBL_STATUS_HOME, GRBL_STATUS_HOLD1, GRBL_STATUS_DOOR2, GRBL_STATUS_DOOR3]
+
+''' Entrees de Grbl rapportees par le champ Pn: du status, le bit N du masque correspond a la lettre N '''
+GRBL_PIN_LETTERS  = ['X', 'Y', 'Z', 'A', 'B', 'C', 'P', 'D', 'H', 'R', 'S']
+GRBL_PIN_BITS     = {L: 1 << N for N, L in enumerate(GRBL_PIN_LETTERS)}
+
 TXT_COLOR_GREEN  = QtGui.QColor(0, 92, 0)
 TXT_COLOR_ORANGE = QtGui.QColor(255, 127, 0)
 TXT_COLOR_RED    = QtGui.QColor(92, 0, 0)
@@ -115,6 +140,85 @@ TXT_COLOR_BLUE   = QtGui.QColor(0, 0, 92)
 COM_FLAG_NO_FLAG  = 0
 COM_FLAG_NO_OK    = 1
 COM_FLAG_NO_ERROR = 2
+COM_NO_ROW        = -1 # Commande ne provenant pas d'une ligne du fichier GCode
+
+''' Protocoles de streaming du GCode vers Grbl '''
+COM_STREAMING_SEND_RESPONSE = 0 # Une seule ligne en attente de reponse, envoi de la suivante a la reception du "ok"
+COM_STREAMING_CHAR_COUNTING = 1 # Remplissage du buffer RX de Grbl en comptant les octets en attente de reponse
+COM_STREAMING_MODES = {
+  "send-response": COM_STREAMING_SEND_RESPONSE,
+  "char-counting": COM_STREAMING_CHAR_COUNTING
+}
+COM_DEFAULT_STREAMING_MODE  = COM_STREAMING_SEND_RESPONSE
+COM_STREAM_STATS_MIN_LINES  = 10 # Nombre minimum de lignes d'un flux pour tracer ses statistiques de debit
+COM_LATENCY_RESOLUTION      = 0.00001 # (s) Pas de l'histogramme des delais entre accuse de reception et envoi suivant
+COM_LATENCY_BINS            = 10000   # Nombre de cases de l'histogramme (les delais superieurs vont dans la derniere)
+
+''' Traces de debug de la communication (grblTrace) '''
+TRACE_LEVEL_OFF    = 0    # Aucune trace
+TRACE_LEVEL_COM    = 1    # Evenements de la communication (ouverture, erreurs, alarmes...)
+TRACE_LEVEL_DATA   = 2    # En plus, toutes les donnees envoyees et recues
+TRACE_BUFFER_SIZE  = 8192 # Nombre d'enregistrements du tampon circulaire
+TRACE_DRAIN_DELAY  = 100  # ms, periode de vidage des traces dans l'onglet debug
+TRACE_DRAIN_MAX    = 2000 # Nombre maxi d'enregistrements affiches a chaque vidage
+
+''' Mesures de fonctionnement (grblMetrics) publiees sur /diagnostics '''
+METRICS_RTT_BOUNDS     = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0] # (s) Bornes de l'histogramme envoi -> ok
+METRICS_GUI_LAG_DELAY  = 100  # ms, periode du timer de mesure du retard de la boucle d'evenements GUI
+METRICS_GUI_LAG_WARN   = 0.2  # (s) Retard de la boucle GUI au dela duquel le diagnostic passe en WARN
+ROS_DIAGNOSTICS_PERIOD = 1.0  # (s) Periode de publication de /diagnostics
+ROS_JOINT_STATES_RATE  = 200  # (Hz) Frequence de publication de joint_states (positions extrapolees entre les rapports de status)
+MOTION_MAX_EXTRAPOLATION = 0.1 # (s) Extrapolation maxi de la position apres un rapport de status (grblMotion)
+
+''' Apercu de la trajectoire du programme publie pour RViz (topic toolpath, visualization_msgs/Marker LINE_LIST) '''
+ROS_TOOLPATH_FRAME        = "W"                       # Repere de la piece (plateau de l'axe B dans laser.urdf.xacro)
+ROS_TOOLPATH_MAX_POINTS   = 200000                    # Budget de points de l'apercu, la trajectoire est simplifiee au dela
+ROS_TOOLPATH_CHUNK_POINTS = 50000                     # Points par message Marker (plus si le budget ne tient pas dans ROS_TOOLPATH_DEPTH messages)
+ROS_TOOLPATH_DEPTH        = 8                         # Messages gardes pour les abonnes tardifs, egal au Depth du display Toolpath de rviz/laser.rviz
+ROS_TOOLPATH_LINE_WIDTH   = 0.0002                    # (m) Epaisseur des traits
+ROS_TOOLPATH_FEED_COLOR   = (0.1, 0.6, 1.0, 1.0)      # RGBA des mouvements en avance travail (G1, G2, G3)
+ROS_TOOLPATH_RAPID_COLOR  = (1.0, 0.6, 0.0, 0.5)      # RGBA des deplacements rapides (G0)
+
+''' Indexation des fichiers GCode '''
+GCODE_INDEX_FIRST_BLOCK = 64 * 1024        # Octets indexes a l'ouverture avant de rendre la main (premieres lignes affichees immediatement)
+GCODE_INDEX_BLOCK_SIZE  = 16 * 1024 * 1024 # Octets indexes par bloc par le thread d'indexation
+GCODE_MODAL_CHECKPOINT  = 1000             # Lignes entre deux points de reprise de l'index de l'etat modal (reprise en cours de programme)
+GCODE_MODAL_WAIT_STEP   = 10               # ms, attente du point de reprise de l'index en construction (reprise en cours de programme)
+GCODE_EDIT_DELAY        = 500              # ms sans modification du programme avant de relancer son indexation, sa verification et son estimation
+GCODE_COLUMNS_AXES      = "XYZAB"          # Axes des colonnes du cache d'analyse des fichiers GCode (gcodeColumns)
+GCODE_COLUMNS_SUFFIX    = ".cn5x.npz"      # Cache (fichier masque) a cote du fichier GCode : .<nom du fichier>.cn5x.npz
+GCODE_COLUMNS_MIN_LINES = 10000            # Lignes en dessous desquelles l'analyse est plus rapide que la lecture du cache
+GCODE_COLUMNS_MIN_RUN   = 64               # Lignes simples consecutives traitees en une fois sur les colonnes par gcodeEstimator
+GCODE_PREPROCESS_DECIMALS_MM   = 4         # Decimales conservees par le preprocesseur d'envoi en G21 (0,1 micron)
+GCODE_PREPROCESS_DECIMALS_INCH = 5         # Decimales conservees en G20 (0,25 micron)
+SCAN_PATH_TOLERANCE     = 0.005            # Tolerance (mm) de fusion des segments alignes du trajet de scan (toolpath.path_compression)
+
+# Groupes modaux des codes G et M supportes par Grbl 1.1 (cles arrondies au dixieme)
+GRBL_G_GROUPS = {
+  0: 'motion', 1: 'motion', 2: 'motion', 3: 'motion', 38.2: 'motion', 38.3: 'motion', 38.4: 'motion', 38.5: 'motion', 80: 'motion',
+  4: 'nonModal', 10: 'nonModal', 28: 'nonModal', 28.1: 'nonModal', 30: 'nonModal', 30.1: 'nonModal', 53: 'nonModal', 92: 'nonModal', 92.1: 'nonModal',
+  17: 'plane', 18: 'plane', 19: 'plane',
+  20: 'units', 21: 'units',
+  90: 'distance', 91: 'distance', 91.1: 'arcDistance',
+  93: 'feedMode', 94: 'feedMode',
+  40: 'cutterComp', 43.1: 'toolLength', 49: 'toolLength',
+  54: 'coord', 55: 'coord', 56: 'coord', 57: 'coord', 58: 'coord', 59: 'coord',
+  61: 'pathControl'
+}
+GRBL_M_GROUPS = {0: 'stop', 1: 'stop', 2: 'stop', 30: 'stop', 3: 'spindle', 4: 'spindle', 5: 'spindle', 7: 'coolant', 8: 'coolant', 9: 'coolant'}
+GRBL_LINE_BUFFER_SIZE   = 80    # Longueur maxi d'une ligne apres suppression des espaces et commentaires
+GRBL_MAX_TOOL_NUMBER    = 255   # Numero d'outil (T) maxi accepte par Grbl
+GCODE_CHECK_MAX_ISSUES  = 1000  # Erreurs conservees par la verification hors ligne d'un programme (gcodeChecker)
+GCODE_CHECK_MAX_LOGGED  = 20    # Erreurs de la verification affichees dans le journal
+# Parametres par defaut de Grbl 1.1f (defaults.h, DEFAULTS_GENERIC) hors parametres des axes
+GRBL_DEFAULT_SETTINGS = {
+  0: 10, 1: 25, 2: 0, 3: 0, 4: 0, 5: 0, 6: 0,
+  10: 1, 11: 0.010, 12: 0.002, 13: 0,
+  20: 0, 21: 0, 22: 0, 23: 0, 24: 25.0, 25: 500.0, 26: 250, 27: 1.0,
+  30: 1000, 31: 0, 32: 0
+}
+# Parametres des axes : $100+n (steps/mm), $110+n (mm/min), $120+n (mm/s^2), $130+n (course maxi, mm)
+GRBL_DEFAULT_AXIS_SETTINGS = {100: 250.0, 110: 500.0, 120: 10.0, 130: 200.0}
 
 ''' qtabMain indexes '''
 CN5X_TAB_MAIN     = 0
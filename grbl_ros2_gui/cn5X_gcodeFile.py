@@ -21,15 +21,21 @@
 '                                                                         '
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-import os, sys
+import os, sys, time
 from datetime import datetime
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt, QCoreApplication, QObject, pyqtSignal, pyqtSlot, QModelIndex, QItemSelectionModel
-from PyQt5.QtGui import QKeySequence, QStandardItemModel, QStandardItem
+from PyQt5.QtGui import QKeySequence
 from PyQt5.QtWidgets import QListView
 from .cn5X_config import *
 from .msgbox import *
 from .grblCom import grblCom
+from .cn5X_gcodeModel import gcodeListModel
+from .gcodeModal import gcodeModalState, gcodeModalIndex, gcodeModalIndexer
+from .gcodePreprocess import gcodePreprocessor
+from .gcodeCheck import gcodeChecker, gcodeCheckThread
+from .gcodeEstimate import gcodeEstimator, gcodeEstimateThread
+from .grblError import grblError
 
 
 class gcodeFile(QObject):
@@ -44,20 +50,52 @@ class gcodeFile(QObject):
   - closeFile()           -> Vide la QListView
   - setGcodeChanged(bool) -> Definit si le contenu de la liste a ete modifie depuis la lecture ou l'enregistrement du fichier
   - bool = gcodeChanged() -> Renvoi vrai si le contenu de la liste a ete modifie depuis la lecture ou l'enregistrement du fichier
+  - modalStateAt(num)     -> Etat modal GCode etabli par les lignes precedant la ligne num (reprise en cours de programme)
+  - setPreprocess(bool)   -> Compactage des lignes envoyees a Grbl (gcodePreprocessor)
+  - streamComment(num)    -> Commentaire precedant la ligne num, retire des lignes envoyees par le preprocesseur
+  - setCheckerFactory(fn) -> Fonction renvoyant le gcodeChecker de la verification hors ligne des programmes
+  - checkIssues()         -> Erreurs relevees par la verification hors ligne, None si elle n'est pas terminee
+  - setEstimatorFactory(fn) -> Fonction renvoyant le gcodeEstimator de l'estimation de la duree des programmes
+  - remainingTime(num)    -> Duree estimee (s) du programme a partir de la ligne num, None si l'estimation n'est pas terminee
   '''
 
-  sig_log     = pyqtSignal(int, str) # Message de fonctionnement du composant
+  sig_log        = pyqtSignal(int, str) # Message de fonctionnement du composant
+  sig_fileLoaded = pyqtSignal()         # Fin de l'indexation du fichier en tache de fond
+  sig_toolpath   = pyqtSignal(object, object) # Trajectoire XYZ (mm, repere de travail) et deplacements rapides du programme estime
 
   def __init__(self, ui, gcodeFileUi: QListView):
     super().__init__()
     self.__filePath         = ""
     self.__ui               = ui
     self.__gcodeFileUi      = gcodeFileUi
-    self.__gcodeFileUiModel = QStandardItemModel(self.__gcodeFileUi)
-    self.__gcodeFileUiModel.itemChanged.connect(self.on_gcodeChanged)
+    self.__gcodeFileUiModel = gcodeListModel(self.__gcodeFileUi)
+    self.__gcodeFileUiModel.dataChanged.connect(self.on_gcodeChanged)
+    self.__gcodeFileUiModel.sig_loaded.connect(self.on_gcodeLoaded)
+    self.__gcodeFileUiModel.rowsInserted.connect(self.on_gcodeRowsChanged)
+    self.__gcodeFileUiModel.rowsRemoved.connect(self.on_gcodeRowsChanged)
+    # Toutes les lignes ont la meme hauteur, la vue n'a pas besoin de les mesurer une a une
+    self.__gcodeFileUi.setUniformItemSizes(True)
+    self.__gcodeFileUi.setModel(self.__gcodeFileUiModel)
 
     self.__gcodeCharge      = False
     self.__gcodeChanged     = False
+    self.__modalIndex       = None # Index de l'etat modal du programme (gcodeModalIndex), construit en tache de fond
+    self.__modalIndexer     = None
+    self.__checkerFactory   = gcodeChecker # Verification sans les limites de la machine tant que Grbl ne les a pas donnees
+    self.__checkThread      = None
+    self.__checker          = None # gcodeChecker de la derniere verification terminee
+    self.__estimatorFactory = gcodeEstimator # Parametres par defaut de Grbl tant qu'il ne les a pas donnes
+    self.__estimateThread   = None
+    self.__estimator        = None # gcodeEstimator de la derniere estimation terminee
+    self.__preprocess       = False
+    self.__streamComments   = {} # N° de ligne envoyee -> commentaire seul sur une ligne precedente (lignes non envoyees)
+
+    # Regroupement des modifications du programme : les passes sur tout le fichier (index de l'etat modal,
+    # verification, estimation) ne sont relancees qu'apres GCODE_EDIT_DELAY sans nouvelle modification
+    self.__editTimer = QtCore.QTimer()
+    self.__editTimer.setSingleShot(True)
+    self.__editTimer.setInterval(GCODE_EDIT_DELAY)
+    self.__editTimer.timeout.connect(self.__startModalIndexer)
 
 
   def showFileOpen(self):
@@ -69,16 +107,11 @@ class gcodeFile(QObject):
   def readFile(self, filePath: str):
     self.sig_log.emit(logSeverity.info.value, self.tr("Reading file: {}").format(filePath))
     try:
-      f = open(filePath,'r')
-      lignes  = f.readlines()
-      f.close()
-      self.sig_log.emit(logSeverity.info.value, self.tr("{} lines in the file").format(len(lignes)))
-      # Envoi du contenu dans la liste
-      self.__gcodeFileUiModel.clear()
-      for l in lignes:
-        item = QStandardItem(l.strip())
-        self.__gcodeFileUiModel.appendRow(item)
-      self.__gcodeFileUi.setModel(self.__gcodeFileUiModel)
+      # Les lignes sont indexees en tache de fond, les premieres sont disponibles immediatement
+      self.__gcodeCharge = False
+      self.__filePath    = filePath
+      self.__stopModalIndexer()
+      self.__gcodeFileUiModel.openFile(filePath)
       # Selectionne la premiere ligne du fichier dans la liste
       self.selectGCodeFileLine(0)
       # Selectionne l'onglet du fichier
@@ -91,12 +124,186 @@ class gcodeFile(QObject):
       return False
 
     # Pas d'erreur
-    self.__gcodeCharge = True
-    self.__filePath     = filePath
     self.__gcodeChanged = False
     return True
 
 
+  @pyqtSlot(int)
+  def on_gcodeLoaded(self, nbLignes: int):
+    ''' Fin de l'indexation du fichier '''
+    self.sig_log.emit(logSeverity.info.value, self.tr("{} lines in the file").format(nbLignes))
+    self.__gcodeCharge = True
+    self.sig_fileLoaded.emit()
+    self.__startModalIndexer()
+
+
+  def __startModalIndexer(self):
+    ''' (Re)construit en tache de fond l'index de l'etat modal du programme, le verifie et estime sa duree '''
+    self.__stopModalIndexer()
+    self.__startCheck()
+    self.__startEstimate()
+    self.__modalIndexTime = time.perf_counter()
+    self.__modalIndexer = gcodeModalIndexer(self.__gcodeFileUiModel.lines())
+    self.__modalIndexer.sig_finished.connect(self.on_modalIndexFinished)
+    self.__modalIndexer.start()
+
+
+  def __stopModalIndexer(self):
+    ''' Arrete l'indexation en cours et oublie l'index (le programme est modifie ou ferme) '''
+    self.__editTimer.stop()
+    self.__modalIndex = None
+    if self.__modalIndexer is not None:
+      self.__modalIndexer.abort()
+      self.__modalIndexer.wait()
+      self.__modalIndexer = None
+    self.__stopCheck()
+    self.__stopEstimate()
+
+
+  def __restartModalIndexer(self):
+    ''' Programme modifie : oublie les resultats en cours et relance les passes apres GCODE_EDIT_DELAY sans autre modification '''
+    self.__stopModalIndexer()
+    self.__editTimer.start()
+
+
+  def __startCheck(self):
+    ''' Verification hors ligne du programme en tache de fond (gcodeChecker) '''
+    self.__stopCheck()
+    self.__checkTime = time.perf_counter()
+    self.__checkThread = gcodeCheckThread(self.__gcodeFileUiModel.lines(), self.__checkerFactory())
+    self.__checkThread.sig_finished.connect(self.on_checkFinished)
+    self.__checkThread.start()
+
+
+  def __stopCheck(self):
+    self.__checker = None
+    if self.__checkThread is not None:
+      self.__checkThread.abort()
+      self.__checkThread.wait()
+      self.__checkThread = None
+
+
+  def __startEstimate(self):
+    ''' Estimation de la duree du programme en tache de fond (gcodeEstimator) '''
+    self.__stopEstimate()
+    self.__estimateTime = time.perf_counter()
+    # Fichier non modifie : estimation sur ses colonnes (gcodeColumns) et leur cache
+    filePath = self.__filePath if self.__filePath != "" and not self.__gcodeFileUiModel.isModified() else None
+    self.__estimateThread = gcodeEstimateThread(self.__gcodeFileUiModel.lines(), self.__estimatorFactory(), filePath)
+    self.__estimateThread.sig_finished.connect(self.on_estimateFinished)
+    self.__estimateThread.start()
+
+
+  def __stopEstimate(self):
+    self.__estimator = None
+    if self.__estimateThread is not None:
+      self.__estimateThread.abort()
+      self.__estimateThread.wait()
+      self.__estimateThread = None
+
+
+  @pyqtSlot(object)
+  def on_modalIndexFinished(self, index: gcodeModalIndex):
+    if self.sender() is self.__modalIndexer:
+      self.__modalIndexer.wait()
+      self.__modalIndexer = None
+      self.__modalIndex = index
+      self.sig_log.emit(logSeverity.info.value, self.tr("GCode modal state indexed in {:0.3f} s ({} checkpoints).").format(time.perf_counter() - self.__modalIndexTime, index.checkpointCount()))
+
+
+  @pyqtSlot(object)
+  def on_checkFinished(self, checker: gcodeChecker):
+    if self.sender() is self.__checkThread:
+      self.__checkThread.wait()
+      self.__checkThread = None
+      self.__checker = checker
+      duree = time.perf_counter() - self.__checkTime
+      if checker.issueCount() == 0:
+        self.sig_log.emit(logSeverity.info.value, self.tr("GCode checked in {:0.3f} s ({:0.0f} lines/s): no error.").format(duree, checker.lineCount() / max(duree, 1e-6)))
+        return
+      self.sig_log.emit(logSeverity.warning.value, self.tr("GCode checked in {:0.3f} s: {} error(s) found.").format(duree, checker.issueCount()))
+      for row, code, detail in checker.issues()[:GCODE_CHECK_MAX_LOGGED]:
+        if code == "ALARM:2":
+          texte = self.tr("Soft limit")
+        else:
+          texte = grblError[int(code.split(':')[1])][1]
+        self.sig_log.emit(logSeverity.warning.value, self.tr("Line {}: {} {} ({})").format(row + 1, code, texte, detail))
+
+
+  @pyqtSlot(object)
+  def on_estimateFinished(self, estimator: gcodeEstimator):
+    if self.sender() is self.__estimateThread:
+      self.__estimateThread.wait()
+      self.__estimateThread = None
+      self.__estimator = estimator
+      hours, remainder = divmod(int(round(estimator.totalTime())), 60*60)
+      minutes, seconds = divmod(remainder, 60)
+      self.sig_log.emit(logSeverity.info.value, self.tr("Estimated GCode duration: {:02d}:{:02d}:{:02d} ({} blocks, computed in {:0.3f} s).").format(hours, minutes, seconds, estimator.blockCount(), time.perf_counter() - self.__estimateTime))
+      self.sig_toolpath.emit(*estimator.toolpath("XYZ"))
+      box = estimator.boundingBox()
+      if box is not None:
+        self.sig_log.emit(logSeverity.info.value, self.tr("GCode travel (machine coordinates): from {} to {}.").format(" ".join("{:0.3f}".format(v) for v in box[0]), " ".join("{:0.3f}".format(v) for v in box[1])))
+
+
+  def setCheckerFactory(self, factory):
+    ''' factory() renvoie le gcodeChecker (axes, limites, decalages de la machine) utilise pour les verifications suivantes '''
+    self.__checkerFactory = factory
+    if self.__gcodeCharge:
+      self.__startCheck()
+
+
+  def checkIssues(self):
+    ''' Erreurs (N° de ligne, code, detail) relevees par la verification hors ligne, None si elle est en cours '''
+    if self.__checker is None:
+      return None
+    return self.__checker.issues()
+
+
+  def setEstimatorFactory(self, factory):
+    ''' factory() renvoie le gcodeEstimator (axes, parametres, decalages de la machine) utilise pour les estimations suivantes '''
+    self.__estimatorFactory = factory
+    if self.__gcodeCharge:
+      self.__startEstimate()
+
+
+  def remainingTime(self, num: int):
+    ''' Duree estimee (s) de l'execution du programme a partir de la ligne num, None si l'estimation est en cours '''
+    if self.__estimator is None:
+      return None
+    return self.__estimator.remainingTime(num)
+
+
+  @pyqtSlot(QModelIndex, int, int)
+  def on_gcodeRowsChanged(self, parent, first, last):
+    # Les lignes ajoutees pendant le chargement sont prises en compte a la fin de celui-ci (on_gcodeLoaded())
+    if self.__gcodeCharge:
+      self.__restartModalIndexer()
+
+
+  def modalStateAt(self, num: int):
+    '''
+    Renvoie l'etat modal GCode (gcodeModalState) etabli par les lignes precedant la ligne num.
+    A partir de l'index : au plus GCODE_MODAL_CHECKPOINT lignes relues. Index en cours de construction : attente
+    du seul point de reprise necessaire. Relecture du debut du programme seulement pendant le chargement du fichier.
+    '''
+    if self.__modalIndex is not None:
+      return self.__modalIndex.stateAt(num, self.__gcodeFileUiModel.lines)
+    if self.__editTimer.isActive():
+      # Modification recente : pas la peine d'attendre la fin de GCODE_EDIT_DELAY
+      self.__startModalIndexer()
+    if self.__modalIndexer is not None:
+      index = self.__modalIndexer.index()
+      while not index.covers(num) and not self.__modalIndexer.wait(GCODE_MODAL_WAIT_STEP):
+        pass
+      if index.covers(num):
+        return index.stateAt(num, self.__gcodeFileUiModel.lines)
+    state = gcodeModalState()
+    if num > 0:
+      for ligne in self.__gcodeFileUiModel.lines(0, num - 1):
+        state.update(ligne)
+    return state
+
+
   def isFileLoaded(self):
     return self.__gcodeCharge
 
@@ -148,41 +355,81 @@ class gcodeFile(QObject):
         filePath = self.__filePath
     self.sig_log.emit(logSeverity.info.value, self.tr("Saving file: {}").format(filePath))
     try:
-      f = open(filePath, 'w')
-      for I in range(self.__gcodeFileUiModel.rowCount()):
-        idx = self.__gcodeFileUiModel.index( I, 0, QModelIndex())
-        if self.__gcodeFileUiModel.data(idx) != "":
-          f.write(self.__gcodeFileUiModel.data(idx) + '\n')
-      f.close()
-      self.__filePath = filePath
+      self.__gcodeFileUiModel.saveFile(filePath)
     except Exception as e:
       self.sig_log.emit(logSeverity.error.value, self.tr("Save file error: {}").format(filePath))
       self.sig_log.emit(logSeverity.error.value, str(e))
-    # Supprime les lignes vides dans la grille d'affichage
-    self.delEmptyRow()
-    # Reinit du flag fichier change
-    self.__gcodeChanged = False
-
-
-  def enQueue(self, com: grblCom, startLine: int = 0, endLine: int = -1):
-    """ Envoi des lignes de startLine a endLine dans la file d'attente du grblCom """
-
-    # Force le curseur souris sablier
-    QtWidgets.QApplication.setOverrideCursor(Qt.WaitCursor)
-    
-    if endLine == -1:
-      endLine = self.__gcodeFileUiModel.rowCount()
-
-    for I in range(startLine, endLine + 1):
-      idx = self.__gcodeFileUiModel.index( I, 0, QModelIndex())
-      if self.__gcodeFileUiModel.data(idx) != "":
-        gcodeLine = self.__gcodeFileUiModel.data(idx)
-        if gcodeLine is not None:
-          com.gcodePush(gcodeLine)
-          com.gcodePush(CMD_GRBL_GET_GCODE_STATE, COM_FLAG_NO_OK)
-
-    # Restore le curseur souris sablier en fin d'initialisation
-    QtWidgets.QApplication.restoreOverrideCursor()
+      return
+    # Relecture du fichier enregistre (sans les lignes vides) pour que la liste lui corresponde
+    ligne = self.__gcodeFileUi.selectionModel().currentIndex().row()
+    self.readFile(filePath)
+    if ligne > 0 and ligne < self.__gcodeFileUiModel.rowCount():
+      self.selectGCodeFileLine(ligne)
+
+
+  def setPreprocess(self, preprocess: bool):
+    ''' Active le compactage (commentaires, espaces, mots modaux redondants, decimales) des lignes envoyees '''
+    self.__preprocess = preprocess
+
+
+  def preprocess(self):
+    return self.__preprocess
+
+
+  def streamComment(self, num: int):
+    ''' Renvoie (et oublie) le commentaire seul sur une ligne precedant la ligne envoyee num, ou None '''
+    return self.__streamComments.pop(num, None)
+
+
+  def enQueue(self, com: grblCom, startLine: int = 0, endLine: int = -1, resume: bool = False):
+    """
+    Envoi des lignes de startLine a endLine dans la file d'attente du grblCom
+    resume = True : reprise en cours de programme, l'etat modal etabli par les lignes precedentes est envoye d'abord
+    """
+    state = None
+    if resume and startLine > 0:
+      state = self.modalStateAt(startLine)
+      self.sig_log.emit(logSeverity.info.value, self.tr("Resuming at line {}, modal state: {}").format(startLine + 1, " ".join(state.preamble())))
+    # Le thread de communication lira les lignes au fur et a mesure de l'envoi
+    source = self.__linesSource(self.__gcodeFileUiModel.lines(startLine, endLine), startLine, state)
+    if self.__preprocess:
+      self.__streamComments = {}
+      source = self.__preprocessedSource(source, gcodePreprocessor())
+    com.gcodeSource(source)
+
+
+  def __preprocessedSource(self, source, preprocessor: gcodePreprocessor):
+    """ Compacte les lignes de source, execute dans le thread de communication """
+    commentaire = None
+    for gcodeLine, flag, row in source:
+      ligne, texte = preprocessor.process(gcodeLine)
+      if texte is not None:
+        commentaire = texte
+      if ligne != "":
+        if commentaire is not None:
+          self.__streamComments[row] = commentaire
+          commentaire = None
+        yield (ligne, flag, row)
+    if preprocessor.bytesIn > 0:
+      self.sig_log.emit(logSeverity.info.value, self.tr("GCode preprocessor: {} lines sent out of {}, {} bytes saved out of {} ({:0.1f} %).").format(
+        preprocessor.linesOut, preprocessor.linesIn, preprocessor.bytesSaved(), preprocessor.bytesIn, 100 * preprocessor.bytesSaved() / preprocessor.bytesIn
+      ))
+
+
+  @staticmethod
+  def __linesSource(lignes, startLine: int, state: gcodeModalState = None):
+    """ Generateur des triplets (ligne, flag, N° de ligne) a envoyer pour chaque ligne GCode non vide """
+    # L'etat modal ($G) est relu par le pooling de grblComSerial quand les lignes envoyees le modifient
+    if state is not None:
+      for gcodeLine in state.preamble():
+        yield (gcodeLine, COM_FLAG_NO_FLAG, COM_NO_ROW)
+    for row, gcodeLine in enumerate(lignes, startLine):
+      if gcodeLine != "":
+        if state is not None:
+          gcodeLine, retabli = state.resumeLine(gcodeLine)
+          if retabli:
+            state = None
+        yield (gcodeLine, COM_FLAG_NO_FLAG, row)
 
 
   def delEmptyRow(self):
@@ -200,13 +447,11 @@ class gcodeFile(QObject):
 
 
   def insertGCodeFileLine(self, num: int):
-    item = QStandardItem("")
-    self.__gcodeFileUiModel.insertRow(num, item)
+    self.__gcodeFileUiModel.insertRow(num)
 
 
   def addGCodeFileLine(self, num: int):
-    item = QStandardItem("")
-    self.__gcodeFileUiModel.insertRow(num+1, item)
+    self.__gcodeFileUiModel.insertRow(num+1)
 
 
   def showConfirmChangeLost(self):
@@ -238,6 +483,7 @@ class gcodeFile(QObject):
         return True
       elif Ret == msgButtonList.Discard:
         # Fermer le fichier consiste en vider la fenetre GCode
+        self.__stopModalIndexer()
         self.__gcodeFileUiModel.clear()
         self.__gcodeChanged = False
         self.__gcodeCharge  =False
@@ -248,15 +494,18 @@ class gcodeFile(QObject):
       # GCode non modifie, on ferme sans confirmation
       # Fermer le fichier consiste en vider la fenetre GCode
       # et a supprimer le status GCode charge.
+      self.__stopModalIndexer()
       self.__gcodeFileUiModel.clear()
       self.__gcodeChanged = False
       self.__gcodeCharge  =False
       return True
 
 
-  @pyqtSlot("QStandardItem*")
-  def on_gcodeChanged(self, item):
+  @pyqtSlot(QModelIndex, QModelIndex, "QVector<int>")
+  def on_gcodeChanged(self, topLeft, bottomRight, roles):
     self.__gcodeChanged = True
+    if self.__gcodeCharge:
+      self.__restartModalIndexer()
 
 
   def gcodeChanged(self):
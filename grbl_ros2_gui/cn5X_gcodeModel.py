@@ -0,0 +1,288 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import os, mmap, tempfile
+from array import array
+import numpy as np
+from PyQt5.QtCore import Qt, QThread, QAbstractListModel, QModelIndex, pyqtSignal, pyqtSlot
+from .cn5X_config import *
+
+
+class gcodeIndexer(QThread):
+  '''
+  Thread d'indexation des lignes d'un fichier GCode mappe en memoire.
+  Emet par blocs les positions (octets) de debut des lignes trouvees a partir de la position start.
+  '''
+
+  sig_offsets  = pyqtSignal(object) # array('Q') des debuts de lignes du bloc
+  sig_finished = pyqtSignal()
+
+  def __init__(self, fileMap: mmap.mmap, start: int):
+    super().__init__()
+    self.__mmap  = fileMap
+    self.__start = start
+    self.__abort = False
+
+
+  def abort(self):
+    self.__abort = True
+
+
+  @staticmethod
+  def indexBlock(fileMap: mmap.mmap, start: int, end: int):
+    ''' Renvoie un array('Q') des debuts de lignes (position suivant chaque '\\n') entre start et end '''
+    buff = np.frombuffer(fileMap, dtype=np.uint8, count=end - start, offset=start)
+    debuts = np.flatnonzero(buff == 10)
+    del buff # Libere la reference sur le mmap (sinon, il ne pourra pas etre ferme)
+    debuts += start + 1
+    offsets = array('Q')
+    offsets.frombytes(debuts.astype(np.uint64).tobytes())
+    return offsets
+
+
+  def run(self):
+    pos  = self.__start
+    size = len(self.__mmap)
+    while pos < size and not self.__abort:
+      end = min(pos + GCODE_INDEX_BLOCK_SIZE, size)
+      self.sig_offsets.emit(gcodeIndexer.indexBlock(self.__mmap, pos, end))
+      pos = end
+    if not self.__abort:
+      self.sig_finished.emit()
+
+
+class gcodeListModel(QAbstractListModel):
+  '''
+  Modele de la liste GCode adosse au fichier mappe en memoire.
+  Seules les positions des debuts de lignes sont conservees (array de uint64 construit en tache de fond),
+  le texte d'une ligne n'est decode que lorsque la vue le demande.
+  Les lignes modifiees ou inserees sont conservees a part (overlay) jusqu'a l'enregistrement.
+  Methodes :
+  - openFile(filePath)        -> Mappe le fichier et lance l'indexation des lignes
+  - clear()                   -> Vide le modele et libere le fichier
+  - saveFile(filePath)        -> Enregistre le contenu du modele (ecriture en flux dans un fichier temporaire puis remplacement)
+  - isLoading()               -> Vrai tant que l'indexation du fichier n'est pas terminee
+  - lines(first, last)        -> Generateur des lignes first a last (inclus), utilisable depuis un autre thread
+  '''
+
+  sig_loaded = pyqtSignal(int) # Fin de l'indexation, nombre de lignes du fichier
+
+  def __init__(self, parent=None):
+    super().__init__(parent)
+    self.__file    = None
+    self.__mmap    = None
+    self.__size    = 0
+    self.__indexer = None
+    self.__offsets = array('Q') # Debuts des lignes du fichier, la derniere valeur est la fin de la derniere ligne connue
+    self.__rows    = array('q') # Pour chaque ligne du modele : N° de ligne dans le fichier si >= 0, -(indice dans overlay + 1) sinon
+    self.__overlay = []         # Texte des lignes modifiees ou inserees
+
+
+  def openFile(self, filePath: str):
+    ''' Mappe le fichier en memoire, indexe les premieres lignes et lance l'indexation du reste en tache de fond '''
+    self.clear()
+    f = open(filePath, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+      # Un fichier vide ne peut pas etre mappe
+      f.close()
+      self.sig_loaded.emit(0)
+      return
+    self.__file = f
+    self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.__size = size
+    self.__offsets.append(0)
+    end = min(GCODE_INDEX_FIRST_BLOCK, size)
+    self.__appendOffsets(gcodeIndexer.indexBlock(self.__mmap, 0, end))
+    if end < size:
+      self.__indexer = gcodeIndexer(self.__mmap, end)
+      self.__indexer.sig_offsets.connect(self.on_indexerOffsets)
+      self.__indexer.sig_finished.connect(self.on_indexerFinished)
+      self.__indexer.start()
+    else:
+      self.__endOfIndex()
+
+
+  def clear(self):
+    ''' Vide le modele et ferme le fichier '''
+    self.beginResetModel()
+    self.__stopIndexer()
+    if self.__mmap is not None:
+      self.__mmap.close()
+      self.__mmap = None
+    if self.__file is not None:
+      self.__file.close()
+      self.__file = None
+    self.__size    = 0
+    self.__offsets = array('Q')
+    self.__rows    = array('q')
+    self.__overlay = []
+    self.endResetModel()
+
+
+  def isLoading(self):
+    return self.__indexer is not None
+
+
+  def isModified(self):
+    ''' Vrai si des lignes ont ete modifiees, inserees ou supprimees depuis l'ouverture du fichier '''
+    return len(self.__overlay) > 0 or len(self.__rows) != len(self.__offsets) - 1
+
+
+  def __stopIndexer(self):
+    if self.__indexer is not None:
+      self.__indexer.abort()
+      self.__indexer.wait()
+      self.__indexer = None
+
+
+  def __appendOffsets(self, offsets: array):
+    ''' Ajoute en fin de modele les lignes dont la fin est maintenant connue '''
+    first = len(self.__offsets) - 1
+    count = len(offsets)
+    if count == 0:
+      return
+    self.beginInsertRows(QModelIndex(), len(self.__rows), len(self.__rows) + count - 1)
+    self.__offsets.extend(offsets)
+    self.__rows.frombytes(np.arange(first, first + count, dtype=np.int64).tobytes())
+    self.endInsertRows()
+
+
+  def __endOfIndex(self):
+    # La derniere ligne peut ne pas se terminer par un retour chariot
+    if self.__offsets[-1] != self.__size:
+      self.__appendOffsets(array('Q', [self.__size]))
+    self.sig_loaded.emit(len(self.__offsets) - 1)
+
+
+  @pyqtSlot(object)
+  def on_indexerOffsets(self, offsets: array):
+    if self.sender() is self.__indexer:
+      self.__appendOffsets(offsets)
+
+
+  @pyqtSlot()
+  def on_indexerFinished(self):
+    if self.sender() is self.__indexer:
+      self.__indexer.wait()
+      self.__indexer = None
+      self.__endOfIndex()
+
+
+  @staticmethod
+  def __rowText(fileMap, offsets, overlay, rowValue: int):
+    if rowValue < 0:
+      return overlay[-rowValue - 1]
+    return fileMap[offsets[rowValue]:offsets[rowValue + 1]].decode('utf-8', 'replace').strip()
+
+
+  def rowCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(self.__rows)
+
+
+  def data(self, index, role=Qt.DisplayRole):
+    if not index.isValid() or index.row() >= len(self.__rows):
+      return None
+    if role in (Qt.DisplayRole, Qt.EditRole):
+      return gcodeListModel.__rowText(self.__mmap, self.__offsets, self.__overlay, self.__rows[index.row()])
+    return None
+
+
+  def flags(self, index):
+    if not index.isValid():
+      return Qt.NoItemFlags
+    return Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsEditable
+
+
+  def setData(self, index, value, role=Qt.EditRole):
+    if not index.isValid() or role != Qt.EditRole:
+      return False
+    self.__overlay.append(str(value).strip())
+    self.__rows[index.row()] = -len(self.__overlay)
+    self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+    return True
+
+
+  def insertRows(self, row: int, count: int, parent=QModelIndex()):
+    if parent.isValid() or row < 0 or row > len(self.__rows):
+      return False
+    self.beginInsertRows(QModelIndex(), row, row + count - 1)
+    for I in range(count):
+      self.__overlay.append("")
+      self.__rows.insert(row + I, -len(self.__overlay))
+    self.endInsertRows()
+    return True
+
+
+  def removeRows(self, row: int, count: int, parent=QModelIndex()):
+    if parent.isValid() or row < 0 or row + count > len(self.__rows):
+      return False
+    self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+    del self.__rows[row:row + count]
+    self.endRemoveRows()
+    return True
+
+
+  def lines(self, first: int = 0, last: int = -1):
+    '''
+    Generateur des lignes first a last (inclus, -1 = jusqu'a la fin).
+    Les N° de lignes sont figes a l'appel, le texte n'est lu qu'au fur et a mesure de l'iteration.
+    '''
+    if last == -1:
+      last = len(self.__rows) - 1
+    rows    = self.__rows[first:last + 1]
+    overlay = list(self.__overlay)
+    return gcodeListModel.__iterLines(self.__mmap, self.__offsets, overlay, rows)
+
+
+  @staticmethod
+  def __iterLines(fileMap, offsets, overlay, rows):
+    for rowValue in rows:
+      yield gcodeListModel.__rowText(fileMap, offsets, overlay, rowValue)
+
+
+  def saveFile(self, filePath: str):
+    '''
+    Enregistre les lignes non vides du modele.
+    L'ecriture se fait en flux dans un fichier temporaire du meme repertoire qui remplace ensuite le fichier.
+    '''
+    dirName = os.path.dirname(os.path.abspath(filePath))
+    fd, tmpPath = tempfile.mkstemp(prefix='.' + os.path.basename(filePath) + '.', dir=dirName)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        for rowValue in self.__rows:
+          if rowValue < 0:
+            ligne = self.__overlay[-rowValue - 1].encode('utf-8')
+          else:
+            ligne = self.__mmap[self.__offsets[rowValue]:self.__offsets[rowValue + 1]].strip()
+          if ligne != b"":
+            f.write(ligne + b'\n')
+      if os.path.exists(filePath):
+        os.chmod(tmpPath, os.stat(filePath).st_mode & 0o7777)
+      os.replace(tmpPath, filePath)
+    except Exception:
+      if os.path.exists(tmpPath):
+        os.remove(tmpPath)
+      raise
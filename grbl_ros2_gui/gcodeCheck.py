@@ -0,0 +1,466 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import re, math
+from PyQt5.QtCore import QThread, pyqtSignal
+from .cn5X_config import *
+
+CHECK_CLEAN   = re.compile(r'\([^)]*\)|;.*|\s')
+CHECK_WORDS   = re.compile(r'([A-Z])([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))')
+CHECK_SYNTAX  = re.compile(r'(?:[A-Z][-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))+')
+CHECK_LETTER  = re.compile(r'[A-Z][^A-Z]*')
+CHECK_NUMBER  = r'([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))'
+CHECK_AXIS_COMMANDS = (10, 28, 30, 92) # G non modaux utilisant les mots d'axes
+CHECK_PLANES  = {17: ('X', 'Y', 'I', 'J'), 18: ('Z', 'X', 'K', 'I'), 19: ('Y', 'Z', 'J', 'K')}
+CHECK_G_CACHE = {} # Texte du nombre d'un mot G -> (code, groupe modal)
+
+
+def gcodeGroup(txt: str):
+  ''' (code, groupe modal ou None) du mot G de valeur txt, les memes quelques textes reviennent sur toutes les lignes '''
+  try:
+    return CHECK_G_CACHE[txt]
+  except KeyError:
+    code = round(float(txt), 1)
+    if code == int(code):
+      code = int(code)
+    resultat = (code, GRBL_G_GROUPS.get(code))
+    if len(CHECK_G_CACHE) < 1000:
+      CHECK_G_CACHE[txt] = resultat
+    return resultat
+
+
+class gcodeChecker():
+  '''
+  Verification hors ligne d'un programme GCode, sans Grbl et sans attendre la vitesse du port serie
+  (mode controle $C) : les lignes sont analysees comme le fait le parser de Grbl 1.1 (groupes modaux
+  GRBL_G_GROUPS et GRBL_M_GROUPS, mots autorises, valeurs requises, arcs) et les erreurs
+  sont relevees avec les codes error:X que Grbl renverrait. Les cibles des mouvements
+  (extremites et etendue des arcs) sont comparees aux limites logicielles, l'espace machine de Grbl
+  allant de -$13x a 0 pour chaque axe : les depassements sont releves avec le code ALARM:2.
+  Comme Grbl, une ligne en erreur ne modifie pas l'etat modal ; au contraire de Grbl, la verification
+  continue apres une erreur ou une alarme.
+  La position n'est connue sur un axe qu'apres un deplacement absolu de cet axe (ou a partir de mpos) :
+  les limites ne sont verifiees que sur les axes de position connue.
+  '''
+
+  def __init__(self, axisNames = DEFAULT_AXIS_NAMES, maxTravel = None, offsets: dict = None, mpos = None):
+    '''
+    axisNames : lettres des axes de la machine
+    maxTravel : courses maxi des axes ($130 a $13x, mm), None pour ne pas verifier les limites logicielles
+    offsets   : decalages connus de Grbl, en coordonnees machine (mm) : { 54 a 59, 92 : decalages, 28, 30 : positions }
+    mpos      : position machine de depart, None si inconnue
+    '''
+    self.__axisNames = "".join(axisNames)
+    self.__nbAxis    = len(self.__axisNames)
+    self.__maxTravel = list(maxTravel) if maxTravel is not None else None
+    offsets = offsets or {}
+    zero = [0.0] * self.__nbAxis
+    self.__coords = [list(offsets.get(n, zero))[:self.__nbAxis] for n in range(54, 60)]
+    self.__g92    = list(offsets.get(92, zero))[:self.__nbAxis]
+    self.__g28    = list(offsets.get(28, zero))[:self.__nbAxis]
+    self.__g30    = list(offsets.get(30, zero))[:self.__nbAxis]
+    self.__pos    = list(mpos)[:self.__nbAxis] if mpos is not None else [None] * self.__nbAxis
+    # Lignes les plus frequentes (G0/G1 facultatif, mots d'axes dans l'ordre, F facultatif) : traitement direct
+    self.__fastLine = re.compile(r'(?:G0*([01]))?' + ''.join('(?:{}{})?'.format(L, CHECK_NUMBER) for L in self.__axisNames) + '(?:F' + CHECK_NUMBER + ')?').fullmatch
+    self.__wco    = None
+    self.__resetModal()
+    self.__issues     = []
+    self.__issueCount = 0
+    self.__lineCount  = 0
+
+
+  def __resetModal(self):
+    ''' Etat modal de Grbl a la mise sous tension et apres M2/M30 '''
+    self.__motion   = 0
+    self.__plane    = 17
+    self.__units    = 21
+    self.__distance = 90
+    self.__feedMode = 94
+    self.__coord    = 0
+    self.__feed     = 0.0
+    self.__wco      = None
+
+
+  def issues(self):
+    ''' Liste des (N° de ligne, code Grbl "error:X" ou "ALARM:2", detail) relevees, GCODE_CHECK_MAX_ISSUES au plus '''
+    return self.__issues
+
+
+  def issueCount(self):
+    ''' Nombre total d'erreurs relevees (y compris au dela de GCODE_CHECK_MAX_ISSUES) '''
+    return self.__issueCount
+
+
+  def lineCount(self):
+    return self.__lineCount
+
+
+  def check(self, lines, abort = None, firstRow: int = 0):
+    ''' Verifie les lignes (iterable), renvoie False si abort() a interrompu la verification '''
+    checkLine = self.checkLine
+    row = firstRow - 1
+    for row, line in enumerate(lines, firstRow):
+      if row & 0x3fff == 0 and abort is not None and abort():
+        return False
+      checkLine(line, row)
+    self.__lineCount = row + 1 - firstRow
+    return True
+
+
+  def __issue(self, row: int, code: str, detail: str):
+    self.__issueCount += 1
+    if len(self.__issues) < GCODE_CHECK_MAX_ISSUES:
+      self.__issues.append((row, code, detail))
+
+
+  def checkLine(self, line: str, row: int):
+    ''' Verifie une ligne et applique son effet a l'etat modal et a la position '''
+    if '(' in line or ';' in line or '\t' in line:
+      ligne = CHECK_CLEAN.sub('', line).upper()
+    else:
+      ligne = line.replace(' ', '').upper()
+    if ligne == "" or ligne[0] == '%':
+      # Ligne vide, commentaire ou delimiteur de programme
+      return
+    if ligne[0] == '$':
+      if ligne == CMD_GRBL_RUN_HOME_CYCLE:
+        # Apres la prise d'origine, la machine est a son origine
+        self.__pos = [0.0] * self.__nbAxis
+      return
+    if len(ligne) >= GRBL_LINE_BUFFER_SIZE:
+      self.__issue(row, "error:11", ligne[:GRBL_LINE_BUFFER_SIZE] + "...")
+      return
+    m = self.__fastLine(ligne)
+    if m is not None and self.__fastMove(m, row):
+      return
+    if not CHECK_SYNTAX.fullmatch(ligne):
+      if not ligne[0].isalpha():
+        self.__issue(row, "error:1", ligne)
+      else:
+        # Premier mot dont la valeur n'est pas un nombre valide
+        mauvais = [m for m in CHECK_LETTER.findall(ligne) if not CHECK_SYNTAX.fullmatch(m)]
+        self.__issue(row, "error:2", mauvais[0] if mauvais else ligne)
+      return
+
+    # Mots de la ligne, par groupe modal
+    groups = {}
+    mGroups = {}
+    words = {}
+    axisNames = self.__axisNames
+    for lettre, txt in CHECK_WORDS.findall(ligne):
+      if lettre == 'G':
+        code, group = gcodeGroup(txt)
+        if group is None:
+          return self.__issue(row, "error:20", "G" + txt)
+        if group in groups:
+          return self.__issue(row, "error:21", "G{:g} G{:g}".format(groups[group], code))
+        if group == 'nonModal' and code in CHECK_AXIS_COMMANDS and groups.get('motion', 80) != 80 \
+          or group == 'motion' and code != 80 and groups.get('nonModal') in CHECK_AXIS_COMMANDS:
+          return self.__issue(row, "error:24", ligne)
+        groups[group] = code
+      elif lettre == 'M':
+        val = float(txt)
+        group = GRBL_M_GROUPS.get(val)
+        if group is None:
+          return self.__issue(row, "error:20", "M" + txt)
+        if group in mGroups:
+          return self.__issue(row, "error:21", "M{:g} M{:g}".format(mGroups[group], val))
+        mGroups[group] = int(val)
+      elif lettre in words:
+        return self.__issue(row, "error:25", lettre)
+      elif lettre in axisNames or lettre in "FIJKLNPRST":
+        words[lettre] = float(txt)
+        if txt[0] == '-' and lettre in "FNPST" and words[lettre] < 0:
+          return self.__issue(row, "error:4", lettre + txt)
+      else:
+        return self.__issue(row, "error:20", lettre + txt)
+    if 'N' in words and words['N'] > 9999999:
+      return self.__issue(row, "error:27", "N")
+    if 'T' in words and words['T'] > GRBL_MAX_TOOL_NUMBER:
+      return self.__issue(row, "error:38", "T")
+
+    # Etat modal apres la ligne (applique seulement si la ligne est valide)
+    feedMode = groups.get('feedMode', self.__feedMode)
+    units    = groups.get('units', self.__units)
+    plane    = groups.get('plane', self.__plane)
+    distance = groups.get('distance', self.__distance)
+    coord    = groups['coord'] - 54 if 'coord' in groups else self.__coord
+    k = 25.4 if units == 20 else 1.0
+    feed = self.__feed
+    if 'F' in words:
+      feed = words['F'] if feedMode == 93 else words['F'] * k
+    elif feedMode == 93:
+      feed = 0.0 # En G93, F doit etre present sur chaque ligne de mouvement
+    nonModal = groups.get('nonModal')
+    motion = groups.get('motion', self.__motion)
+    axes = {I: words[L] * k for I, L in enumerate(axisNames) if L in words}
+    used = set()
+
+    # Cible en coordonnees machine (None pour les axes de position inconnue)
+    pos = self.__pos
+    target = list(pos)
+    if nonModal == 53:
+      for I, v in axes.items():
+        target[I] = v
+    elif distance == 91:
+      for I, v in axes.items():
+        target[I] = pos[I] + v if pos[I] is not None else None
+    elif axes:
+      if coord == self.__coord:
+        wco = self.__workOffset()
+      else:
+        wco = [c + g if c is not None and g is not None else None for c, g in zip(self.__coords[coord], self.__g92)]
+      for I, v in axes.items():
+        target[I] = v + wco[I] if wco[I] is not None else None
+
+    newPos = pos
+    axesUsed = False
+    moves = []     # Cibles successives a verifier
+    arcs  = []
+    if nonModal == 4:
+      if 'P' not in words:
+        return self.__issue(row, "error:28", "G4 P")
+      used.add('P')
+    elif nonModal == 10:
+      if 'L' not in words or 'P' not in words:
+        return self.__issue(row, "error:28", "G10 L P")
+      used.update('LP')
+      L, P = words['L'], words['P']
+      if L not in (2, 20):
+        return self.__issue(row, "error:20", "G10 L{:g}".format(L))
+      if P != int(P) or P > 6:
+        return self.__issue(row, "error:29", "G10 P{:g}".format(P))
+      axesUsed = True
+    elif nonModal in (28, 30):
+      # Passage par la cible puis retour a la position memorisee (sur les axes indiques, ou tous)
+      stored = self.__g28 if nonModal == 28 else self.__g30
+      if axes:
+        moves.append(target)
+      newPos = [stored[I] if (not axes or I in axes) else target[I] for I in range(self.__nbAxis)]
+      moves.append(newPos)
+      axesUsed = True
+    elif nonModal == 92 and not axes:
+      return self.__issue(row, "error:26", "G92")
+    elif nonModal == 92:
+      axesUsed = True
+
+    if nonModal == 53 and motion not in (0, 1):
+      return self.__issue(row, "error:30", "G53")
+    if axes and not axesUsed:
+      if motion == 80:
+        return self.__issue(row, "error:31", ligne)
+      if motion != 0 and feed <= 0:
+        return self.__issue(row, "error:22", ligne)
+      if motion in (2, 3):
+        rc, detail = self.__arc(target, words, axes, k, plane, motion == 2, used, arcs)
+        if rc != 0:
+          return self.__issue(row, "error:{}".format(rc), detail)
+      elif motion != 0 and motion != 1:
+        # Sondage G38.x : la cible doit differer de la position courante
+        if all(t == p for t, p in zip(target, pos)) and None not in target:
+          return self.__issue(row, "error:33", ligne)
+      moves.append(target)
+      newPos = target
+    elif 'motion' in groups and motion not in (0, 1, 80):
+      return self.__issue(row, "error:26", ligne)
+    if 'I' in words or 'J' in words or 'K' in words or 'R' in words or 'L' in words or 'P' in words:
+      if set('IJKRLP') & set(words) - used:
+        return self.__issue(row, "error:36", ligne)
+
+    # Ligne valide : application
+    self.__feedMode, self.__units, self.__plane, self.__distance, self.__coord = feedMode, units, plane, distance, coord
+    self.__feed = feed
+    if 'coord' in groups or nonModal in (10, 92, 92.1):
+      self.__wco = None
+    if nonModal == 10:
+      P = int(words['P']) - 1 if words['P'] > 0 else coord
+      for I, v in axes.items():
+        if words['L'] == 2:
+          self.__coords[P][I] = v
+        else:
+          self.__coords[P][I] = pos[I] - self.__g92[I] - v if pos[I] is not None and self.__g92[I] is not None else None
+    elif nonModal == 28.1:
+      self.__g28 = list(pos)
+    elif nonModal == 30.1:
+      self.__g30 = list(pos)
+    elif nonModal == 92:
+      for I, v in axes.items():
+        c = self.__coords[coord][I]
+        self.__g92[I] = pos[I] - c - v if pos[I] is not None and c is not None else None
+    elif nonModal == 92.1:
+      self.__g92 = [0.0] * self.__nbAxis
+    if 'motion' in groups:
+      self.__motion = motion
+    stop = mGroups.get('stop')
+    if stop == 2 or stop == 30:
+      self.__resetModal()
+      self.__motion = 1
+
+    # Limites logicielles
+    if self.__maxTravel is not None:
+      for point in moves:
+        self.__checkLimits(row, point)
+      for point in arcs:
+        self.__checkLimits(row, point)
+    self.__pos = newPos
+
+
+  def __fastMove(self, m, row: int):
+    '''
+    Ligne de mouvement G0/G1 simple, sans erreur possible autre qu'une avance non definie :
+    renvoie False pour les cas a traiter par l'analyse complete (G93, arcs modaux, avance manquante...)
+    '''
+    valeurs = m.groups()
+    motion = self.__motion if valeurs[0] is None else int(valeurs[0])
+    if motion > 1 or self.__feedMode == 93:
+      return False
+    k = 25.4 if self.__units == 20 else 1.0
+    f = valeurs[-1]
+    if f is None:
+      feed = self.__feed
+    elif f[0] == '-':
+      return False
+    else:
+      feed = float(f) * k
+    axes = valeurs[1:-1]
+    if axes.count(None) < len(axes):
+      if motion == 1 and feed <= 0:
+        return False
+      pos = self.__pos
+      if self.__distance == 90:
+        target = [p if v is None else float(v) * k + o if o is not None else None for p, v, o in zip(pos, axes, self.__workOffset())]
+      else:
+        target = [p if v is None or p is None else p + float(v) * k for p, v in zip(pos, axes)]
+      if self.__maxTravel is not None:
+        self.__checkLimits(row, target)
+      self.__pos = target
+    self.__motion = motion
+    self.__feed = feed
+    return True
+
+
+  def __workOffset(self):
+    ''' Decalage courant entre coordonnees de travail et coordonnees machine (None pour les axes inconnus) '''
+    if self.__wco is None:
+      self.__wco = [c + g if c is not None and g is not None else None for c, g in zip(self.__coords[self.__coord], self.__g92)]
+    return self.__wco
+
+
+  def __checkLimits(self, row: int, point):
+    for I, v in enumerate(point):
+      if v is not None and not -self.__maxTravel[I] - 1e-6 <= v <= 1e-6:
+        self.__issue(row, "ALARM:2", "{}{:0.3f} [{:0.3f}, 0]".format(self.__axisNames[I], v, -self.__maxTravel[I]))
+        return
+
+
+  def __arc(self, target, words: dict, axes: dict, k: float, plane: int, clockwise: bool, used: set, extremes: list):
+    '''
+    Controle d'un arc comme gc_execute_line() de Grbl, renvoie (code erreur, detail).
+    Ajoute a extremes les points de l'arc les plus eloignes du centre selon les axes du plan
+    (verification des limites sur toute l'etendue de l'arc, pas seulement sur sa cible).
+    '''
+    plan = CHECK_PLANES[plane]
+    try:
+      a0 = self.__axisNames.index(plan[0])
+      a1 = self.__axisNames.index(plan[1])
+    except ValueError:
+      return 20, "G{}".format(plane)
+    pos = self.__pos
+    if 'R' in words:
+      used.add('R')
+      if a0 not in axes and a1 not in axes:
+        return 32, "R"
+    elif plan[2] not in words and plan[3] not in words:
+      return 35, plan[2] + plan[3]
+    else:
+      used.update(set('IJK') & set(words))
+    if None in (pos[a0], pos[a1], target[a0], target[a1]):
+      # Position inconnue : seule la syntaxe peut etre verifiee
+      return 0, None
+    x = target[a0] - pos[a0]
+    y = target[a1] - pos[a1]
+    if 'R' in words:
+      if x == 0 and y == 0:
+        return 33, "R"
+      r = words['R'] * k
+      h = 4.0 * r * r - x * x - y * y
+      if h < 0:
+        return 34, "R{:g}".format(words['R'])
+      h = -math.sqrt(h) / math.hypot(x, y)
+      if not clockwise:
+        h = -h
+      if r < 0:
+        h = -h
+        r = -r
+      off0 = 0.5 * (x - y * h)
+      off1 = 0.5 * (y + x * h)
+    else:
+      off0 = words.get(plan[2], 0.0) * k
+      off1 = words.get(plan[3], 0.0) * k
+      r = math.hypot(off0, off1)
+      deltaR = abs(math.hypot(x - off0, y - off1) - r)
+      if deltaR > 0.005 and (deltaR > 0.5 or deltaR > 0.001 * r):
+        return 33, "{}{:g} {}{:g}".format(plan[2], words.get(plan[2], 0.0), plan[3], words.get(plan[3], 0.0))
+    if self.__maxTravel is None:
+      return 0, None
+    # Points cardinaux balayes par l'arc
+    c0, c1 = pos[a0] + off0, pos[a1] + off1
+    start = math.atan2(-off1, -off0)
+    angle = math.atan2(-off0 * (target[a1] - c1) + off1 * (target[a0] - c0), -off0 * (target[a0] - c0) - off1 * (target[a1] - c1))
+    if clockwise:
+      if angle >= -5e-7:
+        angle -= 2 * math.pi
+    elif angle <= 5e-7:
+      angle += 2 * math.pi
+    for n in range(4):
+      cardinal = n * math.pi / 2
+      balayage = (cardinal - start) % (2 * math.pi) if angle > 0 else (start - cardinal) % (2 * math.pi)
+      if balayage < abs(angle):
+        point = list(target)
+        point[a0] = c0 + r * math.cos(cardinal)
+        point[a1] = c1 + r * math.sin(cardinal)
+        extremes.append(point)
+    return 0, None
+
+
+class gcodeCheckThread(QThread):
+  '''
+  Thread de verification d'un programme (gcodeListModel.lines()) par un gcodeChecker.
+  '''
+
+  sig_finished = pyqtSignal(object) # gcodeChecker apres verification complete
+
+  def __init__(self, lines, checker: gcodeChecker):
+    super().__init__()
+    self.__lines   = lines
+    self.__checker = checker
+    self.__abort   = False
+
+
+  def abort(self):
+    self.__abort = True
+
+
+  def run(self):
+    if self.__checker.check(self.__lines, lambda: self.__abort):
+      self.sig_finished.emit(self.__checker)
@@ -0,0 +1,169 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import os, re, mmap, hashlib, tempfile
+from operator import itemgetter
+import numpy as np
+from .cn5X_config import *
+
+COLUMNS_VERSION = 1
+COLUMNS_NAMES   = GCODE_COLUMNS_AXES + "FS" # Lignes du tableau values
+MOTION_NONE     = -1 # Pas de mot G0/G1 sur la ligne
+MOTION_COMPLEX  = -2 # Ligne non decoupee en colonnes (autres mots, commentaire en tete...) : a analyser sur son texte
+
+COLUMNS_SPACE    = rb'[ \t]*'
+COLUMNS_NUMBER   = rb'([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))'
+COLUMNS_UNSIGNED = rb'([0-9]+\.?[0-9]*|\.[0-9]+)'
+# Ligne simple : N facultatif, G0/G1 facultatif, mots d'axes, F et S dans cet ordre, commentaire final facultatif.
+# Toute autre ligne est capturee entiere par la seconde alternative : chaque ligne du fichier donne une correspondance.
+COLUMNS_LINE = re.compile(rb'^' + COLUMNS_SPACE + rb'(?:N[0-9]+' + COLUMNS_SPACE + rb')?(?:G0*([01])(?![0-9.])' + COLUMNS_SPACE + rb')?'
+                          + b''.join(rb'(?:' + L.encode() + COLUMNS_SPACE + COLUMNS_NUMBER + COLUMNS_SPACE + rb')?' for L in GCODE_COLUMNS_AXES)
+                          + rb'(?:F' + COLUMNS_SPACE + COLUMNS_UNSIGNED + COLUMNS_SPACE + rb')?'
+                          + rb'(?:S' + COLUMNS_SPACE + COLUMNS_UNSIGNED + COLUMNS_SPACE + rb')?'
+                          + rb'(?:\([^)\n]*\)' + COLUMNS_SPACE + rb'|;[^\n]*)?\r?$|^(.*)$', re.M)
+
+
+class gcodeColumns():
+  '''
+  Fichier GCode decoupe en colonnes NumPy, une valeur par ligne du fichier :
+  - offsets : debut (octets) de chaque ligne, suivi de la fin du fichier (uint64, lineCount() + 1 valeurs)
+  - motion  : 0 ou 1 pour G0/G1, MOTION_NONE sans mot G, MOTION_COMPLEX pour les lignes a analyser sur leur texte (int8)
+  - values  : mots X, Y, Z, A, B, F et S (float64, une ligne par mot dans l'ordre de COLUMNS_NAMES, NaN si absent)
+  Les colonnes sont obtenues par une seule expression reguliere compilee sur tout le fichier (tokenize()),
+  puis conservees dans un fichier .npz a cote du fichier GCode (load()), identifie par l'empreinte de son contenu :
+  les ouvertures suivantes du meme fichier ne relisent que le cache.
+  '''
+
+  def __init__(self, offsets, motion, values, filePath: str = None):
+    self.offsets  = offsets
+    self.motion   = motion
+    self.values   = values
+    self.filePath = filePath
+    self.cached   = False # Vrai si les colonnes ont ete lues dans le cache
+
+
+  def lineCount(self):
+    return len(self.motion)
+
+
+  def column(self, lettre: str):
+    ''' Valeurs du mot lettre (X, Y, Z, A, B, F ou S) sur toutes les lignes, NaN si absent '''
+    return self.values[COLUMNS_NAMES.index(lettre)]
+
+
+  def complexRows(self):
+    ''' N° des lignes a analyser sur leur texte '''
+    return np.flatnonzero(self.motion == MOTION_COMPLEX)
+
+
+  def text(self, rows):
+    ''' Texte des lignes rows (relu dans le fichier) '''
+    rows = [int(row) for row in rows]
+    if len(rows) == 0:
+      return []
+    with open(self.filePath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+      offsets = self.offsets
+      return [data[offsets[row]:offsets[row + 1]].decode('utf-8', 'replace').strip() for row in rows]
+
+
+  @staticmethod
+  def tokenize(data, filePath: str = None):
+    ''' Decoupe en colonnes le contenu data (bytes ou mmap) d'un fichier GCode '''
+    size = len(data)
+    if size == 0:
+      return gcodeColumns(np.zeros(1, dtype=np.uint64), np.zeros(0, dtype=np.int8), np.zeros((len(COLUMNS_NAMES), 0)), filePath)
+    # Debuts de lignes comptes comme gcodeListModel : apres chaque '\n', plus la fin d'une derniere ligne sans '\n'
+    buff = np.frombuffer(data, dtype=np.uint8)
+    offsets = np.flatnonzero(buff == 10).astype(np.uint64)
+    del buff # Libere la reference sur le mmap
+    offsets += 1
+    offsets = np.concatenate(([0], offsets)).astype(np.uint64)
+    if offsets[-1] != size:
+      offsets = np.append(offsets, np.uint64(size))
+    n = len(offsets) - 1
+
+    lignes = COLUMNS_LINE.findall(data)
+    if len(lignes) < n:
+      raise ValueError("GCode tokenizer: {} lines matched, {} expected".format(len(lignes), n))
+    del lignes[n:]
+    groupes = len(COLUMNS_NAMES) + 2
+    motion = np.array(list(map(itemgetter(0), lignes)), dtype='S1').view(np.uint8).astype(np.int8) - ord('0')
+    motion[motion < 0] = MOTION_NONE
+    complexe = np.fromiter(map(bool, map(itemgetter(groupes - 1), lignes)), dtype=bool, count=n)
+    motion[complexe] = MOTION_COMPLEX
+    nan = float('nan')
+    values = np.empty((len(COLUMNS_NAMES), n))
+    for I in range(len(COLUMNS_NAMES)):
+      values[I] = np.fromiter([float(v) if v else nan for v in map(itemgetter(I + 1), lignes)], dtype=float, count=n)
+    return gcodeColumns(offsets, motion, values, filePath)
+
+
+  @staticmethod
+  def cachePath(filePath: str):
+    ''' Fichier cache des colonnes d'un fichier GCode : fichier masque dans le meme repertoire '''
+    dirName, baseName = os.path.split(os.path.abspath(filePath))
+    return os.path.join(dirName, "." + baseName + GCODE_COLUMNS_SUFFIX)
+
+
+  @staticmethod
+  def load(filePath: str, cache: bool = True):
+    '''
+    Colonnes du fichier filePath, lues dans le cache si son empreinte correspond au contenu du fichier,
+    sinon obtenues par tokenize() puis enregistrees dans le cache (fichiers de plus de GCODE_COLUMNS_MIN_LINES lignes).
+    '''
+    with open(filePath, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        return gcodeColumns.tokenize(b"", filePath)
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        key = "{}:{}:{}".format(COLUMNS_VERSION, COLUMNS_NAMES, hashlib.blake2b(data, digest_size=16).hexdigest())
+        cachePath = gcodeColumns.cachePath(filePath)
+        if cache and os.path.exists(cachePath):
+          try:
+            with np.load(cachePath) as npz:
+              if str(npz['key']) == key:
+                columns = gcodeColumns(npz['offsets'], npz['motion'], npz['values'], filePath)
+                columns.cached = True
+                return columns
+          except (OSError, KeyError, ValueError):
+            pass # Cache illisible : il est reconstruit
+        columns = gcodeColumns.tokenize(data, filePath)
+    if cache and columns.lineCount() >= GCODE_COLUMNS_MIN_LINES:
+      columns.save(cachePath, key)
+    return columns
+
+
+  def save(self, cachePath: str, key: str):
+    ''' Enregistre les colonnes (fichier temporaire puis remplacement), renvoie False si le repertoire n'est pas accessible '''
+    try:
+      fd, tmpPath = tempfile.mkstemp(prefix=os.path.basename(cachePath) + '.', dir=os.path.dirname(cachePath))
+    except OSError:
+      return False
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        np.savez(f, key=np.array(key), offsets=self.offsets, motion=self.motion, values=self.values)
+      os.replace(tmpPath, cachePath)
+    except OSError:
+      if os.path.exists(tmpPath):
+        os.remove(tmpPath)
+      return False
+    return True
@@ -0,0 +1,650 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import re, math
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+from .cn5X_config import *
+from .gcodeCheck import CHECK_CLEAN, CHECK_WORDS, CHECK_NUMBER, CHECK_PLANES, gcodeGroup
+from .gcodeColumns import gcodeColumns, COLUMNS_NAMES
+
+# Types des blocs du planificateur
+BLOC_RAPID   = 0 # G0, G28, G30 : vitesse maxi des axes
+BLOC_FEED    = 1 # G1, G2, G3, G38.x : avance F (mm/min)
+BLOC_INVERSE = 2 # G93 : F est l'inverse de la duree (min) du bloc
+BLOC_WAIT    = 3 # Synchronisation (planificateur vide) suivie d'une attente (G4) : pas de mouvement
+
+ARC_ANGULAR_TRAVEL_EPSILON = 5e-7 # Comme Grbl (config.h)
+
+
+def fill(values, initial: float):
+  ''' Remplace chaque NaN de values par la derniere valeur presente avant lui (initial avant la premiere) '''
+  indices = np.where(np.isnan(values), -1, np.arange(len(values)))
+  np.maximum.accumulate(indices, out=indices)
+  return np.where(indices >= 0, values[indices], initial)
+
+
+def axisLimit(limits, vectors):
+  ''' Limite (vitesse ou acceleration) de chaque vecteur unitaire selon celles des axes : min(limits[I] / |vectors[:, I]|) '''
+  with np.errstate(divide='ignore'):
+    limite = limits[0] / np.abs(vectors[:, 0])
+    for I in range(1, len(limits)):
+      # Boucle sur les axes : min(axis=1) sur des lignes de 3 a 6 valeurs est plusieurs fois plus lent
+      np.minimum(limite, limits[I] / np.abs(vectors[:, I]), out=limite)
+  return limite
+
+
+def plannerDurations(points, types, feeds, waits, maxRate, accel, junctionDeviation: float, lookahead: int = GRBL_PLANNER_BUFFER_SIZE):
+  '''
+  Duree (s) de chaque bloc, calculee en une fois sur des tableaux NumPy comme le planificateur de Grbl 1.1 :
+  - points   : positions machine (n + 1, nbAxis), points[0] est la position de depart
+  - types    : type BLOC_xxx de chaque bloc, feeds : avance F du bloc (mm/min ou 1/min en G93)
+  - waits    : duree des attentes des blocs BLOC_WAIT (s)
+  - maxRate  : vitesses maxi des axes ($110..., mm/min), accel : accelerations ($120..., mm/s^2)
+  - junctionDeviation : deviation de jonction $11 (mm)
+  - lookahead : nombre de blocs du planificateur (bloc en cours d'execution compris)
+  La vitesse de passage entre deux blocs est limitee par la deviation de jonction, par les vitesses
+  nominales des deux blocs et par l'arret en fin de planificateur : un planificateur plein de blocs
+  courts doit toujours pouvoir s'arreter a la fin de son dernier bloc. Les passes arriere et avant
+  de Grbl sont des minimums cumules (np.minimum.accumulate) sur les carres des vitesses.
+  '''
+  points   = np.asarray(points, dtype=float)
+  types    = np.asarray(types)
+  feeds    = np.asarray(feeds, dtype=float)
+  maxRate  = np.asarray(maxRate, dtype=float) / 60 # mm/s
+  accel    = np.asarray(accel, dtype=float)
+  n = len(types)
+  if n == 0:
+    return np.zeros(0)
+  delta  = np.diff(points, axis=0)
+  L      = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+  moving = types != BLOC_WAIT
+  with np.errstate(divide='ignore', invalid='ignore'):
+    unit = delta / np.where(moving, L, 1.0)[:, None]
+    # Vitesse et acceleration du bloc : celles de l'axe le plus limitant (les axes immobiles donnent inf)
+    vMax = axisLimit(maxRate, unit)
+    a    = np.where(moving, axisLimit(accel, unit), 1.0)
+    vNom = np.where(types == BLOC_RAPID, vMax, np.minimum(np.where(types == BLOC_INVERSE, L * feeds, feeds) / 60, vMax))
+    vNom = np.where(moving, vNom, 0.0)
+
+    # Jonctions : vitesse maxi de passage (au carre) selon la deviation de jonction $11
+    cosTheta = -np.einsum('ij,ij->i', unit[:-1], unit[1:])
+    junctionUnit = unit[1:] - unit[:-1]
+    junctionAccel = axisLimit(accel, junctionUnit) * np.sqrt(np.einsum('ij,ij->i', junctionUnit, junctionUnit))
+    sinThetaD2 = np.sqrt(0.5 * (1.0 - cosTheta))
+    junction2 = junctionAccel * junctionDeviation * sinThetaD2 / (1.0 - sinThetaD2)
+  junction2 = np.where(cosTheta > 0.999999, 0.0, np.where(cosTheta < -0.999999, np.inf, junction2))
+  vNom2 = vNom * vNom
+  limit2 = np.zeros(n + 1) # Vitesse maxi (au carre) a l'entree de chaque bloc, depart et fin a l'arret
+  limit2[1:n] = np.minimum(junction2, np.minimum(vNom2[:-1], vNom2[1:]))
+  limit2[1:n][~(moving[:-1] & moving[1:])] = 0.0 # Synchronisation : le planificateur est vide
+
+  # Passe arriere : deceleration jusqu'a chaque limite suivante et jusqu'a l'arret en fin de planificateur
+  S = np.zeros(n + 1)
+  np.cumsum(2 * a * np.where(moving, L, 0.0), out=S[1:])
+  entry2 = np.minimum.accumulate((limit2 + S)[::-1])[::-1] - S
+  horizon = np.minimum(np.arange(n + 1) + max(lookahead - 1, 1), n)
+  entry2 = np.minimum(entry2, S[horizon] - S)
+  # Passe avant : acceleration depuis chaque entree precedente
+  entry2 = np.maximum(S + np.minimum.accumulate(entry2 - S), 0.0)
+
+  # Profil trapezoidal (ou triangulaire) de chaque bloc
+  v02, v12 = entry2[:-1], entry2[1:]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    peak2 = np.minimum(a * L + (v02 + v12) / 2, vNom2)
+    peak  = np.sqrt(peak2)
+    croisiere = np.maximum(L - (2 * peak2 - v02 - v12) / (2 * a), 0.0)
+    durees = (2 * peak - np.sqrt(v02) - np.sqrt(v12)) / a + croisiere / peak
+  return np.where(moving, durees, np.asarray(waits, dtype=float))
+
+
+class gcodeEstimator():
+  '''
+  Estimation de la duree d'execution d'un programme GCode par Grbl.
+  Les lignes sont traduites en blocs du planificateur (positions machine, arcs decoupes en segments
+  selon la tolerance $12 comme le fait Grbl), puis plannerDurations() calcule la duree de tous
+  les blocs a partir des parametres de la machine. Les lignes que Grbl refuserait sont ignorees
+  (elles sont relevees par gcodeChecker), les synchronisations (G4, M0 a M9, $H) vident le planificateur.
+  Les surcharges d'avance et le temps de communication ne sont pas pris en compte.
+  '''
+
+  def __init__(self, axisNames = DEFAULT_AXIS_NAMES, settings: dict = None, offsets: dict = None, mpos = None, lookahead: int = GRBL_PLANNER_BUFFER_SIZE):
+    '''
+    axisNames : lettres des axes de la machine
+    settings  : parametres $x connus de Grbl ($11, $12, $110..., $120...), valeurs par defaut de Grbl pour les autres
+    offsets   : decalages connus de Grbl, en coordonnees machine (mm) : { 54 a 59, 92 : decalages, 28, 30 : positions }
+    mpos      : position machine de depart, origine machine si elle est inconnue
+    lookahead : nombre de blocs du planificateur de Grbl
+    '''
+    self.__axisNames = "".join(axisNames)
+    self.__nbAxis    = len(self.__axisNames)
+    nbAxis = self.__nbAxis
+    valeurs = dict(GRBL_DEFAULT_SETTINGS)
+    for base, val in GRBL_DEFAULT_AXIS_SETTINGS.items():
+      for I in range(nbAxis):
+        valeurs[base + I] = val
+    valeurs.update(settings or {})
+    self.__junctionDeviation = valeurs[11]
+    self.__arcTolerance      = valeurs[12]
+    self.__maxRate   = [valeurs[110 + I] for I in range(nbAxis)]
+    self.__accel     = [valeurs[120 + I] for I in range(nbAxis)]
+    self.__lookahead = lookahead
+    offsets = offsets or {}
+    zero = [0.0] * nbAxis
+    self.__coords = [list(offsets.get(n, zero))[:nbAxis] for n in range(54, 60)]
+    self.__g92    = list(offsets.get(92, zero))[:nbAxis]
+    self.__g28    = list(offsets.get(28, zero))[:nbAxis]
+    self.__g30    = list(offsets.get(30, zero))[:nbAxis]
+    self.__start  = list(mpos)[:nbAxis] if mpos is not None else list(zero)
+    self.__fastLine = re.compile(r'(?:G0*([01]))?' + ''.join('(?:{}{})?'.format(L, CHECK_NUMBER) for L in self.__axisNames) + '(?:F' + CHECK_NUMBER + ')?').fullmatch
+    self.__rows      = np.zeros(0, dtype=np.int64) # N° de ligne de chaque bloc
+    self.__ends      = np.zeros(0)                 # Instant de fin de chaque bloc (s)
+    self.__lineCount = 0
+    self.__box       = None
+    self.__path      = (np.array([self.__start], dtype=float).reshape(1, nbAxis), np.zeros(0, dtype=np.int8))
+
+
+  def lineCount(self):
+    return self.__lineCount
+
+
+  def blockCount(self):
+    return len(self.__rows)
+
+
+  def totalTime(self):
+    ''' Duree estimee du programme complet (s) '''
+    return float(self.__ends[-1]) if len(self.__ends) > 0 else 0.0
+
+
+  def elapsedTime(self, row: int):
+    ''' Duree estimee des blocs des lignes precedant la ligne row (s) '''
+    k = int(np.searchsorted(self.__rows, row, 'left'))
+    return float(self.__ends[k - 1]) if k > 0 else 0.0
+
+
+  def remainingTime(self, row: int):
+    ''' Duree estimee de l'execution du programme a partir de la ligne row (s) '''
+    return self.totalTime() - self.elapsedTime(row)
+
+
+  def boundingBox(self):
+    ''' (mini, maxi) des positions machine atteintes par les mouvements du programme, None s'il n'y en a pas '''
+    return self.__box
+
+
+  def toolpath(self, axes: str = "XYZ"):
+    '''
+    Trajectoire du programme estime, sans les attentes : positions (n + 1, len(axes)) dans le repere de travail
+    actif au depart du programme (G54 et G92 connus, 0 pour les axes absents de la machine), et pour chacun
+    des n mouvements, vrai si c'est un deplacement rapide.
+    '''
+    points, types = self.__path
+    moving = types != BLOC_WAIT
+    positions = np.concatenate((points[:1], points[1:][moving]))
+    wco = np.add(self.__coords[0], self.__g92)
+    colonnes = [positions[:, self.__axisNames.index(L)] - wco[self.__axisNames.index(L)] if L in self.__axisNames
+                else np.zeros(len(positions)) for L in axes]
+    return np.stack(colonnes, axis=1), types[moving] == BLOC_RAPID
+
+
+  def estimate(self, lines, abort = None):
+    ''' Estime la duree des lignes (iterable), renvoie False si abort() a interrompu l'estimation '''
+    return self.__plan(self.blocks(lines, abort))
+
+
+  def estimateColumns(self, columns: gcodeColumns, abort = None):
+    ''' Estime la duree d'un fichier decoupe en colonnes (gcodeColumns), renvoie False si abort() a interrompu l'estimation '''
+    return self.__plan(self.columnBlocks(columns, abort))
+
+
+  def __plan(self, blocs):
+    if blocs is None:
+      return False
+    rows, points, types, feeds, waits = blocs
+    durees = plannerDurations(points, types, feeds, waits, self.__maxRate, self.__accel, self.__junctionDeviation, self.__lookahead)
+    self.__rows = rows
+    self.__ends = np.cumsum(durees)
+    self.__path = (points, types)
+    moving = types != BLOC_WAIT
+    if moving.any():
+      extremites = np.concatenate((points[:-1][moving], points[1:][moving]))
+      self.__box = (extremites.min(axis=0), extremites.max(axis=0))
+    else:
+      self.__box = None
+    return True
+
+
+  def blocks(self, lines, abort = None):
+    '''
+    Blocs du planificateur produits par les lignes (iterable) : tableaux (N° de ligne, positions machine
+    (n + 1 points, depart compris), types BLOC_xxx, avances, attentes), None si abort() a interrompu le calcul.
+    '''
+    self.__begin()
+    textLine = self.__textLine
+    row = -1
+    for row, line in enumerate(lines):
+      if row & 0x3fff == 0 and abort is not None and abort():
+        return None
+      textLine(line, row)
+    self.__lineCount = row + 1
+    return self.__end()
+
+
+  def columnBlocks(self, columns: gcodeColumns, abort = None):
+    '''
+    Memes blocs que blocks() a partir des colonnes d'un fichier : les suites de lignes simples (G0/G1, axes, F)
+    sont traduites en une fois sur les colonnes, les autres lignes sont analysees sur leur texte.
+    '''
+    self.__begin()
+    n = columns.lineCount()
+    complexes = columns.complexRows()
+    textes = columns.text(complexes)
+    debut = 0
+    for I, row in enumerate(complexes.tolist() + [n]):
+      if I & 0x3ff == 0 and abort is not None and abort():
+        return None
+      if row > debut:
+        self.__columnRun(columns, debut, row)
+      if row < n:
+        self.__textLine(textes[I], row)
+      debut = row + 1
+    self.__lineCount = n
+    return self.__end()
+
+
+  def __begin(self):
+    self.__resetModal()
+    self.__pos    = list(self.__start)
+    self.__last   = list(self.__start) # Fin du dernier bloc
+    self.__chunks = []                 # Blocs deja convertis en tableaux
+    self.__rowsL  = []
+    self.__points = []
+    self.__types  = []
+    self.__feeds  = []
+    self.__waits  = []
+
+
+  def __flush(self):
+    ''' Convertit en tableaux les blocs ajoutes un par un '''
+    if self.__rowsL:
+      self.__chunks.append((np.array(self.__rowsL, dtype=np.int64), np.array(self.__points, dtype=float).reshape(-1, self.__nbAxis),
+                            np.array(self.__types, dtype=np.int8), np.array(self.__feeds, dtype=float), np.array(self.__waits, dtype=float)))
+      self.__rowsL, self.__points, self.__types, self.__feeds, self.__waits = [], [], [], [], []
+
+
+  def __end(self):
+    self.__flush()
+    chunks = self.__chunks
+    self.__chunks = []
+    start = np.array([self.__start], dtype=float).reshape(1, self.__nbAxis)
+    if not chunks:
+      return np.zeros(0, dtype=np.int64), start, np.zeros(0, dtype=np.int8), np.zeros(0), np.zeros(0)
+    return (np.concatenate([c[0] for c in chunks]), np.concatenate([start] + [c[1] for c in chunks]),
+            np.concatenate([c[2] for c in chunks]), np.concatenate([c[3] for c in chunks]), np.concatenate([c[4] for c in chunks]))
+
+
+  def __textLine(self, line: str, row: int):
+    if '(' in line or ';' in line or '\t' in line:
+      ligne = CHECK_CLEAN.sub('', line).upper()
+    else:
+      ligne = line.replace(' ', '').upper()
+    if ligne == "" or ligne[0] == '%':
+      return
+    if ligne[0] == '$':
+      if ligne == CMD_GRBL_RUN_HOME_CYCLE:
+        # Prise d'origine : attente de fin des mouvements, puis la machine est a son origine
+        self.__wait(row, 0.0)
+        self.__pos = [0.0] * self.__nbAxis
+        self.__points[-1] = self.__last = list(self.__pos)
+      return
+    m = self.__fastLine(ligne)
+    if m is not None:
+      valeurs = m.groups()
+      f = valeurs[-1]
+      if f is None or f[0] != '-':
+        axes = [None if v is None else float(v) for v in valeurs[1:-1]]
+        if self.__fastMove(None if valeurs[0] is None else int(valeurs[0]), axes, None if f is None else float(f), row):
+          return
+    self.__line(ligne, row)
+
+
+  def __columnRun(self, columns: gcodeColumns, debut: int, fin: int):
+    ''' Lignes simples debut a fin (exclue) : traduction vectorisee, ou ligne par ligne pour les cas particuliers '''
+    values = columns.values[:, debut:fin]
+    motion = columns.motion[debut:fin]
+    axisNames = self.__axisNames
+    autres = [I for I, L in enumerate(GCODE_COLUMNS_AXES) if L not in axisNames]
+    k = 25.4 if self.__units == 20 else 1.0
+    vectorise = fin - debut >= GCODE_COLUMNS_MIN_RUN and self.__motion in (0, 1) and self.__feedMode == 94 \
+      and not any(np.isfinite(values[I]).any() for I in autres)
+    if vectorise:
+      motions = fill(np.where(motion >= 0, motion, np.nan), self.__motion)
+      feeds   = fill(values[COLUMNS_NAMES.index('F')] * k, self.__feed)
+      axes = [values[COLUMNS_NAMES.index(L)] if L in GCODE_COLUMNS_AXES else None for L in axisNames]
+      deplace = np.zeros(fin - debut, dtype=bool)
+      for v in axes:
+        if v is not None:
+          deplace |= np.isfinite(v)
+      # Avance nulle en G1 : erreur de Grbl, la ligne est ignoree et ne modifie pas l'etat modal
+      vectorise = not (deplace & (motions == 1) & (feeds <= 0)).any()
+    if not vectorise:
+      colonnes = [COLUMNS_NAMES.index(L) if L in GCODE_COLUMNS_AXES else None for L in axisNames]
+      nomsF = COLUMNS_NAMES.index('F')
+      for I in range(fin - debut):
+        if any(values[J, I] == values[J, I] for J in autres):
+          continue # Axe absent de la machine : erreur de Grbl, ligne ignoree
+        axes = [None if J is None or values[J, I] != values[J, I] else float(values[J, I]) for J in colonnes]
+        f = values[nomsF, I]
+        g = int(motion[I])
+        if not self.__fastMove(None if g < 0 else g, axes, None if f != f else float(f), debut + I):
+          self.__line(self.__columnText(values[:, I], g), debut + I)
+      return
+    # Positions machine apres chaque ligne
+    targets = np.empty((fin - debut, self.__nbAxis))
+    for I, v in enumerate(axes):
+      if v is None:
+        targets[:, I] = self.__pos[I]
+      elif self.__distance == 90:
+        targets[:, I] = fill(v * k + self.__workOffset()[I], self.__pos[I])
+      else:
+        targets[:, I] = self.__pos[I] + np.cumsum(np.where(np.isfinite(v), v * k, 0.0))
+    points = targets[deplace]
+    precedents = np.concatenate(([self.__last], points[:-1]))
+    garde = (points != precedents).any(axis=1) # Blocs de longueur nulle ignores comme dans Grbl
+    if garde.any():
+      self.__flush()
+      rows = np.arange(debut, fin)[deplace][garde]
+      self.__chunks.append((rows, points[garde], motions[deplace][garde].astype(np.int8), feeds[deplace][garde], np.zeros(len(rows))))
+      self.__last = list(points[garde][-1])
+    self.__pos    = [float(v) for v in targets[-1]]
+    self.__motion = int(motions[-1])
+    self.__feed   = float(feeds[-1])
+
+
+  @staticmethod
+  def __columnText(valeurs, motion: int):
+    ''' Texte equivalent d'une ligne simple (analyse complete des lignes que __fastMove() ne traite pas) '''
+    ligne = "G{}".format(motion) if motion >= 0 else ""
+    return ligne + "".join("{}{!r}".format(L, float(v)) for L, v in zip(COLUMNS_NAMES, valeurs) if v == v)
+
+
+  def __resetModal(self):
+    ''' Etat modal de Grbl a la mise sous tension et apres M2/M30 '''
+    self.__motion   = 0
+    self.__plane    = 17
+    self.__units    = 21
+    self.__distance = 90
+    self.__feedMode = 94
+    self.__coord    = 0
+    self.__feed     = 0.0
+    self.__wco      = None
+
+
+  def __bloc(self, row: int, target, type: int, feed: float):
+    ''' Ajoute un bloc de mouvement, les blocs de longueur nulle sont ignores comme dans Grbl '''
+    if target != self.__last:
+      self.__rowsL.append(row)
+      self.__points.append(target)
+      self.__types.append(type)
+      self.__feeds.append(feed)
+      self.__waits.append(0.0)
+      self.__last = target
+
+
+  def __wait(self, row: int, duree: float):
+    self.__rowsL.append(row)
+    self.__points.append(self.__last)
+    self.__types.append(BLOC_WAIT)
+    self.__feeds.append(0.0)
+    self.__waits.append(duree)
+
+
+  def __workOffset(self):
+    if self.__wco is None:
+      self.__wco = [c + g for c, g in zip(self.__coords[self.__coord], self.__g92)]
+    return self.__wco
+
+
+  def __fastMove(self, g, axes: list, f, row: int):
+    '''
+    Ligne G0/G1 simple en G94 (g : 0, 1 ou None, axes : valeur ou None pour chaque axe, f : avance ou None),
+    renvoie False pour les cas a traiter par l'analyse complete
+    '''
+    motion = self.__motion if g is None else g
+    if motion > 1 or self.__feedMode == 93:
+      return False
+    k = 25.4 if self.__units == 20 else 1.0
+    feed = self.__feed if f is None else f * k
+    if axes.count(None) < len(axes):
+      if motion == 1 and feed <= 0:
+        return False
+      pos = self.__pos
+      if self.__distance == 90:
+        target = [p if v is None else v * k + o for p, v, o in zip(pos, axes, self.__workOffset())]
+      else:
+        target = [p if v is None else p + v * k for p, v in zip(pos, axes)]
+      self.__bloc(row, target, motion, feed)
+      self.__pos = target
+    self.__motion = motion
+    self.__feed = feed
+    return True
+
+
+  def __line(self, ligne: str, row: int):
+    ''' Analyse complete d'une ligne (sans les controles de gcodeChecker : les lignes invalides sont ignorees) '''
+    groups = {}
+    mGroups = {}
+    words = {}
+    axisNames = self.__axisNames
+    for lettre, txt in CHECK_WORDS.findall(ligne):
+      if lettre == 'G':
+        code, group = gcodeGroup(txt)
+        if group is None or group in groups:
+          return
+        groups[group] = code
+      elif lettre == 'M':
+        group = GRBL_M_GROUPS.get(float(txt))
+        if group is None or group in mGroups:
+          return
+        mGroups[group] = int(float(txt))
+      elif lettre in words or (lettre not in axisNames and lettre not in "FIJKLNPRST"):
+        return
+      else:
+        words[lettre] = float(txt)
+    feedMode = groups.get('feedMode', self.__feedMode)
+    units    = groups.get('units', self.__units)
+    plane    = groups.get('plane', self.__plane)
+    distance = groups.get('distance', self.__distance)
+    coord    = groups['coord'] - 54 if 'coord' in groups else self.__coord
+    k = 25.4 if units == 20 else 1.0
+    feed = self.__feed
+    if 'F' in words:
+      feed = words['F'] if feedMode == 93 else words['F'] * k
+    elif feedMode == 93:
+      feed = 0.0
+    nonModal = groups.get('nonModal')
+    motion = groups.get('motion', self.__motion)
+    axes = {I: words[L] * k for I, L in enumerate(axisNames) if L in words}
+
+    pos = self.__pos
+    target = list(pos)
+    if nonModal == 53:
+      for I, v in axes.items():
+        target[I] = v
+    elif distance == 91:
+      for I, v in axes.items():
+        target[I] = pos[I] + v
+    elif axes:
+      if coord == self.__coord:
+        wco = self.__workOffset()
+      else:
+        wco = [c + g for c, g in zip(self.__coords[coord], self.__g92)]
+      for I, v in axes.items():
+        target[I] = v + wco[I]
+
+    # Synchronisations : broche, arrosage, pauses et fin de programme vident le planificateur
+    if mGroups:
+      self.__wait(row, 0.0)
+    if nonModal == 4:
+      self.__wait(row, words.get('P', 0.0))
+    elif nonModal in (28, 30):
+      stored = self.__g28 if nonModal == 28 else self.__g30
+      if axes:
+        self.__bloc(row, target, BLOC_RAPID, 0.0)
+      target = [stored[I] if (not axes or I in axes) else target[I] for I in range(self.__nbAxis)]
+      self.__bloc(row, target, BLOC_RAPID, 0.0)
+      self.__pos = target
+    elif nonModal in (10, 92):
+      pass
+    elif axes and motion != 80:
+      if motion != 0 and feed <= 0:
+        return
+      type = BLOC_RAPID if motion == 0 else BLOC_INVERSE if feedMode == 93 else BLOC_FEED
+      if motion in (2, 3):
+        if not self.__arc(row, target, words, axes, k, plane, motion == 2, type, feed):
+          return
+      else:
+        self.__bloc(row, target, type, feed)
+      self.__pos = target
+
+    # Application de l'etat modal
+    self.__feedMode, self.__units, self.__plane, self.__distance, self.__coord = feedMode, units, plane, distance, coord
+    self.__feed = feed
+    if 'coord' in groups or nonModal in (10, 92, 92.1):
+      self.__wco = None
+    if nonModal == 10 and 'P' in words and 'L' in words:
+      P = int(words['P']) - 1 if words['P'] > 0 else coord
+      if 0 <= P < 6:
+        for I, v in axes.items():
+          self.__coords[P][I] = v if words['L'] == 2 else pos[I] - self.__g92[I] - v
+    elif nonModal == 28.1:
+      self.__g28 = list(pos)
+    elif nonModal == 30.1:
+      self.__g30 = list(pos)
+    elif nonModal == 92:
+      for I, v in axes.items():
+        self.__g92[I] = pos[I] - self.__coords[coord][I] - v
+    elif nonModal == 92.1:
+      self.__g92 = [0.0] * self.__nbAxis
+    if 'motion' in groups:
+      self.__motion = motion
+    stop = mGroups.get('stop')
+    if stop == 2 or stop == 30:
+      self.__resetModal()
+      self.__motion = 1
+
+
+  def __arc(self, row: int, target, words: dict, axes: dict, k: float, plane: int, clockwise: bool, type: int, feed: float):
+    ''' Decoupe un arc en segments comme mc_arc() de Grbl, renvoie False si l'arc est invalide '''
+    plan = CHECK_PLANES[plane]
+    try:
+      a0 = self.__axisNames.index(plan[0])
+      a1 = self.__axisNames.index(plan[1])
+    except ValueError:
+      return False
+    linear = self.__axisNames.find({17: 'Z', 18: 'Y', 19: 'X'}[plane])
+    pos = self.__pos
+    x = target[a0] - pos[a0]
+    y = target[a1] - pos[a1]
+    if 'R' in words:
+      r = words['R'] * k
+      h = 4.0 * r * r - x * x - y * y
+      if (x == 0 and y == 0) or h < 0:
+        return False
+      h = -math.sqrt(h) / math.hypot(x, y)
+      if not clockwise:
+        h = -h
+      if r < 0:
+        h = -h
+        r = -r
+      off0 = 0.5 * (x - y * h)
+      off1 = 0.5 * (y + x * h)
+    else:
+      off0 = words.get(plan[2], 0.0) * k
+      off1 = words.get(plan[3], 0.0) * k
+      r = math.hypot(off0, off1)
+    c0, c1 = pos[a0] + off0, pos[a1] + off1
+    r0, r1 = -off0, -off1
+    rt0, rt1 = target[a0] - c0, target[a1] - c1
+    angle = math.atan2(r0 * rt1 - r1 * rt0, r0 * rt0 + r1 * rt1)
+    if clockwise:
+      if angle >= -ARC_ANGULAR_TRAVEL_EPSILON:
+        angle -= 2 * math.pi
+    elif angle <= ARC_ANGULAR_TRAVEL_EPSILON:
+      angle += 2 * math.pi
+    tolerance = self.__arcTolerance
+    segments = int(abs(0.5 * angle * r) / math.sqrt(tolerance * (2 * r - tolerance))) if r > tolerance else 0
+    if segments > 1:
+      if type == BLOC_INVERSE:
+        feed *= segments
+      theta = angle / segments
+      dLinear = (target[linear] - pos[linear]) / segments if linear >= 0 else 0.0
+      point = list(pos)
+      for i in range(1, segments):
+        cosT, sinT = math.cos(i * theta), math.sin(i * theta)
+        point = list(point)
+        point[a0] = c0 + r0 * cosT - r1 * sinT
+        point[a1] = c1 + r0 * sinT + r1 * cosT
+        if linear >= 0:
+          point[linear] = pos[linear] + i * dLinear
+        self.__bloc(row, point, type, feed)
+    self.__bloc(row, target, type, feed)
+    return True
+
+
+class gcodeEstimateThread(QThread):
+  '''
+  Thread d'estimation de la duree d'un programme (gcodeListModel.lines()) par un gcodeEstimator.
+  Si filePath est fourni (fichier non modifie depuis son ouverture), l'estimation utilise les colonnes
+  du fichier (gcodeColumns, lues dans leur cache si possible) et les lignes uniquement si le fichier est illisible.
+  '''
+
+  sig_finished = pyqtSignal(object) # gcodeEstimator apres estimation complete
+
+  def __init__(self, lines, estimator: gcodeEstimator, filePath: str = None):
+    super().__init__()
+    self.__lines     = lines
+    self.__estimator = estimator
+    self.__filePath  = filePath
+    self.__abort     = False
+
+
+  def abort(self):
+    self.__abort = True
+
+
+  def run(self):
+    abort = lambda: self.__abort
+    columns = None
+    if self.__filePath:
+      try:
+        columns = gcodeColumns.load(self.__filePath)
+      except (OSError, ValueError):
+        columns = None
+    if columns is not None:
+      termine = self.__estimator.estimateColumns(columns, abort)
+    else:
+      termine = self.__estimator.estimate(self.__lines, abort)
+    if termine:
+      self.sig_finished.emit(self.__estimator)
@@ -0,0 +1,266 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import re
+from PyQt5.QtCore import QThread, pyqtSignal
+from .cn5X_config import *
+
+# Groupes modaux suivis, dans l'ordre des champs de gcodeModalState
+MODAL_MOTION   = { 0: "G0", 1: "G1", 2: "G2", 3: "G3", 38.2: "G38.2", 38.3: "G38.3", 38.4: "G38.4", 38.5: "G38.5", 80: "G80" }
+MODAL_PLANE    = { 17: "G17", 18: "G18", 19: "G19" }
+MODAL_DISTANCE = { 90: "G90", 91: "G91" }
+MODAL_FEED     = { 93: "G93", 94: "G94" }
+MODAL_UNITS    = { 20: "G20", 21: "G21" }
+MODAL_WCS      = { 54: "G54", 55: "G55", 56: "G56", 57: "G57", 58: "G58", 59: "G59" }
+MODAL_MOTION_NEEDS_AXIS = ["G2", "G3", "G38.2", "G38.3", "G38.4", "G38.5"] # Modes de mouvement refuses par Grbl sans mot d'axe
+MODAL_AXIS_LETTERS      = "XYZABCUVW"
+MODAL_AXIS_COMMANDS     = [10, 28, 30, 53, 92] # G non modaux utilisant les mots d'axe (ou n'acceptant que G0/G1)
+
+GCODE_COMMENTS = re.compile(r'\([^)]*\)|;.*')
+GCODE_WORDS    = re.compile(r'([A-Z])\s*([-+]?[0-9]*\.?[0-9]*)')
+GCODE_MODAL_LETTERS = re.compile(r'[GMFSgmfs]') # Lignes sans ces lettres : etat modal inchange
+
+
+class gcodeModalState():
+  '''
+  Etat modal GCode (au sens de Grbl) etabli par les lignes d'un programme :
+  mode de mouvement, plan, G90/G91, G93/G94, G20/G21, repere de travail, longueur d'outil,
+  avance F, vitesse de broche S, broche (M3/M4/M5) et arrosage (M7/M8/M9).
+  preamble() renvoie les lignes a envoyer pour retablir cet etat avant de reprendre un programme.
+  '''
+
+  __slots__ = ("motion", "plane", "distance", "feedMode", "units", "wcs", "toolLength", "spindle", "mist", "flood", "f", "s")
+
+  def __init__(self, values: tuple = None):
+    if values is None:
+      # Etat de Grbl a la mise sous tension
+      values = ("G0", "G17", "G90", "G94", "G21", "G54", "G49", "M5", False, False, None, None)
+    for nom, valeur in zip(self.__slots__, values):
+      setattr(self, nom, valeur)
+
+
+  def values(self):
+    ''' Tuple des valeurs (pour les points de reprise de gcodeModalIndex) '''
+    return tuple(getattr(self, nom) for nom in self.__slots__)
+
+
+  def __eq__(self, other):
+    return isinstance(other, gcodeModalState) and self.values() == other.values()
+
+
+  def __repr__(self):
+    return "gcodeModalState({})".format(self.values())
+
+
+  def update(self, line: str):
+    ''' Applique une ligne GCode a l'etat modal '''
+    if not GCODE_MODAL_LETTERS.search(line):
+      return
+    words = GCODE_WORDS.findall(GCODE_COMMENTS.sub('', line).upper())
+    motion = None
+    for lettre, valeur in words:
+      if lettre == 'G':
+        try:
+          code = float(valeur)
+        except ValueError:
+          continue
+        if code in MODAL_MOTION:
+          motion = MODAL_MOTION[code]
+        elif code in MODAL_PLANE:
+          self.plane = MODAL_PLANE[code]
+        elif code in MODAL_DISTANCE:
+          self.distance = MODAL_DISTANCE[code]
+        elif code in MODAL_FEED:
+          self.feedMode = MODAL_FEED[code]
+        elif code in MODAL_UNITS:
+          self.units = MODAL_UNITS[code]
+        elif code in MODAL_WCS:
+          self.wcs = MODAL_WCS[code]
+        elif code == 49:
+          self.toolLength = "G49"
+        elif code == 43.1:
+          z = [v for l, v in words if l == 'Z']
+          self.toolLength = "G43.1Z{}".format(z[0] if z else 0)
+      elif lettre == 'M':
+        try:
+          code = int(float(valeur))
+        except ValueError:
+          continue
+        if code in (3, 4, 5):
+          self.spindle = "M{}".format(code)
+        elif code == 7:
+          self.mist = True
+        elif code == 8:
+          self.flood = True
+        elif code == 9:
+          self.mist = self.flood = False
+        elif code in (2, 30):
+          # Fin de programme : Grbl restaure une partie des modes par defaut
+          self.motion, self.plane, self.distance, self.feedMode, self.wcs = "G1", "G17", "G90", "G94", "G54"
+          self.spindle, self.mist, self.flood = "M5", False, False
+      elif lettre == 'F':
+        self.f = valeur
+      elif lettre == 'S':
+        self.s = valeur
+    if motion is not None:
+      self.motion = motion
+
+
+  def preamble(self):
+    ''' Lignes GCode retablissant l'etat modal (sauf les modes de mouvement qui exigent des mots d'axe, cf. resumeLine()) '''
+    lignes = [self.units + self.distance + self.feedMode + self.plane + self.wcs, self.toolLength]
+    if self.f is not None:
+      lignes.append("F" + self.f)
+    broche = "S" + self.s if self.s is not None else ""
+    if broche != "" or self.spindle != "M5":
+      lignes.append(broche + self.spindle)
+    if self.mist or self.flood:
+      lignes.append(("M7" if self.mist else "") + ("M8" if self.flood else ""))
+    else:
+      lignes.append("M9")
+    if self.motion not in MODAL_MOTION_NEEDS_AXIS:
+      lignes.append(self.motion)
+    return lignes
+
+
+  def resumeLine(self, line: str):
+    '''
+    Lignes reprises : ajoute le mode de mouvement a la premiere ligne de mouvement (mots d'axe) s'il n'a pas pu
+    etre envoye seul par preamble(). Renvoie (ligne a envoyer, vrai si le mode de mouvement est retabli) :
+    les lignes precedentes (commentaires, F, M...) sont envoyees telles quelles.
+    '''
+    if self.motion not in MODAL_MOTION_NEEDS_AXIS:
+      return line, True
+    words = GCODE_WORDS.findall(GCODE_COMMENTS.sub('', line).upper())
+    codes = []
+    for lettre, valeur in words:
+      if lettre in 'GM':
+        try:
+          codes.append((lettre, float(valeur)))
+        except ValueError:
+          pass
+    if any(L == 'G' and c in MODAL_MOTION for L, c in codes) or any(L == 'M' and c in (2, 30) for L, c in codes):
+      return line, True # La ligne fixe elle-meme le mode de mouvement
+    if any(L == 'G' and c in MODAL_AXIS_COMMANDS for L, c in codes):
+      return line, False # Mots d'axe d'une commande non modale
+    if any(lettre in MODAL_AXIS_LETTERS for lettre, valeur in words):
+      return self.motion + line, True
+    return line, False
+
+
+class gcodeModalIndex():
+  '''
+  Index de l'etat modal d'un programme GCode, construit en une seule passe : l'etat avant les lignes
+  0, interval, 2 * interval... est conserve. L'etat avant n'importe quelle ligne est ensuite retrouve
+  en relisant au plus interval lignes a partir du point de reprise precedent.
+  Pendant la construction (gcodeModalIndexer), les points de reprise deja etablis sont utilisables
+  par un autre thread : covers(row) indique si l'etat avant la ligne row est deja accessible.
+  '''
+
+  def __init__(self, interval: int = GCODE_MODAL_CHECKPOINT):
+    self.__interval    = interval
+    self.__checkpoints = []
+    self.__rowCount    = 0
+    self.__complete    = False
+
+
+  def rowCount(self):
+    return self.__rowCount
+
+
+  def checkpointCount(self):
+    return len(self.__checkpoints)
+
+
+  def isComplete(self):
+    return self.__complete
+
+
+  def covers(self, row: int):
+    ''' Vrai si l'etat avant la ligne row est accessible : index complet ou point de reprise deja etabli '''
+    return self.__complete or row <= 0 or (row - 1) // self.__interval < len(self.__checkpoints)
+
+
+  def build(self, lines, abort = None):
+    ''' Parcourt les lignes (iterable) du programme, renvoie False si abort() l'a interrompu '''
+    state = gcodeModalState()
+    interval = self.__interval
+    # Les points de reprise sont ajoutes au fur et a mesure pour etre utilisables avant la fin (covers())
+    checkpoints = self.__checkpoints = []
+    self.__complete = False
+    row = -1
+    for row, line in enumerate(lines):
+      if row % interval == 0:
+        checkpoints.append(state.values())
+        if abort is not None and abort():
+          return False
+      state.update(line)
+    self.__rowCount = row + 1
+    self.__complete = True
+    return True
+
+
+  def stateAt(self, row: int, lines):
+    '''
+    Renvoie l'etat modal avant la ligne row.
+    lines(first, last) doit renvoyer les lignes first a last (inclus) du programme indexe (gcodeListModel.lines()).
+    '''
+    if row <= 0 or len(self.__checkpoints) == 0:
+      return gcodeModalState()
+    if self.__complete:
+      row = min(row, self.__rowCount)
+    n = min((row - 1) // self.__interval, len(self.__checkpoints) - 1)
+    state = gcodeModalState(self.__checkpoints[n])
+    first = n * self.__interval
+    if first < row:
+      for line in lines(first, row - 1):
+        state.update(line)
+    return state
+
+
+class gcodeModalIndexer(QThread):
+  '''
+  Thread de construction d'un gcodeModalIndex a partir des lignes d'un programme (gcodeListModel.lines()).
+  '''
+
+  sig_finished = pyqtSignal(object) # gcodeModalIndex construit
+
+  def __init__(self, lines):
+    super().__init__()
+    self.__lines = lines
+    self.__abort = False
+    self.__index = gcodeModalIndex()
+
+
+  def index(self):
+    ''' Index en cours de construction, utilisable jusqu'aux points de reprise deja etablis (covers()) '''
+    return self.__index
+
+
+  def abort(self):
+    self.__abort = True
+
+
+  def run(self):
+    if self.__index.build(self.__lines, lambda: self.__abort):
+      self.sig_finished.emit(self.__index)
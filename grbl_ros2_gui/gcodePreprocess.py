@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import re
+from .cn5X_config import *
+from .gcodeModal import GCODE_COMMENTS, MODAL_MOTION, MODAL_PLANE, MODAL_DISTANCE, MODAL_FEED, MODAL_UNITS, MODAL_WCS
+
+PREPROCESS_WORDS    = re.compile(r'([A-Z])([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))')
+PREPROCESS_BLANKS   = re.compile(r'\s+')
+PREPROCESS_GROUPS   = [MODAL_MOTION, MODAL_PLANE, MODAL_DISTANCE, MODAL_FEED, MODAL_UNITS, MODAL_WCS]
+PREPROCESS_NON_MODAL = [4, 10, 28, 28.1, 30, 30.1, 92, 92.1] # G non modaux apres lesquels la ligne est laissee telle quelle (hors mise en forme)
+PREPROCESS_PROBE    = [38.2, 38.3, 38.4, 38.5] # Sondages : toujours envoyes explicitement
+PREPROCESS_AXES     = "XYZABC"
+PREPROCESS_OFFSETS  = "IJKR"
+
+
+def compactNumber(valeur: str, decimals: int = None):
+  ''' Ecriture la plus courte d'un nombre : sans zeros inutiles, arrondi a decimals chiffres apres la virgule '''
+  if decimals is not None:
+    texte = "{:.{}f}".format(float(valeur), decimals)
+  else:
+    texte = valeur.lstrip('+')
+  if '.' in texte:
+    texte = texte.rstrip('0').rstrip('.')
+  signe = ''
+  if texte[:1] == '-':
+    signe, texte = '-', texte[1:]
+  texte = texte.lstrip('0')
+  if texte == '' or texte[:1] == '.' and texte.strip('.') == '':
+    return '0'
+  return signe + texte
+
+
+class gcodePreprocessor():
+  '''
+  Reduction du volume envoye a Grbl, ligne par ligne, sans changer ce que Grbl execute :
+  - commentaires retires (les lignes de commentaire seul sont renvoyees a part pour l'affichage de la progression),
+  - espaces supprimes, numeros de ligne (N) retires,
+  - mots G modaux deja actifs, F et S inchanges supprimes,
+  - nombres ecrits au plus court et arrondis a GCODE_PREPROCESS_DECIMALS_MM (G21) ou _INCH (G20) decimales,
+    en dessous de la resolution des machines et de la precision des flottants de Grbl. Les axes ne sont
+    arrondis qu'en G90 : en G91, les arrondis s'accumuleraient d'un deplacement a l'autre.
+  L'etat modal suivi est celui des lignes deja traitees : il part d'un etat inconnu (rien n'est supprime
+  avant d'avoir ete envoye une premiere fois, unites inconnues = arrondi en pouces, le plus fin),
+  un preprocesseur neuf doit etre utilise pour chaque envoi. Il suppose que Grbl accepte toutes les lignes :
+  apres un error:X, l'envoi du programme doit etre repris avec un nouveau preprocesseur.
+  '''
+
+  def __init__(self):
+    self.__modal    = [None] * len(PREPROCESS_GROUPS)
+    self.__f        = None
+    self.__s        = None
+    self.__units    = None
+    self.bytesIn    = 0 # Octets des lignes d'origine (retour chariot compris)
+    self.bytesOut   = 0 # Octets envoyes
+    self.linesIn    = 0
+    self.linesOut   = 0
+
+
+  def __reset(self):
+    self.__modal = [None] * len(PREPROCESS_GROUPS)
+    self.__f = self.__s = self.__units = None
+
+
+  def process(self, line: str):
+    '''
+    Renvoie le couple (ligne compactee ou "" s'il ne reste rien a envoyer, commentaire ou None).
+    Le commentaire n'est renvoye que pour les lignes ne contenant qu'un commentaire entre parentheses.
+    '''
+    self.linesIn += 1
+    self.bytesIn += len(line.encode()) + 1
+    commentaire = None
+    code = GCODE_COMMENTS.sub('', line)
+    if code.strip() == '':
+      texte = line.strip()
+      if texte[:1] == '(' and texte[-1:] == ')':
+        commentaire = texte
+      return "", commentaire
+    code = PREPROCESS_BLANKS.sub('', code)
+    if code[:1] in ('$', '%') or PREPROCESS_WORDS.sub('', code.upper()) != '':
+      # Commande systeme ou syntaxe non reconnue : seuls les commentaires et espaces sont retires
+      self.__reset()
+      return self.__count(code), None
+    words = PREPROCESS_WORDS.findall(code.upper())
+
+    # Premier passage : mots G (les unites s'appliquent a toute la ligne), fin de programme
+    codesG = [float(v) for l, v in words if l == 'G']
+    keepG = any(g in PREPROCESS_NON_MODAL for g in codesG)
+    for g in codesG:
+      if g in MODAL_UNITS and MODAL_UNITS[g] != self.__units:
+        # Changement d'unites : F est a redonner dans les nouvelles unites
+        self.__units = MODAL_UNITS[g]
+        self.__f = None
+      if g in MODAL_FEED and MODAL_FEED[g] != self.__modal[PREPROCESS_GROUPS.index(MODAL_FEED)]:
+        # Grbl remet l'avance a zero au changement de mode d'avance
+        self.__f = None
+    decimals = GCODE_PREPROCESS_DECIMALS_MM if self.__units == "G21" else GCODE_PREPROCESS_DECIMALS_INCH
+    inverseTime = self.__modal[PREPROCESS_GROUPS.index(MODAL_FEED)] == "G93" or 93 in codesG
+    if 91 in codesG or (90 not in codesG and self.__modal[PREPROCESS_GROUPS.index(MODAL_DISTANCE)] != "G90"):
+      axisDecimals = None
+    else:
+      axisDecimals = decimals
+
+    sortie = []
+    finProgramme = False
+    for lettre, valeur in words:
+      if lettre == 'G':
+        g = float(valeur)
+        for I, groupe in enumerate(PREPROCESS_GROUPS):
+          if g in groupe:
+            if groupe[g] == self.__modal[I] and not keepG and g not in PREPROCESS_PROBE:
+              break
+            self.__modal[I] = groupe[g]
+            sortie.append(groupe[g])
+            break
+        else:
+          sortie.append("G" + compactNumber(valeur))
+      elif lettre == 'F':
+        f = float(valeur)
+        if inverseTime or f != self.__f:
+          self.__f = f
+          sortie.append("F" + compactNumber(valeur))
+      elif lettre == 'S':
+        s = float(valeur)
+        if s != self.__s:
+          self.__s = s
+          sortie.append("S" + compactNumber(valeur))
+      elif lettre == 'N':
+        continue
+      elif lettre in PREPROCESS_AXES:
+        sortie.append(lettre + compactNumber(valeur, axisDecimals))
+      elif lettre in PREPROCESS_OFFSETS:
+        sortie.append(lettre + compactNumber(valeur, decimals))
+      else:
+        if lettre == 'M' and float(valeur) in (2, 30):
+          finProgramme = True
+        sortie.append(lettre + compactNumber(valeur))
+    if finProgramme:
+      # Grbl retablit ses modes par defaut a la fin du programme
+      self.__reset()
+    return self.__count("".join(sortie)), None
+
+
+  def __count(self, ligne: str):
+    if ligne != "":
+      self.linesOut += 1
+      self.bytesOut += len(ligne.encode()) + 1
+    return ligne
+
+
+  def bytesSaved(self):
+    return self.bytesIn - self.bytesOut
@@ -26,6 +26,9 @@ from math import *
 from PyQt5.QtCore import QCoreApplication, QObject, QThread, QTimer, QEventLoop, pyqtSignal, pyqtSlot, QIODevice
 from .cn5X_config import *
 from .grblComSerial import grblComSerial
+from .grblTrace import grblTrace
+from .grblMetrics import grblMetrics
+from .grblMotion import grblMotion
 
 GCODE_PARAMETER_OUTPUT_CHANGE_CMD = ["G10", "G28.1", "G30.1", "G38", "G43.1", "G49", "G92"]
 
@@ -41,15 +44,15 @@ class grblCom(QObject):
   sig_ok         = pyqtSignal()         # Emis a la reception de la chaine "ok"
   sig_error      = pyqtSignal(int)      # Emis a la reception d'une erreur Grbl, renvoie le N° d'erreur
   sig_alarm      = pyqtSignal(int)      # Emis a la reception d'une alarme Grbl, renvoie le N° d'alarme
-  sig_status     = pyqtSignal(str)      # Emis a la reception d'un message de status ("<...|.>"), renvoie la ligne complete
+  sig_status     = pyqtSignal(object)   # Emis a la reception d'un message de status ("<...|.>"), renvoie le grblStatus decode
   sig_config     = pyqtSignal(str)      # Emis a la reception d'une valeur de config ($XXX)
   sig_data       = pyqtSignal(str)      # Emis a la reception des autres donnees de Grbl, renvoie la ligne complete
   sig_probe      = pyqtSignal(str)      # Emis a la reception d'un résultat de probe
-  sig_emit       = pyqtSignal(str)      # Emis a l'envoi des donnees sur le port serie
+  sig_emit       = pyqtSignal(str, int) # Emis a l'envoi des donnees sur le port serie (ligne, N° de ligne du fichier GCode ou COM_NO_ROW)
   sig_recu       = pyqtSignal(str)      # Emis a la reception des donnees sur le port serie
-  sig_debug      = pyqtSignal(str)      # Emis a chaque envoi ou reception
   sig_activity   = pyqtSignal(bool)     # Emis a chaque changement de self.__okToSendGCode
   sig_serialLock = pyqtSignal(bool)     # Emis a chaque changement de self.__okToSendGCode
+  sig_streamStats = pyqtSignal(object)  # Emis a la fin d'un flux GCode, renvoie le dictionnaire de ses statistiques
 
 
   def __init__(self):
@@ -60,10 +63,27 @@ class grblCom(QObject):
     self.__connectStatus = False
     self.__grblInit      = False
     self.__pooling       = True
+    self.__streamingMode = COM_DEFAULT_STREAMING_MODE
+    self.__capturePath   = None
     self.__grblVersion   = ""
     self.__grblStatus    = ""
     self.__threads = []
     self.__refreshGcodeParameters = False
+    self.__trace         = grblTrace() # Traces de debug de grblCom et grblComSerial, videes par l'interface
+    self.__metrics       = grblMetrics() # Mesures de fonctionnement, conservees d'une connexion a l'autre
+    self.__motion        = grblMotion()  # Derniere position rapportee par Grbl, datee a sa reception
+
+
+  def trace(self):
+    return self.__trace
+
+
+  def metrics(self):
+    return self.__metrics
+
+
+  def motion(self):
+    return self.__motion
 
 
   def setDecodeur(self, decodeur):
@@ -74,23 +94,36 @@ class grblCom(QObject):
     return self.__decode
 
 
+  def setStreamingMode(self, mode: int):
+    ''' Definit le protocole de streaming (COM_STREAMING_SEND_RESPONSE ou COM_STREAMING_CHAR_COUNTING), pris en compte a la prochaine connexion '''
+    self.__streamingMode = mode
+
+
+  def streamingMode(self):
+    return self.__streamingMode
+
+
+  def setCapture(self, path: str):
+    ''' Enregistre tout le trafic avec Grbl dans path (grblRecorder), pris en compte a la prochaine connexion, None = pas de capture '''
+    self.__capturePath = path
+
+
+  def capture(self):
+    return self.__capturePath
+
+
   def startCom(self, comPort: str, baudRate: int):
     '''
     Gestion des communications serie et des timers dans des threads distincts
     '''
 
-    # TODO : Ajout possibilité de connection réseau
-    # Windows : pseudo serial over TCP driver => rien a faire
-    # Linux : use socat :
-    # sudo socat pty,link=/dev/ttyTCP0,raw tcp:127.0.0.1:1386
-    # comPort = "ttyTCP0" (si dans /dev)
-    # attention aux droits d'accès !
-    # comPort = "/tmp/ttyTCP0" (chemin absolu)
+    # Connexion reseau (Grbl-ESP32, passerelle serie/TCP) : comPort = "socket://hote:port"
+    # (ou tcp://, telnet://), cf. grblTransport. baudRate est alors ignore.
 
-    self.sig_debug.emit("grblCom.startCom(self, {}, {})".format(comPort, baudRate))
+    self.__trace.add(TRACE_LEVEL_COM, "grblCom.startCom(self, {}, {})", comPort, baudRate)
 
     self.sig_log.emit(logSeverity.info.value, 'grblCom: Starting grblComSerial thread on {}.'.format(comPort))
-    newComSerial = grblComSerial(self.__decode, comPort, baudRate, self.__pooling)
+    newComSerial = grblComSerial(self.__decode, comPort, baudRate, self.__pooling, self.__streamingMode, self.__trace, self.__capturePath, self.__metrics, self.__motion)
     thread = QThread()
     thread.setObjectName('grblComSerial')
     self.__threads.append((thread, newComSerial))  # need to store worker too otherwise will be gc'd
@@ -109,9 +142,9 @@ class grblCom(QObject):
     newComSerial.sig_probe.connect(self.sig_probe.emit)
     newComSerial.sig_emit.connect(self.sig_emit.emit)
     newComSerial.sig_recu.connect(self.sig_recu.emit)
-    newComSerial.sig_debug.connect(self.sig_debug.emit)
     newComSerial.sig_activity.connect(self.sig_activity.emit)
     newComSerial.sig_serialLock.connect(self.sig_serialLock.emit)
+    newComSerial.sig_streamStats.connect(self.sig_streamStats.emit)
 
     # Start the thread...
     thread.started.connect(newComSerial.run)
@@ -123,7 +156,7 @@ class grblCom(QObject):
 
   @pyqtSlot(bool)
   def on_sig_connect(self, value: bool):
-    self.sig_debug.emit("grblCom.on_sig_connect(self, {})".format(value))
+    self.__trace.add(TRACE_LEVEL_COM, "grblCom.on_sig_connect(self, {})", value)
     ''' Maintien l'etat de connexion '''
     self.__connectStatus = value
     self.sig_connect.emit()
@@ -131,7 +164,7 @@ class grblCom(QObject):
 
   @pyqtSlot(str)
   def  on_sig_init(self, buff: str):
-    self.sig_debug.emit("grblCom.on_sig_init(self, {})".format(buff))
+    self.__trace.add(TRACE_LEVEL_COM, "grblCom.on_sig_init(self, {})", buff)
     self.__grblInit = True
     self.__grblVersion = buff.split("[")[0]
     self.sig_init.emit(buff)
@@ -142,12 +175,12 @@ class grblCom(QObject):
     return self.__grblVersion
 
 
-  @pyqtSlot(str)
-  def on_sig_status(self, buff: str):
-    self.sig_debug.emit("grblCom.on_sig_status(self, {})".format(buff))
+  @pyqtSlot(object)
+  def on_sig_status(self, status):
     ''' Memorise le status de Grbl a chaque fois qu'on en voi un passer '''
-    self.__grblStatus = buff[1:].split('|')[0]
-    self.sig_status.emit(buff)
+    if status.etat is not None:
+      self.__grblStatus = status.etat
+    self.sig_status.emit(status)
     if self.__refreshGcodeParameters and (self.__grblStatus == GRBL_STATUS_IDLE):
       # Insère la commande Grbl pour relire les paramètres GCode
       self.__Com.gcodePush(CMD_GRBL_GET_GCODE_PARAMATERS, COM_FLAG_NO_OK | COM_FLAG_NO_ERROR)
@@ -165,7 +198,7 @@ class grblCom(QObject):
 
 
   def stopCom(self):
-    self.sig_debug.emit("grblCom.stopCom(self)")
+    self.__trace.add(TRACE_LEVEL_COM, "grblCom.stopCom(self)")
     ''' Stop le thread des communications serie '''
     self.clearCom() # Vide la file d'attente
     self.sig_log.emit(logSeverity.info.value, self.tr("Sending abort to serial communications thread..."))
@@ -177,6 +210,7 @@ class grblCom(QObject):
     self.sig_log.emit(logSeverity.info.value, self.tr("Child(s) thread(s) terminated."))
     self.__grblInit = False
     self.__threads = []
+    self.__motion.reset()
 
 
   def gcodeInsert(self, buff: str, flag=COM_FLAG_NO_FLAG):
@@ -200,6 +234,24 @@ class grblCom(QObject):
       self.sig_log.emit(logSeverity.warning.value, self.tr("grblCom: Grbl not connected or not initialized, [{}] could not be sent.").format(buff))
 
 
+  def gcodeSource(self, source):
+    ''' Ajout d'une source de lignes GCode (iterable de triplets (ligne, flag, N° de ligne du fichier GCode)) lue a la demande par le thread de communication '''
+    if self.__connectStatus and self.__grblInit:
+      self.__Com.gcodeSource(self.__watchSource(source))
+    else:
+      self.sig_log.emit(logSeverity.warning.value, self.tr("grblCom: Grbl not connected or not initialized, GCode source could not be sent."))
+
+
+  def __watchSource(self, source):
+    ''' Verifie au fil de la lecture si les commandes d'une source modifient les paramètres GCode (resultat de $#) '''
+    for buff, flag, row in source:
+      for cmd in GCODE_PARAMETER_OUTPUT_CHANGE_CMD:
+        if cmd in buff:
+          # On relira dès que Grbl sera Idle...
+          self.__refreshGcodeParameters = True
+      yield buff, flag, row
+
+
   def realTimePush(self, buff: str, flag=COM_FLAG_NO_FLAG):
     if self.__connectStatus and self.__grblInit:
       self.__Com.realTimePush(buff, flag)
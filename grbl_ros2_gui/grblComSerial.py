@@ -21,19 +21,32 @@
 '                                                                         '
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-import sys, time
-import serial
+import sys, time, re
+import threading
+from collections import deque
 from enum import Enum
 from math import *
 from PyQt5.QtCore import QCoreApplication, QObject, QThread, QTimer, QEventLoop, pyqtSignal, pyqtSlot, QIODevice
 from .cn5X_config import *
 from .grblComStack import grblStack
+from .grblStatus import grblStatus
+from .grblTransport import grblTransport, grblTransportError
+from .grblTrace import grblTrace
+from .grblRecorder import grblRecorder
+from .grblMetrics import grblMetrics
+from .grblMotion import grblMotion
 
 
 class grblComSerial(QObject):
   '''
   QObject worker assurant la gestion de la communication serie bidirectionnelle entre cn5X++ et grbl.
   Doit etre execute dans son propre thread pour ne pas bloquer l'interface graphique.
+  Les lectures sont faites par un thread dedie, bloque sur le port serie en attente de donnees,
+  les ecritures par le thread du worker, reveille uniquement par l'ajout d'une commande dans les piles,
+  un accuse de reception de Grbl ou l'echeance de l'interrogation periodique.
+  Les traces de debug passent par un grblTrace (partage avec grblCom) et ne coutent rien hors mode debug,
+  les mesures de fonctionnement (files d'attente, debits, delais des ok) par un grblMetrics.
+  La liaison (port serie ou socket TCP, cf. grblTransport) est choisie selon le nom du port.
   '''
 
   sig_connect    = pyqtSignal(bool)     # Message emis a la connexion (valeur = True) et a la deconnexion ou en cas d'erreur de connexion (valeur = False)
@@ -42,47 +55,69 @@ class grblComSerial(QObject):
   sig_ok         = pyqtSignal()         # Emis a la reception de la chaine "ok"
   sig_error      = pyqtSignal(int)      # Emis a la reception d'une erreur Grbl, renvoie le N° d'erreur
   sig_alarm      = pyqtSignal(int)      # Emis a la reception d'une alarme Grbl, renvoie le N° d'alarme
-  sig_status     = pyqtSignal(str)      # Emis a la reception d'un message de status ("<...|.>"), renvoie la ligne complete
+  sig_status     = pyqtSignal(object)   # Emis a la reception d'un message de status ("<...|.>"), renvoie le grblStatus decode
   sig_config     = pyqtSignal(str)      # Emis a la reception d'une valeur de config ($XXX)
   sig_data       = pyqtSignal(str)      # Emis a la reception des autres donnees de Grbl, renvoie la ligne complete
   sig_probe      = pyqtSignal(str)      # Emis a la reception d'un résultat de probe
-  sig_emit       = pyqtSignal(str)      # Emis a l'envoi des donnees sur le port serie
+  sig_emit       = pyqtSignal(str, int) # Emis a l'envoi des donnees sur le port serie (ligne, N° de ligne du fichier GCode ou COM_NO_ROW)
   sig_recu       = pyqtSignal(str)      # Emis a la reception des donnees sur le port serie
-  sig_debug      = pyqtSignal(str)      # Emis a chaque envoi ou reception
   sig_activity   = pyqtSignal(bool)     # Emis lors de l'émission/réception de données sur le port série
   sig_serialLock = pyqtSignal(bool)     # Emis a chaque changement de self.__okToSendGCode
+  sig_streamStats = pyqtSignal(object)  # Emis a la fin d'un flux GCode, renvoie le dictionnaire de ses statistiques
 
-  def __init__(self, decodeur, comPort: str, baudRate: int, pooling: bool):
+  def __init__(self, decodeur, comPort: str, baudRate: int, pooling: bool, streamingMode: int = COM_DEFAULT_STREAMING_MODE, trace: grblTrace = None, capturePath: str = None, metrics: grblMetrics = None, motion: grblMotion = None):
     super().__init__()
     self.__decode = decodeur
+    self.__trace  = trace if trace is not None else grblTrace()
+    self.__metrics = metrics if metrics is not None else grblMetrics()
+    self.__motion  = motion if motion is not None else grblMotion()
 
     self.__abort            = False
     self.__portName         = comPort
     self.__baudRate         = baudRate
+    self.__comPort          = None
+    self.__capturePath      = capturePath # Fichier de capture du trafic avec Grbl (grblRecorder), None = pas de capture
 
     self.__realTimeStack    = grblStack()
     self.__mainStack        = grblStack()
+    self.__sources          = deque() # Iterateurs de couples (ligne GCode, flag) lus a la demande apres la pile principale
 
     self.__initOK           = False
     self.__grblStatus       = ""
 
-    self.__queryCounter     = 0
-    self.__querySequence    = [
-      REAL_TIME_REPORT_QUERY,
-      REAL_TIME_REPORT_QUERY,
-      REAL_TIME_REPORT_QUERY,
-      REAL_TIME_REPORT_QUERY,
-      CMD_GRBL_GET_GCODE_STATE + '\n'
-    ]
-    self.__lastQueryTime    = time.time()
+    self.__nextQueryTime    = time.monotonic() # Echeance de la prochaine interrogation (?) de Grbl
+    self.__lastActivity     = 0                 # Heure du dernier envoi d'une commande autre que ?
+    self.__gcodeStateChanged = True             # Vrai si une commande a pu modifier l'etat modal GCode depuis le dernier $G
+    self.__lastGcodeStateQuery = 0
+    self.__modalWords       = re.compile(r'[GMFST]', re.IGNORECASE)
+    self.__comments         = re.compile(r'\([^)]*\)|;.*')
     self.__pooling          = pooling
     self.__okToSendGCode = True
     self.sig_serialLock.emit(self.__okToSendGCode)
 
+    self.__streamingMode    = streamingMode
+    self.__inFlight         = deque() # Triplets (nb octets, flag, heure d'envoi) des lignes envoyees en attente de reponse de Grbl
+    self.__inFlightBytes    = 0       # Nombre d'octets en attente dans le buffer RX de Grbl
+    self.__inFlightLock     = threading.Lock()
+
+    self.__wakeUp           = threading.Event() # Reveil du thread d'ecriture
+    self.__reader           = None              # Thread de lecture du port serie
+
+    # Statistiques de debit du flux GCode en cours
+    self.__streamStart      = None
+    self.__streamLines      = 0
+    self.__streamBytes      = 0
+    self.__lastAckTime      = 0       # Heure (perf_counter) du dernier accuse de reception
+    self.__waitingAck       = False   # Vrai si une ligne attend de la place dans le buffer de Grbl
+    self.__latencies        = [0] * COM_LATENCY_BINS # Histogramme des delais accuse de reception -> envoi de la ligne en attente
+    self.__latencyCount     = 0
+    self.__latencySum       = 0.0
+
 
   @pyqtSlot()
   def startPooling(self):
     self.__pooling = True
+    self.__wakeUp.set()
 
 
   @pyqtSlot()
@@ -95,6 +130,7 @@ class grblComSerial(QObject):
     ''' Traitement du signal demandant l'arret de la communication '''
     self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.py: abort received."))
     self.__abort = True
+    self.__wakeUp.set()
 
 
   @pyqtSlot()
@@ -102,6 +138,7 @@ class grblComSerial(QObject):
     ''' Vide les files d'attente '''
     self.__realTimeStack.clear()
     self.__mainStack.clear()
+    self.__sources.clear()
 
 
   @pyqtSlot(str)
@@ -109,6 +146,7 @@ class grblComSerial(QObject):
   def realTimePush(self, buff: str, flag = COM_FLAG_NO_FLAG):
     ''' Ajout d'une commande GCode dans la pile en mode FiFo '''
     self.__realTimeStack.addFiFo(buff, flag)
+    self.__wakeUp.set()
 
 
   @pyqtSlot(str)
@@ -116,6 +154,17 @@ class grblComSerial(QObject):
   def gcodePush(self, buff: str, flag = COM_FLAG_NO_FLAG):
     ''' Ajout d'une commande GCode dans la pile en mode FiFo (fonctionnement normal de la pile d'un programe GCode) '''
     self.__mainStack.addFiFo(buff, flag)
+    self.__wakeUp.set()
+
+
+  @pyqtSlot(object)
+  def gcodeSource(self, source):
+    '''
+    Ajout d'une source de commandes GCode (iterable de triplets (ligne, flag, N° de ligne du fichier GCode)).
+    Les lignes ne sont lues qu'au moment de leur envoi, une fois la pile principale vide.
+    '''
+    self.__sources.append(iter(source))
+    self.__wakeUp.set()
 
 
   @pyqtSlot(str)
@@ -123,9 +172,11 @@ class grblComSerial(QObject):
     ''' Reinitialisation de la communication série '''
     self.__realTimeStack.clear()
     self.__mainStack.clear()
-    self.__sendData(REAL_TIME_SOFT_RESET)
+    self.__sources.clear()
+    self.__clearInFlight()
     self.__okToSendGCode = True
     self.sig_serialLock.emit(self.__okToSendGCode)
+    self.realTimePush(REAL_TIME_SOFT_RESET)
 
 
   @pyqtSlot(str)
@@ -133,22 +184,181 @@ class grblComSerial(QObject):
   def gcodeInsert(self, buff: str, flag = COM_FLAG_NO_FLAG):
     ''' Insertion d'une commande GCode dans la pile en mode LiFo (commandes devant passer devant les autres) '''
     self.__mainStack.addLiFo(buff, flag)
+    self.__wakeUp.set()
+
+
+  def __nextGCode(self):
+    ''' Renvoie le prochain triplet (ligne, flag, N° de ligne) a envoyer : pile principale puis sources GCode, ou None '''
+    item = self.__mainStack.pop()
+    while item is None:
+      try:
+        source = self.__sources[0]
+      except IndexError:
+        # Plus de source (ou clearCom() depuis un autre thread)
+        return None
+      try:
+        item = next(source)
+      except StopIteration:
+        self.__sources.popleft()
+      except Exception as err:
+        self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__nextGCode(): Error reading GCode source: {}").format(err))
+        self.__sources.popleft()
+    return item
+
+
+  def __canSendGCode(self, nbBytes: int):
+    ''' Renvoie vrai si une ligne de nbBytes octets peut etre envoyee selon le protocole de streaming actif '''
+    if len(self.__inFlight) == 0:
+      return True
+    if self.__streamingMode == COM_STREAMING_CHAR_COUNTING:
+      # Le buffer circulaire de Grbl ne peut contenir que GRBL_RX_BUFFER_SIZE - 1 octets
+      return self.__inFlightBytes + nbBytes <= GRBL_RX_BUFFER_SIZE - 1
+    return False
+
+
+  def __setSerialLock(self, okToSend: bool):
+    if okToSend != self.__okToSendGCode:
+      self.__okToSendGCode = okToSend
+      self.sig_serialLock.emit(self.__okToSendGCode)
+
+
+  def __sendGCode(self, buff: str, flag = COM_FLAG_NO_FLAG):
+    ''' Envoie une ligne GCode et la memorise en attente de l'accuse de reception de Grbl '''
+    nbBytes = len(bytes(buff, sys.getdefaultencoding()))
+    with self.__inFlightLock:
+      self.__inFlight.append((nbBytes, flag, time.perf_counter()))
+      self.__inFlightBytes += nbBytes
+    self.__metrics.linesSent += 1
+    self.__metrics.bytesSent += nbBytes
+    # Statistiques de debit
+    if not flag & COM_FLAG_NO_OK:
+      if self.__streamStart is None:
+        self.__streamStart = time.time()
+        self.__streamLines = 0
+        self.__streamBytes = 0
+        self.__latencies = [0] * COM_LATENCY_BINS
+        self.__latencyCount = 0
+        self.__latencySum = 0.0
+      self.__streamLines += 1
+    if self.__waitingAck:
+      # Delai entre l'accuse de reception qui a libere la place et l'envoi de la ligne qui l'attendait
+      latency = time.perf_counter() - self.__lastAckTime
+      self.__latencies[min(int(latency / COM_LATENCY_RESOLUTION), COM_LATENCY_BINS - 1)] += 1
+      self.__latencyCount += 1
+      self.__latencySum += latency
+      self.__waitingAck = False
+    if self.__streamStart is not None:
+      self.__streamBytes += nbBytes
+    # Les commandes systeme ($) ne modifient pas l'etat modal GCode
+    if buff[:1] != '$' and self.__modalWords.search(self.__comments.sub('', buff)):
+      self.__gcodeStateChanged = True
+    self.__sendData(buff)
+
+
+  def __ackGCode(self):
+    ''' Libere la place de la plus ancienne ligne envoyee a la reception de son "ok" ou "error:X", renvoie son flag '''
+    with self.__inFlightLock:
+      if len(self.__inFlight) == 0:
+        # Reponse a une ligne envoyee hors protocole (ou apres un reset), on ignore.
+        return COM_FLAG_NO_FLAG
+      nbBytes, flag, tEnvoi = self.__inFlight.popleft()
+      self.__inFlightBytes -= nbBytes
+    self.__metrics.ack(self.__lastAckTime - tEnvoi)
+    return flag
+
+
+  def __clearInFlight(self):
+    ''' Grbl vide son buffer de reception en cas de reset ou d'alarme '''
+    with self.__inFlightLock:
+      self.__inFlight.clear()
+      self.__inFlightBytes = 0
+    # Un reset reinitialise aussi l'etat modal GCode
+    self.__gcodeStateChanged = True
+
+
+  def __queryDelay(self):
+    ''' Periode d'interrogation de Grbl (secondes) selon l'activite de la machine '''
+    if self.__grblStatus in GRBL_QUERY_FAST_STATUS \
+    or len(self.__inFlight) > 0 \
+    or time.monotonic() - self.__lastActivity < GRBL_QUERY_DELAY_IDLE / 1000:
+      return GRBL_QUERY_DELAY / 1000
+    return GRBL_QUERY_DELAY_IDLE / 1000
+
+
+  def __txSaturated(self):
+    ''' Vrai si le buffer d'emission du port serie n'arrive pas a se vider '''
+    # Seulement les octets deja remis au systeme : le bloc en cours de ce tour de boucle n'est pas encore envoye
+    try:
+      return self.__comPort.sentWaiting() > COM_TX_SATURATION
+    except Exception:
+      return False
 
 
-  def __sendData(self, buff: str):
-    ''' Envoie des donnees sur le port serie '''
-    # Signal debug pour toutes les donnees envoyees
-    if buff[-2:] == "\r\n":
-      self.sig_debug.emit(">>> " + buff[:-2] + "\\r\\n")
-    elif buff[-1:] == "\n":
-      self.sig_debug.emit(">>> " + buff[:-1] + "\\n")
+  def __pollGrbl(self):
+    ''' Interrogations de Grbl : status (?) a une frequence adaptee a l'etat de la machine, $G si l'etat modal a pu changer '''
+    now = time.monotonic()
+    if now < self.__nextQueryTime:
+      return
+    if self.__txSaturated():
+      # Pas d'interrogation tant que le port serie est sature, on retentera plus tard
+      self.__nextQueryTime = now + GRBL_QUERY_DELAY / 1000
+      return
+    self.realTimePush(REAL_TIME_REPORT_QUERY)
+    self.__nextQueryTime = now + self.__queryDelay()
+    if self.__gcodeStateChanged:
+      if self.__grblStatus == GRBL_STATUS_IDLE or now - self.__lastGcodeStateQuery >= GRBL_GCODE_STATE_DELAY / 1000:
+        self.gcodeInsert(CMD_GRBL_GET_GCODE_STATE, COM_FLAG_NO_OK | COM_FLAG_NO_ERROR)
+        self.__gcodeStateChanged = False
+        self.__lastGcodeStateQuery = now
+
+
+  def __latencyPercentile(self, percent: float):
+    ''' Delai (s) accuse de reception -> envoi en dessous duquel se trouvent percent % des mesures '''
+    seuil = self.__latencyCount * percent / 100
+    cumul = 0
+    for I, nb in enumerate(self.__latencies):
+      cumul += nb
+      if cumul >= seuil:
+        return (I + 1) * COM_LATENCY_RESOLUTION
+    return COM_LATENCY_BINS * COM_LATENCY_RESOLUTION
+
+
+  def __endOfStream(self):
+    ''' Trace et emet les statistiques de debit du flux GCode qui vient de se terminer '''
+    duree = time.time() - self.__streamStart
+    self.__streamStart = None
+    if self.__streamLines < COM_STREAM_STATS_MIN_LINES or duree <= 0:
+      return
+    mode = [k for k, v in COM_STREAMING_MODES.items() if v == self.__streamingMode][0]
+    stats = {
+      'mode':            mode,
+      'lines':           self.__streamLines,
+      'bytes':           self.__streamBytes,
+      'duration':        duree,
+      'linesPerSecond':  self.__streamLines / duree,
+      'bytesPerSecond':  self.__streamBytes / duree,
+      'ackLatencyCount': self.__latencyCount,
+      'ackLatencyMean':  self.__latencySum / self.__latencyCount if self.__latencyCount > 0 else 0.0,
+      'ackLatencyP99':   self.__latencyPercentile(99) if self.__latencyCount > 0 else 0.0
+    }
+    self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial: {} lines, {} bytes streamed in {:0.3f} s ({:0.1f} lines/s, {:0.0f} bytes/s, {} mode, ok -> send: mean {:0.3f} ms, p99 {:0.3f} ms).").format(
+      stats['lines'], stats['bytes'], duree, stats['linesPerSecond'], stats['bytesPerSecond'], mode,
+      stats['ackLatencyMean'] * 1000, stats['ackLatencyP99'] * 1000
+    ))
+    self.sig_streamStats.emit(stats)
+
+
+  def __sendData(self, buff: str, encoding: str = sys.getdefaultencoding()):
+    ''' Ajoute des donnees au bloc a envoyer sur le port serie par __flushData() '''
+    # Trace de toutes les donnees envoyees, mise en forme (repr) seulement a l'affichage
+    if self.__trace.level >= TRACE_LEVEL_DATA:
+      self.__trace.add(TRACE_LEVEL_DATA, ">>> {!r}", buff)
+    if buff == REAL_TIME_REPORT_QUERY:
+      self.__metrics.statusQueries += 1
     else:
-      if buff == REAL_TIME_SOFT_RESET:
-        self.sig_debug.emit(">>> REAL_TIME_SOFT_RESET")
-      elif buff == REAL_TIME_JOG_CANCEL:
-        self.sig_debug.emit(">>> REAL_TIME_JOG_CANCEL")
-      else:
-        self.sig_debug.emit(">>> " + buff)
+      # Interrogations rapides pour suivre la reaction de Grbl a la commande
+      self.__lastActivity = time.monotonic()
+      self.__nextQueryTime = min(self.__nextQueryTime, self.__lastActivity + GRBL_QUERY_DELAY / 1000)
     # Force l'etat "Home" car grbl bloque la commande ? pendant le Homing
     if buff[0:2] == CMD_GRBL_RUN_HOME_CYCLE:
       self.__decode.set_etatMachine(GRBL_STATUS_HOME)
@@ -156,35 +366,31 @@ class grblComSerial(QObject):
     # Force l'etat RUN en cas de Probe pour éviter le téléscopage avec les réponses de $#
     if "G38" in buff:
       self.__grblStatus = GRBL_STATUS_RUN
-    # Formatage du buffer a envoyer
-    buffWrite = bytes(buff, sys.getdefaultencoding())
-    # Temps necessaire pour la com (millisecondes), arrondi a l'entier superieur
-    tempNecessaire = ceil(1000 * len(buffWrite) * 8 / self.__baudRate)
-    timeout = 10 + (2 * tempNecessaire) # 2 fois le temps necessaire + 10 millisecondes
-    self.__comPort.write_timeout = timeout
-    # Ecriture sur le port serie
-    self.sig_debug.emit("grblComSerial.__sendData(), T = {} : timeout = {}".format(time.time() * 1000, timeout))
+    self.__comPort.write(bytes(buff, encoding))
+
+
+  def __flushData(self):
+    ''' Envoi en une seule ecriture de toutes les donnees ajoutees par __sendData() depuis le dernier envoi '''
+    if self.__comPort.outWaiting() == 0:
+      return
     self.sig_activity.emit(True)
     try:
-      self.__comPort.write(buffWrite)
-    except serial.SerialTimeoutException:
-      self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial: Error when sending data: timeout, err# = {}").format(self.__comPort.error()))
+      nbBytes = self.__comPort.flush()
+    except grblTransportError as err:
+      self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial: Error when sending data: {}").format(err))
     except:
       self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial: Unknown error"))
     else:
-      self.sig_debug.emit(self.tr("grblComSerial: Data sent, T = {}".format(time.time() * 1000)))
+      if self.__trace.level >= TRACE_LEVEL_DATA:
+        self.__trace.add(TRACE_LEVEL_DATA, "grblComSerial: {} bytes sent", nbBytes)
       self.sig_activity.emit(False)
 
 
-  def __traileLaLigne(self, l, flag = COM_FLAG_NO_FLAG):
-    ''' Emmet les signaux ad-hoc pour toutes les lignes recues  '''
-    # Envoi de toutes les lignes dans le debug
-    if l[-1:] == "\n":
-      self.sig_debug.emit("<<< " + l[:-1] + "\\n")
-    elif l[-2:] == "\r\n":
-      self.sig_debug.emit("<<< " + l[:-2] + "\\r\\n")
-    else:
-      self.sig_debug.emit("<<< " + l)
+  def __traileLaLigne(self, l, flag = COM_FLAG_NO_FLAG, recu: float = None):
+    ''' Emmet les signaux ad-hoc pour toutes les lignes recues (recu = heure time.monotonic() de reception) '''
+    # Trace de toutes les lignes recues
+    if self.__trace.level >= TRACE_LEVEL_DATA:
+      self.__trace.add(TRACE_LEVEL_DATA, "<<< {}", l)
     # Premier decodage pour envoyer le signal ah-hoc
     if l[:5] == "Grbl " and l[-5:] == "help]": # Init string : Grbl 1.1f ['$' for help]
       self.sig_init.emit(l)
@@ -199,8 +405,15 @@ class grblComSerial(QObject):
       alarmNum = int(l.split(':')[1])
       self.sig_alarm.emit(alarmNum)
     elif l[:1] == "<" and l[-1:] == ">":       # Real-time Status Reports
-      self.__grblStatus = l[1:].split('|')[0]
-      self.sig_status.emit(l)
+      status = grblStatus.parse(l)
+      if status is not None:
+        if status.etat is not None:
+          self.__grblStatus = status.etat
+        # Position datee a la reception, lue par le noeud ROS sans attendre le thread GUI
+        self.__motion.update(status, recu if recu is not None else time.monotonic())
+        self.sig_status.emit(status)
+      else:
+        self.sig_log.emit(logSeverity.warning.value, self.tr("grblComSerial: Incorrect status [{}].").format(l))
     elif l[:5] == "[PRB:": # Probe result
       self.sig_data.emit(l)
       self.sig_probe.emit(l)
@@ -213,69 +426,60 @@ class grblComSerial(QObject):
   def __openComPort(self):
     ''' Ouverture du port serie et attente de la chaine d'initialisation en provenence de Grbl '''
 
-    self.sig_debug.emit("grblComSerial.__openComPort(self)")
+    self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(self)")
 
     openReceiveTimeout = 2000 # Timeout for first Grbl serial message
     openResetTime = 2000      # Time for sending soft reset if init string is not receive from Grbl
     openMaxTime =   5000      # (ms) Timeout pour recevoir la reponse de Grbl apres ouverture du port = 5 secondes
 
-    # Configuration du port serie
-    self.__comPort = serial.Serial()
-    com_settings = {
-      'baudrate':           self.__baudRate,
-      'bytesize':           serial.EIGHTBITS,
-      'parity':             serial.PARITY_NONE,
-      'stopbits':           serial.STOPBITS_ONE,
-      'xonxoff':            False,
-      'dsrdtr':             False,
-      'rtscts':             False,
-      'timeout':            SERIAL_READ_TIMEOUT,
-      'write_timeout':      None,
-      'inter_byte_timeout': None
-      }
-    self.__comPort.apply_settings(com_settings)
-
-    self.__comPort.port = self.__portName
-
-    # Ouverture du port
-    RC = False
+    # Ouverture du port (port serie ou socket TCP selon le nom du port)
     try:
+      self.__comPort = grblTransport.create(self.__portName, self.__baudRate)
       self.__comPort.open()
-    except serial.SerialException as err:
+    except grblTransportError as err:
       self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): Error opening serial port : {0}").format(err))
-      self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): Error opening serial port : {0}").format(err))
+      self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): Error opening serial port : {0}", err)
       self.sig_connect.emit(False)
       return False
     except ValueError as err: #– Will be raised when parameter are out of range e.g. baud rate, data bits.
       self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): Parameter out of range : {0}").format(err))
-      self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): Parameter out of range : {0}").format(err))
+      self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): Parameter out of range : {0}", err)
       self.sig_connect.emit(False)
       return False
     except:
       self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): Unexpected error : {}").format(sys.exc_info()[0]))
-      self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): Unexpected error : {}").format(sys.exc_info()[0]))
+      self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): Unexpected error : {}", sys.exc_info()[0])
       self.sig_connect.emit(False)
       return False
 
     # Ouverture du port OK
     self.sig_connect.emit(True)
-    self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__openComPort(): comPort {} open.").format(self.__comPort.port))
-    self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): comPort {} open.").format(self.__comPort.port))
+    self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__openComPort(): comPort {} open.").format(self.__comPort.name))
+    self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): comPort {} open.", self.__comPort.name)
+
+    # Capture de tous les octets echanges, des la premiere ecriture
+    if self.__capturePath is not None:
+      try:
+        self.__comPort.recorder = grblRecorder(self.__capturePath)
+        self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__openComPort(): capturing serial traffic to {}.").format(self.__capturePath))
+      except OSError as err:
+        self.sig_log.emit(logSeverity.warning.value, self.tr("grblComSerial.__openComPort(): unable to create capture file: {}").format(err))
 
     # Initialisation Grbl
     tDebut=time.time() * 1000
-    self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): Wait for Grbl init... T = {:0.0f} ms...").format(tDebut))
+    self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): Wait for Grbl init...")
 
     # Reveille grbl
     self.__comPort.write(("\r\n\r\n").encode('utf-8'))
+    self.__flushData()
 
     # Attente que Grbl emette sur le port série
-    while self.__comPort.in_waiting == 0:
+    while self.__comPort.inWaiting() == 0:
       time.sleep(0.01)
       now = time.time() * 1000
       if now > tDebut + openReceiveTimeout:
         self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): timeout! No reply from Grbl."))
-        self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): timeout! No reply from Grbl."))
+        self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): timeout! No reply from Grbl.")
         self.sig_connect.emit(False)
         return False
 
@@ -283,19 +487,20 @@ class grblComSerial(QObject):
     tReset = False
     tDebut = time.time() * 1000
     while True:
-      while self.__comPort.in_waiting:
+      # Les lignes suivant la chaine d'initialisation sont laissees au thread de lecture
+      while not self.__initOK and self.__comPort.inWaiting():
         try:
           buff = self.__comPort.readline()
-        except serial.SerialException as err:
+        except grblTransportError as err:
           self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): Read error: {}".format(err)))
-          self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): Read error: {}".format(err)))
+          self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): Read error: {}", err)
           self.sig_connect.emit(False)
           return False
         try:
           l = buff.decode().strip()
-          self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): line received: \"") + l + "\"")
+          self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): line received: \"{}\"", l)
           if l[:5] == "Grbl " and l[-5:] == "help]": # Init string : Grbl V.Mx ['$' for help]
-            self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): Grbl init string received in {:0.0f} ms, OK.").format(time.time()*1000 - tDebut))
+            self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): Grbl init string received in {:0.0f} ms, OK.", time.time()*1000 - tDebut)
             self.sig_init.emit(l)
             self.__initOK = True
           else:
@@ -307,109 +512,149 @@ class grblComSerial(QObject):
         now = time.time() * 1000
         if now > tDebut + (openResetTime) and not tReset:
           # Try to send Reset to Grbl at half time of timeout
-          self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): No response from Grbl after {:0.0f}ms, sending soft reset...").format(openResetTime))
+          self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): No response from Grbl after {:0.0f}ms, sending soft reset...", openResetTime)
           self.__sendData(REAL_TIME_SOFT_RESET)
           self.__sendData("\r\n")
+          self.__flushData()
           tReset = True
         if now > tDebut + openMaxTime:
           self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): Grbl initialization: Timeout!"))
-          self.sig_debug.emit(self.tr("grblComSerial.__openComPort(): openMaxTime ({}ms) timeout elapsed !").format(openMaxTime))
+          self.__trace.add(TRACE_LEVEL_COM, "grblComSerial.__openComPort(): openMaxTime ({}ms) timeout elapsed !", openMaxTime)
           self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__openComPort(): Grbl's init string not received or unknown Grbl version."))
           self.sig_init.emit("Grbl ??? ['$' for help]")
           self.__initOK = True
           return True # On a pas recu la chaine d'initialisation de Grbl mais on essaie quand même...
       else: # self.__initOK
         # Appel de CMD_GRBL_GET_BUILD_INFO pour que l'interface recupere le nombre d'axes et leurs noms
-        self.__sendData(CMD_GRBL_GET_BUILD_INFO + "\n")
+        self.__sendGCode(CMD_GRBL_GET_BUILD_INFO + "\n")
+        self.__flushData()
         return True # On a bien recu la chaine d'initialisation de Grbl
 
+  def __readLoop(self):
+    ''' Thread de lecture : attente bloquante des lignes envoyees par Grbl '''
+    buff = b""
+    while not self.__abort:
+      try:
+        # Lecture d'une ligne envoyée par Grbl, bloquante au plus SERIAL_READ_TIMEOUT
+        buff += self.__comPort.readline()
+      except grblTransportError as err:
+        self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__readLoop(): Unexpected exception when reading serial port: {}").format(err))
+        self.__abort = True
+        self.__wakeUp.set()
+        break
+      if buff[-1:] != b"\n":
+        # Timeout de lecture, ligne vide ou incomplete
+        continue
+      recu = time.monotonic()
+      # Début d'activité de lecture
+      self.sig_activity.emit(True)
+      try:
+        l = buff.decode().strip()
+      except UnicodeDecodeError:
+        # Trace l'erreur et ignore...
+        self.sig_log.emit(logSeverity.warning.value, self.tr("grblComSerial.__readLoop(): utf-8 decode error, buff={}".format(buff)))
+        l = ""
+      buff = b""
+      # Fin de lecture
+      self.sig_activity.emit(False)
+      flag = COM_FLAG_NO_FLAG
+      if l == 'ok' or l[:6] == 'error:':
+        # Accuse de reception ou erreur de la plus ancienne ligne GCode envoyee
+        self.__lastAckTime = time.perf_counter()
+        flag = self.__ackGCode()
+        self.__wakeUp.set()
+      elif l[:6] == 'ALARM:' or (l[:5] == "Grbl " and l[-5:] == "help]"):
+        # Grbl vide son buffer de reception en cas d'alarme ou de reset
+        self.__clearInFlight()
+        self.__wakeUp.set()
+      if l[:6] == 'error:' or l[:6] == 'ALARM:':
+        self.__trace.add(TRACE_LEVEL_COM, "grblComSerial: __readLoop(): Grbl {} received.", l)
+      if l !='':
+        self.__traileLaLigne(l, flag, recu)
+
+
   def __mainLoop(self):
-    ''' Boucle principale du composant : lectures / ecritures sur le port serie '''
-    flag = COM_FLAG_NO_FLAG
-    while True:
+    ''' Boucle principale du composant : ecritures sur le port serie, les lectures sont faites par self.__reader '''
+    self.__reader = threading.Thread(target=self.__readLoop, name="grblComSerialReader", daemon=True)
+    self.__reader.start()
+    while not self.__abort:
+      # Attente d'un evenement : commande a envoyer, accuse de reception ou echeance du pooling
+      timeout = None
+      if self.__pooling and self.__initOK:
+        timeout = max(0, self.__nextQueryTime - time.monotonic())
+      self.__wakeUp.wait(timeout)
+      self.__wakeUp.clear()
+      # Process events to receive signals;
+      QCoreApplication.processEvents()
+      if self.__abort:
+        break
       # On commence par vider la file d'attente des commandes temps reel
       while not self.__realTimeStack.isEmpty():
-        toSend, flag = self.__realTimeStack.pop()
-        self.__sendData(toSend)
-      if self.__okToSendGCode == True:
-        # Envoi d'une ligne gcode si en attente
-        if not self.__mainStack.isEmpty():
-          # La pile n'est pas vide, on envoi la prochaine commande recuperee dans la pile GCode
-          toSend, flag = self.__mainStack.pop()
-          if toSend[-1:] != '\n':
-            toSend += '\n'
-          if not flag & COM_FLAG_NO_OK:
-            if toSend[-2:] == '\r\n':
-              self.sig_emit.emit(toSend[:-2])
-            else:
-              self.sig_emit.emit(toSend[:-1])
-          self.__sendData(toSend)
-          self.__okToSendGCode = False # On enverra plus de commande tant que l'on aura pas recu l'accuse de reception.
-          self.sig_serialLock.emit(self.__okToSendGCode)
-      else: # self.__okToSendGCode is False
-        self.sig_debug.emit(self.tr("grblComSerial.__mainLoop(): Not OK to send GCode ({}).").format(self.__mainStack.next()))
-        # Process events to receive signals;
-        QCoreApplication.processEvents()
-      #-----------------------------------------------------------------
-      # Lecture du port serie
-      #-----------------------------------------------------------------
-      while self.__comPort.in_waiting:
-        # Début d'activité de lecture
-        self.sig_activity.emit(True)
-        try:
-          # Lecture d'une ligne envoyée par Grbl
-          buff = self.__comPort.readline()
-          l = buff.decode().strip()
-          # Fin de lecture
-          self.sig_activity.emit(False)
-          if l.find('ok') >= 0 or l.find('error') >= 0 or l.find('ALARM') >= 0:
-            self.__okToSendGCode = True # Accuse de reception, erreur ou ALARME de la derniere commande GCode envoyee
-            self.sig_serialLock.emit(self.__okToSendGCode)
-          if l.find('ok') >= 0:
-            self.sig_debug.emit(self.tr("grblComSerial: __mainLoop(): ok received"))
-          if l.find('error') >= 0:
-            self.sig_debug.emit(self.tr("grblComSerial: __mainLoop(): error Grbl received [{}].").format(l))
-          if l.find('ALARM') >= 0:
-            self.sig_debug.emit(self.tr("grblComSerial: __mainLoop(): ALARM Grbl received [{}].").format(l))
-          if l !='':
-            self.__traileLaLigne(l, flag)
-        except serial.SerialTimeoutException:
-          self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__mainLoop: Timeout when reading serial port!"))
-        except serial.SerialException:
-          self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.__mainLoop(): Unexpected exception when reading serial port!"))
-        except UnicodeDecodeError:
-          # Trace l'erreur et ignore...
-          self.sig_log.emit(logSeverity.warning.value, self.tr("grblComSerial.__mainLoop(): utf-8 decode error, buff={}".format(buff)))
+        toSend, flag, row = self.__realTimeStack.pop()
+        # Commandes temps reel etendues (0x80 a 0xFF) : un octet par caractere, pas de sequence utf-8
+        self.__sendData(toSend, 'latin-1')
+      # Envoi des lignes gcode en attente tant que le protocole de streaming le permet
+      while True:
+        item = self.__nextGCode()
+        if item is None:
+          self.__setSerialLock(self.__canSendGCode(1))
+          if self.__streamStart is not None and len(self.__inFlight) == 0:
+            self.__endOfStream()
+          break
+        toSend, flag, row = item
+        if toSend[-1:] != '\n':
+          toSend += '\n'
+        if not self.__canSendGCode(len(bytes(toSend, sys.getdefaultencoding()))):
+          # Pas assez de place dans le buffer de Grbl, la ligne attendra le prochain accuse de reception.
+          self.__mainStack.addLiFo(*item)
+          self.__waitingAck = True
+          self.__setSerialLock(False)
+          if self.__trace.level >= TRACE_LEVEL_DATA:
+            self.__trace.add(TRACE_LEVEL_DATA, "grblComSerial.__mainLoop(): Not OK to send GCode ({}).", item)
+          break
+        if not flag & COM_FLAG_NO_OK:
+          if toSend[-2:] == '\r\n':
+            self.sig_emit.emit(toSend[:-2], row)
+          else:
+            self.sig_emit.emit(toSend[:-1], row)
+        self.__sendGCode(toSend, flag)
+        self.__setSerialLock(self.__canSendGCode(1))
 
-        # Process events to receive signals;
-        QCoreApplication.processEvents()
+      # Pooling : Interrogations de Grbl selon l'activite de la machine
+      if self.__pooling and self.__initOK:
+        self.__pollGrbl()
 
-      if self.__abort:
-        self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__mainLoop(): Abort received, closing the thread..."))
-        break # Sortie de la boucle principale
-
-      # Pooling : Interrogations de Grbl a interval regulier selon la sequence definie par self.__querySequence
-      if self.__pooling:
-        if (time.time() - self.__lastQueryTime) * 1000 > GRBL_QUERY_DELAY and self.__initOK:
-          if len(self.__querySequence[self.__queryCounter]) == 1:
-            self.realTimePush(self.__querySequence[self.__queryCounter])
-          else:
-            if self.__grblStatus == GRBL_STATUS_IDLE:
-              self.gcodeInsert(self.__querySequence[self.__queryCounter], COM_FLAG_NO_OK | COM_FLAG_NO_ERROR)
-          self.__lastQueryTime    = time.time()
-          self.__queryCounter += 1
-          if self.__queryCounter >= len(self.__querySequence):
-            self.__queryCounter = 0
+      # Envoi en une fois de tout ce qui a ete prepare pendant ce tour de boucle
+      self.__flushData()
+      self.__updateMetrics()
 
     # On est sorti de la boucle principale : fermeture du port.
+    self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__mainLoop(): Abort received, closing the thread..."))
+    self.__reader.join()
     self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__mainLoop(): Closing serial port."))
     self.sig_connect.emit(False)
     self.__comPort.close()
+    self.__closeCapture()
     self.__initOK = False
     # Emission du signal de fin
     self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.__mainLoop(): End."))
 
 
+  def __updateMetrics(self):
+    ''' Jauges des files d'attente, lues par grblMetrics.snapshot() '''
+    self.__metrics.mainQueue     = self.__mainStack.count()
+    self.__metrics.realTimeQueue = self.__realTimeStack.count()
+    self.__metrics.sourcesQueue  = len(self.__sources)
+    self.__metrics.rxInFlight    = self.__inFlightBytes
+    self.__metrics.linesInFlight = len(self.__inFlight)
+
+
+  def __closeCapture(self):
+    if self.__comPort is not None and self.__comPort.recorder is not None:
+      self.__comPort.recorder.close()
+      self.__comPort.recorder = None
+
+
   @pyqtSlot()
   def run(self):
     ''' Demarre la communication avec le port serie dans un thread separe '''
@@ -422,5 +667,6 @@ class grblComSerial(QObject):
       self.__mainLoop()
     else:
       self.sig_log.emit(logSeverity.error.value, self.tr("grblComSerial.run(): Unable to open serial port!"))
+      self.__closeCapture()
       # Emission du signal de fin
       self.sig_log.emit(logSeverity.info.value, self.tr("grblComSerial.run(): End."))
@@ -21,18 +21,22 @@
 '                                                                         '
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-from PyQt5.QtCore import QObject, QThread, QEventLoop, pyqtSignal, pyqtSlot
+import threading
+from collections import deque
 from .cn5X_config import *
 
 class grblStack():
   '''
   Gestionnaire de file d'attente du port serie.
-  Stocke des couples (CommandeGrbl, flag), soit en mode FiFo (addFiFo()), soit en mode LiFo (addLiFo())
-  et les renvoie dans l'ordre choisi avec la fonction pop().
+  Stocke des triplets (CommandeGrbl, flag, N° de ligne du fichier GCode), soit en mode FiFo (addFiFo()),
+  soit en mode LiFo (addLiFo()) et les renvoie dans l'ordre choisi avec la fonction pop().
+  Basee sur une deque (ajout et retrait en O(1) aux deux extremites), protegee par un verrou
+  car alimentee par le thread de l'interface graphique et videe par le thread de grblComSerial.
   '''
 
   def __init__(self):
-    self.__data = []
+    self.__data = deque()
+    self.__lock = threading.Lock()
 
   def isEmpty(self):
     return len(self.__data) == 0
@@ -40,33 +44,38 @@ class grblStack():
   def count(self):
     return len(self.__data)
 
-  def addFiFo(self, item, flag = COM_FLAG_NO_FLAG):
+  def addFiFo(self, item, flag = COM_FLAG_NO_FLAG, row = COM_NO_ROW):
     ''' Ajoute un element en mode FiFO, l'element ajoute sera le dernier a sortir
     '''
-    self.__data.append((item, flag))
+    with self.__lock:
+      self.__data.append((item, flag, row))
 
-  def addLiFo(self, item, flag = COM_FLAG_NO_FLAG):
+  def addLiFo(self, item, flag = COM_FLAG_NO_FLAG, row = COM_NO_ROW):
     ''' Ajoute un element en mode LiFO, l'element ajoute sera le premier a sortir
     '''
-    self.__data.insert(0, (item, flag))
+    with self.__lock:
+      self.__data.appendleft((item, flag, row))
 
   def next(self):
     ''' Renvoie le prochain element de la Queue sans depiler (le supprimer) ou None si la liste est vide.
     '''
-    if len(self.__data) > 0:
-      return self.__data[0]
-    else:
-      return None
+    with self.__lock:
+      if len(self.__data) > 0:
+        return self.__data[0]
+      else:
+        return None
 
   def pop(self):
     ''' Depile et renvoie le premier element de la liste ou None si la liste est vide.
     '''
-    if len(self.__data) > 0:
-      return self.__data.pop(0)
-    else:
-      return None
+    with self.__lock:
+      if len(self.__data) > 0:
+        return self.__data.popleft()
+      else:
+        return None
 
   def clear(self):
     ''' Vide toute la pile
     '''
-    self.__data.clear()
+    with self.__lock:
+      self.__data.clear()
@@ -28,8 +28,9 @@ from PyQt5.QtCore import QCoreApplication, QObject, QEventLoop, pyqtSignal, pyqt
 from .grblError import grblError
 from .speedOverrides import *
 from .grblCom import grblCom
-
-from math import radians
+from .grblStatus import grblStatus
+from .gcodeCheck import gcodeChecker
+from .gcodeEstimate import gcodeEstimator
 
 
 class grblDecode(QObject):
@@ -39,13 +40,15 @@ class grblDecode(QObject):
   - Met a jour l'interface graphique.
   - Stocke des valeurs des parametres decodes.
   '''
-  sig_publish_joint_states = pyqtSignal(object, object)
 
   def __init__(self, ui, log, grbl: grblCom):
     super().__init__()
     self.ui = ui
     self.log = log
     self.__grblCom   = grbl
+    self.__metrics   = grbl.metrics()
+    self.__feedOverride    = overrideTarget(FEED_OVERRIDE_CODES)
+    self.__spindleOverride = overrideTarget(SPINDLE_OVERRIDE_CODES)
     self.__nbAxis    = DEFAULT_NB_AXIS
     self.__axisNames = DEFAULT_AXIS_NAMES
     self.__validMachineState = [
@@ -77,6 +80,7 @@ class grblDecode(QObject):
       92: [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
     }
     self.__toolLengthOffset = 0
+    self.__settings = {} # Valeurs des parametres $x lus par $$
     self.__probeCoord = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
     self.__wco        = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
     self.__wpos       = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
@@ -85,6 +89,14 @@ class grblDecode(QObject):
     self.__offsetG5x  = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
     self.__etatArrosage = None
     self.__etatMachine = None
+    self.__status         = grblStatus() # Dernier etat decode
+    self.__statusAffiche  = grblStatus() # Etat affiche lors du dernier rafraichissement
+    self.__refreshTimer   = QtCore.QTimer()
+    self.__refreshTimer.setSingleShot(True)
+    self.__refreshTimer.setInterval(GUI_REFRESH_DELAY)
+    self.__refreshTimer.timeout.connect(self.on_refreshTimer)
+    # Table des leds des entrees (bit du masque Pn:, led)
+    self.__pinLeds = [(GRBL_PIN_BITS[L], getattr(self.ui, "cnLed" + L)) for L in GRBL_PIN_LETTERS]
     self.__getNextStatusOutput = False
     self.__getNextGCodeParams = False
     self.__getNextGCodeState = False
@@ -103,6 +115,16 @@ class grblDecode(QObject):
     ]
 
 
+  def feedOverride(self):
+    ''' overrideTarget de la surcharge d'avance de travail '''
+    return self.__feedOverride
+
+
+  def spindleOverride(self):
+    ''' overrideTarget de la surcharge de vitesse de broche '''
+    return self.__spindleOverride
+
+
   def getG5actif(self):
     return "G{}".format(self.__G5actif)
 
@@ -111,6 +133,8 @@ class grblDecode(QObject):
     if val < 3 or val > 6:
       raise RuntimeError(self.tr("The number of axis should be between 3 and 6!"))
     self.__nbAxis = val
+    # Force le reaffichage complet au prochain status
+    self.__statusAffiche = grblStatus()
 
 
   def getNextStatus(self):
@@ -129,197 +153,194 @@ class grblDecode(QObject):
     self.__getNextProbe = True
 
 
-  def decodeGrblStatus(self, grblOutput):
-
-    if grblOutput[0] != "<" or grblOutput[-1] != ">":
-      return self.tr("grblDecode.py.decodeGrblStatus():error ! \n[{}] Incorrect status.").format(grblOutput)
-
-    # Affiche la chaine complette dans la barrs de status self.__statusText
-    self.ui.statusBar.showMessage("{} + {}".format(self.__grblCom.grblVersion(), grblOutput))
-
-    flagPn = False
-    tblDecode = grblOutput[1:-1].split("|")
-    for D in tblDecode:
-      if D in self.__validMachineState:
-        if D != self.__etatMachine:
-          self.ui.lblEtat.setText(D)
-          self.__etatMachine = D
-          if D == GRBL_STATUS_IDLE:
-            if self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(False)
-            if self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(False)
-            if not self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(True)
-            self.ui.lblEtat.setToolTip(self.tr("Grbl is waiting for work."))
-          elif D ==GRBL_STATUS_HOLD0:
-            if self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(False)
-            if not self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(True)
-            if self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(False)
-            self.ui.lblEtat.setToolTip(self.tr("Hold complete. Ready to resume."))
-          elif D ==GRBL_STATUS_HOLD1:
-            if self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(False)
-            if not self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(True)
-            if self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(False)
-            self.ui.lblEtat.setToolTip(self.tr("Hold in-progress. Reset will throw an alarm."))
-          elif D =="Door:0":
-            self.ui.lblEtat.setToolTip(self.tr("Door closed. Ready to resume."))
-          elif D =="Door:1":
-            self.ui.lblEtat.setToolTip(self.tr("Machine stopped. Door still ajar. Can't resume until closed."))
-          elif D =="Door:2":
-            self.ui.lblEtat.setToolTip(self.tr("Door opened. Hold (or parking retract) in-progress. Reset will throw an alarm."))
-          elif D =="Door:3":
-            self.ui.lblEtat.setToolTip(self.tr("Door closed and resuming. Restoring from park, if applicable. Reset will throw an alarm."))
-          elif D == GRBL_STATUS_RUN:
-            if not self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(True)
-            if self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(False)
-            if self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(False)
-            self.ui.lblEtat.setToolTip(self.tr("Grbl running..."))
-          elif D == GRBL_STATUS_JOG:
-            self.ui.lblEtat.setToolTip(self.tr("Grbl jogging..."))
-          elif D == GRBL_STATUS_ALARM:
-            self.ui.lblEtat.setToolTip(self.tr("Grbl Alarm! see Grbl communication."))
-          elif D == GRBL_STATUS_HOME:
-            self.ui.lblEtat.setToolTip(self.tr("Grbl homing, wait for finish..."))
-          else:
-            self.ui.lblEtat.setToolTip("")
-
-      # Machine position MPos ($10=0 ou 2) ou WPos ($10=1 ou 3)?
-      elif D[:5] == "MPos:":
-        # Mémorise la dernière position machine reçue
-        tblPos = D[5:].split(",")
-        for I in range(len(tblPos)):
-          self.__mpos[I] = float(tblPos[I])
-          self.__wpos[I] = float(tblPos[I]) - self.__wco[I]
-        # Met à jour l'interface
-        if not self.ui.mnu_MPos.isChecked():
-          self.ui.mnu_MPos.setChecked(True)
-        if self.ui.mnu_WPos.isChecked():
-          self.ui.mnu_WPos.setChecked(False)
-        tblPos = D[5:].split(",")
-        self.ui.lblPosX.setText('{:+0.3f}'.format(float(tblPos[0]))); self.ui.lblPosX.setToolTip(self.tr("Machine Position (MPos)."))
-        self.ui.lblPosY.setText('{:+0.3f}'.format(float(tblPos[1]))); self.ui.lblPosY.setToolTip(self.tr("Machine Position (MPos)."))
-        self.ui.lblPosZ.setText('{:+0.3f}'.format(float(tblPos[2]))); self.ui.lblPosZ.setToolTip(self.tr("Machine Position (MPos)."))
-        if self.__nbAxis > 3:
-          self.ui.lblPosA.setText('{:+0.3f}'.format(float(tblPos[3]))); self.ui.lblPosA.setToolTip(self.tr("Machine Position (MPos)."))
-        else:
-          self.ui.lblPosA.setText("-")
-        if self.__nbAxis > 4:
-          self.ui.lblPosB.setText('{:+0.3f}'.format(float(tblPos[4]))); self.ui.lblPosB.setToolTip(self.tr("Machine Position (MPos)."))
-        else:
-          self.ui.lblPosB.setText("-")
-        if self.__nbAxis > 5:
-          self.ui.lblPosC.setText('{:+0.3f}'.format(float(tblPos[5]))); self.ui.lblPosB.setToolTip(self.tr("Machine Position (MPos)."))
-        else:
-          self.ui.lblPosC.setText("-")
-        # Publish JointStates to ROS backend
-        joint_values = [float(i)*0.001 for i in tblPos[:3]] + [radians(float(i)) for i in tblPos[3:]]
-        # invert Y and Z axis value because of the URDF definition
-        joint_values[1] = - joint_values[1] 
-        joint_values[2] = - joint_values[2] 
-        self.sig_publish_joint_states.emit(self.__axisNames, joint_values)
-
-      elif D[:5] == "WPos:":
-        # Mémorise la dernière position de travail reçue
-        tblPos = D[5:].split(",")
-        for I in range(len(tblPos)):
-          self.__wpos[I] = float(tblPos[I])
-          self.__mpos[I] = float(tblPos[I]) + self.__wco[I]
-        # Met à jour l'interface
-        if not self.ui.mnu_WPos.isChecked():
-          self.ui.mnu_WPos.setChecked(True)
-        if self.ui.mnu_MPos.isChecked():
-          self.ui.mnu_MPos.setChecked(False)
-        tblPos = D[5:].split(",")
-        self.ui.lblPosX.setText('{:+0.3f}'.format(float(tblPos[0]))); self.ui.lblPosX.setToolTip(self.tr("Working Position (WPos)."))
-        self.ui.lblPosY.setText('{:+0.3f}'.format(float(tblPos[1]))); self.ui.lblPosY.setToolTip(self.tr("Working Position (WPos)."))
-        self.ui.lblPosZ.setText('{:+0.3f}'.format(float(tblPos[2]))); self.ui.lblPosZ.setToolTip(self.tr("Working Position (WPos)."))
-        if self.__nbAxis > 3:
-          self.ui.lblPosA.setText('{:+0.3f}'.format(float(tblPos[3]))); self.ui.lblPosA.setToolTip(self.tr("Working Position (WPos)."))
-        else:
-          self.ui.lblPosA.setText("-")
-        if self.__nbAxis > 4:
-          self.ui.lblPosB.setText('{:+0.3f}'.format(float(tblPos[4]))); self.ui.lblPosB.setToolTip(self.tr("Working Position (WPos)."))
-        else:
-          self.ui.lblPosB.setText("-")
-        if self.__nbAxis > 5:
-          self.ui.lblPosC.setText('{:+0.3f}'.format(float(tblPos[5]))); self.ui.lblPosB.setToolTip(self.tr("Working Position (WPos)."))
-        else:
-          self.ui.lblPosC.setText("-")
-
-      elif D[:4] == "WCO:": # Work Coordinate Offset
-        tblPos = D[4:].split(",")
-        for I in range(len(tblPos)):
-          self.__wco[I] = float(tblPos[I])
-        self.ui.lblWcoX.setText('{:+0.3f}'.format(self.__wco[0]))
-        self.ui.lblWcoY.setText('{:+0.3f}'.format(self.__wco[1]))
-        self.ui.lblWcoZ.setText('{:+0.3f}'.format(self.__wco[2]))
-        if self.__nbAxis > 3:
-          self.ui.lblWcoA.setText('{:+0.3f}'.format(self.__wco[3]))
-        else:
-          self.ui.lblWcoA.setText("-")
-        if self.__nbAxis > 4:
-          self.ui.lblWcoB.setText('{:+0.3f}'.format(self.__wco[4]))
-        else:
-          self.ui.lblWcoB.setText("-")
-        if self.__nbAxis > 5:
-          self.ui.lblWcoC.setText('{:+0.3f}'.format(self.__wco[5]))
-        else:
-          self.ui.lblWcoC.setText("-")
-
-      elif D[:3] == "Bf:": # Buffer State (Bf:15,128)
-        tblValue = D[3:].split(",")
-        self.ui.progressBufferState.setValue(int(tblValue[0]))
-        self.ui.progressBufferState.setMaximum(int(tblValue[1]))
-        self.ui.progressBufferState.setToolTip("Buffer stat : " + tblValue[0] + "/" + tblValue[1])
-
-      elif D[:3] == "Ov:": # Override Values for feed, rapids, and spindle
-        values = D.split(':')[1].split(',')
-        # Avance de travail
-        if int(self.ui.lblAvancePourcent.text()[:-1]) != int(values[0]):
-          adjustFeedOverride(int(values[0]), int(self.ui.lblAvancePourcent.text()[:-1]), self.__grblCom)
-        # Avance rapide
-        if values[1] == 25:
-          self.ui.rbRapid025.setChecked(True)
-        if values[1] == 50:
-          self.ui.rbRapid050.setChecked(True)
-        if values[1] == 25:
-          self.ui.rbRapid100.setChecked(True)
-        # Ajuste la vitesse de broche
-        if int(self.ui.lblBrochePourcent.text()[:-1]) != int(values[2]):
-          adjustSpindleOverride(int(values[2]), int(self.ui.lblBrochePourcent.text()[:-1]), self.__grblCom)
-
-      elif D[:3] == "Pn:": # Input Pin State
-        flagPn = True
-        triggered = D[3:]
-        for L in ['X', 'Y', 'Z', 'A', 'B', 'C', 'P', 'D', 'H', 'R', 'S']:
-          if L in triggered:
-            exec("self.ui.cnLed" + L + ".setLedStatus(True)")
-          else:
-            exec("self.ui.cnLed" + L + ".setLedStatus(False)")
+  def decodeGrblStatus(self, status: grblStatus):
+    '''
+    Memorise l'etat de la machine a partir d'un rapport de status deja decode par grblComSerial.
+    La mise a jour de l'interface est differee au prochain rafraichissement (on_refreshTimer()),
+    seuls les champs ayant change depuis le dernier affichage sont alors mis a jour.
+    '''
+    self.__metrics.statusReports += 1
+    s = self.__status
+    s.raw = status.raw
+    # Si on a pas trouve la chaine Pn:, c'est que toute les leds sont eteintes.
+    s.pn  = status.pn
+    if status.etat is not None:
+      s.etat = status.etat
+      self.__etatMachine = status.etat
+
+    # Machine position MPos ($10=0 ou 2) ou WPos ($10=1 ou 3)?
+    if status.mpos is not None:
+      # Mémorise la dernière position machine reçue
+      for I in range(len(status.mpos)):
+        self.__mpos[I] = status.mpos[I]
+        self.__wpos[I] = status.mpos[I] - self.__wco[I]
+      s.mpos = status.mpos
+      s.wpos = None
+    elif status.wpos is not None:
+      # Mémorise la dernière position de travail reçue
+      for I in range(len(status.wpos)):
+        self.__wpos[I] = status.wpos[I]
+        self.__mpos[I] = status.wpos[I] + self.__wco[I]
+      s.wpos = status.wpos
+      s.mpos = None
+
+    if status.wco is not None: # Work Coordinate Offset
+      for I in range(len(status.wco)):
+        self.__wco[I] = status.wco[I]
+      s.wco = status.wco
+
+    if status.bf is not None: # Buffer State (Bf:15,128)
+      s.bf = status.bf
+      self.__metrics.buffers(status.bf)
+    if status.fs is not None: # Current Feed and Speed
+      s.fs = status.fs
+    s.ln = status.ln
+
+    if status.ov is not None: # Override Values for feed, rapids, and spindle
+      s.ov = status.ov
+      # Avance de travail et vitesse de broche : retablies si Grbl n'a pas les dernieres valeurs envoyees
+      self.__feedOverride.reported(status.ov[0], self.__grblCom)
+      self.__spindleOverride.reported(status.ov[2], self.__grblCom)
+
+    if not self.__refreshTimer.isActive():
+      self.__refreshTimer.start()
 
-      '''
-      elif D[:3] == "Ln:": # Line Number
-        return D
+    if self.__getNextStatusOutput:
+      self.__getNextStatusOutput = False
+      return status.raw
+    else:
+      return ""
 
-      elif D[2:] == "F:": # Current Feed and Speed
-        return D
 
-      elif D[3:] == "FS:": # Current Feed and Speed
-        return D
-      '''
-      '''
-      elif D[2:] == "A:": # OverrideAccessory State
-        return D
-      '''
-    if not flagPn:
-      # Eteint toute les leds. Si on a pas trouve la chaine Pn:, c'est que toute les leds sont eteintes.
-      for L in ['X', 'Y', 'Z', 'A', 'B', 'C', 'P', 'D', 'H', 'R', 'S']:
-        exec("self.ui.cnLed" + L + ".setLedStatus(False)")
+  @pyqtSlot()
+  def on_refreshTimer(self):
+    ''' Met a jour l'interface avec le dernier status decode, uniquement pour les champs modifies '''
+    s = self.__status
+    a = self.__statusAffiche
+
+    if s.raw != a.raw:
+      # Affiche la chaine complette dans la barrs de status self.__statusText
+      self.ui.statusBar.showMessage("{} + {}".format(self.__grblCom.grblVersion(), s.raw))
+
+    if s.etat is not None and s.etat != a.etat:
+      self.__afficheEtat(s.etat)
+
+    if s.mpos is not None and s.mpos != a.mpos:
+      self.__affichePos(s.mpos, True)
+    elif s.wpos is not None and s.wpos != a.wpos:
+      self.__affichePos(s.wpos, False)
+
+    if s.wco is not None and s.wco != a.wco:
+      self.ui.lblWcoX.setText('{:+0.3f}'.format(s.wco[0]))
+      self.ui.lblWcoY.setText('{:+0.3f}'.format(s.wco[1]))
+      self.ui.lblWcoZ.setText('{:+0.3f}'.format(s.wco[2]))
+      if self.__nbAxis > 3:
+        self.ui.lblWcoA.setText('{:+0.3f}'.format(s.wco[3]))
+      else:
+        self.ui.lblWcoA.setText("-")
+      if self.__nbAxis > 4:
+        self.ui.lblWcoB.setText('{:+0.3f}'.format(s.wco[4]))
+      else:
+        self.ui.lblWcoB.setText("-")
+      if self.__nbAxis > 5:
+        self.ui.lblWcoC.setText('{:+0.3f}'.format(s.wco[5]))
+      else:
+        self.ui.lblWcoC.setText("-")
+
+    if s.bf is not None and s.bf != a.bf:
+      self.ui.progressBufferState.setValue(s.bf[0])
+      self.ui.progressBufferState.setMaximum(s.bf[1])
+      self.ui.progressBufferState.setToolTip("Buffer stat : {}/{}".format(s.bf[0], s.bf[1]))
+
+    if s.ov is not None and s.ov != a.ov:
+      # Avance rapide
+      if s.ov[1] == 25:
+        self.ui.rbRapid025.setChecked(True)
+      elif s.ov[1] == 50:
+        self.ui.rbRapid050.setChecked(True)
+      elif s.ov[1] == 100:
+        self.ui.rbRapid100.setChecked(True)
+
+    if s.pn != a.pn: # Input Pin State
+      # Seules les leds dont l'entree a change d'etat sont mises a jour
+      changes = s.pn ^ a.pn if a.pn is not None else ~0
+      for bit, led in self.__pinLeds:
+        if changes & bit:
+          led.setLedStatus(s.pn & bit != 0)
+
+    self.__statusAffiche = s.copy()
+
+
+  def __afficheEtat(self, D: str):
+    self.ui.lblEtat.setText(D)
+    if D == GRBL_STATUS_IDLE:
+      if self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(False)
+      if self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(False)
+      if not self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(True)
+      self.ui.lblEtat.setToolTip(self.tr("Grbl is waiting for work."))
+    elif D ==GRBL_STATUS_HOLD0:
+      if self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(False)
+      if not self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(True)
+      if self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(False)
+      self.ui.lblEtat.setToolTip(self.tr("Hold complete. Ready to resume."))
+    elif D ==GRBL_STATUS_HOLD1:
+      if self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(False)
+      if not self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(True)
+      if self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(False)
+      self.ui.lblEtat.setToolTip(self.tr("Hold in-progress. Reset will throw an alarm."))
+    elif D =="Door:0":
+      self.ui.lblEtat.setToolTip(self.tr("Door closed. Ready to resume."))
+    elif D =="Door:1":
+      self.ui.lblEtat.setToolTip(self.tr("Machine stopped. Door still ajar. Can't resume until closed."))
+    elif D =="Door:2":
+      self.ui.lblEtat.setToolTip(self.tr("Door opened. Hold (or parking retract) in-progress. Reset will throw an alarm."))
+    elif D =="Door:3":
+      self.ui.lblEtat.setToolTip(self.tr("Door closed and resuming. Restoring from park, if applicable. Reset will throw an alarm."))
+    elif D == GRBL_STATUS_RUN:
+      if not self.ui.btnStart.getButtonStatus():    self.ui.btnStart.setButtonStatus(True)
+      if self.ui.btnPause.getButtonStatus():    self.ui.btnPause.setButtonStatus(False)
+      if self.ui.btnStop.getButtonStatus(): self.ui.btnStop.setButtonStatus(False)
+      self.ui.lblEtat.setToolTip(self.tr("Grbl running..."))
+    elif D == GRBL_STATUS_JOG:
+      self.ui.lblEtat.setToolTip(self.tr("Grbl jogging..."))
+    elif D == GRBL_STATUS_ALARM:
+      self.ui.lblEtat.setToolTip(self.tr("Grbl Alarm! see Grbl communication."))
+    elif D == GRBL_STATUS_HOME:
+      self.ui.lblEtat.setToolTip(self.tr("Grbl homing, wait for finish..."))
+    else:
+      self.ui.lblEtat.setToolTip("")
 
 
-    if self.__getNextStatusOutput:
-      self.__getNextStatusOutput = False
-      return grblOutput
+  def __affichePos(self, pos: tuple, machine: bool):
+    ''' Affiche les positions machine (MPos) ou de travail (WPos) '''
+    if machine:
+      if not self.ui.mnu_MPos.isChecked():
+        self.ui.mnu_MPos.setChecked(True)
+      if self.ui.mnu_WPos.isChecked():
+        self.ui.mnu_WPos.setChecked(False)
+      toolTip = self.tr("Machine Position (MPos).")
     else:
-      return ""
+      if not self.ui.mnu_WPos.isChecked():
+        self.ui.mnu_WPos.setChecked(True)
+      if self.ui.mnu_MPos.isChecked():
+        self.ui.mnu_MPos.setChecked(False)
+      toolTip = self.tr("Working Position (WPos).")
+    self.ui.lblPosX.setText('{:+0.3f}'.format(pos[0])); self.ui.lblPosX.setToolTip(toolTip)
+    self.ui.lblPosY.setText('{:+0.3f}'.format(pos[1])); self.ui.lblPosY.setToolTip(toolTip)
+    self.ui.lblPosZ.setText('{:+0.3f}'.format(pos[2])); self.ui.lblPosZ.setToolTip(toolTip)
+    if self.__nbAxis > 3:
+      self.ui.lblPosA.setText('{:+0.3f}'.format(pos[3])); self.ui.lblPosA.setToolTip(toolTip)
+    else:
+      self.ui.lblPosA.setText("-")
+    if self.__nbAxis > 4:
+      self.ui.lblPosB.setText('{:+0.3f}'.format(pos[4])); self.ui.lblPosB.setToolTip(toolTip)
+    else:
+      self.ui.lblPosB.setText("-")
+    if self.__nbAxis > 5:
+      self.ui.lblPosC.setText('{:+0.3f}'.format(pos[5])); self.ui.lblPosC.setToolTip(toolTip)
+    else:
+      self.ui.lblPosC.setText("-")
+
 
   def decodeGrblResponse(self, grblOutput):
 
@@ -356,6 +377,10 @@ class grblDecode(QObject):
           settingNum = int(float(grblOutput[1:].split('=')[0]))
         except ValueError:
           return grblOutput
+        try:
+          self.__settings[settingNum] = float(grblOutput.split('=')[1])
+        except (IndexError, ValueError):
+          pass
         settingInfo = self.grblSetting(settingNum)
         return (grblOutput + " >> " + settingInfo)
 
@@ -565,6 +590,7 @@ class grblDecode(QObject):
           # implémente l'option REPORT_VALUE_FOR_AXIS_NAME_ONCE
           self.__nbAxis = len(self.__axisNames);
         self.updateAxisDefinition()
+        self.__grblCom.motion().setAxisNames(self.__axisNames)
         return grblOutput
       
       else:
@@ -584,8 +610,10 @@ class grblDecode(QObject):
   def set_etatMachine(self, etat):
       if etat in self.__validMachineState:
         if etat != self.__etatMachine:
-          self.ui.lblEtat.setText(etat)
           self.__etatMachine = etat
+          self.__status.etat = etat
+          if not self.__refreshTimer.isActive():
+            self.__refreshTimer.start()
 
   def get_etatMachine(self):
     return self.__etatMachine
@@ -668,6 +696,36 @@ class grblDecode(QObject):
       return self.__G5x[30]
 
 
+  def getSetting(self, num: int):
+    ''' Valeur du parametre $num lue par $$, None si elle n'est pas connue '''
+    return self.__settings.get(num)
+
+
+  def gcodeChecker(self):
+    '''
+    Verificateur hors ligne de programme (gcodeChecker) configure selon Grbl : axes, courses maxi ($130...)
+    si les limites logicielles sont actives ($20), decalages ($#) et position machine si Grbl est connecte.
+    '''
+    nbAxis = min(self.__nbAxis, len(self.__axisNames))
+    maxTravel = None
+    if self.__settings.get(20) == 1 and all(130 + I in self.__settings for I in range(nbAxis)):
+      maxTravel = [self.__settings[130 + I] for I in range(nbAxis)]
+    offsets = {num: valeurs[:nbAxis] for num, valeurs in self.__G5x.items()}
+    mpos = self.__mpos[:nbAxis] if self.__grblCom.isOpen() else None
+    return gcodeChecker(self.__axisNames[:nbAxis], maxTravel, offsets, mpos)
+
+
+  def gcodeEstimator(self):
+    '''
+    Estimateur de la duree des programmes (gcodeEstimator) configure selon Grbl : axes, parametres
+    du planificateur lus par $$ ($11, $12, $110..., $120...), decalages ($#) et position machine si Grbl est connecte.
+    '''
+    nbAxis = min(self.__nbAxis, len(self.__axisNames))
+    offsets = {num: valeurs[:nbAxis] for num, valeurs in self.__G5x.items()}
+    mpos = self.__mpos[:nbAxis] if self.__grblCom.isOpen() else None
+    return gcodeEstimator(self.__axisNames[:nbAxis], dict(self.__settings), offsets, mpos)
+
+
   def grblSetting(self, num):
     ''' Renvoi la description d'un setting de Grbl en fonction de son numéro '''
     # "$-Code"," Setting"," Units"," Setting Description"
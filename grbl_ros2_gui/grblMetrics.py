@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import time
+from bisect import bisect_left
+from .cn5X_config import *
+
+
+class grblMetrics():
+  '''
+  Compteurs de fonctionnement de la communication avec Grbl, publies periodiquement (diagnostics ROS).
+  Alimentes sans verrou par grblComSerial (threads d'ecriture et de lecture), grblDecode et le thread GUI :
+  de simples affectations et increments d'entiers, rien n'est calcule ni mis en forme au moment de la mesure.
+  snapshot() calcule les debits et l'histogramme depuis l'appel precedent, il est appele par un seul lecteur
+  (timer du noeud ROS) ; une mesure concurrente a la remise a zero d'une fenetre peut etre perdue.
+  '''
+
+  def __init__(self):
+    # Jauges, mises a jour par grblComSerial a chaque tour de boucle d'ecriture
+    self.mainQueue        = 0 # Commandes dans la pile principale
+    self.realTimeQueue    = 0 # Commandes dans la pile temps reel
+    self.sourcesQueue     = 0 # Sources GCode (fichiers) en attente
+    self.rxInFlight       = 0 # Octets envoyes en attente de reponse (buffer RX de Grbl)
+    self.linesInFlight    = 0 # Lignes envoyees en attente de reponse
+    # Etat des buffers de Grbl (Bf:), mis a jour par grblDecode
+    self.plannerFree      = None # Blocs libres dans le planificateur
+    self.plannerSize      = 0    # Plus grand nombre de blocs libres vu (planificateur vide)
+    self.rxFree           = None # Octets libres dans le buffer de reception
+    # Compteurs cumules
+    self.linesSent        = 0
+    self.bytesSent        = 0
+    self.linesAcked       = 0
+    self.statusQueries    = 0 # ? envoyes
+    self.statusReports    = 0 # <...> recus
+    self.__rtt            = [0] * (len(METRICS_RTT_BOUNDS) + 1) # Histogramme envoi -> ok
+    self.__rttSum         = 0.0
+    self.__guiLagMax      = 0.0
+    self.__last           = None
+
+
+  def ack(self, roundTrip: float):
+    ''' Reception d'un ok ou error:X, roundTrip = delai (s) depuis l'envoi de la ligne '''
+    self.linesAcked += 1
+    self.__rtt[bisect_left(METRICS_RTT_BOUNDS, roundTrip)] += 1
+    self.__rttSum += roundTrip
+
+
+  def buffers(self, bf: tuple):
+    ''' Etat des buffers de Grbl (Bf:blocs libres,octets libres) '''
+    self.plannerFree, self.rxFree = bf[0], bf[1]
+    if bf[0] > self.plannerSize:
+      self.plannerSize = bf[0]
+
+
+  def guiLag(self, lag: float):
+    ''' Retard (s) d'un timer du thread GUI sur son echeance '''
+    if lag > self.__guiLagMax:
+      self.__guiLagMax = lag
+
+
+  def snapshot(self):
+    ''' Renvoie le dictionnaire des mesures, debits et histogramme calcules depuis l'appel precedent '''
+    now = time.monotonic()
+    totals = (self.linesSent, self.bytesSent, self.linesAcked, self.statusQueries, self.statusReports)
+    rtt, self.__rtt = self.__rtt, [0] * (len(METRICS_RTT_BOUNDS) + 1)
+    rttSum, self.__rttSum = self.__rttSum, 0.0
+    guiLag, self.__guiLagMax = self.__guiLagMax, 0.0
+    if self.__last is None:
+      rates = (0.0,) * len(totals)
+    else:
+      duree = max(now - self.__last[0], 1e-9)
+      rates = tuple((v - p) / duree for v, p in zip(totals, self.__last[1]))
+    self.__last = (now, totals)
+    nbRtt = sum(rtt)
+    return {
+      'mainQueue':         self.mainQueue,
+      'realTimeQueue':     self.realTimeQueue,
+      'sourcesQueue':      self.sourcesQueue,
+      'rxInFlight':        self.rxInFlight,
+      'linesInFlight':     self.linesInFlight,
+      'plannerFree':       self.plannerFree,
+      'plannerUsed':       self.plannerSize - self.plannerFree if self.plannerFree is not None else None,
+      'rxFree':            self.rxFree,
+      'linesSent':         totals[0],
+      'linesPerSecond':    rates[0],
+      'bytesPerSecond':    rates[1],
+      'acksPerSecond':     rates[2],
+      'statusQueryRate':   rates[3],
+      'statusReportRate':  rates[4],
+      'ackRoundTripCount': nbRtt,
+      'ackRoundTripMean':  rttSum / nbRtt if nbRtt > 0 else 0.0,
+      'ackRoundTripHistogram': rtt,
+      'guiLagMax':         guiLag,
+    }
@@ -0,0 +1,99 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+
+from math import sqrt
+from .cn5X_config import *
+from .grblStatus import grblStatus
+
+
+class grblMotion():
+  '''
+  Position machine entre deux rapports de status, pour la publication des joint_states a frequence fixe.
+  update() est appele par le thread de lecture de grblComSerial des l'arrivee d'un rapport : la position
+  (MPos, ou WPos + WCO) est datee a sa reception, sans passer par le thread GUI. En mouvement, la vitesse
+  est la direction du deplacement depuis le rapport precedent a l'avance reelle FS: (mm/min, tous axes
+  comme pour Grbl), ou ce deplacement divise par la duree entre les rapports si FS: n'est pas rapporte.
+  position() extrapole la derniere position a un instant donne, au plus MOTION_MAX_EXTRAPOLATION apres
+  le rapport pour ne pas depasser un arret ou un angle que le rapport suivant n'a pas encore signale.
+  L'echantillon (heure, position, vitesse) est remplace par une seule affectation : pas de verrou,
+  le lecteur (timer du noeud ROS) voit toujours un echantillon complet.
+  '''
+
+  def __init__(self, axisNames = DEFAULT_AXIS_NAMES):
+    self.__axisNames = tuple(axisNames)
+    self.__wco       = None # Dernier decalage de travail (WCO:) rapporte
+    self.__sample    = None # (heure, position machine, vitesse par axe et par seconde ou None) du dernier rapport
+
+
+  def setAxisNames(self, axisNames):
+    self.__axisNames = tuple(axisNames)
+
+
+  def axisNames(self):
+    return self.__axisNames
+
+
+  def reset(self):
+    ''' Oublie la derniere position (deconnexion) '''
+    self.__wco    = None
+    self.__sample = None
+
+
+  def update(self, status: grblStatus, t: float):
+    ''' Rapport de status status recu a l'heure t (time.monotonic()) '''
+    if status.wco is not None:
+      self.__wco = status.wco
+    if status.mpos is not None:
+      pos = status.mpos
+    elif status.wpos is not None and self.__wco is not None:
+      pos = tuple(w + o for w, o in zip(status.wpos, self.__wco))
+    else:
+      return
+    vitesse = None
+    precedent = self.__sample
+    if status.etat in GRBL_QUERY_FAST_STATUS and precedent is not None and len(precedent[1]) == len(pos):
+      delta = [p - q for p, q in zip(pos, precedent[1])]
+      norme = sqrt(sum(d * d for d in delta))
+      duree = t - precedent[0]
+      if norme > 0 and duree > 0:
+        k = status.fs[0] / 60 / norme if status.fs is not None else 1 / duree
+        vitesse = tuple(d * k for d in delta)
+    self.__sample = (t, pos, vitesse)
+
+
+  def position(self, t: float):
+    ''' Position machine extrapolee a l'heure t (time.monotonic()), None avant le premier rapport '''
+    sample = self.__sample
+    if sample is None:
+      return None
+    t0, pos, vitesse = sample
+    if vitesse is None:
+      return pos
+    duree = min(max(t - t0, 0.0), MOTION_MAX_EXTRAPOLATION)
+    return tuple(p + v * duree for p, v in zip(pos, vitesse))
+
+
+  def joints(self, t: float):
+    ''' (noms des axes, position extrapolee a l'heure t), lus ensemble pour un lecteur d'un autre thread '''
+    return self.__axisNames, self.position(t)
@@ -0,0 +1,156 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import os, time, struct, threading, argparse
+from .cn5X_config import *
+
+# Format des fichiers de capture :
+# - entete : CAPTURE_MAGIC, heure systeme et heure monotone (ns) de creation du fichier
+# - enregistrements : heure monotone (ns), sens (CAPTURE_TX ou CAPTURE_RX), longueur, puis les octets
+CAPTURE_MAGIC  = b"GRBLCAP\x01"
+CAPTURE_HEADER = struct.Struct("<8sqq")
+CAPTURE_RECORD = struct.Struct("<qBH")
+CAPTURE_TX     = 0 # Octets envoyes a Grbl
+CAPTURE_RX     = 1 # Octets recus de Grbl
+CAPTURE_MAX_CHUNK = 0xFFFF
+
+
+class grblRecorder():
+  '''
+  Enregistrement binaire de tous les octets echanges avec Grbl, horodates (horloge monotone, ns).
+  Appele par le transport (grblTransport) a chaque bloc envoye et a chaque lecture, depuis les threads
+  d'ecriture et de lecture : un verrou et un fichier bufferise, aucune mise en forme.
+  Le fichier tourne quand il depasse maxBytes : path -> path.1 -> ... -> path.<maxFiles - 1>.
+  '''
+
+  def __init__(self, path: str, maxBytes: int = COM_CAPTURE_MAX_BYTES, maxFiles: int = COM_CAPTURE_FILES):
+    self.__path     = path
+    self.__maxBytes = maxBytes
+    self.__maxFiles = maxFiles
+    self.__lock     = threading.Lock()
+    self.__file     = None
+    self.__size     = 0
+    self.__open()
+
+
+  def path(self):
+    return self.__path
+
+
+  def __open(self):
+    self.__file = open(self.__path, "wb", buffering=COM_CAPTURE_BUFFER_SIZE)
+    self.__file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, time.time_ns(), time.monotonic_ns()))
+    self.__size = CAPTURE_HEADER.size
+
+
+  def __rotate(self):
+    self.__file.close()
+    for I in range(self.__maxFiles - 1, 0, -1):
+      source = self.__path if I == 1 else "{}.{}".format(self.__path, I - 1)
+      if os.path.exists(source):
+        os.replace(source, "{}.{}".format(self.__path, I))
+    if self.__maxFiles <= 1:
+      os.remove(self.__path)
+    self.__open()
+
+
+  def record(self, direction: int, data: bytes):
+    ''' Ajoute un enregistrement (CAPTURE_TX ou CAPTURE_RX) '''
+    t = time.monotonic_ns()
+    with self.__lock:
+      if self.__file is None:
+        return
+      for I in range(0, len(data), CAPTURE_MAX_CHUNK):
+        bloc = data[I:I + CAPTURE_MAX_CHUNK]
+        self.__file.write(CAPTURE_RECORD.pack(t, direction, len(bloc)))
+        self.__file.write(bloc)
+        self.__size += CAPTURE_RECORD.size + len(bloc)
+      if self.__size >= self.__maxBytes:
+        self.__rotate()
+
+
+  def flush(self):
+    with self.__lock:
+      if self.__file is not None:
+        self.__file.flush()
+
+
+  def close(self):
+    with self.__lock:
+      if self.__file is not None:
+        self.__file.close()
+        self.__file = None
+
+
+  @staticmethod
+  def header(path: str):
+    ''' Renvoie (heure systeme, heure monotone) de creation du fichier de capture, en ns '''
+    with open(path, "rb") as f:
+      magic, wallTime, monoTime = CAPTURE_HEADER.unpack(f.read(CAPTURE_HEADER.size))
+    if magic != CAPTURE_MAGIC:
+      raise ValueError("{}: not a Grbl capture file".format(path))
+    return wallTime, monoTime
+
+
+  @staticmethod
+  def records(path: str):
+    ''' Generateur des enregistrements (heure monotone ns, sens, octets) d'un fichier de capture '''
+    grblRecorder.header(path)
+    with open(path, "rb") as f:
+      f.seek(CAPTURE_HEADER.size)
+      while True:
+        entete = f.read(CAPTURE_RECORD.size)
+        if len(entete) < CAPTURE_RECORD.size:
+          # Fin de fichier (ou dernier enregistrement tronque par un arret brutal)
+          return
+        t, direction, longueur = CAPTURE_RECORD.unpack(entete)
+        data = f.read(longueur)
+        if len(data) < longueur:
+          return
+        yield t, direction, data
+
+
+def main():
+  ''' Affiche le contenu d'un fichier de capture, avec les temps morts entre enregistrements '''
+  parser = argparse.ArgumentParser(description="Dump a Grbl serial capture file")
+  parser.add_argument("file", help="capture file (grbl_gui --capture)")
+  parser.add_argument("-g", "--gaps", type=float, default=0.0, metavar="MS", help="only show records following a gap longer than MS milliseconds")
+  args = parser.parse_args()
+
+  wallTime, monoTime = grblRecorder.header(args.file)
+  print("# capture started {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(wallTime / 1e9))))
+  precedent = monoTime
+  nb = [0, 0]
+  octets = [0, 0]
+  for t, direction, data in grblRecorder.records(args.file):
+    nb[direction] += 1
+    octets[direction] += len(data)
+    gap = (t - precedent) / 1e6
+    precedent = t
+    if gap >= args.gaps:
+      print("{:12.3f} {:9.3f} {} {!r}".format((t - monoTime) / 1e6, gap, ">>>" if direction == CAPTURE_TX else "<<<", data))
+  print("# TX: {} records, {} bytes, RX: {} records, {} bytes".format(nb[CAPTURE_TX], octets[CAPTURE_TX], nb[CAPTURE_RX], octets[CAPTURE_RX]))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,1332 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import os, sys, re, math, time, tty, select, socket, threading, argparse
+from collections import deque
+from .cn5X_config import *
+
+GRBL_SIM_BANNER       = "Grbl 1.1f ['$' for help]"
+GRBL_SIM_VERSION      = "[VER:1.1f.20170801:]"
+GRBL_SIM_OPTIONS      = "[OPT:V,{},{}]".format(GRBL_PLANNER_BUFFER_SIZE, GRBL_RX_BUFFER_SIZE)
+GRBL_SIM_HELP         = "[HLP:$$ $# $G $I $N $x=val $Nx=line $J=line $SLP $C $X $H ~ ! ? ctrl-x]"
+GRBL_SIM_LOOP_DELAY   = 0.05  # (s) Attente maxi de la boucle du simulateur
+
+# Parametres affiches en entiers par $$
+GRBL_SIM_INT_SETTINGS = frozenset([0, 1, 2, 3, 4, 5, 6, 10, 13, 20, 21, 22, 23, 26, 30, 31, 32])
+
+# Etapes d'execution d'une ligne
+STEP_BLOC  = 0 # Bloc de mouvement a placer dans le planificateur
+STEP_SYNC  = 1 # Fonction a executer quand tous les mouvements precedents sont termines
+STEP_REPLY = 2 # Reponse a envoyer (ok) une fois les etapes precedentes traitees
+
+
+class gcodeEtat():
+  ''' Etat modal du parser GCode et decalages, copie a chaque ligne pour n'appliquer que les lignes valides '''
+
+  __slots__ = ('motion', 'plane', 'units', 'distance', 'feedMode', 'coord', 'spindle', 'coolant',
+               'tool', 'feed', 'speed', 'pos', 'coords', 'g28', 'g30', 'g92', 'prb', 'prbOk')
+
+  def __init__(self, nbAxis: int):
+    self.coords = [[0.0] * nbAxis for I in range(6)]
+    self.g28    = [0.0] * nbAxis
+    self.g30    = [0.0] * nbAxis
+    self.g92    = [0.0] * nbAxis
+    self.prb    = [0.0] * nbAxis
+    self.prbOk  = False
+    self.pos    = [0.0] * nbAxis
+    self.resetModal()
+
+
+  def resetModal(self):
+    ''' Etat modal par defaut (mise sous tension, reset, M2 et M30) '''
+    self.motion   = 'G0'
+    self.plane    = 17
+    self.units    = 21
+    self.distance = 90
+    self.feedMode = 94
+    self.coord    = 0
+    self.spindle  = 'M5'
+    self.coolant  = set()
+    self.tool     = 0
+    self.feed     = 0.0
+    self.speed    = 0.0
+
+
+  def copy(self):
+    e = gcodeEtat.__new__(gcodeEtat)
+    for k in gcodeEtat.__slots__:
+      setattr(e, k, getattr(self, k))
+    e.coords  = [list(c) for c in self.coords]
+    e.g28     = list(self.g28)
+    e.g30     = list(self.g30)
+    e.g92     = list(self.g92)
+    e.prb     = list(self.prb)
+    e.pos     = list(self.pos)
+    e.coolant = set(self.coolant)
+    return e
+
+
+  def wco(self):
+    ''' Decalage courant entre coordonnees machine et coordonnees de travail '''
+    return [c + g for c, g in zip(self.coords[self.coord], self.g92)]
+
+
+class grblBloc():
+  '''
+  Bloc de mouvement du planificateur.
+  La duree d'execution suit un profil de vitesse trapezoidal (acceleration a, vitesse de croisiere vp)
+  entre la vitesse d'entree et la vitesse de sortie calculees au demarrage du bloc.
+  '''
+
+  __slots__ = ('start', 'target', 'delta', 'unit', 'length', 'vNominal', 'vMax', 'a', 'rapid', 'jog', 'check',
+               's0', 'pL', 'pv0', 'pvp', 'pv1', 'pa', 'pt1', 'pt2', 'pT', 'tAdded', 'tStart', 'tEnd', 'arret')
+
+  def __init__(self, start, target, vNominal: float, vMax: float, a: float, length: float, rapid: bool, jog: bool):
+    self.start    = start
+    self.target   = target
+    self.delta    = [t - s for s, t in zip(start, target)]
+    self.length   = length
+    self.unit     = [d / length for d in self.delta]
+    self.vNominal = vNominal # mm/s
+    self.vMax     = vMax     # mm/s
+    self.a        = a        # mm/s^2
+    self.rapid    = rapid
+    self.jog      = jog
+    self.check    = None     # Fonction de verification avant execution (limites logicielles)
+    self.s0       = 0.0      # Distance deja parcourue avant le profil courant
+    self.tAdded   = 0.0
+    self.tStart   = None
+    self.tEnd     = 0.0
+    self.arret    = False    # Vrai pendant la deceleration d'une suspension (feed hold, jog cancel)
+
+
+  def profil(self, L: float, v0: float, v1: float, vp: float, a: float):
+    ''' Calcule le profil trapezoidal parcourant L mm de v0 a v1 sans depasser vp '''
+    self.pL, self.pv0, self.pv1, self.pa = L, v0, v1, a
+    vp2 = a * L + (v0 * v0 + v1 * v1) / 2
+    if vp2 <= vp * vp:
+      # Profil triangulaire, la vitesse de croisiere n'est pas atteinte
+      vp = math.sqrt(vp2)
+      self.pt1 = self.pt2 = (vp - v0) / a
+    else:
+      d1 = (vp * vp - v0 * v0) / (2 * a)
+      d3 = (vp * vp - v1 * v1) / (2 * a)
+      self.pt1 = (vp - v0) / a
+      self.pt2 = self.pt1 + (L - d1 - d3) / vp
+    self.pvp = vp
+    self.pT  = self.pt2 + (vp - v1) / a
+
+
+  def distance(self, tau: float):
+    ''' Distance parcourue et vitesse au temps tau du profil courant '''
+    if tau <= 0:
+      return 0.0, self.pv0
+    if tau >= self.pT:
+      return self.pL, self.pv1
+    a = self.pa
+    if tau < self.pt1:
+      return self.pv0 * tau + a * tau * tau / 2, self.pv0 + a * tau
+    d1 = (self.pv0 + self.pvp) * self.pt1 / 2
+    if tau < self.pt2:
+      return d1 + self.pvp * (tau - self.pt1), self.pvp
+    u = tau - self.pt2
+    return d1 + self.pvp * (self.pt2 - self.pt1) + self.pvp * u - a * u * u / 2, self.pvp - a * u
+
+
+  def position(self, s: float):
+    ''' Position machine apres s mm parcourus depuis le debut du bloc '''
+    k = min(s / self.length, 1.0)
+    return [p + d * k for p, d in zip(self.start, self.delta)]
+
+
+class grblSimulator():
+  '''
+  Simulateur Grbl 1.1 sur pseudo-terminal, pour tester et mesurer la communication sans machine.
+  Le port esclave du pseudo-terminal (ou le lien symbolique link) s'ouvre comme un port serie Grbl.
+  Avec tcpPort, le simulateur ecoute en TCP sur localhost comme Grbl-ESP32 en telnet (port socket://127.0.0.1:tcpPort,
+  0 = port libre choisi par le systeme), un seul client a la fois, la connexion tient lieu d'ouverture du port :
+  - chaine d'initialisation a l'ouverture du port (reset DTR), apres un soft reset (0x18) ;
+  - buffer de reception de GRBL_RX_BUFFER_SIZE octets (les octets en trop sont perdus et comptes),
+    planificateur de GRBL_PLANNER_BUFFER_SIZE blocs, "ok" envoye quand le bloc entre dans le planificateur ;
+  - reponses ok, error:X, ALARM:X et messages [...] au format Grbl 1.1 ;
+  - commandes $, $$, $x=val, $#, $G, $I, $N, $C, $X, $H, $J=, $SLP, $RST= ;
+  - commandes temps reel ?, !, ~, 0x18, 0x84, 0x85 et surcharges 0x90 a 0xA1 ;
+  - duree des mouvements calculee a partir des parametres $110 a $125 (vitesse et acceleration par axe)
+    et de la deviation de jonction $11, multipliee par timeScale (0 = mouvements instantanes).
+  Simplifications : les surcharges d'avance s'appliquent au bloc suivant, les sondages (G38.x) touchent
+  toujours en fin de course, la vitesse de sortie d'un bloc ne tient compte que du bloc suivant.
+  '''
+
+  def __init__(self, nbAxis: int = DEFAULT_NB_AXIS, axisNames = None, timeScale: float = 1.0, link: str = None, verbose: bool = False, tcpPort: int = None):
+    if axisNames is None:
+      axisNames = DEFAULT_AXIS_NAMES[:nbAxis]
+    self.__nbAxis    = nbAxis
+    self.__axisNames = list(axisNames)
+    self.__timeScale = timeScale
+    self.__link      = link
+    self.__verbose   = verbose
+    self.__tcpPort   = tcpPort
+
+    self.__settings  = dict(GRBL_DEFAULT_SETTINGS)
+    for base, val in GRBL_DEFAULT_AXIS_SETTINGS.items():
+      for I in range(nbAxis):
+        self.__settings[base + I] = val
+    self.__startupBlocks = ["", ""]
+
+    self.__gc        = gcodeEtat(nbAxis)
+    self.__rx        = bytearray()
+    self.__out       = []
+    self.__planner   = deque()
+    self.__pending   = deque()
+    self.__mPos      = [0.0] * nbAxis
+    self.__tMotion   = 0.0 # Fin du dernier profil execute
+    self.__vExit     = 0.0 # Vitesse de sortie du dernier profil execute
+    self.__waitEnd   = None
+    self.__waitFn    = None
+    self.__etat      = GRBL_STATUS_IDLE
+    self.__jogCancel = False
+    self.__resetOverrides()
+
+    self.__lineRe     = re.compile(r'\([^)]*\)?|;.*|\s')
+    self.__wordRe     = re.compile(r'([A-Z])([^A-Z]*)')
+    self.__numberRe   = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)')
+    self.__realTimeRe = re.compile(rb'[?!~\x18\x80-\xff]')
+
+    self.__master    = None
+    self.__slavePath = None
+    self.__server    = None # Socket d'ecoute en mode TCP
+    self.__client    = None # Connexion TCP du client
+    self.__fd        = None # Descripteur de la liaison avec le client (maitre du pty ou socket du client)
+    self.__thread    = None
+    self.__stop      = False
+    self.__connected = False
+
+    # Compteurs pour les mesures
+    self.nbLines     = 0 # Lignes recues
+    self.nbBytes     = 0 # Octets recus (hors temps reel)
+    self.nbRealTime  = 0 # Commandes temps reel recues
+    self.rxOverflow  = 0 # Octets perdus par depassement du buffer de reception
+    self.rxMax       = 0 # Occupation maxi du buffer de reception
+    self.plannerMax  = 0 # Occupation maxi du planificateur
+
+
+  def start(self):
+    ''' Cree le pseudo-terminal (ou la socket d'ecoute) et demarre le thread du simulateur, renvoie le nom du port a ouvrir '''
+    if self.__tcpPort is not None:
+      self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+      self.__server.bind(("127.0.0.1", self.__tcpPort))
+      self.__server.listen(1)
+      self.__tcpPort = self.__server.getsockname()[1]
+      self.__stop = False
+      self.__thread = threading.Thread(target=self.__mainLoop, name="grblSimulator", daemon=True)
+      self.__thread.start()
+      return self.port()
+    self.__master, slave = os.openpty()
+    tty.setraw(slave)
+    self.__slavePath = os.ttyname(slave)
+    # Seul le client garde l'esclave ouvert : POLLHUP sur le maitre tant qu'aucun client n'est connecte
+    os.close(slave)
+    if self.__link is not None:
+      if os.path.islink(self.__link):
+        os.remove(self.__link)
+      os.symlink(self.__slavePath, self.__link)
+    self.__stop = False
+    self.__thread = threading.Thread(target=self.__mainLoop, name="grblSimulator", daemon=True)
+    self.__thread.start()
+    return self.port()
+
+
+  def stop(self):
+    ''' Arrete le thread du simulateur et ferme le pseudo-terminal '''
+    self.__stop = True
+    if self.__thread is not None:
+      self.__thread.join(5)
+      self.__thread = None
+    if self.__master is not None:
+      os.close(self.__master)
+      self.__master = None
+    if self.__client is not None:
+      self.__client.close()
+      self.__client = None
+    if self.__server is not None:
+      self.__server.close()
+      self.__server = None
+    if self.__link is not None and os.path.islink(self.__link):
+      os.remove(self.__link)
+
+
+  def port(self):
+    ''' Nom du port serie a ouvrir pour dialoguer avec le simulateur '''
+    if self.__server is not None:
+      return "socket://127.0.0.1:{}".format(self.__tcpPort)
+    return self.__link if self.__link is not None else self.__slavePath
+
+
+  def etat(self):
+    return self.__etat
+
+
+  def __mainLoop(self):
+    poller = select.poll()
+    if self.__server is not None:
+      poller.register(self.__server, select.POLLIN)
+    else:
+      self.__fd = self.__master
+      poller.register(self.__master, select.POLLIN)
+    while not self.__stop:
+      now = time.monotonic()
+      self.__run(now)
+      self.__flush()
+      events = poller.poll(self.__nextEvent(time.monotonic()) * 1000)
+      now = time.monotonic()
+      hangup = False
+      for fd, event in events:
+        if self.__server is not None and fd == self.__server.fileno():
+          self.__accept(poller, now)
+          continue
+        if event & select.POLLIN:
+          try:
+            data = os.read(fd, 4096)
+          except OSError:
+            data = b""
+          if data != b"":
+            if not self.__connected:
+              self.__connect(now)
+            self.__receive(data, now)
+            continue
+          if self.__server is not None:
+            # Connexion fermee par le client
+            hangup = True
+        if event & (select.POLLHUP | select.POLLERR):
+          hangup = True
+      if hangup:
+        # Pas de client sur le port esclave
+        if self.__connected:
+          self.__log("Port closed")
+          self.__connected = False
+        if self.__server is not None:
+          poller.unregister(self.__client)
+          self.__client.close()
+          self.__client = None
+          self.__fd = None
+        else:
+          time.sleep(GRBL_SIM_LOOP_DELAY)
+      elif not self.__connected and self.__server is None:
+        self.__connect(now)
+      self.__flush()
+
+
+  def __accept(self, poller, now: float):
+    ''' Connexion d'un client TCP, refusee si un client est deja connecte '''
+    try:
+      client, adresse = self.__server.accept()
+    except OSError:
+      return
+    if self.__client is not None:
+      client.close()
+      return
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    self.__client = client
+    self.__fd = client.fileno()
+    poller.register(client, select.POLLIN)
+    self.__connect(now)
+
+
+  def __connect(self, now: float):
+    ''' Ouverture du port par un client : equivalent du reset provoque par DTR a l'ouverture du port d'un Arduino '''
+    self.__log("Port opened")
+    self.__connected = True
+    self.__mPos = [0.0] * self.__nbAxis
+    self.__etat = GRBL_STATUS_IDLE
+    self.__softReset(now, powerUp = True)
+
+
+  def __log(self, msg: str):
+    if self.__verbose:
+      print("grblSimulator: {}".format(msg), file=sys.stderr)
+
+
+  def __write(self, line: str):
+    self.__out.append(line + "\r\n")
+    if self.__verbose:
+      self.__log("<< " + line)
+
+
+  def __flush(self):
+    if self.__out and self.__connected:
+      try:
+        os.write(self.__fd, "".join(self.__out).encode('ascii'))
+      except OSError:
+        pass
+    self.__out = []
+
+
+  def __nextEvent(self, now: float):
+    ''' Delai (s) jusqu'a la prochaine fin de mouvement ou d'attente '''
+    echeance = now + GRBL_SIM_LOOP_DELAY
+    if self.__planner and self.__planner[0].tStart is not None:
+      echeance = min(echeance, self.__planner[0].tEnd)
+    if self.__waitEnd is not None:
+      echeance = min(echeance, self.__waitEnd)
+    return max(0.0, echeance - now)
+
+
+  #-----------------------------------------------------------------------------
+  # Reception
+  #-----------------------------------------------------------------------------
+
+  def __receive(self, data: bytes, now: float):
+    ''' Les commandes temps reel sont traitees a la reception, le reste passe par le buffer de reception '''
+    pos = 0
+    for m in self.__realTimeRe.finditer(data):
+      self.__rxAppend(data[pos:m.start()], now)
+      self.__realTime(data[m.start()], now)
+      pos = m.end()
+    self.__rxAppend(data[pos:], now)
+
+
+  def __rxAppend(self, data: bytes, now: float):
+    self.nbBytes += len(data)
+    while data:
+      room = GRBL_RX_BUFFER_SIZE - 1 - len(self.__rx) # Buffer circulaire : une case reste toujours libre
+      self.__rx += data[:room]
+      data = data[room:]
+      self.rxMax = max(self.rxMax, len(self.__rx))
+      # Grbl lit les lignes au fur et a mesure de leur arrivee tant qu'il n'est pas bloque
+      self.__run(now)
+      if data and len(self.__rx) >= GRBL_RX_BUFFER_SIZE - 1:
+        self.rxOverflow += len(data)
+        self.__log("RX buffer overflow, {} bytes lost".format(len(data)))
+        return
+
+
+  def __realTime(self, c: int, now: float):
+    self.nbRealTime += 1
+    if c == ord(REAL_TIME_REPORT_QUERY):
+      self.__write(self.__statusReport(now))
+    elif c == ord(REAL_TIME_SOFT_RESET):
+      self.__softReset(now)
+    elif c == ord(REAL_TIME_FEED_HOLD):
+      if self.__etat == GRBL_STATUS_JOG:
+        self.__suspend(now, GRBL_STATUS_JOG, GRBL_STATUS_IDLE, jogCancel = True)
+      else:
+        self.__suspend(now, GRBL_STATUS_HOLD1, GRBL_STATUS_HOLD0)
+    elif c == ord(REAL_TIME_SAFETY_DOOR):
+      self.__suspend(now, GRBL_STATUS_DOOR2, GRBL_STATUS_DOOR0)
+    elif c == ord(REAL_TIME_JOG_CANCEL):
+      if self.__etat == GRBL_STATUS_JOG:
+        self.__suspend(now, GRBL_STATUS_JOG, GRBL_STATUS_IDLE, jogCancel = True)
+    elif c == ord(REAL_TIME_CYCLE_START_RESUME):
+      if self.__etat in [GRBL_STATUS_HOLD0, GRBL_STATUS_DOOR0]:
+        self.__etat = GRBL_STATUS_IDLE
+        self.__tMotion = now
+        self.__vExit = 0.0
+        self.__etatMouvement()
+        self.__run(now)
+    elif c == ord(REAL_TIME_FEED_100_POURCENT):   self.__setOverride('feed', 100)
+    elif c == ord(REAL_TIME_FEED_PLUS_10):        self.__setOverride('feed', self.__feedOv + 10)
+    elif c == ord(REAL_TIME_FEED_MOINS_10):       self.__setOverride('feed', self.__feedOv - 10)
+    elif c == ord(REAL_TIME_FEED_PLUS_1):         self.__setOverride('feed', self.__feedOv + 1)
+    elif c == ord(REAL_TIME_FEED_MOINS_1):        self.__setOverride('feed', self.__feedOv - 1)
+    elif c == ord(REAL_TIME_RAPID_100_POURCENT):  self.__setOverride('rapid', 100)
+    elif c == ord(REAL_TIME_RAPID_50_POURCENT):   self.__setOverride('rapid', 50)
+    elif c == ord(REAL_TIME_RAPID_25_POURCENT):   self.__setOverride('rapid', 25)
+    elif c == ord(REAL_TIME_SPINDLE_100_POURCENT): self.__setOverride('spindle', 100)
+    elif c == ord(REAL_TIME_SPINDLE_PLUS_10):     self.__setOverride('spindle', self.__spindleOv + 10)
+    elif c == ord(REAL_TIME_SPINDLE_MOINS_10):    self.__setOverride('spindle', self.__spindleOv - 10)
+    elif c == ord(REAL_TIME_SPINDLE_PLUS_1):      self.__setOverride('spindle', self.__spindleOv + 1)
+    elif c == ord(REAL_TIME_SPINDLE_MOINS_1):     self.__setOverride('spindle', self.__spindleOv - 1)
+    elif c == ord(REAL_TIME_TOGGLE_SPINDLE_STOP):
+      if self.__etat == GRBL_STATUS_HOLD0:
+        self.__spindleStop = not self.__spindleStop
+        self.__ovCounter = 0
+    elif c == ord(REAL_TIME_TOGGLE_FLOOD_COOLANT):
+      self.__toggleCoolant('M8')
+    elif c == ord(REAL_TIME_TOGGLE_MIST_COOLANT):
+      self.__toggleCoolant('M7')
+    # Les autres octets >= 0x80 sont ignores
+
+
+  def __resetOverrides(self):
+    self.__feedOv      = 100
+    self.__rapidOv     = 100
+    self.__spindleOv   = 100
+    self.__spindleStop = False
+    self.__spindle     = 'M5'
+    self.__speed       = 0.0
+    self.__coolant     = set()
+    self.__wcoCounter  = 0
+    self.__ovCounter   = 1
+
+
+  def __setOverride(self, nom: str, valeur: int):
+    if nom == 'rapid':
+      self.__rapidOv = valeur
+    else:
+      valeur = max(10, min(200, valeur))
+      if nom == 'feed':
+        self.__feedOv = valeur
+      else:
+        self.__spindleOv = valeur
+    # Le prochain status contiendra Ov:
+    self.__ovCounter = 0
+
+
+  def __toggleCoolant(self, code: str):
+    if self.__etat in [GRBL_STATUS_IDLE, GRBL_STATUS_RUN, GRBL_STATUS_HOLD0, GRBL_STATUS_HOLD1]:
+      self.__coolant ^= {code}
+      self.__gc.coolant = set(self.__coolant)
+      self.__ovCounter = 0
+
+
+  #-----------------------------------------------------------------------------
+  # Execution : planificateur, etapes en attente et buffer de reception
+  #-----------------------------------------------------------------------------
+
+  def __run(self, now: float):
+    ''' Fait avancer la simulation jusqu'a l'instant now '''
+    while True:
+      avance = self.__advanceMotion(now)
+      avance = self.__feedPending(now) or avance
+      avance = self.__processRx(now) or avance
+      if not avance:
+        break
+
+
+  def __etatMouvement(self):
+    ''' Etat Run, Jog ou Idle selon le contenu du planificateur '''
+    if self.__etat in [GRBL_STATUS_IDLE, GRBL_STATUS_RUN, GRBL_STATUS_JOG]:
+      if self.__planner:
+        self.__etat = GRBL_STATUS_JOG if self.__planner[0].jog else GRBL_STATUS_RUN
+      else:
+        self.__etat = GRBL_STATUS_IDLE
+
+
+  def __startBloc(self, bloc: grblBloc, now: float):
+    ''' Demarre (ou reprend apres suspension) l'execution du bloc en tete du planificateur '''
+    if bloc.check is not None and not bloc.check():
+      return False
+    debut = max(self.__tMotion, bloc.tAdded)
+    v0 = self.__vExit if debut == self.__tMotion else 0.0
+    if bloc.jog or bloc.rapid:
+      vp = bloc.vMax * (1 if bloc.jog else self.__rapidOv / 100)
+    else:
+      vp = min(bloc.vNominal * self.__feedOv / 100, bloc.vMax)
+    L = bloc.length - bloc.s0
+    v1 = 0.0
+    if len(self.__planner) > 1:
+      suivant = self.__planner[1]
+      v1 = min(self.__junctionSpeed(bloc, suivant), vp, suivant.vNominal, math.sqrt(2 * suivant.a * suivant.length))
+    v0 = min(v0, vp)
+    v1 = min(v1, math.sqrt(v0 * v0 + 2 * bloc.a * L))
+    bloc.profil(L, v0, v1, vp, bloc.a)
+    bloc.tStart = debut
+    bloc.tEnd   = debut + bloc.pT * self.__timeScale
+    return True
+
+
+  def __junctionSpeed(self, bloc: grblBloc, suivant: grblBloc):
+    ''' Vitesse maxi de passage entre deux blocs, calculee comme Grbl a partir de la deviation de jonction $11 '''
+    cosTheta = -sum(u * v for u, v in zip(bloc.unit, suivant.unit))
+    if cosTheta > 0.999999:
+      return 0.0 # Demi tour
+    if cosTheta < -0.999999:
+      return math.inf # Ligne droite
+    sinThetaD2 = math.sqrt(0.5 * (1.0 - cosTheta))
+    return math.sqrt(min(bloc.a, suivant.a) * self.__settings[11] * sinThetaD2 / (1.0 - sinThetaD2))
+
+
+  def __tau(self, bloc: grblBloc, now: float):
+    ''' Temps ecoule dans le profil du bloc, a l'echelle des durees calculees '''
+    if self.__timeScale <= 0:
+      return bloc.pT
+    return (now - bloc.tStart) / self.__timeScale
+
+
+  def __positionNow(self, now: float):
+    if self.__planner and self.__planner[0].tStart is not None:
+      bloc = self.__planner[0]
+      s, v = bloc.distance(self.__tau(bloc, now))
+      return bloc.position(bloc.s0 + s)
+    return list(self.__mPos)
+
+
+  def __speedNow(self, now: float):
+    ''' Vitesse courante en mm/min '''
+    if self.__planner and self.__planner[0].tStart is not None:
+      bloc = self.__planner[0]
+      s, v = bloc.distance(self.__tau(bloc, now))
+      return v * 60
+    return 0.0
+
+
+  def __advanceMotion(self, now: float):
+    ''' Termine les attentes et les blocs echus, demarre le bloc suivant '''
+    avance = False
+    while True:
+      if self.__waitEnd is not None:
+        if now < self.__waitEnd:
+          break
+        fn = self.__waitFn
+        self.__waitEnd = self.__waitFn = None
+        if fn is not None:
+          fn(now)
+        avance = True
+        continue
+      if not self.__planner or self.__etat not in [GRBL_STATUS_RUN, GRBL_STATUS_JOG, GRBL_STATUS_HOLD1, GRBL_STATUS_DOOR2]:
+        break
+      bloc = self.__planner[0]
+      if bloc.tStart is None:
+        if not self.__startBloc(bloc, now):
+          return True
+        avance = True
+      if now < bloc.tEnd:
+        break
+      # Fin du profil courant
+      self.__tMotion = bloc.tEnd
+      self.__vExit = bloc.pv1
+      if bloc.arret:
+        # Fin de deceleration d'une suspension
+        bloc.arret = False
+        bloc.s0 += bloc.pL
+        bloc.tStart = None
+        self.__vExit = 0.0
+        self.__mPos = bloc.position(bloc.s0)
+        if bloc.s0 >= bloc.length - 1e-9:
+          self.__planner.popleft()
+        if self.__jogCancel:
+          self.__jogCancel = False
+          self.__planner.clear()
+          self.__pending.clear()
+          self.__gc.pos = list(self.__mPos)
+          self.__etat = GRBL_STATUS_IDLE
+        elif self.__etat == GRBL_STATUS_HOLD1:
+          self.__etat = GRBL_STATUS_HOLD0
+        else:
+          self.__etat = GRBL_STATUS_DOOR0
+      else:
+        self.__planner.popleft()
+        self.__mPos = list(bloc.target)
+        self.__etatMouvement()
+      avance = True
+    return avance
+
+
+  def __suspend(self, now: float, etatDecel: str, etatArret: str, jogCancel: bool = False):
+    ''' Feed hold, porte ou annulation de jog : deceleration jusqu'a l'arret puis attente de reprise '''
+    if self.__etat in [GRBL_STATUS_RUN, GRBL_STATUS_JOG] and self.__planner and self.__planner[0].tStart is not None:
+      bloc = self.__planner[0]
+      s, v = bloc.distance(self.__tau(bloc, now))
+      bloc.s0 += s
+      reste = bloc.length - bloc.s0
+      a = bloc.a
+      if v > 0 and v * v / (2 * a) > reste:
+        # Arret force en fin de bloc
+        a = v * v / (2 * reste) if reste > 0 else math.inf
+      L = min(v * v / (2 * a), reste) if a != math.inf else 0.0
+      if L > 0:
+        bloc.profil(L, v, 0.0, v, a)
+      else:
+        bloc.profil(0.0, 0.0, 0.0, 0.0, 1.0)
+      bloc.tStart = now
+      bloc.tEnd = now + bloc.pT * self.__timeScale
+      bloc.arret = True
+      self.__jogCancel = jogCancel
+      self.__etat = etatDecel
+    elif self.__etat in [GRBL_STATUS_IDLE, GRBL_STATUS_RUN, GRBL_STATUS_JOG]:
+      if jogCancel:
+        self.__planner.clear()
+        self.__pending.clear()
+        self.__gc.pos = list(self.__mPos)
+      self.__etat = etatArret
+
+
+  def __feedPending(self, now: float):
+    ''' Traite les etapes de la ligne en cours : blocs vers le planificateur, synchronisations, reponse '''
+    avance = False
+    while self.__pending and self.__waitEnd is None:
+      kind, arg = self.__pending[0]
+      if kind == STEP_BLOC:
+        if len(self.__planner) >= GRBL_PLANNER_BUFFER_SIZE:
+          break
+        arg.tAdded = now
+        self.__planner.append(arg)
+        self.plannerMax = max(self.plannerMax, len(self.__planner))
+        self.__etatMouvement()
+      elif kind == STEP_SYNC:
+        if self.__planner:
+          break
+        arg(now)
+      else:
+        self.__write(arg)
+      self.__pending.popleft()
+      avance = True
+    return avance
+
+
+  def __startWait(self, now: float, duree: float, fn = None):
+    ''' Attente (tempo G4, cycle de homing) avant la suite des etapes en cours '''
+    self.__waitEnd = now + duree * self.__timeScale
+    self.__waitFn = fn
+
+
+  def __processRx(self, now: float):
+    ''' Execute la ligne suivante du buffer de reception si Grbl n'est pas bloque sur la ligne precedente '''
+    if self.__pending or self.__waitEnd is not None:
+      return False
+    fins = [i for i in (self.__rx.find(b'\n'), self.__rx.find(b'\r')) if i >= 0]
+    if not fins:
+      return False
+    fin = min(fins)
+    ligne = self.__rx[:fin].decode('ascii', 'replace')
+    del self.__rx[:fin + 1]
+    self.nbLines += 1
+    if self.__verbose:
+      self.__log(">> " + ligne)
+    self.__executeLine(ligne, now)
+    return True
+
+
+  #-----------------------------------------------------------------------------
+  # Execution d'une ligne
+  #-----------------------------------------------------------------------------
+
+  def __executeLine(self, ligne: str, now: float):
+    # Comme Grbl : suppression des espaces, des commentaires et des caracteres de controle, passage en majuscules
+    ligne = self.__lineRe.sub('', ligne).upper()
+    ligne = "".join(c for c in ligne if ' ' < c <= '~')
+    if ligne == "":
+      self.__write("ok") # Ligne vide ou commentaire : utilise pour la synchronisation
+      return
+    if len(ligne) >= GRBL_LINE_BUFFER_SIZE:
+      self.__write("error:11")
+      return
+    if ligne[0] == '$':
+      rc = self.__executeSystem(ligne, now)
+    elif self.__etat in [GRBL_STATUS_ALARM, GRBL_STATUS_JOG, GRBL_STATUS_SLEEP]:
+      rc = 9 # GCode bloque en alarme ou pendant un jog
+    else:
+      rc = self.__executeGCode(ligne)
+    if rc is not None:
+      self.__write("ok" if rc == 0 else "error:{}".format(rc))
+
+
+  def __executeGCode(self, ligne: str, jog: bool = False):
+    ''' Analyse la ligne, applique l'etat modal resultant et met en attente ses etapes d'execution '''
+    rc, etat, steps = self.__parseGCode(ligne, jog)
+    if rc != 0:
+      return rc
+    if jog:
+      # Un jog ne modifie pas l'etat modal du parser, seulement sa position
+      self.__gc.pos = etat.pos
+    else:
+      self.__gc = etat
+    if self.__etat == GRBL_STATUS_CHECK:
+      return 0
+    self.__pending.extend(steps)
+    self.__pending.append((STEP_REPLY, "ok"))
+    return None
+
+
+  def __blocs(self, start, target, rapid: bool, feed: float, inverseTime: bool, jog: bool = False, nbSegments: int = 1):
+    ''' Bloc de mouvement de start a target, None si le deplacement est nul '''
+    length = math.sqrt(sum((t - s) ** 2 for s, t in zip(start, target)))
+    if length < 1e-6:
+      return None
+    vMax = math.inf
+    aMax = math.inf
+    for I, (s, t) in enumerate(zip(start, target)):
+      u = abs(t - s) / length
+      if u > 1e-9:
+        vMax = min(vMax, self.__settings[110 + I] / 60 / u)
+        aMax = min(aMax, self.__settings[120 + I] / u)
+    if rapid or jog and feed <= 0:
+      vNominal = vMax
+    elif inverseTime:
+      # G93 : F est l'inverse de la duree (min) du mouvement complet
+      vNominal = min(length * feed * nbSegments / 60, vMax)
+    else:
+      vNominal = min(feed / 60, vMax)
+    bloc = grblBloc(list(start), list(target), vNominal, vMax, aMax, length, rapid, jog)
+    if jog:
+      bloc.vMax = vNominal
+    if self.__settings[20] and not jog:
+      bloc.check = lambda: self.__checkSoftLimits(bloc.target)
+    return (STEP_BLOC, bloc)
+
+
+  def __inLimits(self, target):
+    ''' Limites logicielles : l'espace machine va de -$130 a 0 (prise d'origine en fin de course positive) '''
+    return all(-self.__settings[130 + I] - 1e-6 <= v <= 1e-6 for I, v in enumerate(target))
+
+
+  def __checkSoftLimits(self, target):
+    if self.__inLimits(target):
+      return True
+    self.__alarm(2)
+    return False
+
+
+  def __alarm(self, code: int):
+    ''' Alarme : arret immediat, buffers vides, seul un reset permet d'en sortir '''
+    self.__planner.clear()
+    self.__pending.clear()
+    self.__rx.clear()
+    self.__waitEnd = self.__waitFn = None
+    self.__gc.pos = list(self.__mPos)
+    self.__etat = GRBL_STATUS_ALARM
+    self.__write("ALARM:{}".format(code))
+    self.__write("[MSG:Reset to continue]")
+
+
+  def __parseGCode(self, ligne: str, jog: bool = False):
+    '''
+    Analyse et valide une ligne GCode (nettoyee, en majuscules) sur une copie de l'etat modal.
+    Renvoie (0, nouvel etat, etapes) ou (code erreur Grbl, None, None)
+    '''
+    if not ligne[0].isalpha():
+      return 1, None, None
+    groups = {}
+    mGroups = {}
+    words = {}
+    for m in self.__wordRe.finditer(ligne):
+      lettre, txt = m.group(1), m.group(2)
+      if not self.__numberRe.fullmatch(txt):
+        return 2, None, None
+      val = float(txt)
+      if lettre == 'G':
+        code = round(val, 1)
+        if code == int(code):
+          code = int(code)
+        if code not in GRBL_G_GROUPS:
+          return 20, None, None
+        group = GRBL_G_GROUPS[code]
+        if group in groups:
+          return 21, None, None
+        groups[group] = code
+      elif lettre == 'M':
+        if val not in GRBL_M_GROUPS:
+          return 20, None, None
+        group = GRBL_M_GROUPS[val]
+        if group in mGroups:
+          return 21, None, None
+        mGroups[group] = int(val)
+      elif lettre in words:
+        return 25, None, None
+      elif lettre in self.__axisNames or lettre in "FIJKLNPRST":
+        words[lettre] = val
+      else:
+        return 20, None, None
+    for lettre in "FNPST":
+      if words.get(lettre, 0) < 0:
+        return 4, None, None
+    if words.get('N', 0) > 9999999:
+      return 27, None, None
+    if words.get('T', 0) > GRBL_MAX_TOOL_NUMBER:
+      return 38, None, None
+    if jog:
+      if mGroups or set(groups) - {'units', 'distance', 'nonModal'} or groups.get('nonModal', 53) != 53 \
+        or set(words) - set(self.__axisNames) - {'F', 'N'}:
+        return 16, None, None
+      if 'F' not in words:
+        return 22, None, None
+
+    etat = self.__gc.copy()
+    steps = []
+    used = set()
+    etat.feedMode = groups.get('feedMode', etat.feedMode)
+    etat.units    = groups.get('units', etat.units)
+    k = 25.4 if etat.units == 20 else 1.0
+    inverseTime = etat.feedMode == 93
+    if 'F' in words:
+      etat.feed = words['F'] if inverseTime else words['F'] * k
+    elif inverseTime:
+      etat.feed = 0.0 # En G93, F doit etre present sur chaque ligne de mouvement
+    if 'S' in words:
+      etat.speed = words['S']
+    if 'T' in words:
+      etat.tool = int(words['T'])
+
+    # Broche et arrosage, synchronises avec la fin des mouvements en cours
+    if 'spindle' in mGroups:
+      etat.spindle = "M{}".format(mGroups['spindle'])
+    if mGroups.get('coolant') == 9:
+      etat.coolant = set()
+    elif 'coolant' in mGroups:
+      etat.coolant.add("M{}".format(mGroups['coolant']))
+    if 'spindle' in mGroups or 'coolant' in mGroups:
+      spindle, speed, coolant = etat.spindle, etat.speed, set(etat.coolant)
+      steps.append((STEP_SYNC, lambda now: self.__setAccessories(spindle, speed, coolant)))
+
+    nonModal = groups.get('nonModal')
+    if nonModal == 4:
+      if 'P' not in words:
+        return 28, None, None
+      used.add('P')
+      duree = words['P']
+      steps.append((STEP_SYNC, lambda now: self.__startWait(now, duree)))
+
+    etat.plane    = groups.get('plane', etat.plane)
+    etat.distance = groups.get('distance', etat.distance)
+    if 'coord' in groups:
+      etat.coord = int(groups['coord']) - 54
+
+    axes = {I: words[L] * k for I, L in enumerate(self.__axisNames) if L in words}
+    wco = etat.wco()
+    target = list(etat.pos)
+    for I, v in axes.items():
+      if nonModal == 53:
+        target[I] = v
+      elif etat.distance == 91:
+        target[I] = etat.pos[I] + v
+      else:
+        target[I] = v + wco[I]
+
+    axesUsed = False
+    if nonModal == 10:
+      if 'L' not in words or 'P' not in words:
+        return 28, None, None
+      used.update('LP')
+      L, P = words['L'], words['P']
+      if L not in (2, 20):
+        return 20, None, None
+      if P != int(P) or P > 6:
+        return 29, None, None
+      P = int(P) - 1 if P > 0 else etat.coord
+      for I, v in axes.items():
+        if L == 2:
+          etat.coords[P][I] = v
+        else:
+          etat.coords[P][I] = etat.pos[I] - etat.g92[I] - v
+      axesUsed = True
+    elif nonModal in (28, 30):
+      stored = etat.g28 if nonModal == 28 else etat.g30
+      pos = etat.pos
+      if axes:
+        bloc = self.__blocs(pos, target, True, 0, False)
+        if bloc is not None:
+          steps.append(bloc)
+        pos = target
+      # Seuls les axes indiques (ou tous, sans axe) vont a la position memorisee
+      final = [stored[I] if (not axes or I in axes) else pos[I] for I in range(self.__nbAxis)]
+      bloc = self.__blocs(pos, final, True, 0, False)
+      if bloc is not None:
+        steps.append(bloc)
+      etat.pos = final
+      axesUsed = True
+    elif nonModal in (28.1, 30.1):
+      if nonModal == 28.1:
+        etat.g28 = list(etat.pos)
+      else:
+        etat.g30 = list(etat.pos)
+    elif nonModal == 92:
+      if not axes:
+        return 26, None, None
+      for I, v in axes.items():
+        etat.g92[I] = etat.pos[I] - etat.coords[etat.coord][I] - v
+      axesUsed = True
+    elif nonModal == 92.1:
+      etat.g92 = [0.0] * self.__nbAxis
+
+    # Mouvements
+    motion = etat.motion if not jog else 'G1'
+    motionKey = groups.get('motion')
+    if motionKey is not None:
+      motion = 'G{:g}'.format(motionKey)
+    if nonModal == 53 and motion not in ['G0', 'G1']:
+      return 30, None, None
+    if axes and not axesUsed:
+      if motion == 'G80':
+        return 31, None, None
+      if jog:
+        if not self.__inLimits(target) and self.__settings[20]:
+          return 15, None, None
+        bloc = self.__blocs(etat.pos, target, False, etat.feed, False, jog = True)
+        if bloc is not None:
+          steps.append(bloc)
+      elif motion == 'G0':
+        bloc = self.__blocs(etat.pos, target, True, 0, False)
+        if bloc is not None:
+          steps.append(bloc)
+      elif motion == 'G1':
+        if etat.feed <= 0:
+          return 22, None, None
+        bloc = self.__blocs(etat.pos, target, False, etat.feed, inverseTime)
+        if bloc is not None:
+          steps.append(bloc)
+      elif motion in ['G2', 'G3']:
+        if etat.feed <= 0:
+          return 22, None, None
+        rc = self.__arc(etat, target, words, axes, k, motion == 'G2', inverseTime, steps, used)
+        if rc != 0:
+          return rc, None, None
+      else:
+        # Sondage G38.x : le palpeur touche toujours en fin de course
+        if etat.feed <= 0:
+          return 22, None, None
+        bloc = self.__blocs(etat.pos, target, False, etat.feed, inverseTime)
+        if bloc is None:
+          return 33, None, None
+        steps.append((STEP_SYNC, lambda now: None))
+        steps.append(bloc)
+        prb = list(target)
+        steps.append((STEP_SYNC, lambda now: self.__write("[PRB:{}:1]".format(self.__format(prb)))))
+        etat.prb = prb
+        etat.prbOk = True
+      etat.pos = target
+    elif motion in ['G2', 'G3'] and motionKey is not None:
+      return 26, None, None
+    elif motion.startswith('G38') and motionKey is not None:
+      return 26, None, None
+    if not jog:
+      etat.motion = motion
+
+    if set('IJKR') & set(words) - used or set('LP') & set(words) - used:
+      return 36, None, None
+
+    # Fin de programme
+    stop = mGroups.get('stop')
+    if stop in (0, 1):
+      steps.append((STEP_SYNC, lambda now: self.__pause()))
+    elif stop in (2, 30):
+      etat.resetModal()
+      etat.motion = 'G1'
+      steps.append((STEP_SYNC, lambda now: self.__programEnd()))
+    return 0, etat, steps
+
+
+  def __arc(self, etat: gcodeEtat, target, words: dict, axes: dict, k: float, clockwise: bool, inverseTime: bool, steps: list, used: set):
+    ''' Arc G2/G3 decoupe en segments de corde comme mc_arc() de Grbl (tolerance $12) '''
+    plan = {17: ('X', 'Y', 'I', 'J'), 18: ('Z', 'X', 'K', 'I'), 19: ('Y', 'Z', 'J', 'K')}[etat.plane]
+    try:
+      a0 = self.__axisNames.index(plan[0])
+      a1 = self.__axisNames.index(plan[1])
+    except ValueError:
+      return 20
+    pos = etat.pos
+    x = target[a0] - pos[a0]
+    y = target[a1] - pos[a1]
+    if 'R' in words:
+      used.add('R')
+      if a0 not in axes and a1 not in axes:
+        return 32
+      if x == 0 and y == 0:
+        return 33
+      r = words['R'] * k
+      h = 4.0 * r * r - x * x - y * y
+      if h < 0:
+        return 34
+      h = -math.sqrt(h) / math.hypot(x, y)
+      if not clockwise:
+        h = -h
+      if r < 0:
+        h = -h
+        r = -r
+      off0 = 0.5 * (x - y * h)
+      off1 = 0.5 * (y + x * h)
+    else:
+      if plan[2] not in words and plan[3] not in words:
+        return 35
+      used.update(set('IJK') & set(words))
+      off0 = words.get(plan[2], 0.0) * k
+      off1 = words.get(plan[3], 0.0) * k
+      r = math.hypot(off0, off1)
+      deltaR = abs(math.hypot(x - off0, y - off1) - r)
+      if deltaR > 0.005 and (deltaR > 0.5 or deltaR > 0.001 * r):
+        return 33
+    c0 = pos[a0] + off0
+    c1 = pos[a1] + off1
+    r0, r1 = -off0, -off1
+    rt0, rt1 = target[a0] - c0, target[a1] - c1
+    angle = math.atan2(r0 * rt1 - r1 * rt0, r0 * rt0 + r1 * rt1)
+    if clockwise:
+      if angle >= -5e-7:
+        angle -= 2 * math.pi
+    elif angle <= 5e-7:
+      angle += 2 * math.pi
+    tol = self.__settings[12]
+    nbSegments = max(1, int(abs(0.5 * angle * r) / math.sqrt(tol * (2 * r - tol)))) if r > tol else 1
+    start = pos
+    for I in range(1, nbSegments + 1):
+      if I == nbSegments:
+        point = list(target)
+      else:
+        t = I / nbSegments
+        cosT, sinT = math.cos(angle * t), math.sin(angle * t)
+        point = [p + (q - p) * t for p, q in zip(pos, target)]
+        point[a0] = c0 + r0 * cosT - r1 * sinT
+        point[a1] = c1 + r0 * sinT + r1 * cosT
+      bloc = self.__blocs(start, point, False, etat.feed, inverseTime, nbSegments = nbSegments)
+      if bloc is not None:
+        steps.append(bloc)
+        start = point
+    return 0
+
+
+  def __setAccessories(self, spindle: str, speed: float, coolant: set):
+    self.__spindle = spindle
+    self.__speed   = speed
+    self.__coolant = coolant
+    self.__ovCounter = 0
+
+
+  def __pause(self):
+    ''' M0 / M1 : suspension du programme jusqu'a la commande de reprise ~ '''
+    self.__etat = GRBL_STATUS_HOLD0
+
+
+  def __programEnd(self):
+    ''' M2 / M30 '''
+    self.__setAccessories('M5', 0.0, set())
+    self.__feedOv = self.__rapidOv = self.__spindleOv = 100
+    self.__write("[MSG:Pgm End]")
+
+
+  #-----------------------------------------------------------------------------
+  # Commandes systeme
+  #-----------------------------------------------------------------------------
+
+  def __executeSystem(self, ligne: str, now: float):
+    ''' Commandes $, renvoie le code de retour (0 = ok, None si la reponse est differee) '''
+    cmd = ligne[1:]
+    if cmd == "":
+      self.__write(GRBL_SIM_HELP)
+      return 0
+    if cmd[:2] == "J=":
+      if self.__etat not in [GRBL_STATUS_IDLE, GRBL_STATUS_JOG]:
+        return 8
+      if len(cmd) == 2:
+        return 16
+      return self.__executeGCode(cmd[2:], jog = True)
+    if cmd == "$":
+      if self.__etat in [GRBL_STATUS_RUN, GRBL_STATUS_HOLD0, GRBL_STATUS_HOLD1]:
+        return 8
+      for num in sorted(self.__settings):
+        self.__write("${}={}".format(num, self.__formatSetting(num)))
+      return 0
+    if cmd == "G":
+      self.__write(self.__gcodeState())
+      return 0
+    if cmd == "C":
+      if self.__etat == GRBL_STATUS_CHECK:
+        # La sortie du mode verification provoque un reset
+        self.__write("[MSG:Disabled]")
+        self.__softReset(now)
+        return None
+      if self.__etat != GRBL_STATUS_IDLE:
+        return 8
+      self.__etat = GRBL_STATUS_CHECK
+      self.__write("[MSG:Enabled]")
+      return 0
+    if cmd == "X":
+      if self.__etat == GRBL_STATUS_ALARM:
+        self.__etat = GRBL_STATUS_IDLE
+        self.__write("[MSG:Caution: Unlocked]")
+      return 0
+    # Les autres commandes ne sont acceptees qu'a l'arret
+    if self.__etat not in [GRBL_STATUS_IDLE, GRBL_STATUS_ALARM]:
+      return 8
+    if cmd == "#":
+      for I, nom in enumerate(["G54", "G55", "G56", "G57", "G58", "G59"]):
+        self.__write("[{}:{}]".format(nom, self.__format(self.__gc.coords[I])))
+      self.__write("[G28:{}]".format(self.__format(self.__gc.g28)))
+      self.__write("[G30:{}]".format(self.__format(self.__gc.g30)))
+      self.__write("[G92:{}]".format(self.__format(self.__gc.g92)))
+      self.__write("[TLO:0.000]")
+      self.__write("[PRB:{}:{}]".format(self.__format(self.__gc.prb), 1 if self.__gc.prbOk else 0))
+      return 0
+    if cmd == "H":
+      if not self.__settings[22]:
+        return 5
+      # Recherche rapide ($25) sur toute la course puis approche lente ($24) du degagement ($27)
+      duree = max(self.__settings[130 + I] * 60 / self.__settings[25] for I in range(self.__nbAxis)) \
+            + self.__settings[27] * 2 * 60 / self.__settings[24]
+      self.__etat = GRBL_STATUS_HOME
+      self.__startWait(now, duree, self.__homingDone)
+      return None
+    if cmd == "SLP":
+      self.__etat = GRBL_STATUS_SLEEP
+      self.__write("[MSG:Sleeping]")
+      return 0
+    if cmd == "I":
+      self.__write(GRBL_SIM_VERSION)
+      self.__write(GRBL_SIM_OPTIONS)
+      if self.__nbAxis != 3 or self.__axisNames != ['X', 'Y', 'Z']:
+        self.__write("[AXS:{}:{}]".format(self.__nbAxis, "".join(self.__axisNames)))
+      return 0
+    if cmd == "N":
+      for I, bloc in enumerate(self.__startupBlocks):
+        self.__write("$N{}={}".format(I, bloc))
+      return 0
+    if cmd[:1] == "N" and cmd[2:3] == "=" and cmd[1:2] in "01":
+      self.__startupBlocks[int(cmd[1])] = cmd[3:]
+      return 0
+    if cmd[:4] == "RST=":
+      if cmd[4:] not in ["$", "#", "*"]:
+        return 3
+      if cmd[4:] in ["$", "*"]:
+        self.__settings = dict(GRBL_DEFAULT_SETTINGS)
+        for base, val in GRBL_DEFAULT_AXIS_SETTINGS.items():
+          for I in range(self.__nbAxis):
+            self.__settings[base + I] = val
+      if cmd[4:] in ["#", "*"]:
+        nouveau = gcodeEtat(self.__nbAxis)
+        nouveau.pos = self.__gc.pos
+        self.__gc = nouveau
+      self.__write("[MSG:Restoring defaults]")
+      return 0
+    num, egal, valeur = cmd.partition("=")
+    if egal == "" or not num.isdigit():
+      return 3
+    num = int(num)
+    if num not in self.__settings:
+      return 3
+    if not self.__numberRe.fullmatch(valeur):
+      return 2
+    valeur = float(valeur)
+    if valeur < 0:
+      return 4
+    if num == 20 and valeur and not self.__settings[22]:
+      return 10 # Limites logicielles sans prise d'origine
+    self.__settings[num] = int(valeur) if num in GRBL_SIM_INT_SETTINGS else valeur
+    return 0
+
+
+  def __homingDone(self, now: float):
+    self.__mPos = [0.0] * self.__nbAxis
+    self.__gc.pos = list(self.__mPos)
+    self.__etat = GRBL_STATUS_IDLE
+    self.__write("ok")
+
+
+  def __softReset(self, now: float, powerUp: bool = False):
+    ''' Ctrl+X : arret immediat, vidage des buffers, etat modal par defaut '''
+    enMouvement = self.__etat in [GRBL_STATUS_RUN, GRBL_STATUS_JOG, GRBL_STATUS_HOME, GRBL_STATUS_HOLD1, GRBL_STATUS_DOOR2]
+    self.__mPos = self.__positionNow(now)
+    self.__planner.clear()
+    self.__pending.clear()
+    self.__rx.clear()
+    self.__waitEnd = self.__waitFn = None
+    self.__jogCancel = False
+    self.__tMotion = now
+    self.__vExit = 0.0
+    self.__resetOverrides()
+    self.__gc.resetModal()
+    self.__gc.g92 = [0.0] * self.__nbAxis
+    self.__gc.pos = list(self.__mPos)
+    if enMouvement:
+      # Position perdue : alarme
+      self.__write("ALARM:3")
+      self.__etat = GRBL_STATUS_ALARM
+    elif self.__etat in [GRBL_STATUS_SLEEP] or (powerUp and self.__settings[22]):
+      self.__etat = GRBL_STATUS_ALARM
+    elif self.__etat != GRBL_STATUS_ALARM:
+      self.__etat = GRBL_STATUS_IDLE
+    self.__write(GRBL_SIM_BANNER)
+    if self.__etat == GRBL_STATUS_ALARM:
+      self.__write("[MSG:'$H'|'$X' to unlock]")
+
+
+  #-----------------------------------------------------------------------------
+  # Reponses
+  #-----------------------------------------------------------------------------
+
+  def __format(self, valeurs):
+    return ",".join("{:0.3f}".format(v) for v in valeurs)
+
+
+  def __formatSetting(self, num: int):
+    if num in GRBL_SIM_INT_SETTINGS:
+      return "{}".format(int(self.__settings[num]))
+    return "{:0.3f}".format(self.__settings[num])
+
+
+  def __gcodeState(self):
+    ''' Reponse a $G : etat modal du parser '''
+    gc = self.__gc
+    k = 25.4 if gc.units == 20 else 1.0
+    mots = [gc.motion, "G{}".format(54 + gc.coord), "G{}".format(gc.plane), "G{}".format(gc.units),
+            "G{}".format(gc.distance), "G{}".format(gc.feedMode), gc.spindle]
+    mots += sorted(gc.coolant) if gc.coolant else ["M9"]
+    mots += ["T{}".format(gc.tool), "F{:g}".format(round(gc.feed / k if gc.feedMode == 94 else gc.feed, 3)), "S{:g}".format(gc.speed)]
+    return "[GC:{}]".format(" ".join(mots))
+
+
+  def __statusReport(self, now: float):
+    ''' Reponse a ? '''
+    self.__run(now)
+    mPos = self.__positionNow(now)
+    champs = [self.__etat]
+    if self.__settings[10] & 1:
+      champs.append("MPos:" + self.__format(mPos))
+    else:
+      champs.append("WPos:" + self.__format([p - w for p, w in zip(mPos, self.__gc.wco())]))
+    if self.__settings[10] & 2:
+      champs.append("Bf:{},{}".format(GRBL_PLANNER_BUFFER_SIZE - len(self.__planner), GRBL_RX_BUFFER_SIZE - 1 - len(self.__rx)))
+    speed = self.__speed * self.__spindleOv / 100 if self.__spindle != 'M5' and not self.__spindleStop else 0
+    champs.append("FS:{:0.0f},{:0.0f}".format(self.__speedNow(now), speed))
+    # WCO: et Ov: ne sont envoyes que periodiquement ou apres modification
+    actif = self.__etat not in [GRBL_STATUS_IDLE, GRBL_STATUS_ALARM, GRBL_STATUS_CHECK, GRBL_STATUS_SLEEP]
+    self.__wcoCounter -= 1
+    self.__ovCounter -= 1
+    if self.__wcoCounter < 0:
+      champs.append("WCO:" + self.__format(self.__gc.wco()))
+      self.__wcoCounter = 29 if actif else 9
+      if self.__ovCounter < 0:
+        self.__ovCounter = 0 # Ov: au status suivant
+    elif self.__ovCounter < 0:
+      champs.append("Ov:{},{},{}".format(self.__feedOv, self.__rapidOv, self.__spindleOv))
+      accessoires = {'M3': 'S', 'M4': 'C'}.get(self.__spindle, '')
+      accessoires += ('F' if 'M8' in self.__coolant else '') + ('M' if 'M7' in self.__coolant else '')
+      if accessoires != '':
+        champs.append("A:" + accessoires)
+      self.__ovCounter = 19 if actif else 9
+    return "<" + "|".join(champs) + ">"
+
+
+def main():
+  ''' Lance le simulateur, affiche le port a ouvrir et tourne jusqu'a Ctrl+C '''
+  parser = argparse.ArgumentParser(description="Grbl 1.1 simulator on a pseudo-terminal")
+  parser.add_argument("-l", "--link", help="create a symbolic link to the pseudo-terminal (ex: /tmp/ttyGrbl)")
+  parser.add_argument("-a", "--axes", default="".join(DEFAULT_AXIS_NAMES), help="axis names (default: {})".format("".join(DEFAULT_AXIS_NAMES)))
+  parser.add_argument("-t", "--time-scale", type=float, default=1.0, help="motion duration multiplier, 0 for instant moves (default: 1.0)")
+  parser.add_argument("-v", "--verbose", action="store_true", help="trace received lines and replies")
+  parser.add_argument("--tcp", type=int, metavar="PORT", help="listen on TCP port PORT of localhost instead of a pseudo-terminal, 0 for any free port")
+  args = parser.parse_args()
+
+  sim = grblSimulator(len(args.axes), list(args.axes.upper()), args.time_scale, args.link, args.verbose, args.tcp)
+  print("Grbl simulator listening on {}".format(sim.start()), flush=True)
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    sim.stop()
+    print("Grbl simulator: {} lines, {} bytes, {} realtime commands, RX overflow = {} bytes".format(
+      sim.nbLines, sim.nbBytes, sim.nbRealTime, sim.rxOverflow))
+
+
+if __name__ == '__main__':
+  main()
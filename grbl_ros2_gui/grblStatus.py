@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+
+from .cn5X_config import *
+
+
+GRBL_VALID_STATUS = frozenset([
+  GRBL_STATUS_IDLE,
+  GRBL_STATUS_RUN,
+  GRBL_STATUS_HOLD0,
+  GRBL_STATUS_HOLD1,
+  GRBL_STATUS_JOG,
+  GRBL_STATUS_ALARM,
+  GRBL_STATUS_DOOR0,
+  GRBL_STATUS_DOOR1,
+  GRBL_STATUS_DOOR2,
+  GRBL_STATUS_DOOR3,
+  GRBL_STATUS_CHECK,
+  GRBL_STATUS_HOME,
+  GRBL_STATUS_SLEEP
+])
+
+
+class grblStatus():
+  '''
+  Enregistrement compact d'un rapport de status de Grbl (<...>).
+  Le rapport est decode une seule fois (par grblComSerial) et l'enregistrement est partage par
+  tous les consommateurs (grblCom, grblDecode...) via le signal sig_status.
+  Les champs absents du rapport valent None, sauf pn (0 : aucune entree active).
+  - raw  : Chaine complete du status
+  - etat : Etat de la machine (Idle, Run, Hold:0...)
+  - mpos : Tuple des positions machine (MPos:) ou None
+  - wpos : Tuple des positions de travail (WPos:) ou None
+  - wco  : Tuple des decalages de travail (WCO:) ou None
+  - bf   : Tuple (blocs libres dans le planificateur, octets libres dans le buffer de reception) (Bf:) ou None
+  - ov   : Tuple des overrides (avance, rapide, broche) en % (Ov:) ou None
+  - fs   : Tuple (avance, vitesse de broche) courantes (FS:), (avance,) si Grbl n'a pas de broche variable (F:), ou None
+  - ln   : N° de la ligne en cours d'execution (Ln:) ou None
+  - pn   : Masque des entrees actives (Pn:), voir GRBL_PIN_BITS
+  '''
+
+  __slots__ = ('raw', 'etat', 'mpos', 'wpos', 'wco', 'bf', 'ov', 'fs', 'ln', 'pn')
+
+  def __init__(self):
+    self.raw  = None
+    self.etat = None
+    self.mpos = None
+    self.wpos = None
+    self.wco  = None
+    self.bf   = None
+    self.ov   = None
+    self.fs   = None
+    self.ln   = None
+    self.pn   = None
+
+
+  def copy(self):
+    s = grblStatus()
+    for attr in grblStatus.__slots__:
+      setattr(s, attr, getattr(self, attr))
+    return s
+
+
+  @staticmethod
+  def parse(grblOutput: str):
+    '''
+    Decode un rapport de status en un seul passage, renvoie un grblStatus ou None si le rapport est incorrect.
+    L'etat est toujours le premier champ du rapport (Grbl 1.1).
+    '''
+    if grblOutput[:1] != "<" or grblOutput[-1:] != ">":
+      return None
+    s = grblStatus()
+    s.raw = grblOutput
+    s.pn  = 0
+    champs = grblOutput[1:-1].split("|")
+    if champs[0] in GRBL_VALID_STATUS:
+      s.etat = champs[0]
+    try:
+      for D in champs[1:]:
+        nom, sep, valeur = D.partition(":")
+        if nom == "MPos":
+          s.mpos = tuple(map(float, valeur.split(",")))
+        elif nom == "WPos":
+          s.wpos = tuple(map(float, valeur.split(",")))
+        elif nom == "FS" or nom == "F":
+          s.fs = tuple(map(float, valeur.split(",")))
+        elif nom == "Bf":
+          s.bf = tuple(map(int, valeur.split(",")))
+        elif nom == "WCO":
+          s.wco = tuple(map(float, valeur.split(",")))
+        elif nom == "Ov":
+          s.ov = tuple(map(int, valeur.split(",")))
+        elif nom == "Pn":
+          for L in valeur:
+            s.pn |= GRBL_PIN_BITS.get(L, 0)
+        elif nom == "Ln":
+          s.ln = int(valeur)
+    except ValueError:
+      return None
+    return s
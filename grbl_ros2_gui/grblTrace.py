@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import time
+from itertools import count
+from .cn5X_config import *
+
+
+class grblTrace():
+  '''
+  Traces de debug de la communication avec Grbl, filtrees a la source par niveau.
+  Les appelants testent le niveau avant de preparer quoi que ce soit :
+    if trace.level >= TRACE_LEVEL_DATA:
+      trace.add(TRACE_LEVEL_DATA, ">>> {}", buff)
+  Les enregistrements (N° d'ordre, heure, format, arguments) sont ranges sans mise en forme dans un tampon
+  circulaire pre-alloue, sans verrou : plusieurs threads peuvent ecrire (thread d'ecriture, thread de lecture,
+  thread GUI). Les enregistrements les plus anciens sont ecrases si le tampon n'est pas vide a temps.
+  drain() met en forme et renvoie les lignes en attente, il est appele par un timer du thread GUI.
+  '''
+
+  def __init__(self, size: int = TRACE_BUFFER_SIZE):
+    self.level     = TRACE_LEVEL_OFF
+    self.__size    = size
+    self.__buffer  = [None] * size
+    self.__next    = count()  # next() est atomique : attribue un N° d'ordre unique a chaque enregistrement
+    self.__read    = 0        # N° d'ordre du prochain enregistrement a lire
+    self.__t0      = time.perf_counter()
+
+
+  def setLevel(self, level: int):
+    self.level = level
+
+
+  def add(self, level: int, fmt: str, *args):
+    ''' Enregistre une trace mise en forme plus tard par fmt.format(*args) '''
+    if self.level < level:
+      return
+    n = next(self.__next)
+    self.__buffer[n % self.__size] = (n, time.perf_counter(), fmt, args)
+
+
+  def drain(self, maxRecords: int = None):
+    ''' Renvoie les lignes mises en forme des enregistrements en attente (au plus maxRecords) '''
+    lignes = []
+    while maxRecords is None or len(lignes) < maxRecords:
+      record = self.__buffer[self.__read % self.__size]
+      if record is None or record[0] < self.__read:
+        # Pas encore ecrit
+        break
+      if record[0] > self.__read:
+        # Le tampon a fait le tour : les enregistrements anterieurs a record[0] - size + 1 sont perdus
+        oldest = record[0] - self.__size + 1
+        lignes.append("... {} trace records lost".format(oldest - self.__read))
+        self.__read = oldest
+        continue
+      n, t, fmt, args = record
+      try:
+        texte = fmt.format(*args) if args else fmt
+      except Exception as err:
+        texte = "{} {} (format error: {})".format(fmt, args, err)
+      lignes.append("{:10.3f} {}".format((t - self.__t0) * 1000, texte))
+      self.__read = n + 1
+    return lignes
+
+
+  def clear(self):
+    ''' Oublie les enregistrements en attente '''
+    self.__read = next(self.__next) + 1
@@ -0,0 +1,415 @@
+# -*- coding: UTF-8 -*-
+
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'                                                                         '
+' Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)    '
+'                                                                         '
+' This file is part of cn5X++                                             '
+'                                                                         '
+' cn5X++ is free software: you can redistribute it and/or modify it       '
+'  under the terms of the GNU General Public License as published by      '
+' the Free Software Foundation, either version 3 of the License, or       '
+' (at your option) any later version.                                     '
+'                                                                         '
+' cn5X++ is distributed in the hope that it will be useful, but           '
+' WITHOUT ANY WARRANTY; without even the implied warranty of              '
+' MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           '
+' GNU General Public License for more details.                            '
+'                                                                         '
+' You should have received a copy of the GNU General Public License       '
+' along with this program.  If not, see <http://www.gnu.org/licenses/>.   '
+'                                                                         '
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+
+import sys, time, struct, socket, select
+from math import ceil
+from urllib.parse import parse_qs
+import serial
+from .cn5X_config import *
+from .grblRecorder import grblRecorder, CAPTURE_TX, CAPTURE_RX
+
+try:
+  import fcntl, termios
+except ImportError:
+  # Windows : pas de FIONREAD / TIOCOUTQ sur les sockets
+  fcntl = None
+
+
+class grblTransportError(Exception):
+  ''' Erreur d'ouverture, de lecture ou d'ecriture sur la liaison avec Grbl '''
+
+
+class grblTransport():
+  '''
+  Liaison d'octets entre grblComSerial et Grbl, le moteur de streaming est le meme quel que soit le transport.
+  Les ecritures sont accumulees par write() et envoyees en un seul bloc par flush() : le thread d'ecriture
+  envoie ainsi en une fois tout ce qu'il a a envoyer a chaque reveil (commandes temps reel et lignes GCode).
+  La lecture est faite par un seul thread (le thread de lecture de grblComSerial), l'ecriture par un autre.
+  Methodes :
+  - create(portName, baudRate) -> Transport adapte au nom du port (port serie, socket://hote:port ou replay://fichier)
+  - open() / close() / isOpen()
+  - write(data)                -> Ajoute data au bloc en cours
+  - flush()                    -> Envoie le bloc en cours, renvoie le nombre d'octets envoyes
+  - readline()                 -> Ligne complete (terminee par \\n) ou b"" si rien de complet apres SERIAL_READ_TIMEOUT
+  - inWaiting()                -> Nombre d'octets recus et non encore lus
+  - outWaiting()               -> Nombre d'octets en attente d'emission, bloc en cours compris
+  - sentWaiting()              -> Nombre d'octets deja envoyes par flush() que le systeme n'a pas encore emis
+  Les erreurs de la liaison levent grblTransportError.
+  Si recorder (grblRecorder) est defini, tous les octets envoyes et recus y sont enregistres.
+  '''
+
+  def __init__(self, name: str):
+    self.name = name
+    self.recorder = None
+    self.__txBuffer = bytearray()
+    self.__rxBuffer = bytearray()
+
+
+  @staticmethod
+  def create(portName: str, baudRate: int):
+    ''' Renvoie le transport correspondant au nom du port '''
+    if portName.lower().startswith(COM_REPLAY_URL_SCHEME):
+      path, sep, query = portName[len(COM_REPLAY_URL_SCHEME):].partition('?')
+      speed = float(parse_qs(query).get('speed', ['1'])[0])
+      return grblReplayTransport(portName, path, speed)
+    for prefix in COM_TCP_URL_SCHEMES:
+      if portName.lower().startswith(prefix):
+        host, port = grblTransport.splitAddress(portName[len(prefix):])
+        return grblTcpTransport(portName, host, port)
+    return grblSerialTransport(portName, baudRate)
+
+
+  @staticmethod
+  def splitAddress(address: str):
+    ''' "hote:port", "hote" ou "[ipv6]:port" => (hote, port) '''
+    address = address.split('/')[0].split('?')[0]
+    host, sep, port = address.rpartition(':')
+    if sep == '' or host.count(':') > 0 and not host.endswith(']'):
+      # Pas de port (ou adresse IPv6 sans crochets)
+      host, port = address, ''
+    host = host.strip('[]')
+    if host == '':
+      raise ValueError("No host in network port name")
+    try:
+      return host, int(port) if port != '' else COM_TCP_DEFAULT_PORT
+    except ValueError:
+      raise ValueError("Invalid TCP port number: {}".format(port))
+
+
+  def open(self):
+    raise NotImplementedError
+
+
+  def close(self):
+    raise NotImplementedError
+
+
+  def isOpen(self):
+    raise NotImplementedError
+
+
+  def _send(self, data: bytes):
+    ''' Envoi effectif d'un bloc d'octets '''
+    raise NotImplementedError
+
+
+  def _receive(self):
+    ''' Lecture des octets disponibles, bloquante au plus SERIAL_READ_TIMEOUT, renvoie b"" a l'expiration '''
+    raise NotImplementedError
+
+
+  def _available(self):
+    ''' Nombre d'octets recus par le systeme et pas encore lus '''
+    return 0
+
+
+  def _pending(self):
+    ''' Nombre d'octets remis au systeme et pas encore emis '''
+    return 0
+
+
+  def write(self, data: bytes):
+    self.__txBuffer += data
+
+
+  def flush(self):
+    if len(self.__txBuffer) == 0:
+      return 0
+    data = bytes(self.__txBuffer)
+    self.__txBuffer.clear()
+    self._send(data)
+    if self.recorder is not None:
+      self.recorder.record(CAPTURE_TX, data)
+    return len(data)
+
+
+  def readline(self):
+    fin = self.__rxBuffer.find(b"\n")
+    if fin < 0:
+      data = self._receive()
+      if self.recorder is not None and data:
+        self.recorder.record(CAPTURE_RX, data)
+      self.__rxBuffer += data
+      fin = self.__rxBuffer.find(b"\n")
+      if fin < 0:
+        return b""
+    ligne = bytes(self.__rxBuffer[:fin + 1])
+    del self.__rxBuffer[:fin + 1]
+    return ligne
+
+
+  def inWaiting(self):
+    return len(self.__rxBuffer) + self._available()
+
+
+  def outWaiting(self):
+    return len(self.__txBuffer) + self._pending()
+
+
+  def sentWaiting(self):
+    return self._pending()
+
+
+class grblSerialTransport(grblTransport):
+  ''' Liaison par port serie (pyserial) '''
+
+  def __init__(self, portName: str, baudRate: int):
+    super().__init__(portName)
+    self.__baudRate = baudRate
+    self.__port = serial.Serial()
+
+
+  def open(self):
+    ''' Ouverture du port, ValueError si les parametres sont hors limites '''
+    self.__port.apply_settings({
+      'baudrate':           self.__baudRate,
+      'bytesize':           serial.EIGHTBITS,
+      'parity':             serial.PARITY_NONE,
+      'stopbits':           serial.STOPBITS_ONE,
+      'xonxoff':            False,
+      'dsrdtr':             False,
+      'rtscts':             False,
+      'timeout':            SERIAL_READ_TIMEOUT / 1000,
+      'write_timeout':      None,
+      'inter_byte_timeout': None
+    })
+    self.__port.port = self.name
+    try:
+      self.__port.open()
+    except serial.SerialException as err:
+      raise grblTransportError(str(err)) from err
+
+
+  def close(self):
+    self.__port.close()
+
+
+  def isOpen(self):
+    return self.__port.is_open
+
+
+  def _send(self, data: bytes):
+    # Temps necessaire pour la com (millisecondes), arrondi a l'entier superieur
+    tempNecessaire = ceil(1000 * len(data) * 8 / self.__baudRate)
+    self.__port.write_timeout = (10 + 2 * tempNecessaire) / 1000 # 2 fois le temps necessaire + 10 millisecondes
+    try:
+      self.__port.write(data)
+    except serial.SerialTimeoutException as err:
+      raise grblTransportError("timeout") from err
+    except serial.SerialException as err:
+      raise grblTransportError(str(err)) from err
+
+
+  def _receive(self):
+    try:
+      # Tout ce qui est deja arrive, ou attente du premier octet au plus SERIAL_READ_TIMEOUT
+      return self.__port.read(max(1, self.__port.in_waiting))
+    except (serial.SerialException, OSError) as err:
+      raise grblTransportError(str(err)) from err
+
+
+  def _available(self):
+    try:
+      return self.__port.in_waiting
+    except (serial.SerialException, OSError) as err:
+      raise grblTransportError(str(err)) from err
+
+
+  def _pending(self):
+    try:
+      return self.__port.out_waiting
+    except Exception:
+      # out_waiting n'est pas disponible sur toutes les plateformes
+      return 0
+
+
+class grblTcpTransport(grblTransport):
+  '''
+  Liaison par socket TCP (Grbl-ESP32 en telnet, passerelle serie/TCP) sans passer par un pty et socat.
+  Socket non bloquante attendue par select(), algorithme de Nagle desactive (TCP_NODELAY) pour que
+  chaque bloc parte immediatement : les commandes temps reel et les lignes GCode ne doivent pas attendre un ACK.
+  '''
+
+  def __init__(self, name: str, host: str, port: int):
+    super().__init__(name)
+    self.__host = host
+    self.__port = port
+    self.__socket = None
+
+
+  def open(self):
+    try:
+      self.__socket = socket.create_connection((self.__host, self.__port), COM_TCP_CONNECT_TIMEOUT / 1000)
+      self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      self.__socket.setblocking(False)
+    except OSError as err:
+      if self.__socket is not None:
+        self.__socket.close()
+        self.__socket = None
+      raise grblTransportError("{}:{}: {}".format(self.__host, self.__port, err)) from err
+
+
+  def close(self):
+    if self.__socket is not None:
+      self.__socket.close()
+      self.__socket = None
+
+
+  def isOpen(self):
+    return self.__socket is not None
+
+
+  def _send(self, data: bytes):
+    reste = memoryview(data)
+    while len(reste) > 0:
+      try:
+        reste = reste[self.__socket.send(reste):]
+      except BlockingIOError:
+        pass
+      except OSError as err:
+        raise grblTransportError(str(err)) from err
+      if len(reste) > 0:
+        # Buffer d'emission de la socket plein, attente de place
+        if not select.select([], [self.__socket], [], COM_TCP_WRITE_TIMEOUT / 1000)[1]:
+          raise grblTransportError("timeout")
+
+
+  def _receive(self):
+    try:
+      if not select.select([self.__socket], [], [], SERIAL_READ_TIMEOUT / 1000)[0]:
+        return b""
+      data = self.__socket.recv(4096)
+    except BlockingIOError:
+      return b""
+    except (OSError, ValueError) as err:
+      raise grblTransportError(str(err)) from err
+    if data == b"":
+      raise grblTransportError("connection closed by {}:{}".format(self.__host, self.__port))
+    return data
+
+
+  def _available(self):
+    if fcntl is None:
+      return 0
+    buf = bytearray(4)
+    try:
+      fcntl.ioctl(self.__socket.fileno(), termios.FIONREAD, buf)
+    except OSError:
+      return 0
+    return int.from_bytes(buf, sys.byteorder)
+
+
+  def _pending(self):
+    # Octets de la socket pas encore acquittes par l'hote distant (SIOCOUTQ == TIOCOUTQ sous Linux)
+    if fcntl is None or not hasattr(termios, 'TIOCOUTQ'):
+      return 0
+    buf = bytearray(4)
+    try:
+      fcntl.ioctl(self.__socket.fileno(), termios.TIOCOUTQ, buf)
+    except OSError:
+      return 0
+    return int.from_bytes(buf, sys.byteorder)
+
+
+class grblReplayTransport(grblTransport):
+  '''
+  Rejeu d'une capture de grblRecorder a la place de Grbl, pour profiler le decodage et l'affichage sans machine.
+  Les octets recus de Grbl sont restitues avec leur chronologie d'origine (depuis l'ouverture du port) divisee
+  par speed, 0 = sans attente. Les octets envoyes par cn5X++ sont ignores.
+  Port : replay:///chemin/du/fichier.cap?speed=4
+  '''
+
+  def __init__(self, name: str, path: str, speed: float = 1.0):
+    super().__init__(name)
+    self.__path    = path
+    self.__speed   = speed
+    self.__records = None
+    self.__pending = None # Prochain enregistrement recu (heure monotone ns, sens, octets)
+    self.__t0      = 0    # Heure (monotone, s) de l'ouverture du rejeu
+    self.__base    = 0    # Heure monotone (ns) de l'ouverture du port lors de la capture
+
+
+  def open(self):
+    try:
+      wallTime, self.__base = grblRecorder.header(self.__path)
+    except (OSError, ValueError, struct.error) as err:
+      raise grblTransportError(str(err)) from err
+    self.__records = grblRecorder.records(self.__path)
+    self.__t0 = time.monotonic()
+    self.__nextRecord()
+
+
+  def close(self):
+    if self.__records is not None:
+      self.__records.close()
+      self.__records = None
+    self.__pending = None
+
+
+  def isOpen(self):
+    return self.__records is not None
+
+
+  def __nextRecord(self):
+    self.__pending = None
+    for record in self.__records:
+      if record[1] == CAPTURE_RX:
+        self.__pending = record
+        return
+
+
+  def __delay(self):
+    ''' Attente (s) avant l'echeance du prochain enregistrement '''
+    if self.__speed <= 0:
+      return 0.0
+    return self.__t0 + (self.__pending[0] - self.__base) / 1e9 / self.__speed - time.monotonic()
+
+
+  def _send(self, data: bytes):
+    pass
+
+
+  def _receive(self):
+    if self.__pending is None:
+      # Fin de la capture : la liaison reste ouverte et muette
+      time.sleep(SERIAL_READ_TIMEOUT / 1000)
+      return b""
+    delay = self.__delay()
+    if delay > SERIAL_READ_TIMEOUT / 1000:
+      time.sleep(SERIAL_READ_TIMEOUT / 1000)
+      return b""
+    if delay > 0:
+      time.sleep(delay)
+    data = self.__pending[2]
+    self.__nextRecord()
+    # Regroupe les enregistrements deja echus
+    while self.__pending is not None and self.__delay() <= 0 and len(data) < 4096:
+      data += self.__pending[2]
+      self.__nextRecord()
+    return data
+
+
+  def _available(self):
+    if self.__pending is None or self.__delay() > 0:
+      return 0
+    return len(self.__pending[2])
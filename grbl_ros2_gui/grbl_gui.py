@@ -47,7 +47,7 @@ class upperCaseValidator(QtGui.QValidator):
 
 class MainWindow(QtWidgets.QMainWindow):
 
-  sig_publish_joint_states = QtCore.pyqtSignal(object, object)
+  sig_publish_toolpath = QtCore.pyqtSignal(object, object)
   sig_set_ros_parameters = QtCore.pyqtSignal(object)
   sig_send_scan_on_off_srv_request = QtCore.pyqtSignal()
   sig_send_scan_reset_srv_request = QtCore.pyqtSignal()
@@ -74,8 +74,11 @@ class MainWindow(QtWidgets.QMainWindow):
     parser.add_argument("-c", "--connect", action="store_true", help=self.tr("Connect the serial port"))
     parser.add_argument("-f", "--file", help=self.tr("Load the GCode file"))
     parser.add_argument("-l", "--lang", help=self.tr("Define the interface language"))
-    parser.add_argument("-p", "--port", help=self.tr("select the serial port"))
+    parser.add_argument("-p", "--port", help=self.tr("select the serial port, or socket://host:port for a network connection"))
+    parser.add_argument("-s", "--streaming", choices=list(COM_STREAMING_MODES.keys()), help=self.tr("Select the GCode streaming protocol"))
     parser.add_argument("-u", "--noUrgentStop", action="store_true", help=self.tr("Unlock urgent stop"))
+    parser.add_argument("--preprocess", action="store_true", help=self.tr("Compact the GCode lines sent to Grbl (comments, spaces, redundant modal words, extra decimals)"))
+    parser.add_argument("--capture", metavar='FILE', help=self.tr("Record the serial traffic with Grbl to FILE (replay with --port replay://FILE?speed=N)"))
     self.__args = parser.parse_args()
 
     # Retrouve le fichier de licence dans le même répertoire que l'exécutable
@@ -102,10 +105,27 @@ class MainWindow(QtWidgets.QMainWindow):
 
     self.__gcodeFile = gcodeFile(self.ui, self.ui.gcodeTable)
     self.__gcodeFile.sig_log.connect(self.on_sig_log)
+    self.__gcodeFile.sig_fileLoaded.connect(self.setEnableDisableGroupes)
+    self.__gcodeFile.sig_toolpath.connect(self.sig_publish_toolpath)
+    self.__gcodeFile.setPreprocess(self.__args.preprocess)
 
     self.timerDblClic = QtCore.QTimer()
 
+    # Regroupement des mouvements des boutons rotatifs de surcharge : un seul envoi par periode GUI_OVERRIDE_DELAY
+    self.__feedOverrideTimer = QtCore.QTimer()
+    self.__feedOverrideTimer.setSingleShot(True)
+    self.__feedOverrideTimer.setInterval(GUI_OVERRIDE_DELAY)
+    self.__feedOverrideTimer.timeout.connect(self.on_feedOverrideTimer)
+    self.__spindleOverrideTimer = QtCore.QTimer()
+    self.__spindleOverrideTimer.setSingleShot(True)
+    self.__spindleOverrideTimer.setInterval(GUI_OVERRIDE_DELAY)
+    self.__spindleOverrideTimer.timeout.connect(self.on_spindleOverrideTimer)
+
     self.__grblCom = grblCom()
+    if self.__args.streaming is not None:
+      self.__grblCom.setStreamingMode(COM_STREAMING_MODES[self.__args.streaming])
+    if self.__args.capture is not None:
+      self.__grblCom.setCapture(self.__args.capture)
     self.__grblCom.sig_log.connect(self.on_sig_log)
     self.__grblCom.sig_connect.connect(self.on_sig_connect)
     self.__grblCom.sig_init.connect(self.on_sig_init)
@@ -117,13 +137,26 @@ class MainWindow(QtWidgets.QMainWindow):
     self.__grblCom.sig_data.connect(self.on_sig_data)
     self.__grblCom.sig_emit.connect(self.on_sig_emit)
     self.__grblCom.sig_recu.connect(self.on_sig_recu)
-    self.__grblCom.sig_debug.connect(self.on_sig_debug)
     self.__grblCom.sig_activity.connect(self.on_sig_activity)
     self.__grblCom.sig_serialLock.connect(self.on_sig_serialLock)
 
+    # Les traces de debug de la communication ne sont produites qu'en mode debug, l'onglet debug les recupere periodiquement
+    self.__traceTimer = QtCore.QTimer()
+    self.__traceTimer.setInterval(TRACE_DRAIN_DELAY)
+    self.__traceTimer.timeout.connect(self.on_traceTimer)
+
+    # Mesure du retard de la boucle d'evenements GUI (publie avec les autres mesures de grblCom.metrics())
+    self.__lagTimer = QtCore.QTimer()
+    self.__lagTimer.setInterval(METRICS_GUI_LAG_DELAY)
+    self.__lagTimer.timeout.connect(self.on_lagTimer)
+    self.__lagTime = time.perf_counter()
+    self.__lagTimer.start()
+
     self.__decode = grblDecode(self.ui, self.log, self.__grblCom)
-    self.__decode.sig_publish_joint_states.connect(self.sig_publish_joint_states)
     self.__grblCom.setDecodeur(self.__decode)
+    # Verification hors ligne et estimation de la duree des programmes selon la configuration de Grbl
+    self.__gcodeFile.setCheckerFactory(self.__decode.gcodeChecker)
+    self.__gcodeFile.setEstimatorFactory(self.__decode.gcodeEstimator)
 
     self.__jog = grblJog(self.__grblCom)
     self.ui.dsbJogSpeed.setValue(DEFAULT_JOG_SPEED)
@@ -444,7 +477,7 @@ class MainWindow(QtWidgets.QMainWindow):
             self.ui.cmbPort.setCurrentIndex(len(self.ui.cmbPort)-1)
         elif lastPort == p.device:
           self.ui.cmbPort.setCurrentIndex(len(self.ui.cmbPort)-1)
-    else:
+    elif self.__args.port is None:
       m = msgBox(
                   title  = self.tr("Warning !"),
                   text   = self.tr("No communication port available!"),
@@ -454,6 +487,10 @@ class MainWindow(QtWidgets.QMainWindow):
                   stdButton = msgButtonList.Close
                 )
       m.afficheMsg()
+    # Port non detecte par comports() (pseudo-terminal du simulateur Grbl par exemple) : on l'ajoute a la liste
+    if self.__args.port is not None and self.__args.port not in [p.device for p in ports]:
+      self.ui.cmbPort.addItem(self.__args.port)
+      self.ui.cmbPort.setCurrentIndex(len(self.ui.cmbPort)-1)
     # S'il n'y a qu'un seul port serie et que l'on a rien precise comme option port, on le selectionne
     if self.__args.port == None:
       if len(ports) == 1:
@@ -1848,7 +1885,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.qtabConsole.setCurrentIndex(CN5X_TAB_GRBL)
       # Recupere les coordonnees et parametres du port a connecter
       serialDevice = self.ui.cmbPort.currentText()
-      serialDevice = serialDevice.split("-")
+      # " - " : les noms de ports reseau (socket://grbl-esp32.local:23) peuvent contenir des tirets
+      serialDevice = serialDevice.split(" - ")
       serialDevice = serialDevice[0].strip()
       baudRate = int(self.ui.cmbBauds.currentText())
       # Demarrage du communicator
@@ -1875,7 +1913,7 @@ class MainWindow(QtWidgets.QMainWindow):
     self.__connectionStatus = self.__grblCom.isOpen()
     if self.__connectionStatus:
       # Mise a jour de l'interface machine connectée
-      self.ui.lblConnectStatus.setText(self.tr("Connected to {}").format(self.ui.cmbPort.currentText().split("-")[0].strip()))
+      self.ui.lblConnectStatus.setText(self.tr("Connected to {}").format(self.ui.cmbPort.currentText().split(" - ")[0].strip()))
       self.ui.btnConnect.setText(self.tr("Disconnect")) # La prochaine action du bouton sera pour deconnecter
       self.setEnableDisableConnectControls()
       # Active les groupes de controles de pilotage de Grbl
@@ -1901,20 +1939,33 @@ class MainWindow(QtWidgets.QMainWindow):
 
   @pyqtSlot(int)
   def on_feedOverride(self, value: int):
-    adjustFeedOverride(int(self.ui.lblAvancePourcent.text()[:-1]), value, self.__grblCom)
+    # L'affichage suit le bouton, l'envoi a Grbl est differe a l'echeance du timer, vers la valeur du bouton a ce moment la
     self.ui.lblAvancePourcent.setText("{}%".format(value))
+    if not self.__feedOverrideTimer.isActive():
+      self.__feedOverrideTimer.start()
     if self.ui.btnLinkOverride.isChecked() and (value != self.ui.dialBroche.value()):
       self.ui.dialBroche.setValue(value)
 
 
+  @pyqtSlot()
+  def on_feedOverrideTimer(self):
+    self.__decode.feedOverride().send(self.ui.dialAvance.value(), self.__grblCom)
+
+
   @pyqtSlot(int)
   def on_spindleOverride(self, value: int):
-    adjustSpindleOverride(int(self.ui.lblBrochePourcent.text()[:-1]), value, self.__grblCom)
     self.ui.lblBrochePourcent.setText("{}%".format(value))
+    if not self.__spindleOverrideTimer.isActive():
+      self.__spindleOverrideTimer.start()
     if self.ui.btnLinkOverride.isChecked() and (value != self.ui.dialAvance.value()):
       self.ui.dialAvance.setValue(value)
 
 
+  @pyqtSlot()
+  def on_spindleOverrideTimer(self):
+    self.__decode.spindleOverride().send(self.ui.dialBroche.value(), self.__grblCom)
+
+
   @pyqtSlot()
   def on_btnLinkOverride(self):
     if self.ui.btnLinkOverride.isChecked() and (self.ui.dialAvance.value() != self.ui.dialBroche.value()):
@@ -2178,9 +2229,9 @@ class MainWindow(QtWidgets.QMainWindow):
       self.__pBox.stop()
 
 
-  @pyqtSlot(str)
-  def on_sig_status(self, data: str):
-    retour = self.__decode.decodeGrblStatus(data)
+  @pyqtSlot(object)
+  def on_sig_status(self, status):
+    retour = self.__decode.decodeGrblStatus(status)
     if retour != "":
       self.logGrbl.append(retour)
     if self.__cycleRun and self.__decode.get_etatMachine() == GRBL_STATUS_RUN:
@@ -2238,26 +2289,33 @@ class MainWindow(QtWidgets.QMainWindow):
         self.logGrbl.append(retour)
       else:
         self.logGrbl.append(data)
-
-
-  @pyqtSlot(str)
-  def on_sig_emit(self, data: str):
+    elif data[:1] == "$":
+      # Memorise la valeur du parametre
+      self.__decode.decodeGrblData(data)
+    if data.split('=')[0] == "$13{}".format(self.__nbAxis - 1):
+      # Derniers parametres de $$ : nouvelle verification du programme avec les limites logicielles
+      # et nouvelle estimation de sa duree avec les vitesses et accelerations de la machine
+      self.__gcodeFile.setCheckerFactory(self.__decode.gcodeChecker)
+      self.__gcodeFile.setEstimatorFactory(self.__decode.gcodeEstimator)
+
+
+  @pyqtSlot(str, int)
+  def on_sig_emit(self, data: str, ligne: int):
     if data != "":
       self.logGrbl.append(data)
-      if self.__cycleRun:
-        # Recherche la ligne dans la liste du fichier GCode
-        ligne = self.__gcodeFile.getGCodeSelectedLine()[0]
-        while ligne < self.ui.gcodeTable.model().rowCount():
-          idx = self.ui.gcodeTable.model().index(ligne, 0, QtCore.QModelIndex())
-          if self.ui.gcodeTable.model().data(idx) == data:
-            self.__gcodeFile.selectGCodeFileLine(ligne)
-            break
-          else:
-            ligne += 1
+      if self.__cycleRun and ligne != COM_NO_ROW:
+        # Selectionne la ligne envoyee dans la liste du fichier GCode
+        self.__gcodeFile.selectGCodeFileLine(ligne)
         # Mise à jour de la progressBox
         self.__pBox.setValue(ligne + 1)
+        self.__pBox.setRemaining(self.__gcodeFile.remainingTime(ligne))
         if data[:1] == '(' and data[-1:] == ")":
           self.__pBox.setComment(data)
+        elif self.__gcodeFile.preprocess():
+          # Les lignes de commentaire ne sont pas envoyees par le preprocesseur
+          commentaire = self.__gcodeFile.streamComment(ligne)
+          if commentaire is not None:
+            self.__pBox.setComment(commentaire)
 
 
   @pyqtSlot(str)
@@ -2271,9 +2329,47 @@ class MainWindow(QtWidgets.QMainWindow):
       self.logDebug.append(data)
 
 
+  @pyqtSlot()
+  def on_traceTimer(self):
+    ''' Affichage en un seul bloc des traces de la communication accumulees depuis le dernier vidage '''
+    lignes = self.__grblCom.trace().drain(TRACE_DRAIN_MAX)
+    if len(lignes) > 0:
+      self.logDebug.append("\n".join(lignes))
+
+
+  @pyqtSlot()
+  def on_lagTimer(self):
+    now = time.perf_counter()
+    self.__grblCom.metrics().guiLag(now - self.__lagTime - METRICS_GUI_LAG_DELAY / 1000)
+    self.__lagTime = now
+
+
+  def metrics(self):
+    ''' Mesures de fonctionnement de la communication avec Grbl (grblMetrics), lues par le backend ROS '''
+    return self.__grblCom.metrics()
+
+
+  def motion(self):
+    ''' Position machine datee a la reception des rapports de status (grblMotion), lue par le backend ROS '''
+    return self.__grblCom.motion()
+
+
+  def setTraceLevel(self, debug: bool):
+    ''' Active ou coupe a la source les traces de debug de la communication '''
+    if debug:
+      self.__grblCom.trace().clear()
+      self.__grblCom.trace().setLevel(TRACE_LEVEL_DATA)
+      self.__traceTimer.start()
+    else:
+      self.__grblCom.trace().setLevel(TRACE_LEVEL_OFF)
+      self.__traceTimer.stop()
+      self.on_traceTimer()
+
+
   @pyqtSlot()
   def on_mnuDebug_mode(self):
     ''' Set the debug button on the same status '''
+    self.setTraceLevel(self.ui.mnuDebug_mode.isChecked())
     if self.ui.mnuDebug_mode.isChecked():
       if not self.ui.btnDebug.isChecked():
         self.ui.btnDebug.setChecked(True)
@@ -2316,9 +2412,11 @@ class MainWindow(QtWidgets.QMainWindow):
     if self.ui.btnDebug.isChecked():
       if not self.ui.mnuDebug_mode.isChecked():
         self.ui.mnuDebug_mode.setChecked(True)
+      self.setTraceLevel(True)
       self.ui.btnPausePooling.setEnabled(True)
       self.on_sig_debug("cn5X++ (v{}) : Starting debug.".format(APP_VERSION_STRING))
     else:
+      self.setTraceLevel(False)
       self.on_sig_debug("cn5X++ (v{}) : Stop debugging.".format(APP_VERSION_STRING))
       if self.ui.mnuDebug_mode.isChecked():
         self.ui.mnuDebug_mode.setChecked(False)
@@ -2352,6 +2450,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
       # Affichage de la boite de progression
       self.__pBox.setRange(startFrom, self.ui.gcodeTable.model().rowCount())
+      self.__pBox.setRemaining(self.__gcodeFile.remainingTime(startFrom))
       self.__pBoxArmee = False
       self.__pBox.start()
 
@@ -2359,7 +2458,13 @@ class MainWindow(QtWidgets.QMainWindow):
       self.__cycleRun = True
       self.__cyclePause = False
       
-      self.__gcodeFile.enQueue(self.__grblCom, startFrom)
+      # Resultat de la verification hors ligne (les erreurs ont ete detaillees dans le journal)
+      issues = self.__gcodeFile.checkIssues()
+      if issues:
+        self.log(logSeverity.warning.value, self.tr("The GCode check found errors, the first one at line {}.").format(issues[0][0] + 1))
+
+      # Reprise en cours de programme : l'etat modal des lignes precedentes est retabli avant la ligne startFrom
+      self.__gcodeFile.enQueue(self.__grblCom, startFrom, resume = True)
       
       self.ui.btnStart.setButtonStatus(True)
       self.ui.btnPause.setButtonStatus(False)
@@ -2739,7 +2844,7 @@ class MainWindow(QtWidgets.QMainWindow):
         current_Y = float(self.ui.lblPosY.text())
         # Generate scan gcode
         toolpath = RectangleZigzagPath(tool_diameter=scan_resolution, scan_speed=scan_speed)
-        gcode_blocks = toolpath.make(X_start=current_X-scan_width/2,Y_start=current_Y-scan_height/2,width=scan_width,height=scan_height)
+        gcode_blocks = toolpath.make(X_start=current_X-scan_width/2,Y_start=current_Y-scan_height/2,width=scan_width,height=scan_height,tolerance=SCAN_PATH_TOLERANCE)
         # Push all the gcode to the buffer
         for gcode in gcode_blocks:
           self.__grblCom.gcodePush(gcode)
@@ -2811,7 +2916,9 @@ def main(args=None):
     backend = Backend()
     window = MainWindow()
     # Connect GUI signals to ROS backend slots
-    window.sig_publish_joint_states.connect(backend.publish_joint_states)
+    window.sig_publish_toolpath.connect(backend.publish_toolpath)
+    backend.set_metrics(window.metrics())
+    backend.set_motion(window.motion())
     window.sig_set_ros_parameters.connect(backend.set_ros_parameters)
     window.sig_send_scan_on_off_srv_request.connect(backend.send_scan_on_off_request)
     window.sig_send_scan_reset_srv_request.connect(backend.send_scan_reset_request)
@@ -24,7 +24,7 @@
 import sys
 import threading
 from threading import Timer,Thread,Event
-from datetime import datetime
+from datetime import datetime, timedelta
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtCore import Qt, QCoreApplication, QObject, pyqtSignal, pyqtSlot, QSettings
 from .cn5X_config import *
@@ -81,8 +81,14 @@ class qwProgressBox(QtWidgets.QWidget):
     self.pBoxLblElapse.setText(self.tr("Elapsed time:"))
     self.pBoxLblElapse.setGeometry(20, self.pBoxLblComment.geometry().y()+self.pBoxLblComment.height()+3, self.pBoxLblStart.width(), 20)
 
+    # Duree restante estimee par le planificateur (gcodeEstimator)
+    self.pBoxLblRemaining = QtWidgets.QLabel(self.pBox)
+    self.pBoxLblRemaining.setText(self.tr("Remaining time:"))
+    self.pBoxLblRemaining.setGeometry(20, self.pBoxLblElapse.geometry().y()+self.pBoxLblElapse.height()+3, self.pBoxLblStart.width(), 20)
+    self.__remaining = None
+
     pBoxLargeur = self.pBoxLblStart.width() + 40
-    pBoxHauteur = self.pBoxLblElapse.geometry().y()+self.pBoxLblElapse.height()+6
+    pBoxHauteur = self.pBoxLblRemaining.geometry().y()+self.pBoxLblRemaining.height()+6
     defaultX    = int((parent.width() - pBoxLargeur) / 2)
     defaultY    = int((parent.height() - pBoxHauteur) / 5 * 3)
     pBoxX = self.__settings.value("ProgressBox/posX", defaultX, type=int)
@@ -117,6 +123,23 @@ class qwProgressBox(QtWidgets.QWidget):
     self.pBoxProgress.setToolTip(self.tr("Line {} of {}").format(val, self.pBoxProgress.maximum()))
 
 
+  def setRemaining(self, seconds):
+    ''' Duree restante estimee (s) et heure de fin prevue, None si l'estimation n'est pas disponible '''
+    if seconds is None:
+      if self.__remaining is not None:
+        self.__remaining = None
+        self.pBoxLblRemaining.setText(self.tr("Remaining time:"))
+      return
+    total_seconds = int(round(seconds))
+    if total_seconds == self.__remaining:
+      return
+    self.__remaining = total_seconds
+    hours, remainder = divmod(total_seconds,60*60)
+    minutes, seconds = divmod(remainder,60)
+    fin = datetime.now() + timedelta(seconds=total_seconds)
+    self.pBoxLblRemaining.setText(self.tr("Remaining time: {:02d}:{:02d}:{:02d} (ends at {})").format(hours, minutes, seconds, fin.strftime("%H:%M:%S")))
+
+
   def setComment(self, comment: str):
     self.pBoxLblComment.setText(comment)
 
@@ -11,11 +11,23 @@ Ros backend for the GUI.
 from PyQt5 import QtCore
 from PyQt5.QtCore import pyqtSlot
 
+import math
+import threading
+import time
+from array import array
 import rclpy
-from rclpy.qos import QoSProfile
+from rclpy.qos import QoSProfile, DurabilityPolicy
+from rclpy.serialization import serialize_message
 from sensor_msgs.msg import JointState
 from .rviz_interactive_marker import GRBLInteractiveMarker
-from std_msgs.msg import String
+from std_msgs.msg import String, ColorRGBA
+from geometry_msgs.msg import Point
+from visualization_msgs.msg import Marker
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from .cn5X_config import ROS_DIAGNOSTICS_PERIOD, METRICS_RTT_BOUNDS, METRICS_GUI_LAG_WARN, ROS_JOINT_STATES_RATE
+from .cn5X_config import ROS_TOOLPATH_FRAME, ROS_TOOLPATH_MAX_POINTS, ROS_TOOLPATH_CHUNK_POINTS, ROS_TOOLPATH_LINE_WIDTH
+from .cn5X_config import ROS_TOOLPATH_FEED_COLOR, ROS_TOOLPATH_RAPID_COLOR, ROS_TOOLPATH_DEPTH
+from .toolpath.preview import SENTINEL, chunks, decimate, line_list, pack_points
 
 from std_srvs.srv import Trigger
 
@@ -42,16 +54,38 @@ class Backend(QtCore.QObject):
                 ('max_travel_b', 0.0),
                 ('scan_mode', 0),
                 ('scan_width', 0.0),
-                ('scan_height', 0.0)
+                ('scan_height', 0.0),
+                ('toolpath_frame', ROS_TOOLPATH_FRAME),
+                ('toolpath_max_points', ROS_TOOLPATH_MAX_POINTS)
             ])
+        # Machine position between status reports, see set_motion()
+        self.motion = None
         self.joint_pub = self.node.create_publisher(JointState, 'joint_states', qos_profile)
         self.joint_states = JointState()
+        self.joint_names = None
+        self.joint_count = 0
+        self.joint_scales = []
+        self.joint_timer = self.node.create_timer(1.0 / ROS_JOINT_STATES_RATE, self.publish_joint_states)
 
         self.rviz_interactive_markers = GRBLInteractiveMarker(self.node)
         self.rviz_interactive_markers.sig_jog_axis.connect(self.sig_push_gcode)
 
+        # Toolpath preview, see publish_toolpath(): late subscribers (RViz) get the last published path once,
+        # up to ROS_TOOLPATH_DEPTH messages, the depth of the Toolpath display in rviz/laser.rviz
+        toolpath_qos = QoSProfile(depth=ROS_TOOLPATH_DEPTH, durability=DurabilityPolicy.TRANSIENT_LOCAL)
+        self.toolpath_pub = self.node.create_publisher(Marker, 'toolpath', toolpath_qos)
+        # Decimation and serialization run in the spin thread, woken up by the guard condition
+        self.toolpath_lock = threading.Lock()
+        self.toolpath = None
+        self.toolpath_guard = self.node.create_guard_condition(self.send_toolpath)
+
         self.cmd_sub = self.node.create_subscription(String, 'cmd/gcode', self.push_gcode, qos_profile)
 
+        # Streaming telemetry, see set_metrics()
+        self.metrics = None
+        self.diagnostics_pub = self.node.create_publisher(DiagnosticArray, 'diagnostics', qos_profile)
+        self.diagnostics_timer = self.node.create_timer(ROS_DIAGNOSTICS_PERIOD, self.publish_diagnostics)
+
         self.cli_scan = self.node.create_client(Trigger, 'labjack_pointcloud2_publisher/scan_on_off')
         self.cli_scan_reset = self.node.create_client(Trigger, 'labjack_pointcloud2_publisher/scan_reset')
         self.req_scan = Trigger.Request()
@@ -79,17 +113,126 @@ class Backend(QtCore.QObject):
             self.node.get_logger().info('Scan Reset service not available, waiting again...')
         self.future = self.cli_scan_reset.call_async(self.req_scan)
 
-    @pyqtSlot(object,object)
-    def publish_joint_states(self, joint_names, joint_values):
+    def set_motion(self, motion):
+        """Machine position (grblMotion) stamped by the serial thread, published on joint_states."""
+        self.motion = motion
+
+    def publish_joint_states(self):
+        """Publish the machine position extrapolated to now, at ROS_JOINT_STATES_RATE."""
+        if self.motion is None:
+            return
+        names, position = self.motion.joints(time.monotonic())
+        if position is None:
+            return
+        if names != self.joint_names or len(position) != self.joint_count:
+            # Reallocated only when the axes change: mm to m for X, Y, Z, degrees to radians
+            # for the rotary axes, Y and Z inverted because of the URDF definition
+            n = min(len(names), len(position))
+            self.joint_names = names
+            self.joint_count = len(position)
+            self.joint_scales = [0.001, -0.001, -0.001][:n] + [math.pi / 180] * (n - 3)
+            self.joint_states.name = list(names[:n])
+            self.joint_states.position = array('d', [0.0] * n)
+        values = self.joint_states.position
+        for i, (v, k) in enumerate(zip(position, self.joint_scales)):
+            values[i] = v * k
         self.joint_states.header.stamp = self.node.get_clock().now().to_msg()
-        self.joint_states.name = joint_names
-        self.joint_states.position = joint_values
         self.joint_pub.publish(self.joint_states)
 
+    @pyqtSlot(object, object)
+    def publish_toolpath(self, points, rapid):
+        """
+        Publish the toolpath of the loaded program as LINE_LIST markers.
+
+        points: (n + 1, 3) XYZ vertices in work coordinates (mm), rapid: (n,) True for G0 moves.
+        Only hands the path to the spin thread (send_toolpath()): the GUI thread returns at once,
+        a path not sent yet is replaced by the new one.
+        """
+        with self.toolpath_lock:
+            self.toolpath = (points, rapid)
+        self.toolpath_guard.trigger()
+
+    def send_toolpath(self):
+        """
+        Send the last path given to publish_toolpath(), from the spin thread.
+
+        The path is decimated under the toolpath_max_points budget, then sent in the
+        toolpath_frame frame after a DELETEALL marker clearing the previous program.
+        """
+        with self.toolpath_lock:
+            toolpath, self.toolpath = self.toolpath, None
+        if toolpath is None:
+            return
+        points, rapid = toolpath
+        frame = self.node.get_parameter('toolpath_frame').value
+        max_points = self.node.get_parameter('toolpath_max_points').value
+        vertices, rapid = decimate(points, rapid, max_points)
+        # DELETEALL and the feed and rapid chunks must fit in the ROS_TOOLPATH_DEPTH messages kept for
+        # late subscribers: the chunks grow beyond ROS_TOOLPATH_CHUNK_POINTS for large budgets
+        chunk_points = max(ROS_TOOLPATH_CHUNK_POINTS, 2 * math.ceil(max_points / (2 * (ROS_TOOLPATH_DEPTH - 3))))
+        stamp = self.node.get_clock().now().to_msg()
+        clear = Marker()
+        clear.header.frame_id = frame
+        clear.header.stamp = stamp
+        clear.action = Marker.DELETEALL
+        self.toolpath_pub.publish(clear)
+        marker_id = 0
+        for select, color in ((False, ROS_TOOLPATH_FEED_COLOR), (True, ROS_TOOLPATH_RAPID_COLOR)):
+            for chunk in chunks(line_list(vertices, rapid, select) * 0.001, chunk_points):
+                marker = Marker()
+                marker.header.frame_id = frame
+                marker.header.stamp = stamp
+                marker.ns = 'toolpath'
+                marker.id = marker_id
+                marker.type = Marker.LINE_LIST
+                marker.action = Marker.ADD
+                marker.pose.orientation.w = 1.0
+                marker.scale.x = ROS_TOOLPATH_LINE_WIDTH
+                marker.color = ColorRGBA(r=color[0], g=color[1], b=color[2], a=color[3])
+                marker.points = [Point(x=SENTINEL[0], y=SENTINEL[1], z=SENTINEL[2])]
+                # Vertices copied as one block into the serialized message
+                self.toolpath_pub.publish(pack_points(serialize_message(marker), chunk))
+                marker_id += 1
+        self.node.get_logger().info('Toolpath preview: {} points in {} markers'.format(2 * len(rapid), marker_id))
+
     @pyqtSlot(object)
     def set_ros_parameters(self, list_params):
         self.node.set_parameters(list_params)
 
+    def set_metrics(self, metrics):
+        """Counters (grblMetrics) published on /diagnostics, shared with the GUI and serial threads."""
+        self.metrics = metrics
+
+    def publish_diagnostics(self):
+        if self.metrics is None:
+            return
+        m = self.metrics.snapshot()
+        status = DiagnosticStatus()
+        status.name = 'grbl: streaming'
+        status.hardware_id = self.node.get_parameter('port').value
+        status.level = DiagnosticStatus.OK
+        status.message = 'OK'
+        if m['guiLagMax'] > METRICS_GUI_LAG_WARN:
+            status.level = DiagnosticStatus.WARN
+            status.message = 'GUI event loop lagging'
+        elif m['linesInFlight'] == 0 and m['mainQueue'] + m['sourcesQueue'] > 0 and m['plannerUsed'] == 0:
+            # Lines are waiting on our side while Grbl has nothing left to execute
+            status.level = DiagnosticStatus.WARN
+            status.message = 'Planner starved'
+        values = [(key, m[key]) for key in (
+            'mainQueue', 'realTimeQueue', 'sourcesQueue', 'rxInFlight', 'linesInFlight',
+            'plannerUsed', 'plannerFree', 'rxFree', 'linesSent', 'linesPerSecond', 'bytesPerSecond',
+            'acksPerSecond', 'statusQueryRate', 'statusReportRate', 'ackRoundTripCount')]
+        values.append(('ackRoundTripMean_ms', m['ackRoundTripMean'] * 1000))
+        bounds = ['<={:g}ms'.format(b * 1000) for b in METRICS_RTT_BOUNDS] + ['>{:g}ms'.format(METRICS_RTT_BOUNDS[-1] * 1000)]
+        values += [('ackRoundTrip ' + b, n) for b, n in zip(bounds, m['ackRoundTripHistogram'])]
+        values.append(('guiLagMax_ms', m['guiLagMax'] * 1000))
+        status.values = [KeyValue(key=k, value='' if v is None else '{:g}'.format(v)) for k, v in values]
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = self.node.get_clock().now().to_msg()
+        diagnostics.status = [status]
+        self.diagnostics_pub.publish(diagnostics)
+
     def push_gcode(self, gcode):
         self.sig_push_gcode.emit(gcode.data)
 
@@ -21,39 +21,91 @@
 '                                                                         '
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
+import time
 from .cn5X_config import *
 from .grblCom import grblCom
 
+# Codes temps reel d'une surcharge : (100%, +10%, -10%, +1%, -1%)
+FEED_OVERRIDE_CODES    = (REAL_TIME_FEED_100_POURCENT, REAL_TIME_FEED_PLUS_10, REAL_TIME_FEED_MOINS_10, REAL_TIME_FEED_PLUS_1, REAL_TIME_FEED_MOINS_1)
+SPINDLE_OVERRIDE_CODES = (REAL_TIME_SPINDLE_100_POURCENT, REAL_TIME_SPINDLE_PLUS_10, REAL_TIME_SPINDLE_MOINS_10, REAL_TIME_SPINDLE_PLUS_1, REAL_TIME_SPINDLE_MOINS_1)
+
+
+def __overrideSteps(valeurDepart: int, valeurArrivee: int, codes: tuple):
+  ''' Pas de 10% puis de 1% les moins nombreux pour aller de valeurDepart a valeurArrivee sans sortir des limites de Grbl '''
+  ecart = valeurArrivee - valeurDepart
+  meilleur = None
+  for dizaines in (ecart // 10, -(-ecart // 10)):
+    # Grbl borne la surcharge a chaque pas : les pas de 10% ne doivent pas depasser les limites
+    if GRBL_OVERRIDE_MIN <= valeurDepart + 10 * dizaines <= GRBL_OVERRIDE_MAX:
+      if meilleur is None or abs(dizaines) + abs(ecart - 10 * dizaines) < abs(meilleur) + abs(ecart - 10 * meilleur):
+        meilleur = dizaines
+  unites = ecart - 10 * meilleur
+  return (codes[1] * meilleur if meilleur > 0 else codes[2] * -meilleur) \
+       + (codes[3] * unites if unites > 0 else codes[4] * -unites)
+
+
+def overrideSequence(valeurDepart: int, valeurArrivee: int, codes: tuple):
+  '''
+  Sequence minimale de commandes temps reel pour passer la surcharge de valeurDepart a valeurArrivee (%),
+  en combinant les pas de 10% et de 1% dans les deux sens et le retour a 100%.
+  '''
+  valeurDepart  = min(max(valeurDepart, GRBL_OVERRIDE_MIN), GRBL_OVERRIDE_MAX)
+  valeurArrivee = min(max(valeurArrivee, GRBL_OVERRIDE_MIN), GRBL_OVERRIDE_MAX)
+  if valeurDepart == valeurArrivee:
+    return ""
+  sequence = __overrideSteps(valeurDepart, valeurArrivee, codes)
+  depuis100 = codes[0] + __overrideSteps(100, valeurArrivee, codes)
+  return depuis100 if len(depuis100) < len(sequence) else sequence
+
+
 def adjustFeedOverride(valeurDepart: int, valeurArrivee: int, grbl: grblCom):
-  valeurCourante = valeurDepart
-  while valeurCourante != valeurArrivee:
-    if valeurCourante <= valeurArrivee - 10:
-      grbl.realTimePush(REAL_TIME_FEED_PLUS_10, COM_FLAG_NO_OK)
-      valeurCourante += 10
-    elif valeurCourante < valeurArrivee:
-      grbl.realTimePush(REAL_TIME_FEED_PLUS_1, COM_FLAG_NO_OK)
-      valeurCourante += 1
-    elif valeurCourante >= valeurArrivee + 10:
-      grbl.realTimePush(REAL_TIME_FEED_MOINS_10, COM_FLAG_NO_OK)
-      valeurCourante -= 10
-    elif valeurCourante > valeurArrivee:
-      grbl.realTimePush(REAL_TIME_FEED_MOINS_1, COM_FLAG_NO_OK)
-      valeurCourante -= 1
+  ''' Envoie en une seule commande temps reel la sequence de passage de valeurDepart a valeurArrivee '''
+  sequence = overrideSequence(valeurDepart, valeurArrivee, FEED_OVERRIDE_CODES)
+  if sequence != "":
+    grbl.realTimePush(sequence, COM_FLAG_NO_OK)
 
 
 def adjustSpindleOverride(valeurDepart: int, valeurArrivee: int, grbl: grblCom):
-  valeurCourante = valeurDepart
-  while valeurCourante != valeurArrivee:
-    if valeurCourante <= valeurArrivee - 10:
-      grbl.realTimePush(REAL_TIME_SPINDLE_PLUS_10, COM_FLAG_NO_OK)
-      valeurCourante += 10
-    elif valeurCourante < valeurArrivee:
-      grbl.realTimePush(REAL_TIME_SPINDLE_PLUS_1, COM_FLAG_NO_OK)
-      valeurCourante += 1
-    elif valeurCourante >= valeurArrivee + 10:
-      grbl.realTimePush(REAL_TIME_SPINDLE_MOINS_10, COM_FLAG_NO_OK)
-      valeurCourante -= 10
-    elif valeurCourante > valeurArrivee:
-      grbl.realTimePush(REAL_TIME_SPINDLE_MOINS_1, COM_FLAG_NO_OK)
-      valeurCourante -= 1
+  ''' Envoie en une seule commande temps reel la sequence de passage de valeurDepart a valeurArrivee '''
+  sequence = overrideSequence(valeurDepart, valeurArrivee, SPINDLE_OVERRIDE_CODES)
+  if sequence != "":
+    grbl.realTimePush(sequence, COM_FLAG_NO_OK)
+
+
+class overrideTarget():
+  '''
+  Surcharge (avance ou broche) demandee a Grbl par un bouton rotatif.
+  Les sequences sont calculees depuis la derniere valeur envoyee et non depuis le dernier Ov: recu :
+  un status deja en route au moment de l'envoi ne le reflete pas encore. Le Ov: des status n'est compare
+  a la valeur envoyee qu'apres GUI_OVERRIDE_SETTLE, pour retablir la valeur si Grbl l'a perdue (reset...).
+  '''
+
+  def __init__(self, codes: tuple):
+    self.__codes    = codes
+    self.__value    = 100   # Derniere valeur envoyee
+    self.__sentTime = None
+
+
+  def value(self):
+    return self.__value
+
+
+  def __push(self, valeurDepart: int, grbl: grblCom):
+    sequence = overrideSequence(valeurDepart, self.__value, self.__codes)
+    if sequence != "":
+      grbl.realTimePush(sequence, COM_FLAG_NO_OK)
+      self.__sentTime = time.monotonic()
+
+
+  def send(self, valeur: int, grbl: grblCom):
+    ''' Envoie la sequence de passage de la derniere valeur envoyee a valeur '''
+    depart, self.__value = self.__value, valeur
+    self.__push(depart, grbl)
+
 
+  def reported(self, valeur: int, grbl: grblCom):
+    ''' Valeur Ov: d'un status : renvoie la difference si Grbl n'a pas la derniere valeur envoyee '''
+    if self.__sentTime is not None and time.monotonic() - self.__sentTime < GUI_OVERRIDE_SETTLE / 1000:
+      return # Status peut-etre anterieur au dernier envoi
+    if valeur != self.__value:
+      self.__push(valeur, grbl)
@@ -0,0 +1,274 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Toolpath compression: fewer, longer G-code blocks for the same path.
+
+Dense G1 polylines cost one ``ok`` round-trip per block and keep Grbl's
+planner short of look-ahead. This module merges nearly collinear segments
+(Douglas-Peucker within a tolerance) and replaces runs of points lying on a
+circle of the XY plane with G2/G3 arcs.
+
+Points are rows of an array whose columns are the axes given by ``axes``
+(for example 'XY', 'XYZ' or 'XYZAB'). Rotary axes (A, B, C) are compared
+through ``angular_tolerance`` (degrees) instead of ``tolerance`` (mm): a point
+is only dropped if every linear axis and every rotary axis stays within its
+own tolerance of the simplified path. Grbl interpolates all axes linearly in
+joint space, so this bounds the joint deviation, which is the conservative
+choice for the 5-axis laser where the tool tip is a non-linear function of
+the joints. Arcs are only fitted where every axis other than X and Y is
+constant.
+"""
+
+import re
+
+import numpy as np
+
+ROTARY_AXES = 'ABC'
+ARC_MIN_POINTS = 4       # An arc must replace at least 3 segments
+ARC_MAX_POINTS = 2000    # Points tried per arc (bounds the fitting cost)
+ARC_MIN_RADIUS = 1e-3
+ARC_MAX_RADIUS = 1e4     # Beyond this an "arc" is a straight line
+MOTION_CODES = (0, 1, 2, 3, 38.2, 38.3, 38.4, 38.5, 80)   # Motion modal group of Grbl
+
+GCODE_WORD = re.compile(r'([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))')
+
+
+def _scale(axes, tolerance, angular_tolerance):
+    """Per-axis factors bringing every axis tolerance to 1."""
+    return np.array([1.0 / angular_tolerance if a in ROTARY_AXES else 1.0 / tolerance for a in axes])
+
+
+def simplify(points, tolerance, axes='XY', angular_tolerance=None):
+    """
+    Return the indices of the points kept by Douglas-Peucker.
+
+    The first and last points are always kept. angular_tolerance defaults to
+    tolerance (in degrees) for the rotary axes.
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+    scaled = points * _scale(axes, tolerance, angular_tolerance or tolerance)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a = scaled[first]
+        chord = scaled[last] - a
+        inner = scaled[first + 1:last] - a
+        length2 = chord.dot(chord)
+        if length2 > 0:
+            t = np.clip(inner.dot(chord) / length2, 0.0, 1.0)
+            deviation = np.abs(inner - np.outer(t, chord))
+        else:
+            deviation = np.abs(inner)
+        # Scaled deviation per axis: every axis must stay within its own tolerance
+        worst = deviation.max(axis=1)
+        i = int(np.argmax(worst))
+        if worst[i] > 1.0:
+            keep[first + 1 + i] = True
+            stack.append((first, first + 1 + i))
+            stack.append((first + 1 + i, last))
+    return np.flatnonzero(keep)
+
+
+def _circle(p1, p2, p3):
+    """Centre and radius of the circle through three XY points, None if they are collinear."""
+    ax, ay = p1
+    bx, by = p2
+    cx, cy = p3
+    d = 2.0 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+    a2 = ax * ax + ay * ay
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    ux = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d
+    uy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d
+    r = np.hypot(ax - ux, ay - uy)
+    if not ARC_MIN_RADIUS <= r <= ARC_MAX_RADIUS:
+        return None
+    return np.array([ux, uy]), r
+
+
+def _fits_arc(xy, first, last, tolerance):
+    """(centre, clockwise) if points first..last lie on one arc within tolerance, else None."""
+    run = xy[first:last + 1]
+    circle = _circle(run[0], run[len(run) // 2], run[-1])
+    if circle is None:
+        return None
+    centre, r = circle
+    rel = run - centre
+    if np.abs(np.hypot(rel[:, 0], rel[:, 1]) - r).max() > tolerance:
+        return None
+    # Same turning direction everywhere, less than a full turn
+    cross = rel[:-1, 0] * rel[1:, 1] - rel[:-1, 1] * rel[1:, 0]
+    dot = (rel[:-1] * rel[1:]).sum(axis=1)
+    if not (np.all(cross > 0) or np.all(cross < 0)):
+        return None
+    sweep = np.abs(np.arctan2(cross, dot)).sum()
+    if sweep >= 2 * np.pi - 1e-6:
+        return None
+    # The arc bulges out of each original chord by its sagitta
+    chords = np.hypot(*(run[1:] - run[:-1]).T)
+    if (r - np.sqrt(np.maximum(r * r - (chords / 2) ** 2, 0.0))).max() > tolerance:
+        return None
+    return centre, bool(cross[0] < 0)
+
+
+def compress(points, tolerance, axes='XY', angular_tolerance=None, arcs=True):
+    """
+    Compress a polyline into moves.
+
+    Returns a list of ('G1', point) and ('G2' or 'G3', point, (I, J)) moves
+    leading from points[0] (not repeated) to points[-1].
+    """
+    points = np.asarray(points, dtype=float)
+    # Zero length segments have no direction
+    points = points[np.r_[True, np.any(points[1:] != points[:-1], axis=1)]]
+    n = len(points)
+    arcs = arcs and 'X' in axes and 'Y' in axes and tolerance > 0
+    if arcs:
+        xy = points[:, [axes.index('X'), axes.index('Y')]]
+        others = [k for k, a in enumerate(axes) if a not in 'XY']
+    moves = []
+    pending = [0]  # Polyline waiting for Douglas-Peucker, as indices
+
+    def flush():
+        if len(pending) > 1:
+            kept = simplify(points[pending], tolerance, axes, angular_tolerance)
+            moves.extend(('G1', points[pending[k]]) for k in kept[1:])
+        del pending[1:]
+
+    i = 0
+    while i < n - 1:
+        best = None
+        if arcs:
+            last = i + ARC_MIN_POINTS - 1
+            limit = min(n - 1, i + ARC_MAX_POINTS)
+            while last <= limit:
+                if others and np.abs(points[i:last + 1, others] - points[i, others]).max() > 0:
+                    break
+                fit = _fits_arc(xy, i, last, tolerance)
+                if fit is None:
+                    break
+                best = (last, fit)
+                last += 1
+        if best is None:
+            i += 1
+            pending.append(i)
+            continue
+        last, (centre, clockwise) = best
+        flush()
+        moves.append(('G2' if clockwise else 'G3', points[last], tuple(centre - xy[i])))
+        i = last
+        pending[0] = i
+    flush()
+    return moves
+
+
+def to_gcode(moves, axes='XY', feed=None, decimals=3):
+    """G-code blocks of moves, F on the first block only."""
+    fmt = '{}{:0.%df}' % decimals
+    blocks = []
+    for move in moves:
+        block = move[0] + ''.join(fmt.format(a, v) for a, v in zip(axes, move[1]))
+        if len(move) > 2:
+            block += fmt.format('I', move[2][0]) + fmt.format('J', move[2][1])
+        if feed is not None and not blocks:
+            block += 'F{:0.2f}'.format(feed)
+        blocks.append(block)
+    return blocks
+
+
+def compress_gcode(blocks, tolerance, angular_tolerance=None, arcs=True, decimals=3):
+    """
+    Compress the runs of G1 blocks of a G-code program.
+
+    A run is a sequence of G90 G94 G1 blocks made only of axis words, all
+    giving the same axes, with an unchanged F. Any other block ends the run
+    and is copied as is. Arcs are only fitted in the G17 plane and G1 is
+    restored after a run ending with an arc.
+    """
+    out = []
+    state = {'motion': None, 'absolute': True, 'plane': 17, 'inverse': False, 'feed': None}
+    position = {}
+    run = []            # Axis words of the blocks of the current run
+    run_lines = []
+    run_start = {}
+    run_feed = None     # F given on the first block of the run
+    run_plane = 17
+
+    def end_run():
+        if len(run) < 3:
+            out.extend(run_lines)
+        else:
+            axes = ''.join(a for a in 'XYZABC' if a in run[0])
+            points = np.array([[run_start[a] for a in axes]] + [[words[a] for a in axes] for words in run])
+            moves = compress(points, tolerance, axes, angular_tolerance, arcs and run_plane == 17)
+            out.extend(to_gcode(moves, axes, run_feed, decimals))
+            if moves[-1][0] != 'G1':
+                out.append('G1')
+        del run[:]
+        del run_lines[:]
+
+    for line in blocks:
+        code = re.sub(r'\([^)]*\)|;.*|\s', '', line).upper()
+        words = GCODE_WORD.findall(code)
+        if GCODE_WORD.sub('', code) != '':
+            # System command or unknown syntax: nothing is known after it
+            end_run()
+            out.append(line)
+            position.clear()
+            continue
+        unknown = False
+        for letter, value in words:
+            g = float(value)
+            if letter != 'G':
+                continue
+            if g in MOTION_CODES:
+                state['motion'] = g
+            elif g in (90, 91):
+                state['absolute'] = g == 90
+            elif g in (17, 18, 19):
+                state['plane'] = g
+            elif g in (93, 94):
+                state['inverse'] = g == 93
+            elif int(g) in (10, 28, 30, 53, 54, 55, 56, 57, 58, 59, 92):
+                # Position changed or known only in another frame
+                unknown = True
+        axis_words = {a: float(v) for a, v in words if a in 'XYZABC'}
+        if axis_words and state['motion'] not in (0, 1, 2, 3):
+            # Probing stops anywhere on the way, axis words after G80 are an error for Grbl
+            unknown = True
+        feed = [float(v) for a, v in words if a == 'F']
+        candidate = (axis_words and state['motion'] == 1 and state['absolute'] and not state['inverse']
+                     and all(a in 'GXYZABCF' for a, v in words)
+                     and all(float(v) == 1 for a, v in words if a == 'G')
+                     and all(a in position for a in axis_words))
+        if run and not (candidate and set(axis_words) == set(run[0])
+                        and (not feed or feed[0] == state['feed'])):
+            end_run()
+        if candidate:
+            if not run:
+                run_start = dict(position)
+                run_feed = feed[0] if feed else None
+                run_plane = state['plane']
+            run.append(axis_words)
+            run_lines.append(line)
+        else:
+            out.append(line)
+        if feed:
+            state['feed'] = feed[0]
+        for a, v in axis_words.items():
+            position[a] = v if state['absolute'] else position[a] + v if a in position else None
+        position = {a: v for a, v in position.items() if v is not None and not unknown}
+    end_run()
+    return out
@@ -0,0 +1,114 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Toolpath preview: the moves of a G-code program as RViz line lists.
+
+The job time estimator (gcodeEstimate) already turns a program into the
+positions of every planner block. A LINE_LIST marker draws each segment with
+its two end points, so a multi-million block program is far too heavy for
+RViz. ``decimate`` merges consecutive vertices falling in the same cell of a
+grid whose cell size doubles until the point budget is met: the outline of
+the part is kept at a resolution set by the budget, dense regions lose their
+detail first, and rapid moves stay apart from feed moves.
+
+Building a ``geometry_msgs/Point`` object per vertex costs more than the whole
+decimation, so ``pack_points`` writes the vertices straight into the CDR
+serialization of a marker holding a single sentinel point instead.
+"""
+
+import struct
+
+import numpy as np
+
+# Placeholder point of the serialized marker template, replaced by pack_points()
+SENTINEL = (1.5e300, -2.5e-300, 3.5e299)
+CDR_LITTLE_ENDIAN = 1    # Second byte of the CDR encapsulation header
+
+
+def decimate(points, rapid, max_points):
+    """
+    Simplify a polyline so that its line list holds at most max_points points.
+
+    points: (n + 1, k) vertices, segment i going from points[i] to points[i + 1].
+    rapid: (n,) booleans, True for the G0 segments.
+    Return the kept vertices and the rapid flag of the segments between them.
+    """
+    points = np.asarray(points, dtype=float)
+    rapid = np.asarray(rapid, dtype=bool)
+    if 2 * len(rapid) <= max_points or len(points) < 2:
+        return points, rapid
+    # The ends and every switch between rapid and feed moves are always kept
+    forced = np.zeros(len(points), dtype=bool)
+    forced[[0, -1]] = True
+    forced[1:-1] = rapid[1:] != rapid[:-1]
+    # Column by column: reductions along the short axis of an (n, k) array are slow
+    columns = [np.ascontiguousarray(points[:, k]) for k in range(points.shape[1])]
+    origins = [c.min() for c in columns]
+    span = max(c.max() - o for c, o in zip(columns, origins))
+    cell = span / max_points if span > 0 else 1.0
+    # Doubling the cell size is a right shift of the cell indices of the finest grid:
+    # bisection on the shift for the finest grid within the budget
+    cells = [np.floor((c - o) / cell).astype(np.int64) for c, o in zip(columns, origins)]
+
+    def kept_vertices(shift):
+        keep = forced.copy()
+        for c in cells:
+            shifted = c >> shift
+            keep[1:] |= shifted[1:] != shifted[:-1]
+        return np.flatnonzero(keep)
+
+    low, high = 0, max(int(c.max()) for c in cells).bit_length()
+    kept = kept_vertices(high)
+    while low < high:
+        middle = (low + high) // 2
+        candidate = kept_vertices(middle)
+        if 2 * (len(candidate) - 1) <= max_points:
+            high, kept = middle, candidate
+        else:
+            low = middle + 1
+    if 2 * (len(kept) - 1) > max_points:
+        # Too many switches between rapid and feed moves: evenly spaced vertices
+        kept = np.unique(np.linspace(0, len(points) - 1, max(max_points // 2, 1) + 1).astype(np.int64))
+    return points[kept], rapid[kept[1:] - 1]
+
+
+def line_list(vertices, rapid, select):
+    """End points (2 m, 3) of the m segments whose rapid flag is select, in line list order."""
+    vertices = np.asarray(vertices, dtype=float)
+    index = np.flatnonzero(np.asarray(rapid, dtype=bool) == select)
+    segments = np.empty((len(index), 2, vertices.shape[1]))
+    segments[:, 0] = vertices[index]
+    segments[:, 1] = vertices[index + 1]
+    return segments.reshape(-1, vertices.shape[1])
+
+
+def chunks(points, size):
+    """Split a line list in arrays of at most size points, never between the two ends of a segment."""
+    size = max(size - size % 2, 2)
+    return [points[i:i + size] for i in range(0, len(points), size)]
+
+
+def pack_points(serialized, points):
+    """
+    Replace the sentinel point of a serialized message by points (n, 3).
+
+    serialized is the little endian CDR serialization of a message whose
+    points sequence holds the single point SENTINEL.
+    """
+    pattern = np.array(SENTINEL, dtype='<f8').tobytes()
+    start = serialized.find(pattern)
+    if len(serialized) < 4 or serialized[1] != CDR_LITTLE_ENDIAN:
+        raise ValueError('Serialized message is not little endian CDR')
+    if start < 0 or serialized.find(pattern, start + 1) >= 0:
+        raise ValueError('Serialized message without a single sentinel point')
+    one = struct.pack('<I', 1)
+    # Sequence length, followed by padding when the first double needs 8 byte alignment
+    count = start - 4 if serialized[start - 4:start] == one else start - 8
+    if serialized[count:count + 4] != one:
+        raise ValueError('Serialized message without a single sentinel point')
+    data = np.ascontiguousarray(points, dtype='<f8').reshape(-1, 3)
+    return b''.join((serialized[:count], struct.pack('<I', len(data)), serialized[count + 4:start], data.tobytes(),
+                     serialized[start + len(pattern):]))
@@ -1,5 +1,8 @@
 
 
+from .path_compression import compress_gcode
+
+
 class RectangleZigzagPath:
 
     def __init__(self, tool_diameter=1.0, stepover_percentage=1.0, scan_speed=1000.0):
@@ -7,7 +10,7 @@ class RectangleZigzagPath:
         self.stepoverPercentage = stepover_percentage
         self.scanSpeed = scan_speed
 
-    def make(self, X_start=0.0, Y_start=0.0, width=10., height=10., fill_type='Raster'):
+    def make(self, X_start=0.0, Y_start=0.0, width=10., height=10., fill_type='Raster', tolerance=0.0):
 
         # GCode Blocks
         blocks = []
@@ -128,6 +131,10 @@ class RectangleZigzagPath:
                 blocks.append(gcode)
             lastxy = (x,y)
 
+        # Merge collinear blocks
+        if tolerance > 0:
+            blocks = compress_gcode(blocks, tolerance)
+
         return blocks
 
     #----------------------------------------------------------------------
@@ -24,6 +24,7 @@ setup(
     install_requires=['setuptools',
                       'PyQt5',
                       'pyserial',
+                      'numpy',
                       'LabJackPython',
                       ],
     zip_safe=True,
@@ -35,6 +36,8 @@ setup(
     entry_points={
         'console_scripts': [
             'grbl_gui = grbl_ros2_gui.grbl_gui:main',
+            'grbl_simulator = grbl_ros2_gui.grblSimulator:main',
+            'grbl_capture_dump = grbl_ros2_gui.grblRecorder:main',
             'labjack_stream_device = labjack.stream_analog_read:main',
             'labjack_range_data_publisher = labjack.publish_range_data:main',
             'labjack_point_publisher = labjack.publish_point:main',
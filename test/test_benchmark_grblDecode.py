@@ -0,0 +1,125 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of the status report decoding (grblDecode.decodeGrblStatus).
+
+Compares the former exec() based Pn: LED update with the pin dispatch table,
+and measures the full decode + render cost of one status line.
+"""
+
+import time
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.grblDecode import grblDecode  # noqa: E402
+from grbl_ros2_gui.grblMetrics import grblMetrics  # noqa: E402
+from grbl_ros2_gui.grblStatus import grblStatus  # noqa: E402
+
+N = 20000
+
+STATUS_LINES = [
+    '<Run|MPos:10.000,20.000,-3.000,0.000,90.000|Bf:15,128|FS:500,8000|Pn:XZ|Ov:100,100,100>',
+    '<Run|MPos:10.010,20.000,-3.000,0.000,90.000|Bf:14,120|FS:500,8000|Ov:100,100,100>',
+    '<Run|MPos:10.020,20.000,-3.000,0.000,90.000|Bf:14,120|FS:500,8000|Pn:P>',
+    '<Run|MPos:10.030,20.000,-3.000,0.000,90.000|Bf:15,128|FS:500,8000|WCO:0.000,0.000,0.000,0.000,0.000>',
+]
+
+
+class StubWidget:
+    """Accepts any widget call, counts LED updates."""
+
+    def __init__(self):
+        self.ledCalls = 0
+
+    def setLedStatus(self, value):
+        self.ledCalls += 1
+
+    def text(self):
+        return '100%'
+
+    def isChecked(self):
+        return False
+
+    def getButtonStatus(self):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class StubUi:
+
+    def __init__(self):
+        self.widgets = {}
+
+    def __getattr__(self, name):
+        return self.widgets.setdefault(name, StubWidget())
+
+    def ledCalls(self):
+        return sum(w.ledCalls for w in self.widgets.values())
+
+
+def legacyPinUpdate(ui, grblOutput):
+    """Pn: handling as it was done before the dispatch table."""
+    flagPn = False
+    for D in grblOutput[1:-1].split('|'):
+        if D[:3] == 'Pn:':
+            flagPn = True
+            triggered = D[3:]
+            for L in ['X', 'Y', 'Z', 'A', 'B', 'C', 'P', 'D', 'H', 'R', 'S']:
+                if L in triggered:
+                    exec('ui.cnLed' + L + '.setLedStatus(True)')
+                else:
+                    exec('ui.cnLed' + L + '.setLedStatus(False)')
+    if not flagPn:
+        for L in ['X', 'Y', 'Z', 'A', 'B', 'C', 'P', 'D', 'H', 'R', 'S']:
+            exec('ui.cnLed' + L + '.setLedStatus(False)')
+
+
+@pytest.fixture
+def decoder():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    ui = StubUi()
+    grbl = StubWidget()
+    grbl.grblVersion = lambda: 'Grbl 1.1f'
+    metrics = grblMetrics()
+    grbl.metrics = lambda: metrics
+    yield grblDecode(ui, None, grbl), ui
+    del app
+
+
+@pytest.mark.benchmark
+def test_pin_update_exec_vs_table(decoder):
+    decode, ui = decoder
+    legacyUi = StubUi()
+    t0 = time.perf_counter()
+    for i in range(N):
+        legacyPinUpdate(legacyUi, STATUS_LINES[i % len(STATUS_LINES)])
+    t1 = time.perf_counter()
+    for i in range(N):
+        decode.decodeGrblStatus(grblStatus.parse(STATUS_LINES[i % len(STATUS_LINES)]))
+        decode.on_refreshTimer()
+    t2 = time.perf_counter()
+    print('\nexec() Pn: update: {:0.1f} us/line, {} LED calls'.format((t1 - t0) / N * 1e6, legacyUi.ledCalls()))
+    print('decode + render with pin table: {:0.1f} us/line, {} LED calls'.format((t2 - t1) / N * 1e6, ui.ledCalls()))
+    # Edge only updates: far fewer LED calls than 11 per status line
+    assert ui.ledCalls() < legacyUi.ledCalls() / 2
+    # Decoding and rendering a whole line now costs less than the former LED update alone
+    assert t2 - t1 < t1 - t0
+
+
+@pytest.mark.benchmark
+def test_decode_only_cost(decoder):
+    """Parse and decode without rendering: the cost paid for every status report."""
+    decode, ui = decoder
+    t0 = time.perf_counter()
+    for i in range(N):
+        decode.decodeGrblStatus(grblStatus.parse(STATUS_LINES[i % len(STATUS_LINES)]))
+    t1 = time.perf_counter()
+    print('\nparse + decodeGrblStatus: {:0.1f} us/line'.format((t1 - t0) / N * 1e6))
+    assert decode.get_etatMachine() == 'Run'
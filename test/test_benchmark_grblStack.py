@@ -0,0 +1,69 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmarks of the serial queue (grblStack).
+
+Enqueuing a large file must stay linear: each push and pop is O(1)
+whatever the number of queued commands.
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from grbl_ros2_gui.grblComStack import grblStack  # noqa: E402
+
+N = 10 ** 6
+
+
+@pytest.mark.benchmark
+def test_fifo_push_pop_1M():
+    stack = grblStack()
+    t0 = time.perf_counter()
+    for i in range(N):
+        stack.addFiFo('G1X{}'.format(i & 0xFF))
+    t1 = time.perf_counter()
+    while not stack.isEmpty():
+        stack.pop()
+    t2 = time.perf_counter()
+    print('\n{} addFiFo: {:0.3f} s ({:0.0f} ns/item), {} pop: {:0.3f} s ({:0.0f} ns/item)'.format(
+        N, t1 - t0, (t1 - t0) / N * 1e9, N, t2 - t1, (t2 - t1) / N * 1e9))
+    # A list based queue (pop(0)) needs minutes for the same work.
+    assert t2 - t1 < 10
+
+
+@pytest.mark.benchmark
+def test_lifo_insert_1M():
+    stack = grblStack()
+    t0 = time.perf_counter()
+    for i in range(N):
+        stack.addLiFo('$G')
+    t1 = time.perf_counter()
+    print('\n{} addLiFo: {:0.3f} s ({:0.0f} ns/item)'.format(N, t1 - t0, (t1 - t0) / N * 1e9))
+    assert stack.count() == N
+
+
+def test_concurrent_producer_consumer():
+    """FIFO order is kept between a producer (GUI) and a consumer (serial) thread."""
+    stack = grblStack()
+    count = 100000
+    received = []
+
+    def consumer():
+        while len(received) < count:
+            item = stack.pop()
+            if item is not None:
+                received.append(item[0])
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    for i in range(count):
+        stack.addFiFo(i)
+    thread.join(30)
+    assert received == list(range(count))
@@ -0,0 +1,100 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Status report parser (grblStatus) checked and benchmarked on a corpus of Grbl output.
+
+The legacy benchmark reproduces the former behaviour, where each report was
+split three times (grblComSerial, grblCom and grblDecode).
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+pytest.importorskip('PyQt5')
+
+from grbl_ros2_gui.cn5X_config import GRBL_PIN_BITS  # noqa: E402
+from grbl_ros2_gui.grblStatus import GRBL_VALID_STATUS, grblStatus  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'grbl_status_corpus.txt')
+
+with open(CORPUS_PATH) as f:
+    CORPUS = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def legacyParse(grblOutput):
+    """Status parsing as it was spread across grblComSerial, grblCom and grblDecode."""
+    etat = grblOutput[1:].split('|')[0]  # grblComSerial.__traileLaLigne
+    etat = grblOutput[1:].split('|')[0]  # grblCom.on_sig_status
+    pos = wco = bf = ov = None
+    pn = ''
+    for D in grblOutput[1:-1].split('|'):  # grblDecode.decodeGrblStatus
+        if D[:5] == 'MPos:' or D[:5] == 'WPos:':
+            tblPos = D[5:].split(',')
+            pos = [float(tblPos[i]) for i in range(len(tblPos))]
+            tblPos = D[5:].split(',')
+            pos = ['{:+0.3f}'.format(float(v)) for v in tblPos]
+        elif D[:4] == 'WCO:':
+            wco = [float(v) for v in D[4:].split(',')]
+        elif D[:3] == 'Bf:':
+            tblValue = D[3:].split(',')
+            bf = (int(tblValue[0]), int(tblValue[1]))
+        elif D[:3] == 'Ov:':
+            ov = D.split(':')[1].split(',')
+            ov = (int(ov[0]), int(ov[2]))
+        elif D[:3] == 'Pn:':
+            pn = D[3:]
+    return etat, pos, wco, bf, ov, pn
+
+
+def parseCorpus():
+    return [grblStatus.parse(line) for line in CORPUS]
+
+
+def test_corpus_parses():
+    assert len(CORPUS) > 100
+    for line, status in zip(CORPUS, parseCorpus()):
+        assert status is not None, line
+        assert status.raw == line
+        assert status.etat in GRBL_VALID_STATUS, line
+        assert (status.mpos is None) != (status.wpos is None), line
+        assert len(status.mpos or status.wpos) == 5
+        assert status.bf is not None and len(status.bf) == 2
+
+
+def test_fields():
+    status = grblStatus.parse('<Run|MPos:1.000,-2.500,3.000,90.000,0.000|Bf:3,64|Ln:150|FS:800,12000|Pn:PXH|Ov:120,50,80|A:SF>')
+    assert status.etat == 'Run'
+    assert status.mpos == (1.0, -2.5, 3.0, 90.0, 0.0)
+    assert status.wpos is None
+    assert status.bf == (3, 64)
+    assert status.ln == 150
+    assert status.fs == (800.0, 12000.0)
+    assert status.ov == (120, 50, 80)
+    assert status.pn == GRBL_PIN_BITS['P'] | GRBL_PIN_BITS['X'] | GRBL_PIN_BITS['H']
+    status = grblStatus.parse('<Door:1|WPos:0.000,0.000,0.000|F:600>')
+    assert status.etat == 'Door:1'
+    assert status.wpos == (0.0, 0.0, 0.0)
+    assert status.fs == (600.0,)
+    assert status.pn == 0 and status.ln is None and status.wco is None
+
+
+def test_incorrect_status():
+    assert grblStatus.parse('ok') is None
+    assert grblStatus.parse('<Idle|MPos:1.0,abc,3.0>') is None
+
+
+@pytest.mark.benchmark(group='status-parse')
+def test_benchmark_parse(benchmark):
+    result = benchmark(parseCorpus)
+    assert len(result) == len(CORPUS)
+
+
+@pytest.mark.benchmark(group='status-parse')
+def test_benchmark_legacy_parse(benchmark):
+    result = benchmark(lambda: [legacyParse(line) for line in CORPUS])
+    assert len(result) == len(CORPUS)
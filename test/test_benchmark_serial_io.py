@@ -0,0 +1,113 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of the grblComSerial I/O engine against a pseudo-terminal stand-in for Grbl.
+
+Measures the CPU used by a connected but idle communication thread and the
+wake-up latency between a realtime command push and its arrival on the wire.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.cn5X_config import REAL_TIME_FEED_HOLD, REAL_TIME_CYCLE_START_RESUME, REAL_TIME_SOFT_RESET  # noqa: E402
+from grbl_ros2_gui.grblComSerial import grblComSerial  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+
+REALTIME_COMMANDS = [REAL_TIME_FEED_HOLD, REAL_TIME_CYCLE_START_RESUME, REAL_TIME_SOFT_RESET]
+
+
+class PtyGrbl(threading.Thread):
+    """Minimal Grbl stand-in: banner, ok for each line, timestamps realtime bytes."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        import tty
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.realtime = []
+
+    def run(self):
+        buff = b''
+        while True:
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            now = time.perf_counter()
+            for c in data:
+                if bytes([c]) in (b'?', b'!', b'~', b'\x18') or c >= 0x80:
+                    self.realtime.append((bytes([c]), now))
+                else:
+                    buff += bytes([c])
+            while b'\n' in buff:
+                line, buff = buff.split(b'\n', 1)
+                line = line.strip()
+                if line == b'':
+                    os.write(self.master, b"Grbl 1.1f ['$' for help]\r\n")
+                else:
+                    os.write(self.master, b'ok\r\n')
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+@pytest.fixture
+def connected_worker():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])  # noqa: F841
+    grbl = PtyGrbl()
+    grbl.start()
+    worker = grblComSerial(None, grbl.port, 115200, False)
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    time.sleep(0.5)  # Banner and $I exchange
+    yield worker, grbl
+    worker.abort()
+    thread.join(5)
+    grbl.close()
+
+
+@pytest.mark.benchmark
+def test_idle_cpu(connected_worker):
+    """A connected, non polling, idle worker must not burn CPU."""
+    period = 2.0
+    cpu0 = time.process_time()
+    time.sleep(period)
+    cpu = (time.process_time() - cpu0) / period
+    print('\nidle CPU: {:0.2f} %'.format(cpu * 100))
+    assert cpu < 0.05
+
+
+@pytest.mark.benchmark
+def test_realtime_wakeup_latency(connected_worker):
+    """Time from realTimePush() to the byte being readable by Grbl."""
+    worker, grbl = connected_worker
+    latencies = []
+    for i in range(200):
+        cmd = REALTIME_COMMANDS[i % len(REALTIME_COMMANDS)]
+        count = len(grbl.realtime)
+        t0 = time.perf_counter()
+        worker.realTimePush(cmd)
+        while len(grbl.realtime) == count:
+            time.sleep(0.0001)
+        latencies.append(grbl.realtime[-1][1] - t0)
+        time.sleep(0.005)
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print('\nrealtime latency: mean = {:0.3f} ms, p99 = {:0.3f} ms, max = {:0.3f} ms'.format(
+        mean * 1000, p99 * 1000, latencies[-1] * 1000))
+    assert p99 < 0.010
@@ -0,0 +1,255 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+End-to-end streaming benchmarks: grblCom / grblComSerial against the Grbl simulator.
+
+Each case streams a G-code file (Plaque01.ngc, scaled up by repetition) from a
+gcodeListModel through grblCom.gcodeSource(), as the GUI does, to a
+grblSimulator running in a separate process with instant motion, over a
+pseudo-terminal (serial transport) and over TCP (socket:// transport). It reports
+lines/s, bytes/s, the delay between an ok and the send of the line waiting for
+it (mean, p99), GUI thread blocking and CPU time per streamed line.
+
+The runs take tens of seconds: under pytest they only run with
+GRBL_BENCH_STREAMING=1, the multi-million-line case also needs
+GRBL_BENCH_LARGE=1. Results are written as JSON to $GRBL_BENCH_OUTPUT, when
+set, so that runs can be compared between commits.
+
+Standalone: python3 test/test_benchmark_streaming.py [--lines N [N ...]] [--transports pty tcp] [--output FILE]
+(--output defaults to $GRBL_BENCH_OUTPUT, no JSON report without either)
+"""
+
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.cn5X_config import COM_FLAG_NO_FLAG, COM_STREAMING_MODES  # noqa: E402
+from grbl_ros2_gui.cn5X_gcodeModel import gcodeListModel  # noqa: E402
+from grbl_ros2_gui.grblCom import grblCom  # noqa: E402
+
+pytestmark = [
+    pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty'),
+    pytest.mark.skipif(os.environ.get('GRBL_BENCH_STREAMING') != '1',
+                       reason='set GRBL_BENCH_STREAMING=1 for the end-to-end streaming runs'),
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAQUE = os.path.join(ROOT, 'grbl_ros2_gui', 'Plaque01.ngc')
+OUTPUT = os.environ.get('GRBL_BENCH_OUTPUT')     # JSON report, none when not set
+
+SMALL = 0           # Plaque01.ngc as is
+MEDIUM = 20000
+LARGE = 2000000
+HEARTBEAT = 5       # ms, GUI thread heartbeat period
+TIMEOUT = 3600      # s, per stream
+
+
+class Simulator:
+    """grblSimulator in its own process so that its CPU time is not counted."""
+
+    def __init__(self, transport='pty'):
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+        options = ['--tcp', '0'] if transport == 'tcp' else []
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'grbl_ros2_gui.grblSimulator', '--time-scale', '0'] + options,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, env=env, cwd=ROOT)
+        self.port = self.process.stdout.readline().split()[-1]
+        self.stats = ''
+
+    def stop(self):
+        self.process.send_signal(signal.SIGINT)
+        self.stats = self.process.communicate(timeout=10)[0]
+
+    def rxOverflow(self):
+        return int(self.stats.split('RX overflow = ')[1].split()[0])
+
+
+def scaledFile(directory, nbLines):
+    """Plaque01.ngc repeated up to nbLines lines (as is for SMALL)."""
+    with open(PLAQUE) as f:
+        lines = f.read().splitlines()
+    if nbLines == SMALL:
+        return PLAQUE
+    path = os.path.join(directory, 'plaque_{}.ngc'.format(nbLines))
+    with open(path, 'w') as f:
+        for i in range(nbLines):
+            f.write(lines[i % len(lines)] + '\n')
+    return path
+
+
+def waitFor(app, condition, timeout):
+    t0 = time.time()
+    while not condition():
+        if time.time() - t0 > timeout:
+            raise TimeoutError()
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def stream(app, com, path, mode, transport='pty'):
+    """Stream path to a fresh simulator and return the measures of the run."""
+    sim = Simulator(transport)
+    com.setStreamingMode(COM_STREAMING_MODES[mode])
+    errors = []
+    stats = []
+    emitted = []
+    loop = QtCore.QEventLoop()
+    slots = [
+        (com.sig_error, errors.append),
+        (com.sig_streamStats, stats.append),
+        (com.sig_streamStats, lambda s: loop.quit()),
+        # Light GUI side consumers, as the main window has
+        (com.sig_emit, lambda line, row: emitted.append(row)),
+        (com.sig_status, lambda status: None),
+    ]
+    for signal_, slot in slots:
+        signal_.connect(slot)
+    try:
+        com.startCom(sim.port, 115200)
+        waitFor(app, lambda: com.isOpen() and com.grblInitStatus(), 10)
+        time.sleep(0.2)  # $I exchange
+        app.processEvents()
+
+        model = gcodeListModel()
+        loaded = []
+        model.sig_loaded.connect(loaded.append)
+        model.openFile(path)
+        waitFor(app, lambda: loaded, 60)
+
+        beats = []
+        heartbeat = QtCore.QTimer()
+        heartbeat.timeout.connect(lambda: beats.append(time.perf_counter()))
+        heartbeat.start(HEARTBEAT)
+        QtCore.QTimer.singleShot(TIMEOUT * 1000, loop.quit)
+
+        cpu0 = time.process_time()
+        com.gcodeSource((line, COM_FLAG_NO_FLAG, row) for row, line in enumerate(model.lines()) if line != '')
+        loop.exec_()
+        cpu = time.process_time() - cpu0
+        heartbeat.stop()
+        model.clear()
+    finally:
+        if com.isOpen():
+            com.stopCom()
+        sim.stop()
+        for signal_, slot in slots:
+            signal_.disconnect(slot)
+
+    assert stats, 'stream not finished'
+    result = dict(stats[0])
+    gaps = sorted(max(0.0, b - a - HEARTBEAT / 1000) for a, b in zip(beats, beats[1:]))
+    result.update({
+        'file': os.path.basename(path),
+        'transport': transport,
+        'fileLines': loaded[0],
+        'guiBlockMax': gaps[-1] if gaps else 0.0,
+        'guiBlockP99': gaps[int(len(gaps) * 0.99)] if gaps else 0.0,
+        'cpuPerLine': cpu / result['lines'],
+        'errors': len(errors),
+        'signalsEmitted': len(emitted),
+        'rxOverflow': sim.rxOverflow(),
+    })
+    return result
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, universal_newlines=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def writeResults(results, output):
+    report = {
+        'commit': gitCommit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def printResult(r):
+    print('\n{file} ({fileLines} lines, {mode}, {transport}): {linesPerSecond:0.0f} lines/s, {bytesPerSecond:0.0f} bytes/s, '
+          'ok -> send mean {m:0.3f} ms p99 {p:0.3f} ms, GUI block max {g:0.1f} ms, CPU {c:0.1f} us/line'.format(
+              m=r['ackLatencyMean'] * 1000, p=r['ackLatencyP99'] * 1000, g=r['guiBlockMax'] * 1000,
+              c=r['cpuPerLine'] * 1e6, **r))
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    # As in the GUI, one grblCom for the whole session, reconnected for each run
+    com = grblCom()
+    results = []
+    yield app, com, results
+    if results and OUTPUT:
+        writeResults(results, OUTPUT)
+
+
+SIZES = [SMALL, MEDIUM, pytest.param(LARGE, marks=pytest.mark.skipif(
+    os.environ.get('GRBL_BENCH_LARGE') != '1', reason='set GRBL_BENCH_LARGE=1 for the multi-million-line run'))]
+
+
+TRANSPORTS = ['pty', 'tcp']
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('transport', TRANSPORTS)
+@pytest.mark.parametrize('mode', list(COM_STREAMING_MODES.keys()))
+@pytest.mark.parametrize('nbLines', SIZES)
+def test_streaming(app, tmp_path, nbLines, mode, transport):
+    qapp, com, results = app
+    path = scaledFile(str(tmp_path), nbLines)
+    r = stream(qapp, com, path, mode, transport)
+    results.append(r)
+    printResult(r)
+    assert r['errors'] == 0
+    assert r['rxOverflow'] == 0
+    assert r['signalsEmitted'] == r['lines']
+    with open(path) as f:
+        assert r['lines'] == sum(1 for line in f if line.strip() != '')
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='grblCom streaming benchmark against the Grbl simulator')
+    parser.add_argument('--lines', type=int, nargs='+', default=[SMALL, MEDIUM],
+                        help='file sizes in lines, 0 for Plaque01.ngc as is (default: 0 {})'.format(MEDIUM))
+    parser.add_argument('--modes', nargs='+', default=list(COM_STREAMING_MODES.keys()), choices=list(COM_STREAMING_MODES.keys()))
+    parser.add_argument('--transports', nargs='+', default=TRANSPORTS, choices=TRANSPORTS)
+    parser.add_argument('--output', default=OUTPUT, help='JSON report (default: $GRBL_BENCH_OUTPUT, none if not set)')
+    args = parser.parse_args()
+    import tempfile
+    qapp = QtCore.QCoreApplication([])
+    com = grblCom()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for nbLines in args.lines:
+            path = scaledFile(directory, nbLines)
+            for mode in args.modes:
+                for transport in args.transports:
+                    results.append(stream(qapp, com, path, mode, transport))
+                    printResult(results[-1])
+    if args.output:
+        writeResults(results, args.output)
+        print('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Offline G-code checker (gcodeCheck): Grbl error codes, soft limits, agreement
+with the Grbl simulator in check mode ($C), and checking speed.
+"""
+
+import random
+import sys
+import time
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.gcodeCheck import gcodeChecker, gcodeCheckThread  # noqa: E402
+
+TEMPLATES = [
+    'G0 X{x} Y{y}', 'G1 X{x} F{f}', 'X{x} Y{y} Z{z}', 'G1 X{x} Y{y} Z{z} F{f}', 'G2 X{x} Y{y} I{i} J{j} F{f}',
+    'G3 X{x} Y{y} R{r}', 'G2 X{x} I{i}', 'G91', 'G90', 'G20', 'G21', 'G93 G1 X{x} F{f}', 'G94', 'G1 X{x}',
+    'G41 X{x}', 'G0 G1 X{x}', 'X{x} X{x}', 'G80 X{x}', 'G80', 'F-{f}', 'G4', 'G4 P0.1', 'G10 L2 P1 X{x}',
+    'G10 L20 P2 Y{y}', 'G55', 'G54', 'G92 X{x}', 'G92', 'G92.1', 'G28', 'G28 G91 Z{z}', 'G28.1', 'G30 X{x}',
+    'G53 G0 X{x}', 'G53 G2 X{x} I1', 'M3 M4', 'M3 S{f}', 'M5 M8', 'M9', 'T300', 'T2', 'Q1', 'G18', 'G17',
+    'G2 X{x} Z{z} I{i} K{j} F{f}', 'G38.2 Z{z} F{f}', 'G38.3', 'G1 I{i}', 'N{f} G0 X{x}', '(comment) X{x}',
+    'G1 X1.2.3', 'M2', '$H', 'G0 Y{y} ; comment', 'G17 G1 F{f}', 'G1 X{x} Y{y} F{f} S{f}',
+]
+
+
+def randomProgram(nbLines, seed):
+    rnd = random.Random(seed)
+    values = lambda: dict(x=round(rnd.uniform(-80, 80), 3), y=round(rnd.uniform(-80, 80), 3),  # noqa: E731
+                          z=round(rnd.uniform(-20, 20), 3), i=rnd.choice([0, 5, -5, 2.5]),
+                          j=rnd.choice([0, 5, -5]), r=rnd.choice([10, -10, 100, 0.1]), f=rnd.choice([100, 500]))
+    return [rnd.choice(TEMPLATES).format(**values()) for n in range(nbLines)]
+
+
+def codes(checker):
+    return {row: code for row, code, detail in checker.issues()}
+
+
+def test_error_codes():
+    program = ['G21 G90', 'G0 X-10 Y-10', 'G1 X-20 F100', 'G41 X1', 'G0 G1 X1', 'X1 X2', 'G92 G0 X1', 'G80 X1',
+               'G4', 'G10 L3 P1 X1', 'G10 L2 P7 X1', 'X1.2.3', '%', 'G38.2', 'M3 M4', 'T300', 'A5', 'F-100',
+               'G2 X-10 Y0 I5 J0', 'G3 X-5 Y-5', 'G53 G2 X1 I1', 'G1 X1 R1', 'G92', 'X' + '1' * 80, '(only) ;a']
+    checker = gcodeChecker('XYZ')
+    assert checker.check(program)
+    assert codes(checker) == {
+        3: 'error:20', 4: 'error:21', 5: 'error:25', 6: 'error:24', 7: 'error:31', 8: 'error:28', 9: 'error:20',
+        10: 'error:29', 11: 'error:2', 13: 'error:26', 14: 'error:21', 15: 'error:38', 16: 'error:20',
+        17: 'error:4', 18: 'error:33', 19: 'error:35', 20: 'error:30', 21: 'error:36', 22: 'error:26',
+        23: 'error:11'}
+    assert checker.lineCount() == len(program) and checker.issueCount() == 20
+
+
+def test_soft_limits():
+    checker = gcodeChecker('XYZ', maxTravel=[200, 100, 50], offsets={54: [-100, -50, -25]})
+    program = [
+        'G0 X10 Y10',                       # Work origin in the middle of the machine
+        'G1 X99 F500', 'X101',              # Limit at X = 100 in work coordinates
+        'G0 X0 Y0', 'G2 X0 Y0 I0 J20',      # Full circle between Y = 0 and Y = 40: inside
+        'G2 X0 Y0 I0 J30', 'G2 X0 Y0 I0 J-30',  # Only the top or the bottom of the circles is outside
+        'G90 G0 Z20', 'G91 Z10', 'G90', 'G53 G0 Z0', '$H', 'G53 G1 X1',
+    ]
+    checker.check(program)
+    assert [(row, code) for row, code, detail in checker.issues()] == [
+        (2, 'ALARM:2'), (5, 'ALARM:2'), (6, 'ALARM:2'), (8, 'ALARM:2'), (12, 'ALARM:2')]
+    assert checker.issues()[0][2] == 'X1.000 [-200.000, 0]'
+    # Unknown start position: nothing is checked on an axis before an absolute move sets it
+    checker = gcodeChecker('XYZ', maxTravel=[200, 100, 50])
+    checker.check(['G91 G1 X1000 F100', 'G90 X1', 'G91 X-2'])
+    assert [row for row, code, detail in checker.issues()] == [1]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+def test_same_errors_as_simulator():
+    serial = pytest.importorskip('serial')
+    from grbl_ros2_gui.grblSimulator import grblSimulator
+
+    program = randomProgram(600, seed=5)
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0)
+    port = serial.Serial(sim.start(), 115200, timeout=2)
+    try:
+        port.write(b'\n')
+        while not port.readline().startswith(b'Grbl'):
+            pass
+        port.write(b'$C\n')
+        while port.readline().strip() != b'[MSG:Enabled]':
+            pass
+        assert port.readline().strip() == b'ok'
+        expected = {}
+        for row, line in enumerate(program):
+            if line == '$H':
+                continue
+            port.write(line.encode() + b'\n')
+            reply = port.readline().decode().strip()
+            while reply.startswith('['):
+                reply = port.readline().decode().strip()
+            if reply != 'ok':
+                expected[row] = reply
+    finally:
+        port.close()
+        sim.stop()
+    checker = gcodeChecker('XYZ', mpos=[0, 0, 0])
+    checker.check(line for line in program if line != '$H')
+    rows = [row for row, line in enumerate(program) if line != '$H']
+    assert {rows[row]: code for row, code in codes(checker).items()} == expected
+    assert len(set(expected.values())) > 10
+
+
+def test_background_check():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    results = []
+    thread = gcodeCheckThread(randomProgram(20000, seed=1), gcodeChecker('XYZ'))
+    thread.sig_finished.connect(results.append)
+    thread.start()
+    t0 = time.time()
+    while not results and time.time() - t0 < 30:
+        app.processEvents()
+        time.sleep(0.001)
+    thread.wait()
+    assert results[0].lineCount() == 20000 and results[0].issueCount() > 0
+    # An aborted check reports nothing
+    assert not gcodeChecker('XYZ').check(iter(randomProgram(100, seed=2)), lambda: True)
+
+
+@pytest.mark.benchmark
+def test_check_speed():
+    rnd = random.Random(1)
+    program = ['G1 X{:.4f} Y{:.4f} Z{:.4f} F{}'.format(rnd.uniform(-100, 0), rnd.uniform(-100, 0), rnd.uniform(-10, 0), 500)
+               if n % 4 == 0 else 'X{:.4f} Y{:.4f}'.format(rnd.uniform(-100, 0), rnd.uniform(-100, 0))
+               for n in range(200000)]
+    checker = gcodeChecker('XYZ', maxTravel=[200, 200, 100], mpos=[0, 0, 0])
+    t0 = time.perf_counter()
+    checker.check(program)
+    duree = time.perf_counter() - t0
+    print('\ngcodeChecker: {} lines in {:0.3f} s, {:0.0f} lines/s'.format(len(program), duree, len(program) / duree))
+    assert checker.issueCount() == 0
+    # Much faster than $C check mode, bounded by the serial round trip of every line
+    assert len(program) / duree > 20000
@@ -0,0 +1,123 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Columnar G-code parse (gcodeColumns): one regex over the whole file, NumPy
+columns per word, the hidden cache next to the file, and job time estimates
+from the columns matching the estimates from the text lines.
+"""
+
+import os
+import random
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+np = pytest.importorskip('numpy')
+
+from grbl_ros2_gui import gcodeEstimate  # noqa: E402
+from grbl_ros2_gui.gcodeColumns import MOTION_COMPLEX, MOTION_NONE, gcodeColumns  # noqa: E402
+from grbl_ros2_gui.gcodeEstimate import gcodeEstimator  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAQUE = os.path.join(ROOT, 'grbl_ros2_gui', 'Plaque01.ngc')
+TEMPLATES = ['G0 X{x} Y{y}', 'G1 X{x} F{f}', 'G91', 'G90', 'G20', 'G21', 'G1 X{x}', 'Z{x} (comment)', 'N10 X{x}',
+             'G0', 'F{f}', 'A{x}', 'X{x} S100', 'G2 X{x} Y{y} R20', 'G93 G1 X{x} F2', 'G94', 'G4 P0.2', '$H']
+
+
+def writeProgram(path, lines):
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def randomProgram(nbLines, seed):
+    rnd = random.Random(seed)
+    lines = []
+    for n in range(nbLines):
+        template = rnd.choice(TEMPLATES) if rnd.random() < 0.05 else rnd.choice(['X{x} Y{y}', 'Y{y} Z{x}', 'G1 X{x}'])
+        lines.append(template.format(x=round(rnd.uniform(-50, 50), 3), y=round(rnd.uniform(-5, 5), 2),
+                                     f=rnd.choice([100, 300])))
+    return lines
+
+
+def test_tokenize():
+    data = b'G0 X1 Y-2.5\n  n5 g1 z.5 F100 (cut)\nG01 X+1 S1000 ; spindle\nY2\r\nM3 S100\n(only)\nG1 A1 X2\nG10 X1\n\nX1'
+    columns = gcodeColumns.tokenize(data.upper())
+    assert columns.lineCount() == 10
+    assert list(columns.motion) == [0, 1, 1, MOTION_NONE, MOTION_COMPLEX, MOTION_NONE, MOTION_COMPLEX,
+                                    MOTION_COMPLEX, MOTION_NONE, MOTION_NONE]
+    assert np.array_equal(columns.column('X')[[0, 2, 9]], [1, 1, 1])
+    assert columns.column('Y')[0] == -2.5 and columns.column('Y')[3] == 2 and columns.column('Z')[1] == 0.5
+    assert columns.column('F')[1] == 100 and columns.column('S')[2] == 1000
+    assert np.isnan(columns.column('X')[[1, 3, 4, 5, 8]]).all()
+    assert list(columns.complexRows()) == [4, 6, 7]
+    assert list(columns.offsets[:3]) == [0, 12, 35] and columns.offsets[-1] == len(data)
+
+
+def test_cache(tmp_path):
+    path = writeProgram(tmp_path / 'job.ngc', randomProgram(20000, seed=1))
+    cachePath = gcodeColumns.cachePath(path)
+    assert os.path.basename(cachePath) == '.job.ngc.cn5x.npz'
+    first = gcodeColumns.load(path)
+    assert not first.cached and os.path.exists(cachePath)
+    second = gcodeColumns.load(path)
+    assert second.cached
+    assert np.array_equal(first.offsets, second.offsets) and np.array_equal(first.motion, second.motion)
+    assert np.array_equal(first.values, second.values, equal_nan=True)
+    assert second.text(second.complexRows()[:3]) == first.text(first.complexRows()[:3])
+    # A modified file no longer matches its cache
+    with open(path, 'a') as f:
+        f.write('X1\n')
+    third = gcodeColumns.load(path)
+    assert not third.cached and third.lineCount() == first.lineCount() + 1
+    # Small files are not worth a cache, a broken cache is rebuilt
+    small = writeProgram(tmp_path / 'small.ngc', randomProgram(100, seed=2))
+    gcodeColumns.load(small)
+    assert not os.path.exists(gcodeColumns.cachePath(small))
+    with open(cachePath, 'wb') as f:
+        f.write(b'garbage')
+    assert not gcodeColumns.load(path).cached and gcodeColumns.load(path).cached
+
+
+@pytest.mark.parametrize('seed', [None, 1, 2, 3])
+def test_same_estimate_as_text(tmp_path, monkeypatch, seed):
+    monkeypatch.setattr(gcodeEstimate, 'GCODE_COLUMNS_MIN_RUN', 4)
+    if seed is None:
+        with open(PLAQUE) as f:
+            lines = f.read().splitlines()
+    else:
+        lines = randomProgram(5000, seed)
+    columns = gcodeColumns.load(writeProgram(tmp_path / 'job.ngc', lines), cache=False)
+    fromText = gcodeEstimator('XYZ').blocks(lines)
+    fromColumns = gcodeEstimator('XYZ').columnBlocks(columns)
+    for a, b in zip(fromText, fromColumns):
+        assert a.shape == b.shape and np.allclose(a, b)
+    estimator = gcodeEstimator('XYZ')
+    assert estimator.estimateColumns(columns) and estimator.lineCount() == len(lines)
+    mini, maxi = estimator.boundingBox()
+    assert np.allclose(mini, fromText[1].min(axis=0)) and np.allclose(maxi, fromText[1].max(axis=0))
+
+
+@pytest.mark.benchmark
+def test_cached_estimate_speed(tmp_path):
+    rnd = random.Random(1)
+    lines = ['G21 G90', 'G1 F500'] + ['X{:.4f} Y{:.4f}'.format(rnd.uniform(-100, 0), rnd.uniform(-100, 0))
+                                      if n % 1000 else 'M3 S1000 (spindle)' for n in range(200000)]
+    path = writeProgram(tmp_path / 'job.ngc', lines)
+    gcodeColumns.load(path)
+    t0 = time.perf_counter()
+    estimator = gcodeEstimator('XYZ')
+    estimator.estimateColumns(gcodeColumns.load(path))
+    cached = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    reference = gcodeEstimator('XYZ')
+    reference.estimate(lines)
+    text = time.perf_counter() - t0
+    print('\ngcodeColumns: {} lines estimated in {:0.3f} s from the cache, {:0.3f} s from the text'.format(
+        len(lines), cached, text))
+    assert estimator.totalTime() == pytest.approx(reference.totalTime())
+    assert cached < text / 3
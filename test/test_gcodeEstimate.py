@@ -0,0 +1,161 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Job time estimator (gcodeEstimate): trapezoidal profiles, junction deviation,
+planner lookahead, arcs and dwells, compared with a block by block reference
+planner, and planning speed on a million blocks.
+"""
+
+import math
+import os
+import time
+
+import pytest
+
+pytest.importorskip('PyQt5.QtCore')
+np = pytest.importorskip('numpy')
+
+from grbl_ros2_gui.gcodeEstimate import BLOC_FEED, BLOC_WAIT, gcodeEstimator, plannerDurations  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAQUE = os.path.join(ROOT, 'grbl_ros2_gui', 'Plaque01.ngc')
+SETTINGS = {11: 0.01, 110: 6000, 111: 6000, 112: 6000, 120: 100, 121: 100, 122: 100}
+
+
+def referenceDurations(points, types, feeds, waits, maxRate, accel, deviation, lookahead):
+    """Grbl planner written block by block: limits, then one backward pass per planner window, then a forward pass."""
+    n = len(types)
+    unit, length, vNom, a = [], [], [], []
+    for i in range(n):
+        d = np.asarray(points[i + 1]) - np.asarray(points[i])
+        L = math.sqrt(d.dot(d))
+        length.append(L)
+        if types[i] == BLOC_WAIT:
+            unit.append(np.zeros(len(d)))
+            vNom.append(0.0)
+            a.append(1.0)
+            continue
+        u = d / L
+        unit.append(u)
+        vMax = min(r / 60 / abs(c) for r, c in zip(maxRate, u) if abs(c) > 1e-12)
+        a.append(min(r / abs(c) for r, c in zip(accel, u) if abs(c) > 1e-12))
+        vNom.append(vMax if types[i] == 0 else min(feeds[i] / 60, vMax))
+    limit = [0.0] * (n + 1)
+    for i in range(1, n):
+        if types[i - 1] == BLOC_WAIT or types[i] == BLOC_WAIT:
+            continue
+        cos = -unit[i - 1].dot(unit[i])
+        if cos > 0.999999:
+            continue
+        if cos < -0.999999:
+            junction = math.inf
+        else:
+            j = unit[i] - unit[i - 1]
+            j /= math.sqrt(j.dot(j))
+            sin = math.sqrt(0.5 * (1 - cos))
+            junction = min(r / abs(c) for r, c in zip(accel, j) if abs(c) > 1e-12) * deviation * sin / (1 - sin)
+        limit[i] = min(junction, vNom[i - 1] ** 2, vNom[i] ** 2)
+    entry = [0.0] * (n + 1)
+    for i in range(1, n):
+        v = 0.0  # Stop at the end of the planner window
+        for k in range(min(i + lookahead - 1, n) - 1, i - 1, -1):
+            v = min(limit[k], v + 2 * a[k] * length[k])
+        entry[i] = v
+    for i in range(1, n):
+        entry[i] = min(entry[i], entry[i - 1] + 2 * a[i - 1] * length[i - 1])
+    durations = []
+    for i in range(n):
+        if types[i] == BLOC_WAIT:
+            durations.append(waits[i])
+            continue
+        v0, v1, L = math.sqrt(entry[i]), math.sqrt(entry[i + 1]), length[i]
+        peak = math.sqrt(min(a[i] * L + (entry[i] + entry[i + 1]) / 2, vNom[i] ** 2))
+        cruise = L - (2 * peak * peak - v0 * v0 - v1 * v1) / (2 * a[i])
+        durations.append((peak - v0) / a[i] + (peak - v1) / a[i] + max(cruise, 0) / peak)
+    return np.array(durations)
+
+
+def total(lines, **kwargs):
+    estimator = gcodeEstimator('XYZ', SETTINGS, **kwargs)
+    assert estimator.estimate(lines)
+    return estimator.totalTime()
+
+
+def test_profiles():
+    # 50 mm/s reached after 0.5 s and 12.5 mm, 75 mm at cruise speed
+    assert total(['G1 X100 F3000']) == pytest.approx(2.5)
+    assert total(['G21 G1 X50 F3000', 'X100']) == pytest.approx(2.5)
+    assert total(['G20 G1 X{} F{}'.format(100 / 25.4, 3000 / 25.4)]) == pytest.approx(2.5)
+    # Rapid too short to reach 100 mm/s
+    assert total(['G0 X10']) == pytest.approx(2 * math.sqrt(10 / 100))
+    # Dwell and synchronisation
+    assert total(['G1 X50 F3000', 'M8', 'G4 P1.5', 'X100']) == pytest.approx(2 * (0.5 + 0.5 + 25 / 50) + 1.5)
+    # Square corner: the junction speed depends on $11
+    corner = ['G1 X50 F3000', 'Y50']
+    assert total(['G1 X50 F3000', 'G4 P0', 'Y50']) > total(corner) > total(['G1 X50 F3000', 'X100'])
+    smooth = gcodeEstimator('XYZ', {**SETTINGS, 11: 0.1})
+    smooth.estimate(corner)
+    assert total(corner) > smooth.totalTime()
+    # G93: F50 is 1/50 min per block, about 1.2 s without acceleration
+    assert 1.2 < total(['G93 G1 X10 F50']) < 1.4
+
+
+def test_lookahead():
+    lines = ['G1 F6000'] + ['X{:.2f}'.format(0.01 * i) for i in range(1, 1001)]
+    # A full planner of 0.01 mm blocks must be able to stop within 0.14 mm: far below 100 mm/s
+    assert total(lines) > 2 * total(['G1 X10 F6000'])
+    assert total(lines, lookahead=100) < total(lines)
+
+
+def test_arcs():
+    estimator = gcodeEstimator('XYZ', SETTINGS)
+    estimator.estimate(['G2 X0 Y0 I10 J0 F600'])
+    # Chords within $12 = 0.002 mm as Grbl computes them, at 10 mm/s
+    assert estimator.blockCount() == int(math.pi * 10 / math.sqrt(0.002 * (20 - 0.002)))
+    assert estimator.totalTime() == pytest.approx(2 * math.pi * 10 / 10, rel=0.02)
+    assert total(['G2 X0 Y20 R10 F600', 'G3 X0 Y0 R10']) == pytest.approx(total(['G2 X0 Y20 I0 J10 F600', 'G3 X0 Y0 I0 J-10']), rel=1e-3)
+
+
+def test_same_as_reference_planner():
+    rnd = np.random.default_rng(4)
+    n = 400
+    points = np.cumsum(np.r_[np.zeros((1, 3)), rnd.uniform(-2, 2, (n, 3)) * rnd.choice([0.01, 1], (n, 1))], axis=0)
+    types = rnd.choice([0, 1, 1, 1, BLOC_WAIT], n)
+    points[1:][types == BLOC_WAIT] = points[:-1][types == BLOC_WAIT]
+    points = np.cumsum(np.r_[points[:1], np.diff(points, axis=0) * (types != BLOC_WAIT)[:, None]], axis=0)
+    feeds = rnd.choice([300, 1000, 5000], n).astype(float)
+    waits = rnd.uniform(0, 1, n)
+    maxRate, accel = [3000, 4000, 500], [50, 80, 20]
+    for lookahead in (15, 4):
+        expected = referenceDurations(points, types, feeds, waits, maxRate, accel, 0.02, lookahead)
+        durations = plannerDurations(points, types, feeds, waits, maxRate, accel, 0.02, lookahead)
+        assert np.allclose(durations, expected, rtol=1e-9, atol=1e-12)
+
+
+def test_remaining_time():
+    with open(PLAQUE) as f:
+        lines = f.read().splitlines()
+    estimator = gcodeEstimator('XYZ')
+    assert estimator.estimate(lines)
+    assert estimator.lineCount() == len(lines) and estimator.blockCount() > 0
+    remaining = [estimator.remainingTime(row) for row in range(len(lines) + 1)]
+    assert remaining[0] == estimator.totalTime() > 0 and remaining[-1] == 0
+    assert all(a >= b for a, b in zip(remaining, remaining[1:]))
+    # An aborted estimate reports nothing
+    assert not gcodeEstimator('XYZ').estimate(iter(lines), lambda: True)
+
+
+@pytest.mark.benchmark
+def test_planner_speed():
+    n = 1000000
+    rnd = np.random.default_rng(1)
+    points = np.cumsum(rnd.uniform(-1, 1, (n + 1, 5)), axis=0)
+    types = np.full(n, BLOC_FEED, dtype=np.int8)
+    t0 = time.perf_counter()
+    durations = plannerDurations(points, types, np.full(n, 1000.0), np.zeros(n), [500] * 5, [10] * 5, 0.01)
+    duree = time.perf_counter() - t0
+    print('\nplannerDurations: {} blocks in {:0.3f} s, {:0.0f} s of machining'.format(n, duree, durations.sum()))
+    assert np.all(np.isfinite(durations)) and duree < 1.0
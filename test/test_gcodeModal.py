@@ -0,0 +1,245 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Modal state index used to resume a program in the middle (gcodeModal): state
+tracking, preamble, checkpointed lookups against a full rescan, and the cost
+of a resume on a large file.
+"""
+
+import random
+import time
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+pytest.importorskip('numpy')
+
+from grbl_ros2_gui.cn5X_gcodeModel import gcodeListModel  # noqa: E402
+from grbl_ros2_gui.gcodeModal import gcodeModalIndex, gcodeModalIndexer, gcodeModalState  # noqa: E402
+
+PROGRAM = [
+    '(header) G20',
+    'G21 G90 G17 G94',
+    'G55',
+    'M3 S12000',
+    'M8',
+    'G0 X0 Y0 Z5',
+    'G1 Z-1 F300',
+    'X10 Y10',
+    'G91 G2 X5 Y5 I5 J0 F600',
+    'X-5 Y-5 I0 J-5 ; still G2',
+    'G90 M7',
+    'S8000 M4',
+    'G43.1 Z2.5',
+]
+
+
+def randomProgram(nbLines, seed=1):
+    rnd = random.Random(seed)
+    choices = ['G0 X{0} Y{0}', 'G1 X{0} F{1}', 'G2 X{0} Y{0} I1 J0', 'X{0} Y{0}', 'G91', 'G90', 'G20', 'G21',
+               'M3 S{1}', 'M4 S{1}', 'M5', 'M8', 'M7', 'M9', 'G54', 'G56', '(comment G91)', '', 'F{1}', 'G93', 'G94']
+    return [rnd.choice(choices).format(rnd.randint(-50, 50), rnd.randint(1, 5000)) for i in range(nbLines)]
+
+
+def loadModel(app, tmp_path, lines):
+    path = str(tmp_path / 'program.ngc')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    model = gcodeListModel()
+    loaded = []
+    model.sig_loaded.connect(loaded.append)
+    model.openFile(path)
+    t0 = time.time()
+    while not loaded and time.time() - t0 < 60:
+        app.processEvents()
+        time.sleep(0.001)
+    return model
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def test_state_and_preamble():
+    state = gcodeModalState()
+    for line in PROGRAM:
+        state.update(line)
+    assert state.values() == ('G2', 'G17', 'G90', 'G94', 'G21', 'G55', 'G43.1Z2.5', 'M4', True, True, '600', '8000')
+    assert state.preamble() == ['G21G90G94G17G55', 'G43.1Z2.5', 'F600', 'S8000M4', 'M7M8']
+    # G2 cannot be sent without axis words: it goes with the first resumed line
+    assert state.resumeLine('X1 Y1 I1 J0') == ('G2X1 Y1 I1 J0', True)
+    assert state.resumeLine('G1 X1') == ('G1 X1', True)
+    state.update('M30')
+    assert state.preamble()[-2:] == ['M9', 'G1']
+    assert gcodeModalState().preamble() == ['G21G90G94G17G54', 'G49', 'M9', 'G0']
+
+
+@pytest.mark.parametrize('first', ['(next arc)', 'F200', 'M8', 'G92 X0'])
+def test_resume_before_axis_words(first):
+    from grbl_ros2_gui.cn5X_gcodeFile import gcodeFile
+    from grbl_ros2_gui.gcodeCheck import gcodeChecker
+
+    state = gcodeModalState()
+    state.update('G17 G2 X10 Y0 I5 J0 F300')
+    # The motion word waits for the first line with axis words
+    lines = [first, '', 'X0 Y0 I-5 J0', 'X10 Y0 I5 J0']
+    sent = [line for line, flag, row in gcodeFile._gcodeFile__linesSource(lines, 100, state)]
+    assert sent[-3:] == [first, 'G2X0 Y0 I-5 J0', 'X10 Y0 I5 J0']
+    checker = gcodeChecker('XYZ')
+    assert checker.check(['G0 X10 Y0'] + sent)
+    assert checker.issues() == []
+
+
+def test_index_matches_rescan(app, tmp_path):
+    lines = randomProgram(5000)
+    model = loadModel(app, tmp_path, lines)
+    index = gcodeModalIndex(interval=97)
+    assert index.build(model.lines())
+    assert index.rowCount() == len(lines) and index.checkpointCount() == (len(lines) + 96) // 97
+    for row in [0, 1, 96, 97, 98, 1000, 4999, 5000] + random.Random(2).sample(range(len(lines)), 50):
+        expected = gcodeModalState()
+        for line in lines[:row]:
+            expected.update(line)
+        assert index.stateAt(row, model.lines) == expected, row
+    model.clear()
+
+
+def test_background_indexer(app, tmp_path):
+    lines = randomProgram(3000)
+    model = loadModel(app, tmp_path, lines)
+    indexes = []
+    indexer = gcodeModalIndexer(model.lines())
+    indexer.sig_finished.connect(indexes.append)
+    indexer.start()
+    t0 = time.time()
+    while not indexes and time.time() - t0 < 30:
+        app.processEvents()
+        time.sleep(0.001)
+    indexer.wait()
+    assert indexes[0].rowCount() == 3000
+    # An aborted build reports nothing
+    aborted = gcodeModalIndex()
+    assert not aborted.build(iter(lines), lambda: True)
+    model.clear()
+
+
+class ListView(QtCore.QObject):
+    """The QListView calls made by gcodeFile, without a QApplication."""
+
+    def setUniformItemSizes(self, uniform):
+        pass
+
+    def setModel(self, model):
+        self.model = model
+        self.selection = QtCore.QItemSelectionModel(model)
+
+    def selectionModel(self):
+        return self.selection
+
+
+def waitFor(app, condition, timeout=30):
+    t0 = time.time()
+    while not condition() and time.time() - t0 < timeout:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def openProgram(app, tmp_path, monkeypatch, lines):
+    """gcodeFile of lines, with the start time of each modal index build, once its passes are done."""
+    from grbl_ros2_gui import cn5X_gcodeFile
+
+    started = []
+
+    class CountingIndexer(gcodeModalIndexer):
+        def start(self):
+            started.append(time.time())
+            super().start()
+
+    monkeypatch.setattr(cn5X_gcodeFile, 'gcodeModalIndexer', CountingIndexer)
+    path = tmp_path / 'program.ngc'
+    path.write_text('\n'.join(lines) + '\n')
+    view = ListView()
+    gcode = cn5X_gcodeFile.gcodeFile(None, view)
+    gcode.readFile(str(path))
+    waitFor(app, lambda: gcode.checkIssues() is not None and gcode.remainingTime(0) is not None)
+    assert len(started) == 1
+    return gcode, view.model, started
+
+
+def test_edits_restart_passes_once(app, tmp_path, monkeypatch):
+    from grbl_ros2_gui.cn5X_config import GCODE_EDIT_DELAY
+
+    gcode, model, started = openProgram(app, tmp_path, monkeypatch, randomProgram(3000))
+    # A burst of edits drops the results at once but starts the full file passes only once, after it
+    for row in range(10):
+        model.setData(model.index(row), 'G1 X{}'.format(row))
+        model.insertRows(row, 1)
+        app.processEvents()
+    assert len(started) == 1 and gcode.checkIssues() is None and gcode.remainingTime(0) is None
+    waitFor(app, lambda: gcode.checkIssues() is not None and gcode.remainingTime(0) is not None)
+    assert len(started) == 2 and started[1] - started[0] >= GCODE_EDIT_DELAY / 1000
+    gcode.setGcodeChanged(False)
+    gcode.closeFile()
+
+
+def test_partial_index():
+    lines = randomProgram(1000)
+    index = gcodeModalIndex(interval=100)
+
+    def source():
+        for row, line in enumerate(lines):
+            if row == 550:
+                # Checkpoints 0 to 500 are there: any row up to 600 is reached from one of them
+                assert index.covers(600) and not index.covers(601) and not index.isComplete()
+                expected = gcodeModalState()
+                for previous in lines[:580]:
+                    expected.update(previous)
+                assert index.stateAt(580, lambda first, last: lines[first:last + 1]) == expected
+            yield line
+
+    assert index.build(source()) and index.isComplete() and index.covers(5000)
+
+
+def test_resume_while_indexing(app, tmp_path, monkeypatch):
+    lines = randomProgram(20000)
+    gcode, model, started = openProgram(app, tmp_path, monkeypatch, lines)
+    model.setData(model.index(0), 'G1 X1')
+    app.processEvents()
+    # Resuming right after an edit starts the index at once and waits for its checkpoint only
+    expected = gcodeModalState()
+    for line in ['G1 X1'] + lines[1:15000]:
+        expected.update(line)
+    assert gcode.modalStateAt(15000) == expected
+    assert len(started) == 2
+    waitFor(app, lambda: gcode.checkIssues() is not None and gcode.remainingTime(0) is not None)
+    gcode.setGcodeChanged(False)
+    gcode.closeFile()
+
+
+@pytest.mark.benchmark
+def test_resume_cost(app, tmp_path):
+    nbLines = 200000
+    lines = randomProgram(nbLines)
+    model = loadModel(app, tmp_path, lines)
+    index = gcodeModalIndex()
+    t0 = time.perf_counter()
+    index.build(model.lines())
+    build = time.perf_counter() - t0
+    row = nbLines - 1
+    t0 = time.perf_counter()
+    state = index.stateAt(row, model.lines)
+    resume = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    expected = gcodeModalState()
+    for line in model.lines(0, row - 1):
+        expected.update(line)
+    rescan = time.perf_counter() - t0
+    print('\nmodal index: build {:0.3f} s for {} lines, resume {:0.3f} ms, full rescan {:0.1f} ms'.format(
+        build, nbLines, resume * 1000, rescan * 1000))
+    assert state == expected
+    assert resume < rescan / 20
+    model.clear()
@@ -0,0 +1,179 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Bandwidth-reducing G-code preprocessor (gcodePreprocess): number compaction,
+suppression of redundant modal words, and equivalence of the motion Grbl
+executes for the original and preprocessed programs (reference interpreter,
+then the Grbl simulator).
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.gcodePreprocess import compactNumber, gcodePreprocessor  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLAQUE = os.path.join(ROOT, 'grbl_ros2_gui', 'Plaque01.ngc')
+WORD = re.compile(r'([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+
+
+def interpret(lines):
+    """Moves (motion, target, arc centre, feed, spindle, coolant) as Grbl would plan them."""
+    state = {'motion': 0, 'abs': True, 'inch': False, 'f': 0.0, 's': 0.0, 'm': (5, 9), 'inverse': False}
+    pos = [0.0] * 6
+    moves = []
+    for line in lines:
+        words = WORD.findall(re.sub(r'\([^)]*\)|;.*', '', line).upper())
+        axes = {}
+        ijk = {}
+        for letter, value in words:
+            v = float(value)
+            if letter == 'G':
+                if v in (0, 1, 2, 3):
+                    state['motion'] = v
+                elif v in (90, 91):
+                    state['abs'] = v == 90
+                elif v in (20, 21):
+                    if (v == 20) != state['inch']:
+                        state['f'] = 0.0
+                    state['inch'] = v == 20
+                elif v in (93, 94):
+                    if (v == 93) != state['inverse']:
+                        state['f'] = 0.0
+                    state['inverse'] = v == 93
+            elif letter == 'F':
+                state['f'] = v
+            elif letter == 'S':
+                state['s'] = v
+            elif letter == 'M':
+                if v in (3, 4, 5):
+                    state['m'] = (v, state['m'][1])
+                elif v in (7, 8, 9):
+                    state['m'] = (state['m'][0], v)
+            elif letter in 'XYZABC':
+                axes['XYZABC'.index(letter)] = v * (25.4 if state['inch'] else 1)
+            elif letter in 'IJK':
+                ijk[letter] = v * (25.4 if state['inch'] else 1)
+        if axes:
+            for i, v in axes.items():
+                pos[i] = v if state['abs'] else pos[i] + v
+            moves.append((state['motion'], tuple(pos), tuple(sorted(ijk.items())), state['f'], state['s'], state['m']))
+    return moves
+
+
+def assertSameMoves(original, processed, tolerance):
+    a = interpret(original)
+    b = interpret(processed)
+    assert len(a) == len(b)
+    for ma, mb in zip(a, b):
+        assert ma[0] == mb[0] and ma[3:] == mb[3:]
+        assert all(abs(x - y) <= tolerance for x, y in zip(ma[1], mb[1]))
+        assert [k for k, v in ma[2]] == [k for k, v in mb[2]]
+        assert all(abs(x[1] - y[1]) <= tolerance for x, y in zip(ma[2], mb[2]))
+
+
+def preprocess(lines):
+    preprocessor = gcodePreprocessor()
+    out = []
+    for line in lines:
+        compact, comment = preprocessor.process(line)
+        if compact != '':
+            out.append(compact)
+    return out, preprocessor
+
+
+def test_compact_number():
+    assert compactNumber('10.5000') == '10.5'
+    assert compactNumber('0.5000') == '.5'
+    assert compactNumber('-0.5') == '-.5'
+    assert compactNumber('-0.0000', 4) == '0'
+    assert compactNumber('+007') == '7'
+    assert compactNumber('100.00') == '100'
+    assert compactNumber('1.234567', 4) == '1.2346'
+    assert compactNumber('03') == '3'
+
+
+def test_redundant_words():
+    out, p = preprocess([
+        '(begin) ', 'N10 G21 G90', 'G1 X10.0000 Y0 F500.00', 'G1 X20.0000 F500.00 ; same feed',
+        'G90 G1 Y5', 'M3 S10000.0000', 'S10000', 'G20', 'G1 X1 F500', 'G93 G1 X2 F10', 'G1 X3 F10',
+        'G94 G1 X4 F20', '$H', 'G21 G1 X5',
+    ])
+    assert out == ['G21G90', 'G1X10Y0F500', 'X20', 'Y5', 'M3S10000', 'G20', 'X1F500', 'G93X2F10', 'X3F10',
+                   'G94X4F20', '$H', 'G21G1X5']
+    assert p.bytesSaved() == p.bytesIn - p.bytesOut > 0
+    # Comment only lines are returned for the progress display
+    assert gcodePreprocessor().process('(Profile_Faces)') == ('', '(Profile_Faces)')
+    assert gcodePreprocessor().process('; M6 T1.0') == ('', None)
+
+
+def test_plaque_motion_unchanged():
+    with open(PLAQUE) as f:
+        lines = f.read().splitlines()
+    out, p = preprocess(lines)
+    assertSameMoves(lines, out, 1e-9)
+    print('\nPlaque01.ngc: {} -> {} bytes ({:0.1f} % saved), {} -> {} lines'.format(
+        p.bytesIn, p.bytesOut, 100 * p.bytesSaved() / p.bytesIn, p.linesIn, p.linesOut))
+    assert p.bytesSaved() > p.bytesIn * 0.3
+
+
+def test_random_motion_unchanged():
+    rnd = random.Random(3)
+    choices = ['G0 X{0:.6f} Y{1:.3f}', 'G1 X{0:.6f} F{2}', 'G2 X{0:.4f} Y{1:.4f} I1.000 J0 F{2}', 'X{0:.6f} Y{1}',
+               'G91', 'G90', 'G20', 'G21', 'M3 S{2}', 'M5', 'M8', 'M9', 'F{2}', 'G93 G1 X{0:.3f} F{2}', 'G94',
+               '(comment)', '', 'N{2} G1 Z{1:.5f}']
+    lines = [rnd.choice(choices).format(rnd.uniform(-100, 100), rnd.uniform(-100, 100), rnd.choice([100, 500, 500, 1200]))
+             for i in range(20000)]
+    out, p = preprocess(lines)
+    # Rounding stays below 0.5e-5 inch (G20) or 0.5e-4 mm and does not accumulate in G91
+    assertSameMoves(lines, out, 0.5e-5 * 25.4 + 1e-9)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+def test_simulator_accepts_compacted_program():
+    pytest.importorskip('serial')
+    from grbl_ros2_gui.grblCom import grblCom
+    from grbl_ros2_gui.grblSimulator import grblSimulator
+
+    with open(PLAQUE) as f:
+        lines = f.read().splitlines()
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    com = grblCom()
+    positions = []
+    for program in (lines, preprocess(lines)[0]):
+        sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0)
+        port = sim.start()
+        errors = []
+        statuses = []
+        com.sig_error.connect(errors.append)
+        com.sig_status.connect(lambda status: statuses.append(status))
+        try:
+            com.startCom(port, 115200)
+            t0 = time.time()
+            while not (com.isOpen() and com.grblInitStatus()) and time.time() - t0 < 10:
+                app.processEvents()
+                time.sleep(0.01)
+            com.gcodeSource((line, 0, row) for row, line in enumerate(program) if line.strip() != '')
+            t0 = time.time()
+            while time.time() - t0 < 3:
+                app.processEvents()
+                time.sleep(0.01)
+            com.stopCom()
+        finally:
+            sim.stop()
+            com.sig_error.disconnect()
+            com.sig_status.disconnect()
+        assert errors == []
+        positions.append([s.mpos for s in statuses if s.mpos is not None][-1])
+    assert positions[0] == positions[1]
+    test_simulator_accepts_compacted_program.keep = com  # grblCom must outlive the event loop
@@ -0,0 +1,80 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Streaming telemetry counters (grblMetrics): windowed rates and round-trip
+histogram of snapshot(), and the counters collected by grblComSerial during a
+short stream to the Grbl simulator.
+"""
+
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.cn5X_config import METRICS_RTT_BOUNDS  # noqa: E402
+from grbl_ros2_gui.grblMetrics import grblMetrics  # noqa: E402
+
+
+def test_snapshot_windows():
+    metrics = grblMetrics()
+    first = metrics.snapshot()
+    assert first['linesPerSecond'] == 0.0 and first['plannerUsed'] is None
+    metrics.linesSent += 50
+    metrics.ack(0.0005)
+    metrics.ack(0.003)
+    metrics.ack(10.0)
+    metrics.guiLag(0.05)
+    metrics.guiLag(0.01)
+    metrics.buffers((15, 128))
+    metrics.buffers((3, 100))
+    time.sleep(0.1)
+    m = metrics.snapshot()
+    assert 0 < m['linesPerSecond'] <= 500
+    assert m['ackRoundTripCount'] == 3
+    assert m['ackRoundTripHistogram'][0] == 1
+    assert m['ackRoundTripHistogram'][METRICS_RTT_BOUNDS.index(0.005)] == 1
+    assert m['ackRoundTripHistogram'][-1] == 1
+    assert m['guiLagMax'] == 0.05
+    assert (m['plannerUsed'], m['plannerFree'], m['rxFree']) == (12, 3, 100)
+    # Histogram and GUI lag only cover the last window, totals keep growing
+    m = metrics.snapshot()
+    assert m['ackRoundTripCount'] == 0 and m['guiLagMax'] == 0.0
+    assert m['linesPerSecond'] == 0.0 and m['linesSent'] == 50
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+def test_counters_from_stream():
+    from grbl_ros2_gui.grblCom import grblCom
+    from grbl_ros2_gui.grblSimulator import grblSimulator
+
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0)
+    port = sim.start()
+    com = grblCom()
+    try:
+        com.startCom(port, 115200)
+        t0 = time.time()
+        while not (com.isOpen() and com.grblInitStatus()) and time.time() - t0 < 10:
+            app.processEvents()
+            time.sleep(0.01)
+        com.metrics().snapshot()
+        com.gcodeSource(('G1X{}F3000'.format(i % 10), 0, i) for i in range(100))
+        t0 = time.time()
+        while time.time() - t0 < 1.5:
+            app.processEvents()
+            time.sleep(0.01)
+        m = com.metrics().snapshot()
+        com.stopCom()
+    finally:
+        sim.stop()
+    assert m['linesSent'] >= 100
+    assert m['ackRoundTripCount'] >= 100
+    assert m['statusQueryRate'] > 0
+    assert m['mainQueue'] == 0 and m['sourcesQueue'] == 0 and m['linesInFlight'] == 0
+    test_counters_from_stream.keep = com  # grblCom must outlive the event loop
@@ -0,0 +1,99 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Machine position between status reports (grblMotion): extrapolation along the
+last move at the reported feed, bounded horizon, stops, WPos reports, and
+sampling at the joint_states rate while the Grbl simulator runs a move.
+"""
+
+import sys
+import time
+
+import pytest
+
+from grbl_ros2_gui.cn5X_config import MOTION_MAX_EXTRAPOLATION
+from grbl_ros2_gui.grblMotion import grblMotion
+from grbl_ros2_gui.grblStatus import grblStatus
+
+
+def report(motion, line, t):
+    motion.update(grblStatus.parse(line), t)
+
+
+def test_extrapolation_at_reported_feed():
+    motion = grblMotion('XYZ')
+    assert motion.position(0.0) is None
+    report(motion, '<Run|MPos:0.000,0.000,0.000|FS:600,0>', 10.0)
+    assert motion.position(10.05) == (0.0, 0.0, 0.0)
+    # 3-4-5 move: direction from the previous report, speed from FS (600 mm/min = 10 mm/s)
+    report(motion, '<Run|MPos:0.300,0.400,0.000|FS:600,0>', 10.04)
+    x, y, z = motion.position(10.06)
+    assert x == pytest.approx(0.3 + 0.6 * 0.2) and y == pytest.approx(0.4 + 0.8 * 0.2) and z == 0
+    # Never further than MOTION_MAX_EXTRAPOLATION after the report, never before it
+    assert motion.position(11.0)[0] == pytest.approx(0.3 + 6 * MOTION_MAX_EXTRAPOLATION)
+    assert motion.position(10.0) == (0.3, 0.4, 0.0)
+    # A stopped machine is not extrapolated
+    report(motion, '<Hold:0|MPos:0.500,0.600,0.000|FS:0,0>', 10.08)
+    assert motion.position(10.2) == (0.5, 0.6, 0.0)
+    report(motion, '<Idle|MPos:0.500,0.600,0.000|FS:0,0>', 10.12)
+    assert motion.position(10.2) == (0.5, 0.6, 0.0)
+    assert motion.joints(10.2) == (('X', 'Y', 'Z'), (0.5, 0.6, 0.0))
+
+
+def test_wpos_reports_and_missing_feed():
+    motion = grblMotion('XY')
+    # WPos without a known WCO gives no machine position
+    report(motion, '<Run|WPos:1.000,1.000>', 0.0)
+    assert motion.position(0.0) is None
+    report(motion, '<Run|WPos:1.000,1.000|WCO:-10.000,-20.000>', 0.0)
+    assert motion.position(0.0) == (-9.0, -19.0)
+    # Without FS: the speed of the last move between the two reports
+    report(motion, '<Jog|WPos:2.000,1.000>', 0.1)
+    assert motion.position(0.15) == pytest.approx((-7.5, -19.0))
+    motion.reset()
+    assert motion.position(0.15) is None
+    motion.setAxisNames('XYZAB')
+    assert motion.axisNames() == ('X', 'Y', 'Z', 'A', 'B')
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+def test_smooth_samples_from_simulator():
+    pytest.importorskip('serial')
+    QtCore = pytest.importorskip('PyQt5.QtCore')
+    from grbl_ros2_gui.cn5X_config import ROS_JOINT_STATES_RATE
+    from grbl_ros2_gui.grblCom import grblCom
+    from grbl_ros2_gui.grblSimulator import grblSimulator
+
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=1.0)
+    port = sim.start()
+    com = grblCom()
+    samples = []
+    try:
+        com.startCom(port, 115200)
+        t0 = time.time()
+        while not (com.isOpen() and com.grblInitStatus()) and time.time() - t0 < 10:
+            app.processEvents()
+            time.sleep(0.01)
+        com.gcodeSource(iter([('G1X10F480', 0, 0)]))
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < 2.8:
+            app.processEvents()
+            position = com.motion().position(time.monotonic())
+            if position is not None:
+                samples.append(position[0])
+            time.sleep(1.0 / ROS_JOINT_STATES_RATE)
+        com.stopCom()
+    finally:
+        sim.stop()
+    test_smooth_samples_from_simulator.keep = com  # grblCom must outlive the event loop
+    moving = [x for x in samples if 1 < x < 9]
+    steps = [b - a for a, b in zip(moving, moving[1:])]
+    # Status reports come every GRBL_QUERY_DELAY (40 ms): most 5 ms samples fall between them
+    # and still move on, by about 8 mm/s * 5 ms, without going back
+    assert len(set(moving)) > 0.7 * len(moving) > 40
+    assert min(steps) > -0.2 and max(steps) < 0.5
+    assert samples[-1] == pytest.approx(10, abs=1e-3)
@@ -0,0 +1,142 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Serial traffic capture (grblRecorder) and its replay:// transport: record
+format, rotation, timing of the replay, and a capture of a simulator session
+replayed through grblCom.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.grblRecorder import CAPTURE_RX, CAPTURE_TX, grblRecorder  # noqa: E402
+from grbl_ros2_gui.grblTransport import grblReplayTransport, grblTransport, grblTransportError  # noqa: E402
+
+linux = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+
+
+def readLines(link, count, timeout=5.0):
+    lines = []
+    t0 = time.time()
+    while len(lines) < count and time.time() - t0 < timeout:
+        line = link.readline()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def test_roundtrip_and_chunks(tmp_path):
+    path = str(tmp_path / 'grbl.cap')
+    recorder = grblRecorder(path)
+    recorder.record(CAPTURE_TX, b'?')
+    recorder.record(CAPTURE_RX, b'<Idle|MPos:0.000,0.000,0.000|FS:0,0>\r\n')
+    recorder.record(CAPTURE_TX, b'x' * 70000)
+    recorder.close()
+    records = list(grblRecorder.records(path))
+    assert [(d, len(data)) for t, d, data in records] == [(CAPTURE_TX, 1), (CAPTURE_RX, 38), (CAPTURE_TX, 65535),
+                                                          (CAPTURE_TX, 4465)]
+    wallTime, monoTime = grblRecorder.header(path)
+    assert all(t >= monoTime for t, d, data in records)
+    assert records == sorted(records, key=lambda r: r[0])
+
+
+def test_truncated_file(tmp_path):
+    path = str(tmp_path / 'grbl.cap')
+    recorder = grblRecorder(path)
+    recorder.record(CAPTURE_RX, b'ok\r\n')
+    recorder.record(CAPTURE_RX, b'ok\r\n')
+    recorder.close()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 2)
+    assert len(list(grblRecorder.records(path))) == 1
+    with open(path, 'wb') as f:
+        f.write(b'not a capture file at all')
+    with pytest.raises(ValueError):
+        grblRecorder.header(path)
+
+
+def test_rotation(tmp_path):
+    path = str(tmp_path / 'grbl.cap')
+    recorder = grblRecorder(path, maxBytes=1000, maxFiles=3)
+    for i in range(100):
+        recorder.record(CAPTURE_RX, b'ok\r\n' * 10)
+    recorder.close()
+    assert sorted(os.listdir(str(tmp_path))) == ['grbl.cap', 'grbl.cap.1', 'grbl.cap.2']
+    for name in os.listdir(str(tmp_path)):
+        assert os.path.getsize(str(tmp_path / name)) < 1100
+
+
+def test_replay_timing(tmp_path):
+    path = str(tmp_path / 'grbl.cap')
+    recorder = grblRecorder(path)
+    recorder.record(CAPTURE_RX, b"Grbl 1.1f ['$' for help]\r\n")
+    recorder.record(CAPTURE_TX, b'$I\n')
+    time.sleep(0.4)
+    recorder.record(CAPTURE_RX, b'ok\r\n')
+    recorder.close()
+
+    link = grblTransport.create('replay://{}?speed=2'.format(path), 115200)
+    assert isinstance(link, grblReplayTransport)
+    link.open()
+    t0 = time.time()
+    link.write(b'ignored\n')
+    link.flush()
+    assert readLines(link, 2) == [b"Grbl 1.1f ['$' for help]\r\n", b'ok\r\n']
+    assert 0.15 < time.time() - t0 < 0.4
+    # End of the capture: the link stays open and silent
+    assert link.readline() == b''
+    assert link.isOpen()
+    link.close()
+
+    with pytest.raises(grblTransportError):
+        grblTransport.create('replay://{}'.format(tmp_path / 'missing.cap'), 115200).open()
+
+
+@linux
+def test_capture_and_replay_through_grblCom(tmp_path):
+    from grbl_ros2_gui.grblCom import grblCom
+    from grbl_ros2_gui.grblSimulator import grblSimulator
+
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    path = str(tmp_path / 'session.cap')
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0.05)
+    port = sim.start()
+    com = grblCom()
+    sessions = []
+    try:
+        for portName, capture in ((port, path), ('replay://{}?speed=0'.format(path), None)):
+            statuses = []
+            com.sig_status.connect(lambda status: statuses.append(status.raw))
+            com.setCapture(capture)
+            com.startCom(portName, 115200)
+            t0 = time.time()
+            while not (com.isOpen() and com.grblInitStatus()) and time.time() - t0 < 10:
+                app.processEvents()
+                time.sleep(0.01)
+            if capture is not None:
+                com.gcodePush('G1X-5F3000')
+            t0 = time.time()
+            while time.time() - t0 < 1.5:
+                app.processEvents()
+                time.sleep(0.01)
+            com.stopCom()
+            com.sig_status.disconnect()
+            sessions.append(statuses)
+    finally:
+        sim.stop()
+    recorded, replayed = sessions
+    assert len(recorded) > 5
+    assert any('MPos:-5.000' in raw for raw in recorded)
+    # Every status of the capture is decoded again by the replay
+    assert replayed[:len(recorded)] == recorded
+    assert any(d == CAPTURE_TX and b'G1X-5F3000' in data for t, d, data in grblRecorder.records(path))
+    test_capture_and_replay_through_grblCom.keep = com  # grblCom must outlive the event loop
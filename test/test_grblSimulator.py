@@ -0,0 +1,104 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Protocol checks of the pseudo-terminal Grbl simulator (grblSimulator).
+"""
+
+import sys
+import time
+
+import pytest
+
+serial = pytest.importorskip('serial')
+pytest.importorskip('PyQt5')
+
+from grbl_ros2_gui.grblSimulator import grblSimulator  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+
+
+@pytest.fixture
+def grbl():
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0.1)
+    port = serial.Serial(sim.start(), 115200, timeout=0.05)
+    yield sim, port
+    port.close()
+    sim.stop()
+
+
+def exchange(port, data, until='ok', timeout=2.0):
+    """Send data and return the reply lines up to the one starting with until."""
+    port.write(data.encode('ascii'))
+    lines = []
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        line = port.readline().decode('ascii').strip()
+        if line:
+            lines.append(line)
+            if line.startswith(until):
+                return lines
+    raise AssertionError('no {} in {}'.format(until, lines))
+
+
+def test_banner_and_build_info(grbl):
+    sim, port = grbl
+    assert exchange(port, '\n', until='Grbl')[-1] == "Grbl 1.1f ['$' for help]"
+    assert exchange(port, '', until='ok') == ['ok']  # Empty line after the wake up
+    assert exchange(port, '$I\n') == ['[VER:1.1f.20170801:]', '[OPT:V,15,128]', 'ok']
+    assert exchange(port, '$G\n') == ['[GC:G0 G54 G17 G21 G90 G94 M5 M9 T0 F0 S0]', 'ok']
+
+
+def test_errors(grbl):
+    sim, port = grbl
+    exchange(port, '\n', until='Grbl')
+    exchange(port, '')
+    assert exchange(port, 'G1X10\n', until='error') == ['error:22']  # No feed rate
+    assert exchange(port, 'G1G0X1\n', until='error') == ['error:21']
+    assert exchange(port, 'X1Y2X3\n', until='error') == ['error:25']
+    assert exchange(port, 'G5X1\n', until='error') == ['error:20']
+    assert exchange(port, '$H\n', until='error') == ['error:5']    # Homing disabled
+    assert exchange(port, '$999=1\n', until='error') == ['error:3']
+
+
+def test_motion_time_and_status(grbl):
+    sim, port = grbl
+    exchange(port, '\n', until='Grbl')
+    exchange(port, '')
+    # 50 mm at 300 mm/min, 10 mm/s^2: 0.5 s acceleration, 9.5 s cruise, 0.5 s deceleration
+    t0 = time.time()
+    exchange(port, 'G1X-50F300\n')
+    assert exchange(port, '?', until='<')[-1].startswith('<Run|MPos:')
+    while not exchange(port, '?', until='<')[-1].startswith('<Idle|MPos:-50.000,0.000,0.000'):
+        time.sleep(0.01)
+    assert 1.0 < time.time() - t0 < 1.3
+
+
+def test_feed_hold_and_reset(grbl):
+    sim, port = grbl
+    exchange(port, '\n', until='Grbl')
+    exchange(port, '')
+    exchange(port, 'G1X-50F300\n')
+    time.sleep(0.2)
+    port.write(b'!')
+    time.sleep(0.1)
+    assert exchange(port, '?', until='<')[-1].startswith('<Hold:0|')
+    port.write(b'~')
+    assert exchange(port, '?', until='<')[-1].startswith('<Run|')
+    assert exchange(port, '\x18', until='[MSG:') == ['ALARM:3', "Grbl 1.1f ['$' for help]", "[MSG:'$H'|'$X' to unlock]"]
+    assert exchange(port, 'G0X0\n', until='error') == ['error:9']
+    assert exchange(port, '$X\n') == ['[MSG:Caution: Unlocked]', 'ok']
+
+
+def test_planner_and_rx_buffer(grbl):
+    sim, port = grbl
+    exchange(port, '\n', until='Grbl')
+    exchange(port, '')
+    # 30 lines of 10 bytes sent at once: 15 fill the planner, the next blocks Grbl, 127 bytes stay in RX
+    port.write(b''.join(b'G1X-%02dF30\n' % i for i in range(1, 31)))
+    time.sleep(0.5)
+    assert sim.plannerMax == 15
+    assert sim.rxMax == 127
+    assert sim.rxOverflow == 300 - 16 * 10 - 127
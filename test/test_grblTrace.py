@@ -0,0 +1,124 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Level-gated debug tracing of the serial link (grblTrace): ring buffer
+semantics, concurrent writers, and the cost of a disabled trace point compared
+with the former formatted cross-thread sig_debug emission.
+"""
+
+import threading
+import time
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from grbl_ros2_gui.cn5X_config import TRACE_LEVEL_COM, TRACE_LEVEL_DATA, TRACE_LEVEL_OFF  # noqa: E402
+from grbl_ros2_gui.grblTrace import grblTrace  # noqa: E402
+
+N = 100000
+
+
+def test_gated_at_source():
+    trace = grblTrace(16)
+    trace.add(TRACE_LEVEL_COM, 'not {}', 'stored')
+    assert trace.drain() == []
+    trace.setLevel(TRACE_LEVEL_COM)
+    trace.add(TRACE_LEVEL_DATA, 'too {}', 'verbose')
+    trace.add(TRACE_LEVEL_COM, 'port {} open', '/dev/ttyUSB0')
+    lines = trace.drain()
+    assert len(lines) == 1 and lines[0].endswith('port /dev/ttyUSB0 open')
+
+
+def test_deferred_formatting():
+    trace = grblTrace(16)
+    trace.setLevel(TRACE_LEVEL_DATA)
+    trace.add(TRACE_LEVEL_DATA, '>>> {!r}', 'G1X10\n')
+    trace.add(TRACE_LEVEL_DATA, 'bad {} {}', 'one')
+    lines = trace.drain()
+    assert lines[0].endswith(">>> 'G1X10\\n'")
+    assert 'format error' in lines[1]
+
+
+def test_ring_overwrite_and_partial_drain():
+    trace = grblTrace(8)
+    trace.setLevel(TRACE_LEVEL_DATA)
+    for i in range(5):
+        trace.add(TRACE_LEVEL_DATA, 'line {}', i)
+    assert [line.split()[-1] for line in trace.drain(3)] == ['0', '1', '2']
+    for i in range(5, 20):
+        trace.add(TRACE_LEVEL_DATA, 'line {}', i)
+    lines = trace.drain()
+    assert lines[0] == '... 9 trace records lost'
+    assert [line.split()[-1] for line in lines[1:]] == [str(i) for i in range(12, 20)]
+    assert trace.drain() == []
+
+
+def test_clear():
+    trace = grblTrace(8)
+    trace.setLevel(TRACE_LEVEL_DATA)
+    trace.add(TRACE_LEVEL_DATA, 'old')
+    trace.clear()
+    trace.add(TRACE_LEVEL_DATA, 'new')
+    lines = trace.drain()
+    assert len(lines) == 1 and lines[0].endswith('new')
+
+
+def test_concurrent_writers():
+    trace = grblTrace(1 << 16)
+    trace.setLevel(TRACE_LEVEL_DATA)
+
+    def writer(name):
+        for i in range(5000):
+            trace.add(TRACE_LEVEL_DATA, '{} {}', name, i)
+
+    threads = [threading.Thread(target=writer, args=(name,)) for name in 'abcd']
+    for t in threads:
+        t.start()
+    lines = []
+    while any(t.is_alive() for t in threads):
+        lines += trace.drain()
+    for t in threads:
+        t.join()
+    lines += trace.drain()
+    assert len(lines) == 20000
+    for name in 'abcd':
+        assert [int(line.split()[-1]) for line in lines if line.split()[-2] == name] == list(range(5000))
+
+
+class LegacyEmitter(QtCore.QObject):
+    sig_debug = QtCore.pyqtSignal(str)
+
+
+@pytest.mark.benchmark
+def test_disabled_trace_cost():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    trace = grblTrace()
+    trace.setLevel(TRACE_LEVEL_OFF)
+    buff = 'G1X10.000Y20.000F500\n'
+    emitter = LegacyEmitter()
+    emitter.sig_debug.connect(lambda data: None)  # As MainWindow.on_sig_debug with debug off
+
+    t0 = time.perf_counter()
+    for i in range(N):
+        # Former __sendData debug path: string building, time.time() and a signal per call
+        emitter.sig_debug.emit('>>> ' + buff[:-1] + '\\n')
+        emitter.sig_debug.emit('grblComSerial.__sendData(), T = {} : timeout = {}'.format(time.time() * 1000, 12))
+    t1 = time.perf_counter()
+    for i in range(N):
+        if trace.level >= TRACE_LEVEL_DATA:
+            trace.add(TRACE_LEVEL_DATA, '>>> {!r}', buff)
+    t2 = time.perf_counter()
+    trace.setLevel(TRACE_LEVEL_DATA)
+    for i in range(N):
+        if trace.level >= TRACE_LEVEL_DATA:
+            trace.add(TRACE_LEVEL_DATA, '>>> {!r}', buff)
+    t3 = time.perf_counter()
+    print('\nformatted sig_debug: {:0.3f} us/send, gated trace off: {:0.3f} us, on (ring buffer): {:0.3f} us'.format(
+        (t1 - t0) / N * 1e6, (t2 - t1) / N * 1e6, (t3 - t2) / N * 1e6))
+    assert t2 - t1 < (t1 - t0) / 10
+    assert t3 - t2 < t1 - t0
+    del app
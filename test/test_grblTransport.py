@@ -0,0 +1,126 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Transports of grblComSerial (grblTransport): port name parsing, native TCP link
+with Nagle disabled and batched writes, checked against the Grbl simulator
+listening on a local TCP port.
+"""
+
+import socket
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+pytest.importorskip('PyQt5')
+
+from grbl_ros2_gui.grblSimulator import grblSimulator  # noqa: E402
+from grbl_ros2_gui.grblTransport import grblSerialTransport, grblTcpTransport, grblTransport, \
+    grblTransportError  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs Linux sockets and ptys')
+
+
+class CountingTcpTransport(grblTcpTransport):
+    """Counts the blocks actually written to the socket."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.sends = 0
+
+    def _send(self, data):
+        self.sends += 1
+        super()._send(data)
+
+
+def readUntil(link, prefix, timeout=2.0):
+    lines = []
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        line = link.readline().decode('ascii').strip()
+        if line:
+            lines.append(line)
+            if line.startswith(prefix):
+                return lines
+    raise AssertionError('no {} in {}'.format(prefix, lines))
+
+
+@pytest.fixture
+def simulator():
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0, tcpPort=0)
+    port = sim.start()
+    yield sim, port
+    sim.stop()
+
+
+def test_create_from_port_name():
+    assert isinstance(grblTransport.create('/dev/ttyUSB0', 115200), grblSerialTransport)
+    assert isinstance(grblTransport.create('COM3', 115200), grblSerialTransport)
+    for name in ('socket://grbl-esp32.local:23', 'tcp://192.168.0.10:8880', 'TELNET://[::1]:23'):
+        assert isinstance(grblTransport.create(name, 115200), grblTcpTransport)
+
+
+def test_split_address():
+    assert grblTransport.splitAddress('192.168.0.10:8880') == ('192.168.0.10', 8880)
+    assert grblTransport.splitAddress('grbl-esp32.local') == ('grbl-esp32.local', 23)
+    assert grblTransport.splitAddress('[::1]:2323') == ('::1', 2323)
+    assert grblTransport.splitAddress('::1') == ('::1', 23)
+    assert grblTransport.splitAddress('host:23?logging=debug') == ('host', 23)
+    with pytest.raises(ValueError):
+        grblTransport.splitAddress('host:telnet')
+    with pytest.raises(ValueError):
+        grblTransport.splitAddress(':23')
+
+
+def test_connection_refused():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    server.close()
+    with pytest.raises(grblTransportError):
+        grblTransport.create('socket://127.0.0.1:{}'.format(port), 115200).open()
+
+
+def test_tcp_exchange_and_batching(simulator):
+    sim, port = simulator
+    host, tcpPort = grblTransport.splitAddress(port[len('socket://'):])
+    link = CountingTcpTransport(port, host, tcpPort)
+    link.open()
+    try:
+        assert readUntil(link, 'Grbl')[-1] == "Grbl 1.1f ['$' for help]"
+        # Nothing leaves before flush(), then everything goes in one write
+        link.write(b'?')
+        link.write(b'$I\n')
+        link.write(b'G1X-1F1000\n')
+        assert link.outWaiting() == 15 and link.sentWaiting() == 0
+        assert link.flush() == 15
+        assert link.sends == 1
+        lines = readUntil(link, 'ok')
+        assert lines[0].startswith('<Idle|MPos:')
+        assert lines[1:] == ['[VER:1.1f.20170801:]', '[OPT:V,15,128]', 'ok']
+        assert readUntil(link, 'ok') == ['ok']
+        assert link.flush() == 0
+        assert link.sends == 1
+        assert sim.nbLines == 2 and sim.nbRealTime == 1
+    finally:
+        link.close()
+
+
+def test_tcp_read_timeout_and_disconnect(simulator):
+    sim, port = simulator
+    link = grblTransport.create(port, 115200)
+    link.open()
+    readUntil(link, 'Grbl')
+    t0 = time.time()
+    assert link.readline() == b''
+    assert time.time() - t0 < 1.0
+    sim.stop()
+    with pytest.raises(grblTransportError):
+        for i in range(10):
+            link.readline()
+    link.close()
+    assert not link.isOpen()
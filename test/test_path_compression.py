@@ -0,0 +1,129 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Toolpath compression (toolpath.path_compression): Douglas-Peucker within
+tolerance, G2/G3 arc fitting, conservative 5-axis merging, and G-code
+rewriting of the scan and laser toolpaths.
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from grbl_ros2_gui.toolpath.path_compression import compress, compress_gcode, simplify  # noqa: E402
+from grbl_ros2_gui.toolpath.rectangle_zigzag import RectangleZigzagPath  # noqa: E402
+
+
+def sample(start, moves, step=0.01):
+    """Dense XY points along the compressed moves, arcs included."""
+    points = [np.asarray(start[:2], dtype=float)]
+    for move in moves:
+        a = points[-1]
+        b = np.asarray(move[1][:2], dtype=float)
+        if move[0] == 'G1':
+            n = max(2, int(np.hypot(*(b - a)) / step))
+            points.extend(a + np.outer(np.linspace(0, 1, n)[1:], b - a))
+        else:
+            centre = a + np.asarray(move[2])
+            r = np.hypot(*(a - centre))
+            t0 = np.arctan2(*(a - centre)[::-1])
+            t1 = np.arctan2(*(b - centre)[::-1])
+            sweep = (t1 - t0) % (2 * np.pi) if move[0] == 'G3' else -((t0 - t1) % (2 * np.pi))
+            assert abs(np.hypot(*(b - centre)) - r) < 1e-9
+            t = t0 + np.linspace(0, 1, max(3, int(abs(sweep) * r / step)))[1:] * sweep
+            points.extend(centre + r * np.c_[np.cos(t), np.sin(t)])
+    return np.array(points)
+
+
+def distanceToPolyline(points, polyline):
+    a = polyline[:-1]
+    ab = polyline[1:] - a
+    length2 = np.maximum((ab * ab).sum(axis=1), 1e-30)
+    distances = []
+    for p in points:
+        t = np.clip(((p - a) * ab).sum(axis=1) / length2, 0, 1)
+        distances.append(np.hypot(*(a + ab * t[:, None] - p).T).min())
+    return np.array(distances)
+
+
+def test_simplify_within_tolerance():
+    rnd = np.random.default_rng(1)
+    x = np.linspace(0, 100, 2001)
+    line = np.c_[x, 0.3 * x + rnd.uniform(-0.004, 0.004, len(x))]
+    assert list(simplify(line, 0.01)) == [0, len(x) - 1]
+    zigzag = np.c_[x, 5 * np.sin(x / 7)]
+    kept = simplify(zigzag, 0.01)
+    assert kept[0] == 0 and kept[-1] == len(x) - 1 and len(kept) < len(x) / 5
+    assert distanceToPolyline(zigzag, zigzag[kept]).max() <= 0.01 + 1e-9
+
+
+def test_arcs_replace_polygons():
+    t = np.radians(np.arange(0, 181))
+    half = np.c_[20 + 10 * np.cos(t), 10 * np.sin(t)]
+    lower = np.c_[10 * np.cos(t), -10 * np.sin(t)]
+    path = np.r_[np.c_[np.linspace(40, 30, 11), np.zeros(11)], half[1:], lower[1:]]
+    moves = compress(path, 0.01)
+    assert [m[0] for m in moves] == ['G1', 'G3', 'G2']
+    # Tangent circles: an arc may run a few points into the next one, within tolerance
+    assert np.allclose(moves[0][1] + moves[1][2], (20, 0), atol=0.01)
+    assert np.allclose(moves[1][1] + moves[2][2], (0, 0), atol=0.01)
+    assert np.allclose(moves[-1][1], path[-1])
+    dense = sample(path[0], moves)
+    assert distanceToPolyline(path, dense).max() <= 0.01 + 1e-6
+    assert distanceToPolyline(dense, path).max() <= 0.01 + 1e-6
+    # A tolerance below the sagitta of the 1 degree chords keeps the polygon
+    assert all(m[0] == 'G1' for m in compress(path, 1e-4))
+
+
+def test_five_axis_is_conservative():
+    t = np.radians(np.arange(0, 361))
+    contour = np.c_[10 * np.cos(t), 10 * np.sin(t), 5 + 0.01 * np.cos(3 * t), 20 + 5 * np.sin(t), -np.degrees(t)]
+    counts = []
+    for angular in (0.05, 1e-5):
+        moves = compress(contour, 0.02, 'XYZAB', angular_tolerance=angular)
+        # A and B change along the contour: no arc, and every axis stays within its own tolerance
+        assert all(m[0] == 'G1' for m in moves)
+        kept = np.array([contour[0]] + [m[1] for m in moves])
+        for k, tolerance in enumerate([0.02, 0.02, 0.02, angular, angular]):
+            interpolated = np.interp(-contour[:, 4], -kept[:, 4], kept[:, k])
+            assert np.abs(interpolated - contour[:, k]).max() <= tolerance + 1e-9
+        counts.append(len(moves))
+    # XY alone would allow far fewer blocks than the rotary axes do
+    assert len(compress(contour[:, :2], 0.02)) < counts[0] < len(contour) / 2 < counts[1]
+
+
+def test_gcode_runs():
+    program = ['G21', 'G90', 'G0 X0 Y0 Z1 (start)', 'G1 Z0 F200'] + \
+        ['X%.3f Y%.3f' % (10 * np.cos(a), 10 * np.sin(a) - 10) for a in np.radians(np.arange(90, 181))] + \
+        ['X-20 Y-10', 'X-30 Y-10', 'X-40 Y-10 F300', 'X-50 Y-10', 'G91 X1', 'X1', 'G90 G1 X0 Y0', '$H', 'G1 X1 Y1']
+    out = compress_gcode(program, 0.01)
+    assert out[:4] == program[:4]
+    # Quarter circle then a straight line at the same feed, G1 restored before the untouched tail
+    assert out[4].startswith('G3X-10.000Y-10.000I0.000J-10.000')
+    assert out[5:] == ['G1X-30.000Y-10.000', 'X-40 Y-10 F300', 'X-50 Y-10', 'G91 X1', 'X1', 'G90 G1 X0 Y0', '$H',
+                       'G1 X1 Y1']
+    lines = compress_gcode(program, 0.01, arcs=False)
+    assert len(lines) < len(program) and not any(line[:3] in ('G2X', 'G3X') for line in lines)
+
+
+@pytest.mark.parametrize('mode', ['G38.2 Z-10 F100', 'G80'])
+def test_gcode_other_motion_modes(mode):
+    # Bare axis words after a probe move or G80 are not feed moves: never rewritten as G1
+    program = ['G21', 'G90', 'G0 X0 Y0 Z0', 'G1 X1 F200', 'X2', 'X3', 'X4', mode] + \
+        ['X%d' % x for x in range(5, 12)] + ['G1 X12', 'X13']
+    out = compress_gcode(program, 0.01)
+    assert out[:3] == program[:3] and out[3].startswith('G1X4.000')
+    assert out[4:] == program[7:]
+
+
+def test_scan_toolpath():
+    path = RectangleZigzagPath(tool_diameter=0.5, scan_speed=800)
+    for fill in ('Raster', 'Offset'):
+        blocks = path.make(0, 0, 20, 10, fill)
+        compressed = path.make(0, 0, 20, 10, fill, tolerance=0.005)
+        # Repeated points and feeds are gone, the path still ends at the same place
+        assert len(compressed) < len(blocks) and sum('F' in block for block in compressed) == 1
+        assert compressed[0] == blocks[0] and blocks[-1].startswith(compressed[-1])
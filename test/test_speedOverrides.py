@@ -0,0 +1,128 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Feed and spindle override sequences (speedOverrides): minimal realtime byte
+sequences, sent in one realtime push, checked against Grbl's clamping and the
+Grbl simulator.
+"""
+
+import sys
+import time
+
+import pytest
+
+serial = pytest.importorskip('serial')
+pytest.importorskip('PyQt5')
+
+from grbl_ros2_gui import speedOverrides  # noqa: E402
+from grbl_ros2_gui.cn5X_config import COM_FLAG_NO_OK, GRBL_OVERRIDE_MAX, GRBL_OVERRIDE_MIN, \
+    GUI_OVERRIDE_SETTLE  # noqa: E402
+from grbl_ros2_gui.speedOverrides import FEED_OVERRIDE_CODES, SPINDLE_OVERRIDE_CODES, adjustFeedOverride, \
+    overrideSequence, overrideTarget  # noqa: E402
+
+VALUES = range(GRBL_OVERRIDE_MIN, GRBL_OVERRIDE_MAX + 1)
+
+
+def applyAsGrbl(value, sequence, codes):
+    """Override value after Grbl executes sequence (clamped at each step)."""
+    steps = {codes[1]: 10, codes[2]: -10, codes[3]: 1, codes[4]: -1}
+    for c in sequence:
+        if c == codes[0]:
+            value = 100
+        else:
+            value = min(max(value + steps[c], GRBL_OVERRIDE_MIN), GRBL_OVERRIDE_MAX)
+    return value
+
+
+def legacyLength(start, target):
+    """Number of bytes of the former one byte per call greedy walk."""
+    n = 0
+    while start != target:
+        step = 10 if abs(target - start) >= 10 else 1
+        start += step if target > start else -step
+        n += 1
+    return n
+
+
+class StubGrbl:
+
+    def __init__(self):
+        self.pushes = []
+
+    def realTimePush(self, buff, flag):
+        self.pushes.append((buff, flag))
+
+
+@pytest.mark.parametrize('codes', [FEED_OVERRIDE_CODES, SPINDLE_OVERRIDE_CODES])
+def test_all_transitions(codes):
+    total = legacy = 0
+    for start in VALUES:
+        for target in VALUES:
+            sequence = overrideSequence(start, target, codes)
+            assert applyAsGrbl(start, sequence, codes) == target, (start, target)
+            assert len(sequence) <= legacyLength(start, target)
+            total += len(sequence)
+            legacy += legacyLength(start, target)
+    print('\nbytes for all transitions: {} (one byte per step walk: {})'.format(total, legacy))
+
+
+def test_examples():
+    assert overrideSequence(100, 100, FEED_OVERRIDE_CODES) == ''
+    assert overrideSequence(100, 119, FEED_OVERRIDE_CODES) == '\x91\x91\x94'
+    assert overrideSequence(187, 100, FEED_OVERRIDE_CODES) == '\x90'
+    assert overrideSequence(10, 200, SPINDLE_OVERRIDE_CODES) == '\x99' + '\x9a' * 10
+    # Out of range targets are clamped as Grbl does
+    assert applyAsGrbl(100, overrideSequence(100, 500, FEED_OVERRIDE_CODES), FEED_OVERRIDE_CODES) == 200
+
+
+def test_one_push_per_adjustment():
+    grbl = StubGrbl()
+    adjustFeedOverride(10, 200, grbl)
+    adjustFeedOverride(200, 200, grbl)
+    assert grbl.pushes == [('\x90' + '\x91' * 10, COM_FLAG_NO_OK)]
+
+
+def test_override_target(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(speedOverrides.time, 'monotonic', lambda: now[0])
+    grbl = StubGrbl()
+    target = overrideTarget(FEED_OVERRIDE_CODES)
+    # Two quick drags: the second sequence starts from the first target, not from Grbl's last Ov:
+    target.send(120, grbl)
+    target.send(125, grbl)
+    assert applyAsGrbl(100, ''.join(p for p, f in grbl.pushes), FEED_OVERRIDE_CODES) == 125
+    # A report sent before the drags does not undo them
+    target.reported(100, grbl)
+    assert len(grbl.pushes) == 2
+    now[0] += GUI_OVERRIDE_SETTLE / 1000
+    target.reported(125, grbl)
+    assert len(grbl.pushes) == 2 and target.value() == 125
+    # Once settled, a value lost by Grbl (reset) is restored
+    target.reported(100, grbl)
+    assert grbl.pushes[-1] == (overrideSequence(100, 125, FEED_OVERRIDE_CODES), COM_FLAG_NO_OK)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs a Linux pty')
+def test_sequence_on_simulator():
+    from grbl_ros2_gui.grblSimulator import grblSimulator
+    sim = grblSimulator(nbAxis=3, axisNames=['X', 'Y', 'Z'], timeScale=0)
+    port = serial.Serial(sim.start(), 115200, timeout=0.05)
+    try:
+        port.write(b'\n')
+        time.sleep(0.2)
+        port.reset_input_buffer()
+        sequence = overrideSequence(100, 57, FEED_OVERRIDE_CODES) + overrideSequence(100, 143, SPINDLE_OVERRIDE_CODES)
+        port.write(sequence.encode('latin-1'))
+        # Ov: comes with the next report that does not carry WCO:
+        line = ''
+        t0 = time.time()
+        while 'Ov:' not in line and time.time() - t0 < 2:
+            port.write(b'?')
+            line = port.readline().decode('ascii').strip()
+        assert 'Ov:57,100,143' in line
+    finally:
+        port.close()
+        sim.stop()
@@ -0,0 +1,106 @@
+# Copyright 2018-2021 Gauthier Brière (gauthier.briere "at" gmail.com)
+#
+# This file is part of cn5X++, free software released under the GNU General
+# Public License version 3 or later <http://www.gnu.org/licenses/>.
+
+"""
+Toolpath preview (toolpath.preview): level of detail decimation under a point
+budget, line lists, and packing of the vertices into a serialized marker.
+"""
+
+import struct
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from grbl_ros2_gui.toolpath.preview import SENTINEL, chunks, decimate, line_list, pack_points  # noqa: E402
+
+
+def spiral(n):
+    t = np.linspace(0, 40 * np.pi, n + 1)
+    return np.c_[t * np.cos(t), t * np.sin(t), np.zeros(n + 1)]
+
+
+def test_small_paths_are_kept():
+    points = spiral(100)
+    rapid = np.zeros(100, dtype=bool)
+    vertices, flags = decimate(points, rapid, 1000)
+    assert vertices is not None and np.array_equal(vertices, points) and np.array_equal(flags, rapid)
+
+
+def test_decimate_under_budget():
+    points = spiral(200000)
+    rapid = np.zeros(200000, dtype=bool)
+    rapid[50000:50010] = True
+    rapid[-1] = True
+    vertices, flags = decimate(points, rapid, 20000)
+    assert 2 * len(flags) <= 20000 and len(vertices) == len(flags) + 1
+    # The ends are kept, the rapid moves are still the moves between the same points
+    assert np.array_equal(vertices[0], points[0]) and np.array_equal(vertices[-1], points[-1])
+    assert flags[-1] and np.count_nonzero(flags) == 2
+    start = np.flatnonzero(flags)[0]
+    assert np.array_equal(vertices[start], points[50000]) and np.array_equal(vertices[start + 1], points[50010])
+    # The outline stays close to the spiral: every kept vertex is an original one
+    assert np.isin(vertices[:, 0], points[:, 0]).all()
+    step = np.hypot(*np.diff(vertices[:, :2], axis=0).T)
+    assert step.max() < 0.02 * np.ptp(points[:, 0])
+
+
+def test_alternating_moves_fall_back_to_sampling():
+    points = spiral(10000)
+    rapid = np.arange(10000) % 2 == 0
+    vertices, flags = decimate(points, rapid, 1000)
+    assert 2 * len(flags) <= 1000 and np.array_equal(vertices[-1], points[-1])
+
+
+def test_line_list_and_chunks():
+    vertices = np.arange(15, dtype=float).reshape(5, 3)
+    rapid = np.array([False, True, False, False])
+    feed = line_list(vertices, rapid, False)
+    assert feed.shape == (6, 3)
+    assert np.array_equal(feed[:2], vertices[:2]) and np.array_equal(feed[2:4], vertices[2:4])
+    assert np.array_equal(line_list(vertices, rapid, True), vertices[1:3])
+    assert [len(c) for c in chunks(feed, 5)] == [4, 2]
+
+
+@pytest.mark.parametrize('padding', [0, 4])
+def test_pack_points(padding):
+    sentinel = np.array(SENTINEL, dtype='<f8').tobytes()
+    prefix = b'\x00\x01\x00\x00' + b'header' + b'\x00' * (6 + padding)
+    suffix = struct.pack('<I', 0) + b'tail'
+    serialized = prefix + struct.pack('<I', 1) + b'\x00' * padding + sentinel + suffix
+    points = np.arange(12, dtype=float).reshape(4, 3)
+    packed = pack_points(serialized, points)
+    assert packed == prefix + struct.pack('<I', 4) + b'\x00' * padding + points.astype('<f8').tobytes() + suffix
+    with pytest.raises(ValueError):
+        pack_points(serialized.replace(sentinel, b'\x00' * 24), points)
+    with pytest.raises(ValueError):
+        pack_points(b'\x00\x00' + serialized[2:], points)
+
+
+def test_estimated_toolpath():
+    pytest.importorskip('PyQt5.QtCore')
+    from grbl_ros2_gui.gcodeEstimate import gcodeEstimator
+
+    estimator = gcodeEstimator('XYZ', offsets={54: [-100, -50, -10], 92: [1, 0, 0]}, mpos=[-100, -50, 0])
+    estimator.estimate(['G0 X10 Y10', 'G1 Z-1 F100', 'G4 P1', 'X20', 'G0 Z5'])
+    points, rapid = estimator.toolpath()
+    assert np.allclose(points, [[-1, 0, 10], [10, 10, 10], [10, 10, -1], [20, 10, -1], [20, 10, 5]])
+    assert list(rapid) == [True, False, False, True]
+    points, rapid = estimator.toolpath('XYA')
+    assert np.allclose(points[:, 2], 0)
+
+
+@pytest.mark.benchmark
+def test_decimate_speed():
+    points = spiral(2000000)
+    rapid = np.zeros(2000000, dtype=bool)
+    t0 = time.perf_counter()
+    vertices, flags = decimate(points, rapid, 200000)
+    segments = line_list(vertices, flags, False)
+    packed = pack_points(b'\x00\x01\x00\x00' + struct.pack('<I', 1) + np.array(SENTINEL).tobytes(), segments)
+    duree = time.perf_counter() - t0
+    print('\ntoolpath preview: {} segments to {} points in {:0.3f} s'.format(len(points) - 1, len(segments), duree))
+    assert len(packed) > 24 * len(segments) and duree < 2
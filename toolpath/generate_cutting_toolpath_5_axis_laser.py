@@ -13,6 +13,8 @@ parser = argparse.ArgumentParser(description='5-Axis Toolpath Generation')
 parser.add_argument('mesh_cci', metavar='INPUT_MESH_FILE', help='Input CCI mesh file path')
 parser.add_argument('mesh_defect', metavar='INPUT_MESH_FILE', help='Input defect edge mesh file path')
 parser.add_argument('transform_reg', metavar='INPUT_CSV_FILE', help='Input transformation file path')
+parser.add_argument('--tolerance', type=float, default=0.0, help='Merge G1 blocks within this tolerance on X, Y, Z (mm), 0 to disable')
+parser.add_argument('--angular-tolerance', type=float, default=0.05, help='Tolerance on A, B (degree) when merging G1 blocks')
 args = parser.parse_args()
 
 # Read data from input arguments
@@ -232,4 +234,14 @@ if SAVE_GCODE:
     # Close the file after writing
     file.close()
 
+    if args.tolerance > 0:
+        # Fewer, longer blocks: fewer ok round-trips and a fuller Grbl planner
+        from grbl_ros2_gui.toolpath.path_compression import compress_gcode
+        with open(output_file_gcode) as f:
+            blocks = f.read().splitlines()
+        compressed = compress_gcode(blocks, args.tolerance, args.angular_tolerance)
+        with open(output_file_gcode, 'w') as f:
+            f.write("\n".join(compressed))
+        print("G-code compressed: %d -> %d blocks" % (len(blocks), len(compressed)))
+
 plotter.show()
\ No newline at end of file